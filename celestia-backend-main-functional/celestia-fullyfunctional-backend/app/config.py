@@ -30,6 +30,85 @@ class Settings(BaseSettings):
     # App Configuration
     app_name: str = os.getenv("APP_NAME", "FITKIT")
     app_url: str = os.getenv("APP_URL", "http://localhost:8000")
+    
+    # Background health monitoring
+    monitoring_snapshot_max_age_minutes: int = int(os.getenv("MONITORING_SNAPSHOT_MAX_AGE_MINUTES", "60"))
+    # Users whose latest snapshot is kept in memory (least recently read evicted)
+    monitoring_snapshot_max_users: int = int(os.getenv("MONITORING_SNAPSHOT_MAX_USERS", "1000"))
+    monitoring_refresh_interval_hours: int = int(os.getenv("MONITORING_REFRESH_INTERVAL_HOURS", "6"))
+    health_batch_chunk_size: int = int(os.getenv("HEALTH_BATCH_CHUNK_SIZE", "500"))
+    health_batch_workers: int = int(os.getenv("HEALTH_BATCH_WORKERS", "4"))
+    # Declarative health rules file (defaults to app/rules/health_rules.json); reloaded on change
+    health_rules_path: str = os.getenv("HEALTH_RULES_PATH", "")
+    
+    # Smart notification generation (how many days ahead to schedule)
+    notification_days_ahead: int = int(os.getenv("NOTIFICATION_DAYS_AHEAD", "3"))
+    notification_batch_chunk_size: int = int(os.getenv("NOTIFICATION_BATCH_CHUNK_SIZE", "500"))
+
+    # Smart notification delivery
+    notification_dispatch_poll_seconds: int = int(os.getenv("NOTIFICATION_DISPATCH_POLL_SECONDS", "30"))
+    notification_dispatch_batch_size: int = int(os.getenv("NOTIFICATION_DISPATCH_BATCH_SIZE", "200"))
+    notification_dispatch_max_attempts: int = int(os.getenv("NOTIFICATION_DISPATCH_MAX_ATTEMPTS", "3"))
+    notification_dispatch_workers: int = int(os.getenv("NOTIFICATION_DISPATCH_WORKERS", "4"))
+    # Claimed notifications without an outcome after this long are delivered again
+    notification_dispatch_claim_timeout_seconds: int = int(os.getenv("NOTIFICATION_DISPATCH_CLAIM_TIMEOUT_SECONDS", "600"))
+    # Unsent notifications overdue by more than this are expired, not delivered (0 disables)
+    notification_dispatch_max_lateness_minutes: int = int(os.getenv("NOTIFICATION_DISPATCH_MAX_LATENESS_MINUTES", "60"))
+    
+    # Food photo preprocessing before upload to the vision model
+    image_upload_max_bytes: int = int(os.getenv("IMAGE_UPLOAD_MAX_BYTES", str(15 * 1024 * 1024)))
+    image_max_pixels: int = int(os.getenv("IMAGE_MAX_PIXELS", "50000000"))  # after JPEG draft decoding
+    image_max_edge: int = int(os.getenv("IMAGE_MAX_EDGE", "1024"))
+    image_quality: int = int(os.getenv("IMAGE_QUALITY", "82"))
+    image_format: str = os.getenv("IMAGE_FORMAT", "jpeg")  # 'jpeg' or 'webp'
+    image_min_sharpness: float = float(os.getenv("IMAGE_MIN_SHARPNESS", "10"))
+    image_min_brightness: float = float(os.getenv("IMAGE_MIN_BRIGHTNESS", "30"))
+    
+    # Batch meal analysis (/analysis/batch)
+    analysis_batch_max_items: int = int(os.getenv("ANALYSIS_BATCH_MAX_ITEMS", "10"))
+    analysis_batch_items_per_request: int = int(os.getenv("ANALYSIS_BATCH_ITEMS_PER_REQUEST", "5"))
+    analysis_batch_workers: int = int(os.getenv("ANALYSIS_BATCH_WORKERS", "4"))
+    
+    # Write-behind meal logging after analysis
+    meal_write_flush_seconds: float = float(os.getenv("MEAL_WRITE_FLUSH_SECONDS", "0.5"))
+    meal_summary_flush_seconds: float = float(os.getenv("MEAL_SUMMARY_FLUSH_SECONDS", "5"))
+    
+    # Speculative refinement while clarifying questions are answered (0 disables)
+    speculative_refinements: int = int(os.getenv("SPECULATIVE_REFINEMENTS", "2"))
+    speculative_refinement_wait_seconds: float = float(os.getenv("SPECULATIVE_REFINEMENT_WAIT_SECONDS", "30"))
+    
+    # Response cache for body-keyed AI endpoints (swaps, recipe, insights, nutrition lookup/breakdown)
+    response_cache_ttl_seconds: int = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+    response_cache_max_entries: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+    # SQLite file that entries evicted from memory spill to (empty disables spilling)
+    response_cache_spill_path: str = os.getenv("RESPONSE_CACHE_SPILL_PATH", "")
+    response_cache_spill_max_entries: int = int(os.getenv("RESPONSE_CACHE_SPILL_MAX_ENTRIES", "20000"))
+
+    # Users whose meal-history food search index is kept in memory (least recently searched evicted)
+    food_index_max_users: int = int(os.getenv("FOOD_INDEX_MAX_USERS", "1000"))
+    
+    # Agent user-context cache
+    user_context_cache_ttl_seconds: int = int(os.getenv("USER_CONTEXT_CACHE_TTL_SECONDS", "600"))
+    # Users whose context is cached (least recently active evicted)
+    user_context_cache_max_users: int = int(os.getenv("USER_CONTEXT_CACHE_MAX_USERS", "1000"))
+    
+    # Enhanced agent prompt size (estimated tokens)
+    agent_prompt_token_budget: int = int(os.getenv("AGENT_PROMPT_TOKEN_BUDGET", "2000"))
+    
+    # Conversation memory embeddings (local model directory, else hashing vectorizer)
+    memory_embedding_model_path: str = os.getenv("MEMORY_EMBEDDING_MODEL_PATH", "")
+    memory_embedding_dim: int = int(os.getenv("MEMORY_EMBEDDING_DIM", "512"))
+    # Users whose memory vector index is kept in memory (least recently searched evicted)
+    memory_index_max_users: int = int(os.getenv("MEMORY_INDEX_MAX_USERS", "1000"))
+    
+    # Background conversation memory compaction
+    memory_compaction_interval_hours: int = int(os.getenv("MEMORY_COMPACTION_INTERVAL_HOURS", "6"))
+    memory_digest_retention_days: int = int(os.getenv("MEMORY_DIGEST_RETENTION_DAYS", "180"))
+    
+    # Rolling conversation summaries (messages per session between updates)
+    conversation_summary_every_messages: int = int(os.getenv("CONVERSATION_SUMMARY_EVERY_MESSAGES", "10"))
+    # Users whose summary text is cached in memory (least recently active evicted)
+    conversation_summary_cache_users: int = int(os.getenv("CONVERSATION_SUMMARY_CACHE_USERS", "1000"))
 
     class Config:
         env_file = ".env"
@@ -9,6 +9,7 @@ from app.models.agentic_models import (
     UserBehaviorPattern, PredictiveInsight
 )
 from app.routers import agent
+from app.services.conversation_search import conversation_search_index
 from app.services.scheduler_service import start_scheduler, stop_scheduler
 import atexit
 
@@ -37,6 +38,9 @@ def startup_event():
     Base.metadata.create_all(bind=engine)
     print("Database tables initialized on startup")
     
+    # Full-text index over conversation memory (FTS5 / tsvector)
+    conversation_search_index.ensure_schema(engine)
+    
     # Start the notification scheduler service
     try:
         start_scheduler()
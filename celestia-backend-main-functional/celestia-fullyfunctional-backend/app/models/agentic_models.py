@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, JSON, DateTime, Date, Float, Boolean, Text
+from sqlalchemy import Column, Integer, String, ForeignKey, JSON, DateTime, Date, Float, Boolean, Text, LargeBinary, Index, UniqueConstraint
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from app.database import Base
@@ -13,7 +13,7 @@ class ConversationMemory(Base):
     message_type = Column(String)  # 'user' or 'agent'
     content = Column(Text)
     context_data = Column(JSON, default={})  # Store meal context, user state, etc.
-    embedding_vector = Column(JSON, default={})  # For semantic search (future enhancement)
+    embedding = Column(LargeBinary, nullable=True)  # float32 vector bytes for semantic retrieval
     importance_score = Column(Float, default=0.0)  # For memory prioritization
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -30,12 +30,16 @@ class HealthAlert(Base):
     title = Column(String)
     message = Column(Text)
     data_context = Column(JSON, default={})  # Supporting data for the alert
+    dedup_key = Column(String, index=True)  # '<alert_type>:<rule>:<window start>', unique per user
     is_read = Column(Boolean, default=False)
     is_dismissed = Column(Boolean, default=False)
     triggered_at = Column(DateTime(timezone=True), server_default=func.now())
     expires_at = Column(DateTime(timezone=True))  # When alert becomes irrelevant
     
     user = relationship("User")
+    
+    # Monitoring runs upsert on this, so concurrent runs for a user refresh one row
+    __table_args__ = (UniqueConstraint('user_id', 'dedup_key', name='uq_health_alerts_user_dedup'),)
 
 class SmartNotification(Base):
     """Store smart notifications for meal timing and reminders"""
@@ -53,8 +57,17 @@ class SmartNotification(Base):
     personalization_data = Column(JSON, default={})  # User-specific customization
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     sent_at = Column(DateTime(timezone=True))
+    delivery_status = Column(String, nullable=True)  # 'claimed', 'delivered', 'in_app', 'failed', 'retry'
+    delivery_attempts = Column(Integer, default=0)
+    dedup_key = Column(String)  # '<notification_type>:<scheduled date>:<title>', unique per user
     
     user = relationship("User")
+    
+    # The dispatcher scans unsent notifications in scheduled order
+    __table_args__ = (
+        Index('ix_smart_notifications_due', 'is_sent', 'scheduled_time'),
+        UniqueConstraint('user_id', 'dedup_key', name='uq_smart_notifications_user_dedup'),
+    )
 
 class MealPlan(Base):
     """Store AI-generated intelligent meal plans"""
@@ -104,6 +117,7 @@ class UserBehaviorPattern(Base):
     pattern_type = Column(String)  # 'eating_time', 'food_preference', 'calorie_trend', 'macro_balance'
     pattern_data = Column(JSON, default={})  # Detailed pattern information
     confidence_score = Column(Float, default=0.0)  # How confident we are in this pattern
+    stats = Column(JSON, default={})  # Compact online statistics pattern_data is derived from
     last_updated = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
@@ -122,8 +136,11 @@ class PredictiveInsight(Base):
     confidence_level = Column(Float, default=0.0)  # 0.0 to 1.0
     time_horizon = Column(String)  # 'short_term', 'medium_term', 'long_term'
     actionable_recommendations = Column(JSON, default=[])
+    dedup_key = Column(String, index=True)  # '<insight_type>:<window start>', unique per user
     is_active = Column(Boolean, default=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     expires_at = Column(DateTime(timezone=True))
     
     user = relationship("User")
+    
+    __table_args__ = (UniqueConstraint('user_id', 'dedup_key', name='uq_predictive_insights_user_dedup'),)
@@ -1,7 +1,13 @@
-from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
+from pydantic import BaseModel, model_validator
+from typing import List, Dict, Any, Optional, Union
 from datetime import datetime
 
+# Keeps ints as ints and floats as floats when validating model output
+Number = Union[int, float]
+
+# Asked when the model's analysis was cut off and only its complete items were kept
+TRUNCATED_ANALYSIS_QUESTION = "Did this meal include anything else not listed here?"
+
 class UserCreate(BaseModel):
     username: str
     password: str
@@ -21,13 +27,41 @@ class User(BaseModel):
 
 class AnalysisResponse(BaseModel):
     items: List[Dict[str, Any]]
-    total_calories: Optional[int] = 0
-    confidence_overall: Optional[int] = 50
+    total_calories: Optional[Number] = 0
+    confidence_overall: Optional[Number] = 50
     unclear_items: List[str] = []
     need_clarification: bool = False
-    total_protein: Optional[int] = 0
-    total_carbs: Optional[int] = 0
-    total_fat: Optional[int] = 0
+    total_protein: Optional[Number] = 0
+    total_carbs: Optional[Number] = 0
+    total_fat: Optional[Number] = 0
+    
+    class Config:
+        extra = "allow"
+    
+    @model_validator(mode="before")
+    @classmethod
+    def fill_missing_totals(cls, data: Any) -> Any:
+        """
+        Missing totals (e.g. in a truncated response) are the sum of the items.
+        A truncated response may be missing items too, so it asks the user.
+        """
+        if not isinstance(data, dict) or not isinstance(data.get("items"), list):
+            return data
+        data = dict(data)
+        if data.get("partial"):
+            data["need_clarification"] = True
+            data["unclear_items"] = list(data.get("unclear_items") or []) + [TRUNCATED_ANALYSIS_QUESTION]
+        for total, key in (("total_calories", "calories"), ("total_protein", "protein"),
+                           ("total_carbs", "carbs"), ("total_fat", "fat")):
+            if data.get(total) is None:
+                data[total] = sum(
+                    item[key] for item in data["items"]
+                    if isinstance(item, dict) and isinstance(item.get(key), (int, float))
+                )
+        return data
+
+class AnalysisBatchResponse(BaseModel):
+    meals: List[AnalysisResponse]
 
 class MealLog(BaseModel):
     id: int
@@ -1,9 +1,11 @@
 from fastapi import APIRouter, HTTPException, Depends, Body
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.database import get_db
+from app.database import SessionLocal, get_db
 from app.services.agent_service import HealthCoachAgent
 from typing import Dict, Any
 import asyncio
+import json
 
 router = APIRouter()
 
@@ -34,6 +36,39 @@ async def chat_with_agent(
         print(f"Agent chat error: {e}")
         raise HTTPException(status_code=500, detail=f"Chat failed: {str(e)}")
 
+@router.post("/chat/stream")
+async def chat_with_agent_stream(request: Dict[str, Any] = Body(...)):
+    """
+    Chat with the AI health coach agent, streaming the reply as server-sent events:
+    'token' for each chunk, then 'done', or 'error' if the reply breaks off partway
+    """
+    message = request.get("message", "")
+    context = request.get("context", {})
+    
+    if not message:
+        raise HTTPException(status_code=400, detail="Message is required")
+    
+    async def event_stream():
+        # The request-scoped session is closed before the body streams, so use our own
+        db = SessionLocal()
+        try:
+            agent = HealthCoachAgent(db)
+            try:
+                async for text in agent.chat_stream(message, context):
+                    yield f"event: token\ndata: {json.dumps({'text': text})}\n\n"
+            except Exception:
+                yield f"event: error\ndata: {json.dumps({'message': 'Response stream interrupted'})}\n\n"
+                return
+            yield "event: done\ndata: {}\n\n"
+        finally:
+            db.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.get("/daily_tip/{user_id}")
 def get_daily_tip(user_id: int, db: Session = Depends(get_db)):
     """
@@ -1,12 +1,28 @@
+import json
 from typing import Any, Dict, List, Optional
 
-from app.database import get_db
+from app.database import SessionLocal, get_db
+from app.services.behavior_patterns import behavior_pattern_tracker
 from app.services.conversation_memory_service import ConversationMemoryService
 from app.services.enhanced_agent_service import EnhancedAgenticService
+from app.services.health_monitoring_batch import batch_health_monitor
 from app.services.health_monitoring_service import HealthMonitoringService
+from app.services.health_rules import health_rule_engine
 from app.services.intelligent_meal_planner import IntelligentMealPlanner
+from app.services.meal_intent_classifier import intent_metrics
+from app.services.meal_write_queue import meal_write_queue
+from app.services.notification_batch import batch_notification_generator
+from app.services.notification_dispatcher import notification_dispatcher
+from app.services.monitoring_pipeline import monitoring_pipeline
 from app.services.smart_notification_service import SmartNotificationService
+from app.services.response_cache import response_cache
+from app.services.speculative_refinement import speculative_refiner
+from app.services.structured_output import get_parse_stats
+from app.services.user_context_cache import user_context_cache
+from app.services.memory_embeddings import memory_vector_index
+from app.services.conversation_summarizer import conversation_summarizer
 from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 from sqlalchemy.orm import Session
 
@@ -71,6 +87,40 @@ async def enhanced_chat(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Enhanced chat error: {str(e)}")
 
+@router.post("/chat/{user_id}/stream")
+async def enhanced_chat_stream(user_id: int, chat_request: ChatRequest):
+    """
+    Streaming version of the enhanced chat as server-sent events:
+    - 'session' with the session id, sent immediately
+    - 'token' for each chunk of the reply as Gemini produces it
+    - 'done' with the same metadata as /chat/{user_id} once the reply is stored
+    - 'error' instead of 'done' if the reply breaks off partway; it isn't stored
+    """
+    async def event_stream():
+        # The request-scoped session is closed before the body streams, so use our own
+        db = SessionLocal()
+        try:
+            enhanced_service = EnhancedAgenticService(db)
+            async for event in enhanced_service.enhanced_chat_stream(
+                user_id=user_id,
+                message=chat_request.message,
+                session_id=chat_request.session_id,
+                context=chat_request.context
+            ):
+                yield _sse_event(event.pop('type'), event)
+        finally:
+            db.close()
+    
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Format a single server-sent event"""
+    return f"event: {event}\ndata: {json.dumps(data, default=str)}\n\n"
+
 @router.get("/dashboard/{user_id}")
 async def get_health_dashboard(user_id: int, db: Session = Depends(get_db)):
     """
@@ -134,8 +184,7 @@ async def create_intelligent_meal_plan(
         # Generate notifications in background
         background_tasks.add_task(
             _generate_meal_plan_notifications,
-            user_id,
-            db
+            user_id
         )
         
         return {'meal_plan': meal_plan}
@@ -205,6 +254,17 @@ async def mark_meal_completed(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error marking meal completed: {str(e)}")
 
+@router.post("/health-monitoring/batch")
+async def run_batch_health_monitoring(background_tasks: BackgroundTasks):
+    """Run health monitoring for every recently active user in the background"""
+    background_tasks.add_task(batch_health_monitor.run)
+    
+    return {
+        'message': 'Batch health monitoring initiated',
+        'batch_scheduled': True,
+        'last_run': batch_health_monitor.get_status()['last_run']
+    }
+
 @router.get("/health-monitoring/{user_id}")
 async def run_health_monitoring(user_id: int, db: Session = Depends(get_db)):
     """
@@ -258,6 +318,9 @@ async def dismiss_alert(
         if not success:
             raise HTTPException(status_code=404, detail="Alert not found or not accessible")
         
+        # Keep the chat monitoring snapshot in sync with the dismissal
+        monitoring_pipeline.request_refresh(user_id, reason="alert_dismissed")
+        
         return {
             'success': True,
             'message': 'Alert dismissed',
@@ -312,6 +375,17 @@ async def generate_smart_notifications(user_id: int, db: Session = Depends(get_d
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Notification generation error: {str(e)}")
 
+@router.post("/notifications/batch")
+async def run_batch_notification_generation(background_tasks: BackgroundTasks):
+    """Schedule the next days of smart notifications for every recently active user in the background"""
+    background_tasks.add_task(batch_notification_generator.run)
+    
+    return {
+        'message': 'Batch notification generation initiated',
+        'batch_scheduled': True,
+        'last_run': batch_notification_generator.get_status()['last_run']
+    }
+
 @router.get("/notifications/{user_id}")
 async def get_pending_notifications(user_id: int, db: Session = Depends(get_db)):
     """Get all pending notifications for a user"""
@@ -431,7 +505,8 @@ async def cleanup_old_data(
         background_tasks.add_task(
             _cleanup_user_data,
             enhanced_service,
-            days_old
+            days_old,
+            user_id
         )
         
         return {
@@ -443,6 +518,11 @@ async def cleanup_old_data(
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error initiating cleanup: {str(e)}")
 
+@router.get("/intent-metrics")
+async def get_intent_metrics():
+    """Per-intent hit rates for the rule-based meal-history fast path"""
+    return intent_metrics.snapshot()
+
 @router.get("/status")
 async def get_agentic_status():
     """Get status of all agentic AI services"""
@@ -455,6 +535,19 @@ async def get_agentic_status():
             'intelligent_meal_planning': 'available',
             'conversation_memory': 'available'
         },
+        'monitoring_pipeline': monitoring_pipeline.get_status(),
+        'batch_health_monitoring': batch_health_monitor.get_status(),
+        'health_rules': health_rule_engine.get_status(),
+        'behavior_patterns': behavior_pattern_tracker.get_status(),
+        'batch_notifications': batch_notification_generator.get_status(),
+        'notification_dispatcher': notification_dispatcher.get_status(),
+        'meal_write_queue': meal_write_queue.get_status(),
+        'speculative_refinement': speculative_refiner.get_status(),
+        'structured_output': get_parse_stats(),
+        'response_cache': response_cache.get_status(),
+        'user_context_cache': user_context_cache.get_stats(),
+        'memory_vector_index': memory_vector_index.get_stats(),
+        'conversation_summarizer': conversation_summarizer.get_status(),
         'features': [
             'Contextual conversation memory across sessions',
             'Proactive health monitoring with alerts',
@@ -467,18 +560,17 @@ async def get_agentic_status():
     }
 
 # Background task functions
-async def _generate_meal_plan_notifications(user_id: int, db: Session):
-    """Background task to generate notifications for new meal plan"""
+def _generate_meal_plan_notifications(user_id: int):
+    """Background task to generate notifications for new meal plan (runs after the request's session is closed)"""
     try:
-        notification_service = SmartNotificationService(db)
-        notification_service.generate_smart_notifications(user_id)
+        batch_notification_generator.run([user_id])
     except Exception as e:
         print(f"Error generating meal plan notifications: {e}")
 
-async def _cleanup_user_data(enhanced_service: EnhancedAgenticService, days_old: int):
+async def _cleanup_user_data(enhanced_service: EnhancedAgenticService, days_old: int, user_id: int):
     """Background task to cleanup old data"""
     try:
-        enhanced_service.cleanup_old_data(days_old)
+        enhanced_service.cleanup_old_data(days_old, user_id=user_id)
     except Exception as e:
         print(f"Error during data cleanup: {e}")
 
@@ -5,24 +5,24 @@ def clean_session_data(session: dict) -> dict:
         data['image'] = None
     return data
 
-import io
 from typing import Any, Dict, List, Optional
 
+from app.config import settings
 from app.database import get_db
 from app.models.pydantic_models import AnalysisResponse
 from app.routers.sessions import sessions
 from app.services.analysis_service import (analyze_food_image, explainability,
-                                           generate_clarifying_questions,
-                                           portion_estimation,
-                                           refine_analysis_with_answers)
-from app.services.nutrition_service import nutrition_lookup
-from app.services.recommendations_service import (healthy_swaps,
-                                                  personalized_recommendations)
+                                           generate_clarifying_questions)
+from app.services.image_preprocessing import (ImageRejected, UploadTooLarge,
+                                              preprocess_image, read_upload)
+from app.services.meal_batch_service import analyze_meals, enrich_analysis
+from app.services.meal_write_queue import meal_write_queue
+from app.services.speculative_refinement import speculative_refiner
 from app.services.user_service import get_user, log_meal
-from fastapi import (APIRouter, Body, Depends, File, HTTPException, Query,
-                     UploadFile)
-from PIL import Image
+from fastapi import (APIRouter, Body, Depends, File, Form, HTTPException,
+                     Query, UploadFile)
 from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
 
 router = APIRouter()
 
@@ -44,23 +44,143 @@ def validate_session(session_id: str):
     return sessions[session_id]
 
 
-@router.post("/upload/{session_id}")
-async def upload_image(session_id: str, file: UploadFile = File(...)):
-    session = validate_session(session_id)
+async def prepare_upload(file: UploadFile) -> Dict[str, Any]:
+    """Validate, stream and preprocess an uploaded food photo"""
     try:
         # Validate file type
         if not file.content_type or not file.content_type.startswith('image/'):
             raise HTTPException(status_code=400, detail="Invalid file type. Please upload an image.")
-        image_bytes = await file.read()
-        if len(image_bytes) == 0:
+        upload = await read_upload(file)
+        if upload['bytes'] == 0:
             raise HTTPException(status_code=400, detail="Empty file uploaded")
-        image = Image.open(io.BytesIO(image_bytes))
-        sessions[session_id]["image"] = image
-        sessions[session_id]["step"] = "analyze"
-        return {"message": "Image uploaded successfully"}
+        # Downscaled, re-encoded JPEG that is sent to the model as-is
+        image = await run_in_threadpool(preprocess_image, file.file)
+        image['sha256'] = upload['sha256']
+        return image
+    except HTTPException:
+        raise
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    except ImageRejected as e:
+        raise HTTPException(status_code=422, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=400, detail=f"Invalid image file: {str(e)}")
 
+def image_metadata(image: Dict[str, Any]) -> Dict[str, Any]:
+    return {key: value for key, value in image.items() if key != 'data'}
+
+def complete_analysis(db: Session, user, analysis_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Portions, nutrition and recommendations for an analysis; queues the meal log for a known user"""
+    completed = enrich_analysis(analysis_data, user)
+
+    if user:
+        # Persisted (and the daily summary updated) in the background
+        queued = meal_write_queue.enqueue(user.id, analysis_data, completed["portion_estimates"],
+                                          completed["nutrition_summary"], completed["recommendations"])
+        if not queued:
+            # Queue is shutting down; log the meal directly so it isn't lost
+            print(f"Meal write queue unavailable, logging meal for user {user.id} directly")
+            log_meal(db, user.id, analysis_data, completed["portion_estimates"],
+                     completed["nutrition_summary"], completed["recommendations"])
+
+    return completed
+
+def no_food_detected_response() -> Dict[str, Any]:
+    return {
+        "message": "Analysis failed - no food detected",
+        "data": {
+            "analysis_data": {
+                "items": [],
+                "total_calories": 0,
+                "total_protein": 0,
+                "total_carbs": 0,
+                "total_fat": 0,
+                "confidence_overall": 0,
+                "need_clarification": True,
+                "unclear_items": ["No food items detected. Please try a clearer image."]
+            }
+        }
+    }
+
+
+@router.post("/upload/{session_id}")
+async def upload_image(session_id: str, file: UploadFile = File(...)):
+    session = validate_session(session_id)
+    image = await prepare_upload(file)
+    sessions[session_id]["image"] = image
+    sessions[session_id]["step"] = "analyze"
+    return {"message": "Image uploaded successfully", "image": image_metadata(image)}
+
+
+@router.post("/analyze-image")
+async def analyze_image(
+    file: UploadFile = File(...),
+    user_id: Optional[int] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Upload and analyze a food photo in a single request. Nothing is kept on
+    the server between calls: the response carries the full analysis, and
+    any clarifying questions for the client to refine with.
+    """
+    image = await prepare_upload(file)
+    try:
+        user = await run_in_threadpool(get_user, db, user_id) if user_id else None
+        user_profile = user.profile if user else {}
+
+        analysis_data = await run_in_threadpool(analyze_food_image, image, user_profile)
+        if not analysis_data or not analysis_data.get('items'):
+            return {**no_food_detected_response(), "image": image_metadata(image)}
+
+        completed = await run_in_threadpool(complete_analysis, db, user, analysis_data)
+
+        response = {
+            "message": "Analysis complete",
+            "image": image_metadata(image),
+            "data": {"analysis_data": analysis_data, **completed}
+        }
+        if analysis_data.get('need_clarification', False):
+            response["message"] = "Analysis complete, clarification needed"
+            response["questions"] = generate_clarifying_questions(analysis_data)
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
+
+
+@router.post("/batch")
+async def analyze_batch(
+    files: Optional[List[UploadFile]] = File(None),
+    texts: Optional[List[str]] = Form(None),
+    user_id: Optional[int] = Form(None),
+    db: Session = Depends(get_db)
+):
+    """
+    Analyze several meal photos and/or text descriptions in one request, e.g.
+    when back-filling a day. Meals are packed into as few model requests as
+    possible and, for a known user, logged together with one daily summary
+    update. Results come back in input order: photos first, then texts.
+    """
+    files = files or []
+    texts = [text.strip() for text in texts or [] if text and text.strip()]
+    if not files and not texts:
+        raise HTTPException(status_code=400, detail="No images or texts provided")
+    if len(files) + len(texts) > settings.analysis_batch_max_items:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {settings.analysis_batch_max_items} meals can be analyzed per batch"
+        )
+
+    images = [await prepare_upload(file) for file in files]
+    try:
+        user = await run_in_threadpool(get_user, db, user_id) if user_id else None
+        result = await run_in_threadpool(analyze_meals, db, user, images + texts)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Batch analysis failed: {str(e)}")
+
+    for meal in result["meals"][:len(images)]:
+        meal["image"] = image_metadata(images[meal["index"]])
+    return result
+
 
 @router.post("/analyze/{session_id}")
 async def analyze(session_id: str, user_id: Optional[int] = Query(None), db: Session = Depends(get_db)):
@@ -70,55 +190,20 @@ async def analyze(session_id: str, user_id: Optional[int] = Query(None), db: Ses
         raise HTTPException(status_code=400, detail="No image uploaded for this session.")
     try:
         # Get user profile for dietary preferences
-        user_profile = {}
-        if user_id:
-            user = get_user(db, user_id)
-            if user:
-                user_profile = user.profile
+        user = get_user(db, user_id) if user_id else None
+        user_profile = user.profile if user else {}
 
         # Analyze image with user profile
         analysis_data = analyze_food_image(image, user_profile)
         if not analysis_data or not analysis_data.get('items'):
-            return {
-                "message": "Analysis failed - no food detected",
-                "data": {
-                    "analysis_data": {
-                        "items": [],
-                        "total_calories": 0,
-                        "total_protein": 0,
-                        "total_carbs": 0,
-                        "total_fat": 0,
-                        "confidence_overall": 0,
-                        "need_clarification": True,
-                        "unclear_items": ["No food items detected. Please try a clearer image."]
-                    }
-                }
-            }
+            return no_food_detected_response()
 
         sessions[session_id]["analysis_data"] = analysis_data
 
-        # Process additional data
-        portion_estimates = portion_estimation(analysis_data)
-        sessions[session_id]["portion_estimates"] = portion_estimates
-
-        nutrition_summary = nutrition_lookup(analysis_data)
-        sessions[session_id]["nutrition_summary"] = nutrition_summary
-
-        # Get recommendations
-        swaps = healthy_swaps(analysis_data)
-        recommendations = {"swaps": swaps}
-
-        if user_id:
-            user = get_user(db, user_id)
-            if user:
-                personalized = personalized_recommendations(analysis_data, user.profile)
-                recommendations["personalized"] = personalized
-                try:
-                    log_meal(db, user_id, analysis_data, portion_estimates, nutrition_summary, recommendations)
-                except Exception as e:
-                    print(f"Failed to log meal: {e}")
-
-        sessions[session_id]["recommendations"] = recommendations
+        # Portions, nutrition and recommendations; logs the meal for known users
+        completed = complete_analysis(db, user, analysis_data)
+        sessions[session_id].update(completed)
+        recommendations = completed["recommendations"]
 
         # Check if clarification needed
         if analysis_data.get('need_clarification', False):
@@ -126,9 +211,12 @@ async def analyze(session_id: str, user_id: Optional[int] = Query(None), db: Ses
             sessions[session_id]["questions"] = questions
             sessions[session_id]["step"] = "clarify"
             print(f"DEBUG IMAGE: Clarification needed! Questions: {questions}")
+            # Refine the likeliest answers while the user is still answering
+            suggested_answers = speculative_refiner.speculate(session_id, analysis_data, questions)
             return {
                 "message": "Analysis complete, clarification needed",
-                "questions": questions
+                "questions": questions,
+                "suggested_answers": suggested_answers
             }
         else:
             sessions[session_id]["step"] = "results"
@@ -203,11 +291,8 @@ def analyze_text(
     
     try:
         # Get user profile for dietary preferences
-        user_profile = {}
-        if user_id:
-            user = get_user(db, user_id)
-            if user:
-                user_profile = user.profile
+        user = get_user(db, user_id) if user_id else None
+        user_profile = user.profile if user else {}
         
         # Analyze text with user profile
         analysis_data = analyze_food_image(dish_text, user_profile)
@@ -216,28 +301,10 @@ def analyze_text(
         
         sessions[session_id]["analysis_data"] = analysis_data
         
-        # Process additional data
-        portion_estimates = portion_estimation(analysis_data)
-        sessions[session_id]["portion_estimates"] = portion_estimates
-        
-        nutrition_summary = nutrition_lookup(analysis_data)
-        sessions[session_id]["nutrition_summary"] = nutrition_summary
-        
-        # Get recommendations
-        swaps = healthy_swaps(analysis_data)
-        recommendations = {"swaps": swaps}
-        
-        if user_id:
-            user = get_user(db, user_id)
-            if user:
-                personalized = personalized_recommendations(analysis_data, user.profile)
-                recommendations["personalized"] = personalized
-                try:
-                    log_meal(db, user_id, analysis_data, portion_estimates, nutrition_summary, recommendations)
-                except Exception as e:
-                    print(f"Failed to log meal: {e}")
-        
-        sessions[session_id]["recommendations"] = recommendations
+        # Portions, nutrition and recommendations; logs the meal for known users
+        completed = complete_analysis(db, user, analysis_data)
+        sessions[session_id].update(completed)
+        recommendations = completed["recommendations"]
         
         # Check if clarification needed
         if analysis_data.get('need_clarification', False):
@@ -245,9 +312,12 @@ def analyze_text(
             sessions[session_id]["questions"] = questions
             sessions[session_id]["step"] = "clarify"
             print(f"DEBUG TEXT: Clarification needed! Questions: {questions}")
+            # Refine the likeliest answers while the user is still answering
+            suggested_answers = speculative_refiner.speculate(session_id, analysis_data, questions)
             return {
                 "message": "Analysis complete, clarification needed",
-                "questions": questions
+                "questions": questions,
+                "suggested_answers": suggested_answers
             }
         else:
             sessions[session_id]["step"] = "results"
@@ -274,11 +344,16 @@ def refine_analysis(session_id: str, answers: List[str] = Body(...)):
             raise HTTPException(status_code=400, detail="Mismatch in number of answers")
     try:
         original_data = sessions[session_id]["analysis_data"]
-        refined_data = refine_analysis_with_answers(original_data, questions, answers)
+        # Served from a speculative refinement when the answers match one
+        refined_data, speculative = speculative_refiner.refine(session_id, original_data, questions, answers)
         if not refined_data:
             refined_data = original_data
         sessions[session_id]["analysis_data"] = refined_data
         sessions[session_id]["step"] = "results"
-        return {"message": "Analysis refined", "data": clean_session_data(sessions[session_id])}
+        return {
+            "message": "Analysis refined",
+            "speculative": speculative,
+            "data": clean_session_data(sessions[session_id])
+        }
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Analysis refinement failed: {str(e)}")
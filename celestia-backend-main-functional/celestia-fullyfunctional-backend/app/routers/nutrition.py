@@ -1,13 +1,19 @@
-from fastapi import APIRouter, HTTPException
+from fastapi import APIRouter, HTTPException, Response
 from typing import Dict, Any
 from app.services.nutrition_service import nutrition_lookup, detailed_nutrition_breakdown
+from app.services.response_cache import cached_response
 
 router = APIRouter()
 
 @router.post("/lookup")
-def get_nutrition(analysis_data: Dict[str, Any]):
+def get_nutrition(analysis_data: Dict[str, Any], response: Response):
     try:
-        summary = nutrition_lookup(analysis_data)
+        # A failed lookup falls back to the request's own items, which isn't worth keeping
+        summary = cached_response(
+            response, "nutrition_lookup", analysis_data,
+            lambda: nutrition_lookup(analysis_data),
+            cacheable=lambda summary: bool(summary) and summary.get("items") is not analysis_data.get("items")
+        )
         if not summary:
             raise HTTPException(status_code=500, detail="Nutrition lookup failed")
         return summary
@@ -15,9 +21,13 @@ def get_nutrition(analysis_data: Dict[str, Any]):
         raise HTTPException(status_code=500, detail=f"Nutrition lookup error: {str(e)}")
 
 @router.post("/breakdown")
-def get_nutrition_breakdown(analysis_data: Dict[str, Any]):
+def get_nutrition_breakdown(analysis_data: Dict[str, Any], response: Response):
     try:
-        breakdown = detailed_nutrition_breakdown(analysis_data)
+        breakdown = cached_response(
+            response, "nutrition_breakdown", analysis_data,
+            lambda: detailed_nutrition_breakdown(analysis_data),
+            cacheable=lambda breakdown: bool(breakdown and breakdown.get("nutrient_cards"))
+        )
         if not breakdown:
             raise HTTPException(status_code=500, detail="Nutrition breakdown failed")
         return breakdown
@@ -8,16 +8,25 @@ from app.services.recommendations_service import (healthy_swaps,
                                                   personalized_recommendations,
                                                   recipe_generation,
                                                   recipe_modification)
+from app.services.response_cache import cached_response
 from app.services.user_service import get_user
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Response
 from sqlalchemy.orm import Session
 
 router = APIRouter()
 
+# Fallback answers the services return when the model call fails; never cached
+FALLBACK_SWAP_ORIGINAL = 'Current choice'
+FALLBACK_RECIPE_PREFIX = '## Recipe Generation Failed'
+
 @router.post("/swaps")
-def get_swaps(analysis_data: Dict[str, Any]):
+def get_swaps(analysis_data: Dict[str, Any], response: Response):
     try:
-        swaps = healthy_swaps(analysis_data)
+        swaps = cached_response(
+            response, "swaps", analysis_data,
+            lambda: healthy_swaps(analysis_data),
+            cacheable=lambda swaps: bool(swaps) and swaps[0].get('original') != FALLBACK_SWAP_ORIGINAL
+        )
         return {"swaps": swaps}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get swaps: {str(e)}")
@@ -35,9 +44,13 @@ def get_personalized(analysis_data: Dict[str, Any], user_id: int, db: Session =
         raise HTTPException(status_code=500, detail=f"Failed to get personalized recommendations: {str(e)}")
 
 @router.post("/recipe")
-def generate_recipe(analysis_data: Dict[str, Any]):
+def generate_recipe(analysis_data: Dict[str, Any], response: Response):
     try:
-        recipe = recipe_generation(analysis_data)
+        recipe = cached_response(
+            response, "recipe", analysis_data,
+            lambda: recipe_generation(analysis_data),
+            cacheable=lambda recipe: bool(recipe) and not recipe.startswith(FALLBACK_RECIPE_PREFIX)
+        )
         return {"recipe": recipe}
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to generate recipe: {str(e)}")
@@ -58,9 +71,14 @@ def modify_recipe(request: Dict[str, Any]):
         raise HTTPException(status_code=500, detail=f"Failed to modify recipe: {str(e)}")
 
 @router.post("/nutrition-insights")
-def get_insights(analysis_data: Dict[str, Any]):
+def get_insights(analysis_data: Dict[str, Any], response: Response):
     try:
-        insights = get_nutrition_insights(analysis_data)
+        insights = cached_response(
+            response, "nutrition_insights", analysis_data,
+            lambda: get_nutrition_insights(analysis_data),
+            cacheable=lambda insights: "error" not in insights
+            and insights.get("macro_balance", {}).get("status") not in ("error", "unknown")
+        )
         
         # Ensure the response has the proper structure
         if "error" in insights:
@@ -2,6 +2,7 @@ from fastapi import APIRouter, Depends, HTTPException, Body
 from sqlalchemy.orm import Session
 from app.database import get_db
 from app.services.user_service import create_user, get_user, get_meal_history, log_meal
+from app.services.user_context_cache import user_context_cache
 from app.models.pydantic_models import UserCreate, User, MealLog
 from app.models.google_models import GoogleUserCreate
 from app.models.db_models import User as DBUser
@@ -81,6 +82,7 @@ def update_user(user_id: int, profile: Dict[str, Any] = Body(...), db: Session =
         user.profile = profile
         db.commit()
         db.refresh(user)
+        user_context_cache.invalidate(user_id)
         return user
     except Exception as e:
         db.rollback()
@@ -1,8 +1,12 @@
 import json
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, AsyncIterator, List, Optional
 import google.generativeai as genai
 from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 from app.config import settings
+from app.services.conversation_memory_service import ConversationMemoryService
+from app.services.meal_intent_classifier import intent_metrics, meal_intent_classifier
+from app.services.user_context_cache import user_context_cache
 from app.services.user_service import get_meal_history, get_user
 from datetime import datetime, timedelta
 
@@ -52,6 +56,12 @@ class HealthCoachAgent:
         if not self.db or not user_id:
             return {}
         
+        return user_context_cache.get_or_build(
+            user_id, 'agent_context', lambda: self._build_user_context(user_id)
+        )
+    
+    def _build_user_context(self, user_id: int) -> Dict[str, Any]:
+        """Build the agent context from the database (cached by get_user_context)"""
         user = get_user(self.db, user_id)
         if not user:
             return {}
@@ -266,32 +276,91 @@ class HealthCoachAgent:
     async def chat(self, message: str, context: Dict[str, Any]) -> str:
         """Main chat function for the AI agent with meal memory capabilities"""
         try:
-            # Build context-aware prompt
-            user_context = {}
-            meal_memory_result = None
+            prompt, user_context, direct_answer = self._build_chat_prompt(message, context)
             
-            if context.get("user_id") and self.db:
-                user_context = self.get_user_context(context["user_id"])
-                
-                # Check if this is a meal memory query
-                meal_memory_result = self.handle_meal_memory_query(context["user_id"], message)
+            # If meal memory found a specific answer, return it
+            if direct_answer:
+                return direct_answer
             
-            current_analysis = context.get("current_analysis", {})
-            chat_history = context.get("chat_history", [])
+            # Generate response
+            response = agent_model.generate_content(prompt)
             
-            # If meal memory found a specific answer, return it
-            if meal_memory_result and meal_memory_result.get('result'):
-                return meal_memory_result['result']
+            return response.text + self._motivation_suffix(message, user_context)
             
-            # Get insights
-            nutritional_gaps = []
-            meal_improvements = []
-            if current_analysis:
-                nutritional_gaps = self.analyze_nutritional_gaps(current_analysis, user_context)
-                meal_improvements = self.suggest_meal_improvements(current_analysis)
+        except Exception as e:
+            print(f"Agent chat error: {e}")
+            return "I'm having trouble processing that right now. Could you try rephrasing your question?"
+    
+    async def chat_stream(self, message: str, context: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Streaming variant of chat. Yields text chunks as Gemini produces them and
+        stores the exchange in conversation memory once the reply is complete.
+        If the stream breaks off after text was sent the error is re-raised and
+        nothing is stored.
+        """
+        chunks = []
+        try:
+            prompt, user_context, direct_answer = await run_in_threadpool(
+                self._build_chat_prompt, message, context
+            )
+            
+            if direct_answer:
+                chunks.append(direct_answer)
+                yield direct_answer
+            else:
+                stream = await run_in_threadpool(agent_model.generate_content, prompt, stream=True)
+                async for chunk in iterate_in_threadpool(iter(stream)):
+                    try:
+                        text = chunk.text
+                    except Exception:
+                        # Chunks without text parts (e.g. safety metadata) raise on .text
+                        text = ''
+                    if text:
+                        chunks.append(text)
+                        yield text
+                
+                suffix = self._motivation_suffix(message, user_context)
+                if suffix:
+                    chunks.append(suffix)
+                    yield suffix
+                
+        except Exception as e:
+            print(f"Agent chat stream error: {e}")
+            if chunks:
+                # The client already has part of the reply; a cut-off reply isn't stored
+                raise
+            fallback = "I'm having trouble processing that right now. Could you try rephrasing your question?"
+            chunks.append(fallback)
+            yield fallback
+        
+        await run_in_threadpool(self._store_chat_exchange, message, ''.join(chunks), context)
+    
+    def _build_chat_prompt(self, message: str, context: Dict[str, Any]):
+        """Build the chat prompt; returns (prompt, user_context, direct_answer)"""
+        # Build context-aware prompt
+        user_context = {}
+        meal_memory_result = None
+        
+        if context.get("user_id") and self.db:
+            # Structured meal-history questions skip context building entirely
+            meal_memory_result = self.handle_meal_memory_query(context["user_id"], message)
+            if meal_memory_result and meal_memory_result.get('result'):
+                return None, user_context, meal_memory_result['result']
             
-            # Build the prompt
-            prompt = f"""
+            user_context = self.get_user_context(context["user_id"])
+        
+        current_analysis = context.get("current_analysis", {})
+        chat_history = context.get("chat_history", [])
+        
+        # Get insights
+        nutritional_gaps = []
+        meal_improvements = []
+        if current_analysis:
+            nutritional_gaps = self.analyze_nutritional_gaps(current_analysis, user_context)
+            meal_improvements = self.suggest_meal_improvements(current_analysis)
+        
+        # Build the prompt
+        prompt = f"""
             {self.system_prompt}
             
             Current Context:
@@ -317,20 +386,41 @@ class HealthCoachAgent:
             Keep response concise (2-3 sentences max) unless user asks for detailed information.
             Include emojis sparingly to keep the tone friendly.
             """
-            
-            # Generate response
-            response = agent_model.generate_content(prompt)
-            
-            # Add motivational message if appropriate
-            if "goal" in message.lower() or "progress" in message.lower():
-                motivation = self.generate_motivational_message(user_context)
-                return f"{response.text}\n\n💪 {motivation}"
-            
-            return response.text
-            
+        
+        return prompt, user_context, None
+    
+    def _motivation_suffix(self, message: str, user_context: Dict) -> str:
+        """Add motivational message if appropriate"""
+        if "goal" in message.lower() or "progress" in message.lower():
+            motivation = self.generate_motivational_message(user_context)
+            return f"\n\n💪 {motivation}"
+        return ""
+    
+    def _store_chat_exchange(self, message: str, reply: str, context: Dict[str, Any]):
+        """Persist a completed chat exchange to conversation memory"""
+        user_id = context.get("user_id")
+        if not user_id or not self.db or not reply:
+            return
+        
+        try:
+            memory_service = ConversationMemoryService(self.db)
+            session_id = context.get("session_id") or memory_service.create_session_id()
+            memory_service.store_conversation(
+                user_id=user_id,
+                session_id=session_id,
+                message_type='user',
+                content=message,
+                context_data={'source': 'agent_chat'}
+            )
+            memory_service.store_conversation(
+                user_id=user_id,
+                session_id=session_id,
+                message_type='agent',
+                content=reply,
+                context_data={'source': 'agent_chat'}
+            )
         except Exception as e:
-            print(f"Agent chat error: {e}")
-            return "I'm having trouble processing that right now. Could you try rephrasing your question?"
+            print(f"Error storing agent chat exchange: {e}")
     
     def handle_meal_memory_query(self, user_id: int, message: str) -> Optional[Dict[str, Any]]:
         """Handle meal memory queries using the MealMemoryService"""
@@ -338,13 +428,15 @@ class HealthCoachAgent:
             from app.services.meal_memory_service import MealMemoryService
             memory_service = MealMemoryService(self.db)
             
-            # Check if this is a meal memory query
-            query_keywords = ['when did i eat', 'what time', 'how often', 'last time', 'what did i eat with']
+            # Check if this is a structured meal-history question
+            meal_intent = meal_intent_classifier.classify(message)
+            if meal_intent['intent'] == 'none':
+                intent_metrics.record('none', answered=False)
+                return None
             
-            if any(keyword in message.lower() for keyword in query_keywords):
-                return memory_service.search_meals_by_natural_query(user_id, message)
-            
-            return None
+            result = memory_service.answer_intent(user_id, meal_intent, message.lower())
+            intent_metrics.record(meal_intent['intent'], answered=bool(result and result.get('result')))
+            return result
             
         except Exception as e:
             print(f"Meal memory query error: {e}")
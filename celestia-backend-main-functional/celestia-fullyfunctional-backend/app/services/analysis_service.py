@@ -1,40 +1,20 @@
-import io
 import json
-import re
 from typing import Any, Dict, List, Optional, Union
 
 import google.generativeai as genai
 from app.config import settings
+from app.models.pydantic_models import AnalysisBatchResponse, AnalysisResponse
+from app.services.image_preprocessing import as_image_part, preprocess_image
+from app.services.structured_output import parse_structured_output
 from PIL import Image
 
 genai.configure(api_key=settings.google_api_key)
 gemini_model = genai.GenerativeModel("models/gemini-2.0-flash")
 
 def clean_json_response(text: str) -> Optional[Dict[str, Any]]:
-    text = re.sub(r'```json', '', text)
-    text = re.sub(r'```', '', text)
-    text = text.strip()
-    brace_count = 0
-    start_idx = -1
-    end_idx = -1
-    for i, char in enumerate(text):
-        if char == '{':
-            if start_idx == -1:
-                start_idx = i
-            brace_count += 1
-        elif char == '}':
-            brace_count -= 1
-            if brace_count == 0 and start_idx != -1:
-                end_idx = i + 1
-                break
-    if start_idx != -1 and end_idx != -1:
-        json_text = text[start_idx:end_idx]
-        try:
-            return json.loads(json_text)
-        except Exception as e:
-            print(f"JSON parsing error: {e}")
-            return None
-    return None
+    """The JSON object in a model response (see structured_output.extract_json_object)"""
+    # Callers use the object as is, so a truncated response fails rather than coming back short
+    return parse_structured_output(text, partial=False)
 
 def create_fallback_response(error_msg: str) -> Dict[str, Any]:
     return {
@@ -48,8 +28,8 @@ def create_fallback_response(error_msg: str) -> Dict[str, Any]:
         "unclear_items": [f"Analysis failed: {error_msg}. Please try again."]
     }
 
-def analyze_food_image(image_or_text: Union[Image.Image, str], user_profile: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
-    """Analyze food from image or text description"""
+def analyze_food_image(image_or_text: Union[Image.Image, Dict[str, Any], str], user_profile: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+    """Analyze food from an image, a preprocessed image (see preprocess_image) or a text description"""
     if isinstance(image_or_text, str):
         if not image_or_text.strip():
             return create_fallback_response("Empty text provided")
@@ -107,8 +87,8 @@ def analyze_food_image(image_or_text: Union[Image.Image, str], user_profile: Opt
         """
     else:
         try:
-            if image_or_text.mode != 'RGB':
-                image_or_text = image_or_text.convert('RGB')
+            if isinstance(image_or_text, Image.Image):
+                image_or_text = preprocess_image(image_or_text, check_quality=False)
         except Exception as e:
             return create_fallback_response(f"Invalid image format: {str(e)}")
         dietary_context = ""
@@ -164,9 +144,10 @@ def analyze_food_image(image_or_text: Union[Image.Image, str], user_profile: Opt
         if isinstance(image_or_text, str):
             response = gemini_model.generate_content([prompt])
         else:
-            response = gemini_model.generate_content([prompt, image_or_text])
+            response = gemini_model.generate_content([prompt, as_image_part(image_or_text)])
         
-        result = clean_json_response(response.text)
+        # A truncated analysis comes back asking for clarification (see AnalysisResponse)
+        result = parse_structured_output(response.text, AnalysisResponse, partial=True)
         
         if not result:
             return create_fallback_response("JSON parsing failed")
@@ -183,6 +164,86 @@ def analyze_food_image(image_or_text: Union[Image.Image, str], user_profile: Opt
         print(f"Analysis error: {e}")
         return create_fallback_response(f"Analysis service error: {str(e)}")
 
+def analyze_food_batch(inputs: List[Union[Image.Image, Dict[str, Any], str]], user_profile: Optional[Dict[str, Any]] = None) -> Optional[List[Dict[str, Any]]]:
+    """
+    Analyze several meals (photos, preprocessed photos or text descriptions)
+    with one model request. Returns one analysis per input, in order, or None
+    if the response can't be matched up with the inputs.
+    """
+    dietary_context = ""
+    if user_profile and user_profile.get('diet_preference'):
+        dietary_context = f"Note: User prefers {user_profile['diet_preference']} food. Please identify if items are vegetarian/non-vegetarian. "
+    prompt = f"""
+    You are a food nutrition expert specializing in Indian cuisine and nutrition analysis. Below are {len(inputs)} separate meals, each given as a photo or a text description. Analyze every meal on its own and provide detailed nutrition information.
+    {dietary_context}
+    
+    INDIAN CUISINE EXPERTISE:
+    - Recognize traditional Indian dishes like idli, dosa, paratha, biryani, dal, sabzi, roti, chapati, samosa, etc.
+    - Identify regional variations and traditional cooking methods (tandoor, tawa, steaming, tempering/tadka)
+    - Estimate portions in Indian context (1 cup rice = ~150g, 1 roti = ~30g, 1 dosa = ~60g, 1 idli = ~30g, etc.)
+    - Identify accompaniments (chutney, sambar, pickle, raita, etc.)
+    
+    CLARIFICATION LOGIC: Only set need_clarification to true for a meal whose photo is unclear or whose description is genuinely vague.
+    
+    Provide response in this EXACT JSON format, with exactly {len(inputs)} entries in "meals", in the same order as the meals:
+    {{
+        "meals": [
+            {{
+                "items": [
+                    {{
+                        "name": "Food item name (use proper Indian names when applicable)",
+                        "quantity": "estimated quantity in Indian portions",
+                        "confidence": 75,
+                        "calories": 250,
+                        "protein": 12,
+                        "carbs": 30,
+                        "fat": 8,
+                        "is_vegetarian": true,
+                        "regional_cuisine": "North Indian/South Indian/etc",
+                        "cooking_method": "fried/steamed/grilled/etc"
+                    }}
+                ],
+                "total_calories": 250,
+                "total_protein": 12,
+                "total_carbs": 30,
+                "total_fat": 8,
+                "confidence_overall": 75,
+                "need_clarification": false,
+                "unclear_items": []
+            }}
+        ]
+    }}
+    """
+    
+    parts = [prompt]
+    try:
+        for index, meal in enumerate(inputs, start=1):
+            if isinstance(meal, str):
+                parts.append(f"Meal {index} (description): {meal}")
+                continue
+            if isinstance(meal, Image.Image):
+                meal = preprocess_image(meal, check_quality=False)
+            parts.append(f"Meal {index} (photo):")
+            parts.append(as_image_part(meal))
+    except Exception as e:
+        print(f"Batch analysis input error: {e}")
+        return None
+    
+    try:
+        response = gemini_model.generate_content(parts)
+        # Only meals whose object closed are recovered; a missing one fails the count check below
+        result = parse_structured_output(response.text, AnalysisBatchResponse, partial=True)
+        meals = result.get('meals') if result else None
+        
+        if not isinstance(meals, list) or len(meals) != len(inputs) or not all(isinstance(meal, dict) for meal in meals):
+            print(f"Batch analysis returned {len(meals) if isinstance(meals, list) else 'no'} meals for {len(inputs)} inputs")
+            return None
+        return meals
+        
+    except Exception as e:
+        print(f"Batch analysis error: {e}")
+        return None
+
 def generate_clarifying_questions(analysis_data: Dict[str, Any]) -> List[str]:
     unclear_items = analysis_data.get('unclear_items', [])
     if not unclear_items:
@@ -227,7 +288,7 @@ def refine_analysis_with_answers(original_data: Dict[str, Any], questions: List[
     """
     try:
         response = gemini_model.generate_content([prompt])
-        result = clean_json_response(response.text)
+        result = parse_structured_output(response.text, AnalysisResponse, partial=True)
         return result if result else original_data
     except Exception as e:
         print(f"Refinement error: {e}")
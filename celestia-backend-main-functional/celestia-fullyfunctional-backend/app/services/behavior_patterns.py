@@ -0,0 +1,545 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Dict, Any, List, Optional
+import copy
+import math
+import zlib
+
+from sqlalchemy.orm import Session
+
+from app.models.agentic_models import UserBehaviorPattern
+from app.models.db_models import Meal
+from app.services.health_metrics import calculate_balance_score
+
+PATTERN_TYPES = ['eating_time', 'food_preference', 'calorie_trend', 'macro_balance']
+
+# Meal history replayed to seed the statistics of a user who has none yet
+SEED_DAYS = 14
+
+class RunningStats:
+    """Welford running count, mean and variance, plus min and max"""
+
+    def __init__(self, state: Optional[List[float]] = None):
+        self.count, self.mean, self.m2, self.min, self.max = state or [0, 0.0, 0.0, None, None]
+
+    def push(self, value: float):
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+    def to_state(self) -> List[float]:
+        return [self.count, self.mean, self.m2, self.min, self.max]
+
+class Ewma:
+    """
+    Exponentially weighted mean and variance over roughly the last `span`
+    samples. Early on (fewer than about span / 2 samples) it is the plain
+    running mean, so the first sample doesn't dominate.
+    """
+
+    def __init__(self, span: int, state: Optional[List[float]] = None):
+        self.alpha = 2 / (span + 1)
+        self.count, self.mean, self.var = state or [0, 0.0, 0.0]
+
+    def push(self, value: float):
+        self.count += 1
+        alpha = max(self.alpha, 1 / self.count)
+        diff = value - self.mean
+        increment = alpha * diff
+        self.mean += increment
+        self.var = (1 - alpha) * (self.var + diff * increment)
+
+    @property
+    def std(self) -> float:
+        return math.sqrt(max(self.var, 0.0))
+
+    def to_state(self) -> List[float]:
+        return [self.count, self.mean, self.var]
+
+class CountMinSketch:
+    """
+    Count-min sketch of item frequencies: a fixed depth x width grid of
+    counters, so its size doesn't grow with the number of distinct items.
+    The top_k items by estimated count are tracked alongside it.
+    """
+
+    def __init__(self, width: int = 64, depth: int = 3, top_k: int = 10, state: Optional[Dict[str, Any]] = None):
+        state = state or {}
+        self.width = width
+        self.depth = depth
+        self.top_k = top_k
+        self.rows: List[List[int]] = state.get('rows') or [[0] * width for _ in range(depth)]
+        self.top: Dict[str, int] = dict(state.get('top') or {})
+
+    def _cells(self, item: str):
+        for row in range(self.depth):
+            yield row, zlib.crc32(f"{row}:{item}".encode('utf-8')) % self.width
+
+    def add(self, item: str, count: int = 1) -> int:
+        estimate = None
+        for row, column in self._cells(item):
+            self.rows[row][column] += count
+            value = self.rows[row][column]
+            estimate = value if estimate is None else min(estimate, value)
+
+        if item in self.top or len(self.top) < self.top_k:
+            self.top[item] = estimate
+        else:
+            smallest = min(self.top, key=self.top.get)
+            if estimate > self.top[smallest]:
+                del self.top[smallest]
+                self.top[item] = estimate
+        return estimate
+
+    def estimate(self, item: str) -> int:
+        return min(self.rows[row][column] for row, column in self._cells(item))
+
+    def most_common(self, limit: int) -> List[tuple]:
+        return sorted(self.top.items(), key=lambda x: x[1], reverse=True)[:limit]
+
+    def to_state(self) -> Dict[str, Any]:
+        return {'rows': self.rows, 'top': self.top}
+
+def _meal_foods(analysis_data: Dict[str, Any]) -> List[str]:
+    foods = []
+    for item in (analysis_data or {}).get('items') or []:
+        if isinstance(item, dict):
+            food_name = (item.get('name') or '').lower()
+            if food_name:
+                foods.append(food_name)
+    return foods
+
+def _meal_totals(analysis_data: Dict[str, Any]) -> List[float]:
+    """calories, protein, carbs, fat of a meal (the totals daily summaries are built from)"""
+    totals = []
+    for key in ['total_calories', 'total_protein', 'total_carbs', 'total_fat']:
+        try:
+            totals.append(float((analysis_data or {}).get(key) or 0))
+        except (TypeError, ValueError):
+            totals.append(0.0)
+    return totals
+
+class _DailyTracker:
+    """
+    Accumulates the open day's meals and folds each finished day into the
+    running statistics when the first meal of a later day arrives. Meals
+    logged late for an earlier day count towards the open day.
+    """
+
+    def __init__(self, state: Optional[Dict[str, Any]] = None):
+        state = state or {}
+        self.day: Optional[int] = state.get('day')  # date ordinal of the open day
+        self.open: List[Any] = state.get('open') or self._empty_day()
+        self._load(state)
+
+    def add_meal(self, meal_day: date, meal_time: Optional[datetime], analysis_data: Dict[str, Any]):
+        ordinal = meal_day.toordinal()
+        if self.day is not None and ordinal > self.day:
+            self._close_day()
+        if self.day is None or ordinal > self.day:
+            self.day = ordinal
+        self._add_to_day(meal_time, analysis_data)
+
+    def _close_day(self):
+        self._fold(self.open)
+        self.open = self._empty_day()
+
+    def pattern_data(self) -> Dict[str, Any]:
+        # Read with the open day folded in, leaving this tracker's open day as it is
+        current = type(self)(self.to_state())
+        if current.day is not None:
+            current._close_day()
+        return current._pattern_data()
+
+    def to_state(self) -> Dict[str, Any]:
+        return {'day': self.day, 'open': list(self.open), **self._state()}
+
+class EatingTimeTracker(_DailyTracker):
+    """Usual breakfast, lunch and dinner hours, daily eating window and late meals"""
+
+    SLOTS = {'breakfast': (5, 11), 'lunch': (12, 16), 'dinner': (17, 23)}
+
+    def _empty_day(self) -> List[Any]:
+        return [None, None, 0]  # first hour, last hour, meals
+
+    def _load(self, state: Dict[str, Any]):
+        slots = state.get('slots') or {}
+        self.slots = {slot: Ewma(14, slots.get(slot)) for slot in self.SLOTS}
+        self.window = Ewma(14, state.get('window'))
+        self.per_day = Ewma(14, state.get('per_day'))
+        self.late_share = Ewma(14, state.get('late_share'))
+        self.meals = state.get('meals', 0)
+        self.late_meals = state.get('late_meals', 0)
+
+    def _add_to_day(self, meal_time: Optional[datetime], analysis_data: Dict[str, Any]):
+        if not meal_time:
+            return
+        hour = meal_time.hour
+        for slot, (start, end) in self.SLOTS.items():
+            if start <= hour <= end:
+                self.slots[slot].push(hour)
+        self.late_share.push(1.0 if hour >= 21 else 0.0)
+        self.meals += 1
+        self.late_meals += 1 if hour >= 21 else 0
+
+        first, last, meals = self.open
+        self.open = [hour if first is None else min(first, hour), hour if last is None else max(last, hour), meals + 1]
+
+    def _fold(self, day: List[Any]):
+        first, last, meals = day
+        if meals:
+            self.window.push(last - first)
+            self.per_day.push(meals)
+
+    def _pattern_data(self) -> Dict[str, Any]:
+        if not self.meals:
+            return {}
+
+        def slot_time(slot):
+            return round(self.slots[slot].mean, 1) if self.slots[slot].count else None
+
+        return {
+            'avg_breakfast_time': slot_time('breakfast'),
+            'avg_lunch_time': slot_time('lunch'),
+            'avg_dinner_time': slot_time('dinner'),
+            'eating_window': round(self.window.mean, 1),
+            'meals_per_day': round(self.per_day.mean, 1),
+            'meal_frequency': self.meals,
+            'late_meals': self.late_meals,
+            'late_meal_share': round(self.late_share.mean, 2)
+        }
+
+    def _state(self) -> Dict[str, Any]:
+        return {
+            'slots': {slot: stats.to_state() for slot, stats in self.slots.items()},
+            'window': self.window.to_state(),
+            'per_day': self.per_day.to_state(),
+            'late_share': self.late_share.to_state(),
+            'meals': self.meals,
+            'late_meals': self.late_meals
+        }
+
+class CalorieTrendTracker(_DailyTracker):
+    """Daily calories over logged days: 3-day and 14-day EWMAs and lifetime extremes"""
+
+    def _empty_day(self) -> List[Any]:
+        return [0.0]
+
+    def _load(self, state: Dict[str, Any]):
+        self.recent = Ewma(3, state.get('recent'))
+        self.baseline = Ewma(14, state.get('baseline'))
+        self.lifetime = RunningStats(state.get('lifetime'))
+
+    def _add_to_day(self, meal_time: Optional[datetime], analysis_data: Dict[str, Any]):
+        self.open[0] += _meal_totals(analysis_data)[0]
+
+    def _fold(self, day: List[Any]):
+        calories = day[0]
+        if calories > 0:
+            self.recent.push(calories)
+            self.baseline.push(calories)
+            self.lifetime.push(calories)
+
+    def _pattern_data(self) -> Dict[str, Any]:
+        if self.baseline.count < 3:
+            return {}
+
+        avg_calories = self.baseline.mean
+        recent_avg = self.recent.mean
+
+        trend = 'stable'
+        if recent_avg > avg_calories + 200:
+            trend = 'increasing'
+        elif recent_avg < avg_calories - 200:
+            trend = 'decreasing'
+
+        return {
+            'avg_calories': round(avg_calories, 1),
+            'recent_avg': round(recent_avg, 1),
+            'trend': trend,
+            'variability': round(self.baseline.std, 1),
+            'max_calories': round(self.lifetime.max, 1),
+            'min_calories': round(self.lifetime.min, 1),
+            'days_tracked': self.lifetime.count
+        }
+
+    def _state(self) -> Dict[str, Any]:
+        return {
+            'recent': self.recent.to_state(),
+            'baseline': self.baseline.to_state(),
+            'lifetime': self.lifetime.to_state()
+        }
+
+class MacroBalanceTracker(_DailyTracker):
+    """14-day EWMAs of the daily protein/carb/fat share of calories"""
+
+    def _empty_day(self) -> List[Any]:
+        return [0.0, 0.0, 0.0, 0.0]  # calories, protein, carbs, fat
+
+    def _load(self, state: Dict[str, Any]):
+        self.protein = Ewma(14, state.get('protein'))
+        self.carbs = Ewma(14, state.get('carbs'))
+        self.fat = Ewma(14, state.get('fat'))
+
+    def _add_to_day(self, meal_time: Optional[datetime], analysis_data: Dict[str, Any]):
+        self.open = [total + value for total, value in zip(self.open, _meal_totals(analysis_data))]
+
+    def _fold(self, day: List[Any]):
+        calories, protein, carbs, fat = day
+        if calories > 0:
+            self.protein.push(protein * 4 / calories * 100)
+            self.carbs.push(carbs * 4 / calories * 100)
+            self.fat.push(fat * 9 / calories * 100)
+
+    def _pattern_data(self) -> Dict[str, Any]:
+        if not self.protein.count:
+            return {}
+
+        return {
+            'avg_protein_percent': round(self.protein.mean, 1),
+            'avg_carb_percent': round(self.carbs.mean, 1),
+            'avg_fat_percent': round(self.fat.mean, 1),
+            'protein_consistency': round(self.protein.std, 1),
+            'balance_score': calculate_balance_score(self.protein.mean, self.carbs.mean, self.fat.mean)
+        }
+
+    def _state(self) -> Dict[str, Any]:
+        return {'protein': self.protein.to_state(), 'carbs': self.carbs.to_state(), 'fat': self.fat.to_state()}
+
+class FoodPreferenceTracker:
+    """Cuisine and cooking-method counts and a count-min sketch of food frequencies"""
+
+    def __init__(self, state: Optional[Dict[str, Any]] = None):
+        state = state or {}
+        self.cuisine_types: Dict[str, int] = dict(state.get('cuisines') or {})
+        self.cooking_methods: Dict[str, int] = dict(state.get('methods') or {})
+        self.foods = CountMinSketch(state=state.get('foods'))
+        self.meals = state.get('meals', 0)
+
+    def add_meal(self, meal_day: date, meal_time: Optional[datetime], analysis_data: Dict[str, Any]):
+        self.meals += 1
+        for food_name in _meal_foods(analysis_data):
+            self.foods.add(food_name)
+
+            # Simple cuisine classification
+            if any(word in food_name for word in ['dal', 'curry', 'rice', 'roti', 'sabzi']):
+                self.cuisine_types['indian'] = self.cuisine_types.get('indian', 0) + 1
+            elif any(word in food_name for word in ['pasta', 'pizza', 'bread']):
+                self.cuisine_types['western'] = self.cuisine_types.get('western', 0) + 1
+            elif any(word in food_name for word in ['noodles', 'fried rice']):
+                self.cuisine_types['chinese'] = self.cuisine_types.get('chinese', 0) + 1
+
+            # Cooking methods
+            if any(word in food_name for word in ['fried', 'fry']):
+                self.cooking_methods['fried'] = self.cooking_methods.get('fried', 0) + 1
+            elif any(word in food_name for word in ['steamed', 'boiled']):
+                self.cooking_methods['steamed'] = self.cooking_methods.get('steamed', 0) + 1
+            elif any(word in food_name for word in ['grilled', 'roasted']):
+                self.cooking_methods['grilled'] = self.cooking_methods.get('grilled', 0) + 1
+
+    def pattern_data(self) -> Dict[str, Any]:
+        return {
+            'cuisine_preferences': dict(self.cuisine_types),
+            'cooking_methods': dict(self.cooking_methods),
+            'frequent_foods': [{'food': food, 'count': count} for food, count in self.foods.most_common(5)],
+            'total_meals_analyzed': self.meals
+        }
+
+    def to_state(self) -> Dict[str, Any]:
+        return {
+            'cuisines': self.cuisine_types,
+            'methods': self.cooking_methods,
+            'foods': self.foods.to_state(),
+            'meals': self.meals
+        }
+
+TRACKERS = {
+    'eating_time': EatingTimeTracker,
+    'food_preference': FoodPreferenceTracker,
+    'calorie_trend': CalorieTrendTracker,
+    'macro_balance': MacroBalanceTracker
+}
+
+def calculate_pattern_confidence(pattern_data: Dict[str, Any]) -> float:
+    """Calculate confidence score for a pattern based on data quality"""
+    if not pattern_data:
+        return 0.0
+
+    # Base confidence
+    confidence = 0.5
+
+    # Increase confidence based on data completeness
+    if pattern_data.get('total_meals_analyzed', 0) > 10:
+        confidence += 0.2
+    if pattern_data.get('variability', 0) < 50:  # Low variability = more consistent pattern
+        confidence += 0.2
+    if len(pattern_data) > 3:  # More data points
+        confidence += 0.1
+
+    return min(confidence, 1.0)
+
+class BehaviorPatternState:
+    """The online statistics behind all of a user's behavior patterns"""
+
+    def __init__(self, stats: Optional[Dict[str, Dict[str, Any]]] = None):
+        # Trackers update their state in place; don't touch the loaded JSON values
+        stats = copy.deepcopy(stats or {})
+        self.trackers = {pattern_type: tracker(stats.get(pattern_type)) for pattern_type, tracker in TRACKERS.items()}
+
+    @classmethod
+    def from_meals(cls, meals: List[Meal]) -> 'BehaviorPatternState':
+        """Replay meals in the order they were logged"""
+        state = cls()
+        for meal in sorted(meals, key=lambda m: m.id or 0):
+            state.add_meal(meal)
+        return state
+
+    def add_meal(self, meal: Meal):
+        meal_day = meal.upload_date or (meal.upload_time.date() if meal.upload_time else date.today())
+        for tracker in self.trackers.values():
+            tracker.add_meal(meal_day, meal.upload_time, meal.analysis_data or {})
+
+    def patterns(self) -> Dict[str, Dict[str, Any]]:
+        return {pattern_type: tracker.pattern_data() for pattern_type, tracker in self.trackers.items()}
+
+    def rows(self, user_id: int) -> List[Dict[str, Any]]:
+        """UserBehaviorPattern column values for every pattern"""
+        rows = []
+        for pattern_type, tracker in self.trackers.items():
+            pattern_data = tracker.pattern_data()
+            rows.append({
+                'user_id': user_id,
+                'pattern_type': pattern_type,
+                'pattern_data': pattern_data,
+                'stats': tracker.to_state(),
+                'confidence_score': calculate_pattern_confidence(pattern_data)
+            })
+        return rows
+
+class BehaviorPatternTracker:
+    """
+    Keeps users' behavior patterns current as meals are logged. The online
+    statistics behind each pattern are stored in UserBehaviorPattern.stats;
+    every logged meal updates them in O(1) and rewrites pattern_data, so
+    pattern reads never scan meal history. A user without statistics is
+    seeded once from their recent meals.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.user_locks: Dict[int, Lock] = defaultdict(Lock)
+        self.meals_recorded = 0
+        self.users_seeded = 0
+        self.failures = 0
+
+    def record_meal(self, db: Session, meal: Meal) -> bool:
+        """Fold a newly logged (committed) meal into the user's pattern statistics"""
+        return self.record_meals(db, meal.user_id, [meal])
+
+    def record_meals(self, db: Session, user_id: int, meals: List[Meal]) -> bool:
+        """Fold several newly logged (committed) meals of one user in with a single write"""
+        with self.lock:
+            user_lock = self.user_locks[user_id]
+
+        with user_lock:
+            try:
+                rows = self._load_rows(db, [user_id]).get(user_id, {})
+                if self._has_stats(rows):
+                    state = BehaviorPatternState({pattern_type: rows[pattern_type].stats for pattern_type in PATTERN_TYPES})
+                    for meal in sorted(meals, key=lambda m: m.id or 0):
+                        state.add_meal(meal)
+                    seeded = False
+                else:
+                    # The seed history already includes these meals
+                    state = BehaviorPatternState.from_meals(self._get_seed_meals(db, user_id))
+                    seeded = True
+
+                self._save(db, user_id, state, rows)
+                db.commit()
+
+                with self.lock:
+                    self.meals_recorded += len(meals)
+                    self.users_seeded += 1 if seeded else 0
+                return True
+
+            except Exception as e:
+                print(f"Error updating behavior patterns: {e}")
+                db.rollback()
+                with self.lock:
+                    self.failures += 1
+                return False
+
+    def rebuild(self, db: Session, user_id: int, days: int = SEED_DAYS) -> Dict[str, Dict[str, Any]]:
+        """Recompute a user's statistics from their recent meals"""
+        with self.lock:
+            user_lock = self.user_locks[user_id]
+
+        with user_lock:
+            try:
+                state = BehaviorPatternState.from_meals(self._get_seed_meals(db, user_id, days))
+                self._save(db, user_id, state, self._load_rows(db, [user_id]).get(user_id, {}))
+                db.commit()
+                return state.patterns()
+            except Exception as e:
+                print(f"Error rebuilding behavior patterns: {e}")
+                db.rollback()
+                return {}
+
+    def load_patterns(self, db: Session, user_ids: List[int]) -> Dict[int, Dict[str, Dict[str, Any]]]:
+        """Stored pattern_data for users whose patterns are maintained incrementally"""
+        return {
+            user_id: {pattern_type: rows[pattern_type].pattern_data or {} for pattern_type in PATTERN_TYPES}
+            for user_id, rows in self._load_rows(db, user_ids).items()
+            if self._has_stats(rows)
+        }
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'meals_recorded': self.meals_recorded,
+                'users_seeded': self.users_seeded,
+                'failures': self.failures
+            }
+
+    def _has_stats(self, rows: Dict[str, UserBehaviorPattern]) -> bool:
+        return all(pattern_type in rows and rows[pattern_type].stats for pattern_type in PATTERN_TYPES)
+
+    def _load_rows(self, db: Session, user_ids: List[int]) -> Dict[int, Dict[str, UserBehaviorPattern]]:
+        rows_by_user: Dict[int, Dict[str, UserBehaviorPattern]] = defaultdict(dict)
+        for start in range(0, len(user_ids), 500):
+            # Oldest first, so the newest row wins if a pattern was ever stored twice
+            for row in db.query(UserBehaviorPattern).filter(
+                UserBehaviorPattern.user_id.in_(user_ids[start:start + 500])
+            ).order_by(UserBehaviorPattern.id).all():
+                rows_by_user[row.user_id][row.pattern_type] = row
+        return rows_by_user
+
+    def _get_seed_meals(self, db: Session, user_id: int, days: int = SEED_DAYS) -> List[Meal]:
+        cutoff = date.today() - timedelta(days=days)
+        return db.query(Meal).filter(
+            Meal.user_id == user_id,
+            Meal.upload_date >= cutoff
+        ).order_by(Meal.id).all()
+
+    def _save(self, db: Session, user_id: int, state: BehaviorPatternState, rows: Dict[str, UserBehaviorPattern]):
+        now = datetime.now()
+        for values in state.rows(user_id):
+            row = rows.get(values['pattern_type'])
+            if row is None:
+                db.add(UserBehaviorPattern(**values))
+                continue
+            row.pattern_data = values['pattern_data']
+            row.stats = values['stats']
+            row.confidence_score = values['confidence_score']
+            row.last_updated = now
+
+# Global behavior pattern tracker instance
+behavior_pattern_tracker = BehaviorPatternTracker()
@@ -1,16 +1,26 @@
 from datetime import datetime, timedelta
 from typing import Dict, Any, List, Optional
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_, or_
+from sqlalchemy import desc, and_, or_, func
+from app.config import settings
 from app.models.agentic_models import ConversationMemory
+from app.services.conversation_search import conversation_search_index
+from app.services.conversation_summarizer import conversation_summarizer, SUMMARY_MESSAGE_TYPES
+from app.services.memory_embeddings import memory_vector_index, vector_to_bytes, EMBEDDING_STOP_WORDS
+from collections import Counter
 import json
+import re
 import uuid
 
+# Rows the service writes itself rather than chat messages; never pruned as messages
+DERIVED_MESSAGE_TYPES = ('digest',) + SUMMARY_MESSAGE_TYPES
+
 class ConversationMemoryService:
     def __init__(self, db: Session):
         self.db = db
         self.max_memory_per_session = 50  # Maximum messages to keep per session
         self.memory_retention_days = 30  # Days to keep conversation memory
+        self.digest_retention_days = settings.memory_digest_retention_days  # Days to keep session digests
     
     def create_session_id(self) -> str:
         """Generate a unique session ID"""
@@ -28,6 +38,7 @@ class ConversationMemoryService:
         try:
             # Calculate importance score based on content and context
             importance_score = self._calculate_importance_score(content, context_data or {})
+            embedding = memory_vector_index.embed_text(content)
             
             memory = ConversationMemory(
                 user_id=user_id,
@@ -35,6 +46,7 @@ class ConversationMemoryService:
                 message_type=message_type,
                 content=content,
                 context_data=context_data or {},
+                embedding=vector_to_bytes(embedding),
                 importance_score=importance_score
             )
             
@@ -42,8 +54,8 @@ class ConversationMemoryService:
             self.db.commit()
             self.db.refresh(memory)
             
-            # Clean up old memories to maintain performance
-            self._cleanup_old_memories(user_id, session_id)
+            memory_vector_index.add_memory(user_id, memory.id, embedding, memory.created_at)
+            conversation_summarizer.note_message(user_id, session_id)
             
             return memory
             
@@ -63,9 +75,10 @@ class ConversationMemoryService:
             memories = self.db.query(ConversationMemory).filter(
                 and_(
                     ConversationMemory.user_id == user_id,
-                    ConversationMemory.session_id == session_id
+                    ConversationMemory.session_id == session_id,
+                    ~ConversationMemory.message_type.in_(SUMMARY_MESSAGE_TYPES)
                 )
-            ).order_by(ConversationMemory.created_at.desc()).limit(limit).all()
+            ).order_by(ConversationMemory.created_at.desc(), ConversationMemory.id.desc()).limit(limit).all()
             
             # Reverse to get chronological order
             memories.reverse()
@@ -90,31 +103,39 @@ class ConversationMemoryService:
         self, 
         user_id: int, 
         current_context: Dict[str, Any] = None,
-        limit: int = 10
+        limit: int = 10,
+        query_text: Optional[str] = None,
+        exclude_ids: Optional[List[int]] = None
     ) -> List[Dict[str, Any]]:
         """Retrieve relevant conversation memories based on current context"""
         try:
-            # Get recent high-importance memories
-            base_query = self.db.query(ConversationMemory).filter(
-                ConversationMemory.user_id == user_id
-            )
-            
-            # Filter by recency and importance
             cutoff_date = datetime.now() - timedelta(days=self.memory_retention_days)
-            memories = base_query.filter(
+            
+            # With something to match against, rank memories by embedding similarity
+            semantic_query = self._build_semantic_query(query_text, current_context or {})
+            if semantic_query:
+                # Over-fetch a little: summary rows are injected separately and skipped here
+                ranked = memory_vector_index.search(
+                    self.db, user_id, semantic_query, k=limit + 2, since=cutoff_date, exclude_ids=exclude_ids
+                )
+                if ranked:
+                    return self._load_ranked_memories(user_id, ranked)[:limit]
+            
+            # Otherwise fall back to recent high-importance memories
+            memories = self.db.query(ConversationMemory).filter(
                 and_(
+                    ConversationMemory.user_id == user_id,
                     ConversationMemory.created_at >= cutoff_date,
-                    ConversationMemory.importance_score >= 0.3  # Only moderately important memories
+                    ConversationMemory.importance_score >= 0.3,  # Only moderately important memories
+                    ~ConversationMemory.message_type.in_(SUMMARY_MESSAGE_TYPES)
                 )
-            ).order_by(
+            )
+            if exclude_ids:
+                memories = memories.filter(~ConversationMemory.id.in_(exclude_ids))
+            memories = memories.order_by(
                 desc(ConversationMemory.importance_score),
                 desc(ConversationMemory.created_at)
-            ).limit(limit * 2).all()  # Get more to filter contextually
-            
-            # If current context is provided, filter for relevance
-            if current_context:
-                relevant_memories = self._filter_by_context_relevance(memories, current_context)
-                return relevant_memories[:limit]
+            ).limit(limit).all()
             
             return [
                 {
@@ -126,22 +147,105 @@ class ConversationMemoryService:
                     'created_at': memory.created_at.isoformat(),
                     'session_id': memory.session_id
                 }
-                for memory in memories[:limit]
+                for memory in memories
             ]
             
         except Exception as e:
             print(f"Error retrieving contextual memory: {e}")
             return []
     
+    def _build_semantic_query(self, query_text: Optional[str], current_context: Dict[str, Any]) -> str:
+        """Combine the current message with foods being analysed and the user's goals"""
+        parts = [query_text or '']
+        
+        if current_context.get('current_analysis'):
+            parts.extend(
+                item.get('name', '') for item in current_context['current_analysis'].get('items', [])
+            )
+        
+        goals = current_context.get('user_context', {}).get('goals')
+        if isinstance(goals, list):
+            parts.extend(goal for goal in goals if isinstance(goal, str))
+        
+        return " ".join(part for part in parts if part).strip()
+    
+    def _load_ranked_memories(self, user_id: int, ranked: List[tuple]) -> List[Dict[str, Any]]:
+        """Fetch memories for (id, similarity) pairs, keeping their order"""
+        memories = {
+            memory.id: memory for memory in self.db.query(ConversationMemory).filter(
+                ConversationMemory.id.in_([memory_id for memory_id, _ in ranked])
+            ).all()
+        }
+        
+        # Memories deleted by another worker drop out of the index as they are found
+        stale = [memory_id for memory_id, _ in ranked if memory_id not in memories]
+        if stale:
+            memory_vector_index.remove_memories(user_id, stale)
+        
+        return [
+            {
+                'id': memory.id,
+                'message_type': memory.message_type,
+                'content': memory.content,
+                'context_data': memory.context_data,
+                'importance_score': memory.importance_score,
+                'created_at': memory.created_at.isoformat(),
+                'session_id': memory.session_id,
+                'relevance_score': similarity
+            }
+            for memory_id, similarity in ranked
+            for memory in [memories.get(memory_id)]
+            if memory and memory.message_type not in SUMMARY_MESSAGE_TYPES
+        ]
+    
     def search_conversation_history(
         self, 
         user_id: int, 
         search_query: str, 
         limit: int = 10
     ) -> List[Dict[str, Any]]:
-        """Search through conversation history using keywords"""
+        """Search through conversation history using the full-text index"""
+        try:
+            ranked = conversation_search_index.search(self.db, user_id, search_query, limit)
+            if ranked is None:
+                return self._search_conversation_history_linear(user_id, search_query, limit)
+            if not ranked:
+                return []
+            
+            memories = {
+                memory.id: memory for memory in self.db.query(ConversationMemory).filter(
+                    ConversationMemory.id.in_([memory_id for memory_id, _ in ranked])
+                ).all()
+            }
+            
+            return [
+                {
+                    'id': memory.id,
+                    'message_type': memory.message_type,
+                    'content': memory.content,
+                    'context_data': memory.context_data,
+                    'importance_score': memory.importance_score,
+                    'created_at': memory.created_at.isoformat(),
+                    'session_id': memory.session_id,
+                    'relevance_score': score
+                }
+                for memory_id, score in ranked
+                for memory in [memories.get(memory_id)]
+                if memory
+            ]
+            
+        except Exception as e:
+            print(f"Error searching conversation history: {e}")
+            return []
+    
+    def _search_conversation_history_linear(
+        self, 
+        user_id: int, 
+        search_query: str, 
+        limit: int = 10
+    ) -> List[Dict[str, Any]]:
+        """Keyword scan over every memory, used when no full-text index is available"""
         try:
-            # Simple text search (can be enhanced with full-text search later)
             search_terms = search_query.lower().split()
             
             memories = self.db.query(ConversationMemory).filter(
@@ -310,106 +414,176 @@ class ConversationMemoryService:
         # Cap the score at 1.0
         return min(score, 1.0)
     
-    def _filter_by_context_relevance(
-        self, 
-        memories: List[ConversationMemory], 
-        current_context: Dict[str, Any]
-    ) -> List[Dict[str, Any]]:
-        """Filter memories by relevance to current context"""
-        relevant_memories = []
-        
-        # Extract current context keywords
-        current_keywords = set()
-        
-        if current_context.get('current_analysis'):
-            items = current_context['current_analysis'].get('items', [])
-            for item in items:
-                food_name = item.get('name', '').lower()
-                current_keywords.update(food_name.split())
-        
-        if current_context.get('user_context', {}).get('goals'):
-            for goal in current_context['user_context']['goals']:
-                current_keywords.update(goal.lower().split())
-        
-        for memory in memories:
-            relevance_score = 0
-            
-            # Check content relevance
-            memory_content = memory.content.lower()
-            memory_context = json.dumps(memory.context_data).lower()
-            
-            for keyword in current_keywords:
-                if keyword in memory_content:
-                    relevance_score += 2
-                if keyword in memory_context:
-                    relevance_score += 1
-            
-            # Include if relevant or high importance
-            if relevance_score > 0 or memory.importance_score >= 0.7:
-                relevant_memories.append({
-                    'id': memory.id,
-                    'message_type': memory.message_type,
-                    'content': memory.content,
-                    'context_data': memory.context_data,
-                    'importance_score': memory.importance_score,
-                    'created_at': memory.created_at.isoformat(),
-                    'session_id': memory.session_id,
-                    'relevance_score': relevance_score
-                })
-        
-        # Sort by relevance and importance
-        relevant_memories.sort(
-            key=lambda x: (x['relevance_score'], x['importance_score']), 
-            reverse=True
-        )
-        
-        return relevant_memories
-    
-    def _cleanup_old_memories(self, user_id: int, session_id: str):
-        """Clean up old memories to maintain performance"""
+    def compact_memories(self, user_id: Optional[int] = None, retention_days: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Prune expired memories and trim oversized sessions with set-based deletes.
+        Everything removed from a session is folded into that session's digest row.
+        Runs from the scheduler (and /agentic/cleanup), never on the chat write path.
+        """
         try:
-            # Remove very old memories
-            cutoff_date = datetime.now() - timedelta(days=self.memory_retention_days)
-            old_memories = self.db.query(ConversationMemory).filter(
-                and_(
-                    ConversationMemory.user_id == user_id,
-                    ConversationMemory.created_at < cutoff_date
-                )
-            ).all()
+            now = datetime.now()
+            cutoff_date = now - timedelta(days=retention_days or self.memory_retention_days)
+            
+            def scoped(query):
+                return query.filter(ConversationMemory.user_id == user_id) if user_id else query
             
-            for memory in old_memories:
-                self.db.delete(memory)
+            columns = (
+                ConversationMemory.id, ConversationMemory.user_id, ConversationMemory.session_id,
+                ConversationMemory.message_type, ConversationMemory.content,
+                ConversationMemory.importance_score, ConversationMemory.created_at
+            )
             
-            # Limit memories per session
-            session_memories = self.db.query(ConversationMemory).filter(
+            # Messages past the retention cutoff (a session's newer messages stay)
+            pruned = scoped(self.db.query(*columns)).filter(
                 and_(
-                    ConversationMemory.user_id == user_id,
-                    ConversationMemory.session_id == session_id
+                    ConversationMemory.created_at < cutoff_date,
+                    ~ConversationMemory.message_type.in_(DERIVED_MESSAGE_TYPES)
                 )
-            ).order_by(desc(ConversationMemory.created_at)).all()
-            
-            if len(session_memories) > self.max_memory_per_session:
-                # Keep high importance memories and recent ones
-                to_keep = []
-                to_delete = []
-                
-                for memory in session_memories:
-                    if len(to_keep) < self.max_memory_per_session:
-                        if memory.importance_score >= 0.5 or len(to_keep) < self.max_memory_per_session // 2:
-                            to_keep.append(memory)
-                        else:
-                            to_delete.append(memory)
-                    else:
-                        to_delete.append(memory)
+            ).all()
+            pruned_ids = {row.id for row in pruned}
+            
+            # Sessions over the size limit keep their recent and important messages
+            oversized = scoped(self.db.query(
+                ConversationMemory.user_id, ConversationMemory.session_id
+            )).filter(
+                ~ConversationMemory.message_type.in_(DERIVED_MESSAGE_TYPES)
+            ).group_by(
+                ConversationMemory.user_id, ConversationMemory.session_id
+            ).having(func.count(ConversationMemory.id) > self.max_memory_per_session).all()
+            
+            for session_user_id, session_id in oversized:
+                session_rows = self.db.query(*columns).filter(
+                    and_(
+                        ConversationMemory.user_id == session_user_id,
+                        ConversationMemory.session_id == session_id,
+                        ~ConversationMemory.message_type.in_(DERIVED_MESSAGE_TYPES)
+                    )
+                ).order_by(desc(ConversationMemory.created_at)).all()
                 
-                for memory in to_delete:
-                    self.db.delete(memory)
+                kept = 0
+                for row in session_rows:
+                    if kept < self.max_memory_per_session and (
+                        row.importance_score >= 0.5 or kept < self.max_memory_per_session // 2
+                    ):
+                        kept += 1
+                    elif row.id not in pruned_ids:
+                        pruned.append(row)
+                        pruned_ids.add(row.id)
+            
+            # One digest per session summarizing everything pruned from it
+            by_session: Dict[tuple, List[Any]] = {}
+            for row in pruned:
+                by_session.setdefault((row.user_id, row.session_id), []).append(row)
+            
+            for (session_user_id, session_id), rows in by_session.items():
+                self._upsert_session_digest(session_user_id, session_id, rows)
+            
+            # Deleted by id in chunks of 500, regardless of session
+            ids = sorted(pruned_ids)
+            for start in range(0, len(ids), 500):
+                self.db.query(ConversationMemory).filter(
+                    ConversationMemory.id.in_(ids[start:start + 500])
+                ).delete(synchronize_session=False)
+            
+            # Digests and session summaries outlive the messages they cover, but not forever
+            expired_digests = scoped(self.db.query(ConversationMemory.id, ConversationMemory.user_id)).filter(
+                and_(
+                    ConversationMemory.message_type.in_(['digest', 'session_summary']),
+                    ConversationMemory.created_at < now - timedelta(days=self.digest_retention_days)
+                )
+            ).all()
+            if expired_digests:
+                self.db.query(ConversationMemory).filter(
+                    ConversationMemory.id.in_([row.id for row in expired_digests])
+                ).delete(synchronize_session=False)
             
             self.db.commit()
             
+            # Rebuilt lazily from the stored vectors, picking up new and rewritten digests
+            for affected_user_id in {row.user_id for row in pruned + expired_digests}:
+                memory_vector_index.invalidate(affected_user_id)
+            for session_user_id, session_id in by_session:
+                conversation_summarizer.forget_session(session_user_id, session_id)
+            
+            return {
+                'memories_deleted': len(ids),
+                'sessions_digested': len(by_session),
+                'digests_expired': len(expired_digests)
+            }
+            
         except Exception as e:
-            print(f"Error cleaning up memories: {e}")
+            print(f"Error compacting memories: {e}")
             self.db.rollback()
+            return {'error': str(e)}
+    
+    def _upsert_session_digest(self, user_id: int, session_id: str, rows: List[Any]):
+        """Merge pruned messages into the session's digest row, creating it if needed"""
+        digest = self.db.query(ConversationMemory).filter(
+            and_(
+                ConversationMemory.user_id == user_id,
+                ConversationMemory.session_id == session_id,
+                ConversationMemory.message_type == 'digest'
+            )
+        ).first()
+        previous = digest.context_data if digest and digest.context_data else {}
+        
+        topic_counts = Counter(previous.get('topic_counts', {}))
+        for row in rows:
+            if row.message_type == 'user':
+                topic_counts.update(
+                    word for word in re.findall(r"[a-z]+", (row.content or "").lower())
+                    if len(word) > 3 and word not in EMBEDDING_STOP_WORDS
+                )
+        topic_counts = Counter(dict(topic_counts.most_common(20)))
+        
+        highlights = previous.get('highlights', []) + [
+            {
+                'text': re.split(r"(?<=[.!?])\s", (row.content or "").strip())[0][:160],
+                'importance': row.importance_score or 0.0
+            }
+            for row in rows if row.message_type == 'user' and row.content
+        ]
+        highlights = sorted(highlights, key=lambda item: item['importance'], reverse=True)[:5]
+        
+        times = [row.created_at for row in rows if row.created_at] or [datetime.now()]
+        for key in ('first_message_at', 'last_message_at'):
+            if previous.get(key):
+                times.append(datetime.fromisoformat(previous[key]))
+        first_at, last_at = min(times), max(times)
+        message_count = previous.get('message_count', 0) + len(rows)
+        
+        topics = [word for word, _ in topic_counts.most_common(8)]
+        content = f"Earlier conversation ({message_count} messages, {first_at:%b %d} - {last_at:%b %d})."
+        if topics:
+            content += f" Topics: {', '.join(topics)}."
+        if highlights:
+            content += " User said: " + "; ".join(f'"{item["text"]}"' for item in highlights)
+        
+        context_data = {
+            'digest': True,
+            'message_count': message_count,
+            'first_message_at': first_at.isoformat(),
+            'last_message_at': last_at.isoformat(),
+            'topic_counts': dict(topic_counts),
+            'highlights': highlights
+        }
+        
+        embedding = vector_to_bytes(memory_vector_index.embed_text(content))
+        if digest:
+            digest.content = content
+            digest.context_data = context_data
+            digest.embedding = embedding
+            digest.created_at = datetime.now()
+        else:
+            self.db.add(ConversationMemory(
+                user_id=user_id,
+                session_id=session_id,
+                message_type='digest',
+                content=content,
+                context_data=context_data,
+                embedding=embedding,
+                importance_score=0.8
+            ))
     
     def update_memory_importance(self, memory_id: int, new_importance: float):
         """Update the importance score of a specific memory"""
@@ -0,0 +1,166 @@
+from datetime import datetime
+from typing import List, Optional, Tuple
+import math
+import re
+
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Session
+
+# Blend weights for text relevance, stored importance and recency
+RELEVANCE_WEIGHT = 0.6
+IMPORTANCE_WEIGHT = 0.25
+RECENCY_WEIGHT = 0.15
+RECENCY_HALF_LIFE_DAYS = 14
+
+SQLITE_SCHEMA = [
+    # user_key holds "u<user_id>" so the per-user filter is part of the FTS match itself
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS conversation_memory_fts USING fts5(
+        content, context, user_key, tokenize = 'porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversation_memory_fts_insert
+    AFTER INSERT ON conversation_memory BEGIN
+        INSERT INTO conversation_memory_fts (rowid, content, context, user_key)
+        VALUES (NEW.id, NEW.content, COALESCE(NEW.context_data, ''), 'u' || NEW.user_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversation_memory_fts_delete
+    AFTER DELETE ON conversation_memory BEGIN
+        DELETE FROM conversation_memory_fts WHERE rowid = OLD.id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS conversation_memory_fts_update
+    AFTER UPDATE OF content, context_data ON conversation_memory BEGIN
+        DELETE FROM conversation_memory_fts WHERE rowid = OLD.id;
+        INSERT INTO conversation_memory_fts (rowid, content, context, user_key)
+        VALUES (NEW.id, NEW.content, COALESCE(NEW.context_data, ''), 'u' || NEW.user_id);
+    END
+    """,
+    # Backfill rows written before the index existed
+    """
+    INSERT INTO conversation_memory_fts (rowid, content, context, user_key)
+    SELECT id, content, COALESCE(context_data, ''), 'u' || user_id FROM conversation_memory
+    WHERE id NOT IN (SELECT rowid FROM conversation_memory_fts)
+    """,
+]
+
+POSTGRES_SCHEMA = [
+    # Content outranks context data, mirroring the old 2:1 substring weights
+    """
+    ALTER TABLE conversation_memory ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('english', coalesce(content, '')), 'A') ||
+        setweight(to_tsvector('english', coalesce(context_data::text, '')), 'B')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_conversation_memory_search_vector ON conversation_memory USING GIN (search_vector)",
+    "CREATE INDEX IF NOT EXISTS ix_conversation_memory_user_created ON conversation_memory (user_id, created_at)",
+]
+
+class ConversationSearchIndex:
+    """
+    Full-text index over ConversationMemory. Uses SQLite FTS5 or a PostgreSQL
+    tsvector/GIN column depending on the database, kept in sync by the database
+    itself (FTS5 triggers / generated column) whenever a memory is stored or deleted.
+    """
+
+    def __init__(self):
+        self.backend: Optional[str] = None
+
+    def ensure_schema(self, engine: Engine):
+        """Create the full-text structures; safe to call on every startup"""
+        dialect = engine.dialect.name
+        statements = SQLITE_SCHEMA if dialect == 'sqlite' else POSTGRES_SCHEMA if dialect == 'postgresql' else []
+
+        if not statements:
+            print(f"Conversation full-text search not supported on {dialect}; using linear search")
+            return
+
+        try:
+            with engine.begin() as conn:
+                for statement in statements:
+                    conn.execute(text(statement))
+            self.backend = dialect
+        except Exception as e:
+            print(f"Conversation full-text index unavailable, using linear search: {e}")
+            self.backend = None
+
+    @property
+    def available(self) -> bool:
+        return self.backend is not None
+
+    def search(self, db: Session, user_id: int, query: str, limit: int = 10) -> Optional[List[Tuple[int, float]]]:
+        """
+        Return (memory_id, blended_score) pairs, best first, or None when the
+        index is unavailable and the caller should fall back to a scan.
+        """
+        if not self.available:
+            return None
+
+        terms = re.findall(r"[a-z0-9]+", query.lower())
+        if not terms:
+            return []
+
+        # Rank a bounded candidate pool by text relevance, then blend in importance and recency
+        pool_size = max(limit * 5, 25)
+        try:
+            if self.backend == 'sqlite':
+                rows = self._search_sqlite(db, user_id, terms, pool_size)
+            else:
+                rows = self._search_postgres(db, user_id, terms, pool_size)
+        except Exception as e:
+            print(f"Full-text conversation search failed: {e}")
+            return None
+
+        if not rows:
+            return []
+
+        max_relevance = max(row[1] for row in rows) or 1.0
+        now = datetime.now()
+        scored = []
+        for memory_id, relevance, importance, created_at in rows:
+            if isinstance(created_at, str):
+                created_at = datetime.fromisoformat(created_at)
+            age_days = max((now - created_at).total_seconds() / 86400, 0) if created_at else 0
+            recency = math.pow(0.5, age_days / RECENCY_HALF_LIFE_DAYS)
+            score = (
+                RELEVANCE_WEIGHT * (relevance / max_relevance)
+                + IMPORTANCE_WEIGHT * (importance or 0.0)
+                + RECENCY_WEIGHT * recency
+            )
+            scored.append((memory_id, round(score, 4)))
+
+        scored.sort(key=lambda item: item[1], reverse=True)
+        return scored[:limit]
+
+    def _search_sqlite(self, db: Session, user_id: int, terms: List[str], pool_size: int):
+        match = f'user_key:"u{user_id}" AND {{content context}}: ({" OR ".join(f"{term}*" for term in terms)})'
+        # bm25() is lower-is-better; column weights favour content over context
+        result = db.execute(text("""
+            SELECT m.id, -bm25(conversation_memory_fts, 2.0, 1.0, 0.0) AS relevance,
+                   m.importance_score, m.created_at
+            FROM conversation_memory_fts
+            JOIN conversation_memory m ON m.id = conversation_memory_fts.rowid
+            WHERE conversation_memory_fts MATCH :match
+            ORDER BY bm25(conversation_memory_fts, 2.0, 1.0, 0.0)
+            LIMIT :pool_size
+        """), {'match': match, 'pool_size': pool_size})
+        return result.fetchall()
+
+    def _search_postgres(self, db: Session, user_id: int, terms: List[str], pool_size: int):
+        result = db.execute(text("""
+            SELECT id, ts_rank_cd(search_vector, query) AS relevance, importance_score, created_at
+            FROM conversation_memory, to_tsquery('english', :tsquery) AS query
+            WHERE user_id = :user_id AND search_vector @@ query
+            ORDER BY relevance DESC
+            LIMIT :pool_size
+        """), {'tsquery': " | ".join(f"{term}:*" for term in terms), 'user_id': user_id, 'pool_size': pool_size})
+        return result.fetchall()
+
+# Global conversation search index instance
+conversation_search_index = ConversationSearchIndex()
@@ -0,0 +1,342 @@
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from threading import Lock
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+import re
+
+import google.generativeai as genai
+from sqlalchemy import and_
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.agentic_models import ConversationMemory
+from app.services.memory_embeddings import EMBEDDING_STOP_WORDS, memory_vector_index, vector_to_bytes
+
+logger = logging.getLogger(__name__)
+
+genai.configure(api_key=settings.google_api_key)
+summary_model = genai.GenerativeModel("models/gemini-2.0-flash")
+
+SUMMARY_MESSAGE_TYPES = ('session_summary', 'user_summary')
+# user_summary rows are not tied to a chat session
+USER_SUMMARY_SESSION = '__user__'
+
+SESSION_SUMMARY_WORDS = 120
+USER_SUMMARY_WORDS = 150
+
+SESSION_SUMMARY_PROMPT = """You maintain a running summary of a conversation between a user and their AI health coach.
+
+Current summary:
+{previous}
+
+New messages:
+{messages}
+
+Rewrite the summary in at most {max_words} words of plain text. Keep what matters for future coaching:
+the user's goals, preferences, allergies, health concerns, questions asked, advice given and decisions made.
+Drop greetings and small talk."""
+
+USER_SUMMARY_PROMPT = """You maintain a long-term profile of a user built from their conversations with an AI health coach.
+
+Current long-term summary:
+{previous}
+
+Latest session summary:
+{session}
+
+Merge them into an updated long-term summary of at most {max_words} words of plain text.
+Prefer durable facts (goals, preferences, allergies, recurring concerns, what has and hasn't worked)
+over details of a single conversation."""
+
+class ConversationSummarizer:
+    """
+    Rolling, hierarchical summaries of conversation memory. Every N messages a
+    session's summary is extended with just the new messages, and the user-level
+    summary is folded forward from it. Both live in ConversationMemory rows
+    (session_summary / user_summary) and are generated in the background;
+    chat reads the cached text so per-turn prompt cost stays flat. Cached text
+    is kept for the max_users most recently active users; a session's state
+    is dropped once compaction has folded it into a digest.
+    """
+
+    def __init__(self, every_messages: int = 10, max_workers: int = 1, max_users: int = 1000):
+        self.every_messages = every_messages
+        self.max_workers = max_workers
+        self.max_users = max_users
+        # Sessions with an unsummarized message count, oldest first
+        self.max_pending = max_users * 10
+        self.executor = None
+        self.lock = Lock()
+        # (user_id, session_id) -> messages stored since the last summary request
+        self.pending: 'OrderedDict[Tuple[int, str], int]' = OrderedDict()
+        self.in_flight: set = set()
+        # user_id -> {'user_summary': str, 'sessions': {session_id: str}}, least recently used first
+        self.cache: 'OrderedDict[int, Dict[str, Any]]' = OrderedDict()
+        self.runs = 0
+        self.extractive_fallbacks = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="conversation-summary"
+            )
+        return self.executor
+
+    def note_message(self, user_id: int, session_id: str):
+        """Count a stored message; queue a summary update once the session crosses the threshold"""
+        key = (user_id, session_id)
+        with self.lock:
+            self.pending[key] = self.pending.get(key, 0) + 1
+            self.pending.move_to_end(key)
+            while len(self.pending) > self.max_pending:
+                self.pending.popitem(last=False)
+            if self.pending[key] < self.every_messages or key in self.in_flight:
+                return
+            self.pending[key] = 0
+            self.in_flight.add(key)
+
+        try:
+            self._get_executor().submit(self._run, user_id, session_id)
+        except RuntimeError as e:
+            # Executor already shut down
+            logger.warning(f"Conversation summarizer unavailable for user {user_id}: {e}")
+            with self.lock:
+                self.in_flight.discard(key)
+
+    def get_summaries(self, db: Session, user_id: int, session_id: Optional[str] = None) -> Dict[str, Optional[str]]:
+        """Cached user-level and session-level summary text (None where not generated yet)"""
+        with self.lock:
+            cached = self.cache.get(user_id)
+            if cached is not None:
+                self.cache.move_to_end(user_id)
+            if cached is not None and (session_id is None or session_id in cached['sessions']):
+                return {
+                    'user_summary': cached['user_summary'],
+                    'session_summary': cached['sessions'].get(session_id) if session_id else None
+                }
+
+        sessions = [USER_SUMMARY_SESSION] + ([session_id] if session_id else [])
+        rows = db.query(ConversationMemory.session_id, ConversationMemory.content).filter(
+            and_(
+                ConversationMemory.user_id == user_id,
+                ConversationMemory.message_type.in_(SUMMARY_MESSAGE_TYPES),
+                ConversationMemory.session_id.in_(sessions)
+            )
+        ).all()
+        found = {row.session_id: row.content for row in rows}
+
+        with self.lock:
+            cached = self._cache_entry(user_id)
+            cached['user_summary'] = found.get(USER_SUMMARY_SESSION)
+            if session_id:
+                cached['sessions'][session_id] = found.get(session_id)
+
+        return {
+            'user_summary': found.get(USER_SUMMARY_SESSION),
+            'session_summary': found.get(session_id) if session_id else None
+        }
+
+    def summarize_session(self, db: Session, user_id: int, session_id: str, force: bool = False) -> bool:
+        """
+        Extend a session's summary with the messages stored since it was last
+        updated, then fold it into the user summary. Returns False when there
+        was not enough new conversation to summarize.
+        """
+        session_row = self._get_summary_row(db, user_id, 'session_summary', session_id)
+        previous_context = session_row.context_data if session_row and session_row.context_data else {}
+        through_id = previous_context.get('summarized_through_id', 0)
+
+        new_messages = db.query(ConversationMemory).filter(
+            and_(
+                ConversationMemory.user_id == user_id,
+                ConversationMemory.session_id == session_id,
+                ConversationMemory.message_type.in_(['user', 'agent']),
+                ConversationMemory.id > through_id
+            )
+        ).order_by(ConversationMemory.id).limit(200).all()
+
+        if not new_messages or (len(new_messages) < self.every_messages and not force):
+            return False
+
+        session_summary = self._generate(
+            SESSION_SUMMARY_PROMPT.format(
+                previous=session_row.content if session_row else "(none yet)",
+                messages=self._format_messages(new_messages),
+                max_words=SESSION_SUMMARY_WORDS
+            ),
+            fallback=lambda: self._fallback_summary(
+                session_row.content if session_row else "", new_messages, SESSION_SUMMARY_WORDS
+            )
+        )
+        self._save_summary_row(db, session_row, user_id, 'session_summary', session_id, session_summary, {
+            'summarized_through_id': new_messages[-1].id,
+            'message_count': previous_context.get('message_count', 0) + len(new_messages),
+            'updated_at': datetime.now().isoformat()
+        })
+
+        user_row = self._get_summary_row(db, user_id, 'user_summary', USER_SUMMARY_SESSION)
+        user_context = user_row.context_data if user_row and user_row.context_data else {}
+        user_summary = self._generate(
+            USER_SUMMARY_PROMPT.format(
+                previous=user_row.content if user_row else "(none yet)",
+                session=session_summary,
+                max_words=USER_SUMMARY_WORDS
+            ),
+            fallback=lambda: self._trim_words(
+                f"{user_row.content if user_row else ''} {session_summary}".strip(), USER_SUMMARY_WORDS
+            )
+        )
+        self._save_summary_row(db, user_row, user_id, 'user_summary', USER_SUMMARY_SESSION, user_summary, {
+            'sessions_folded': user_context.get('sessions_folded', 0) + 1,
+            'updated_at': datetime.now().isoformat()
+        })
+
+        db.commit()
+
+        with self.lock:
+            cached = self._cache_entry(user_id)
+            cached['user_summary'] = user_summary
+            cached['sessions'][session_id] = session_summary
+            self.runs += 1
+
+        return True
+
+    def forget_session(self, user_id: int, session_id: str):
+        """Drop a session's cached summary and message count (its messages have been digested)"""
+        with self.lock:
+            self.pending.pop((user_id, session_id), None)
+            cached = self.cache.get(user_id)
+            if cached is not None:
+                cached['sessions'].pop(session_id, None)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'every_messages': self.every_messages,
+                'summaries_in_flight': len(self.in_flight),
+                'users_cached': len(self.cache),
+                'sessions_pending': len(self.pending),
+                'runs': self.runs,
+                'extractive_fallbacks': self.extractive_fallbacks
+            }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _run(self, user_id: int, session_id: str):
+        db = SessionLocal()
+        try:
+            self.summarize_session(db, user_id, session_id)
+        except Exception as e:
+            db.rollback()
+            logger.error(f"Conversation summary failed for user {user_id}: {e}")
+        finally:
+            db.close()
+            with self.lock:
+                self.in_flight.discard((user_id, session_id))
+
+    def _cache_entry(self, user_id: int) -> Dict[str, Any]:
+        """The user's cache entry, created (evicting the least recently used user) if needed; caller holds the lock"""
+        cached = self.cache.get(user_id)
+        if cached is None:
+            cached = self.cache[user_id] = {'user_summary': None, 'sessions': {}}
+            while len(self.cache) > self.max_users:
+                self.cache.popitem(last=False)
+        self.cache.move_to_end(user_id)
+        return cached
+
+    def _get_summary_row(self, db: Session, user_id: int, message_type: str, session_id: str) -> Optional[ConversationMemory]:
+        return db.query(ConversationMemory).filter(
+            and_(
+                ConversationMemory.user_id == user_id,
+                ConversationMemory.message_type == message_type,
+                ConversationMemory.session_id == session_id
+            )
+        ).first()
+
+    def _save_summary_row(
+        self,
+        db: Session,
+        row: Optional[ConversationMemory],
+        user_id: int,
+        message_type: str,
+        session_id: str,
+        content: str,
+        context_data: Dict[str, Any]
+    ):
+        embedding = vector_to_bytes(memory_vector_index.embed_text(content))
+        if row:
+            row.content = content
+            row.context_data = context_data
+            row.embedding = embedding
+            # Summaries are dated by their last refresh so retention follows activity
+            row.created_at = datetime.now()
+        else:
+            db.add(ConversationMemory(
+                user_id=user_id,
+                session_id=session_id,
+                message_type=message_type,
+                content=content,
+                context_data=context_data,
+                embedding=embedding,
+                importance_score=0.9
+            ))
+
+    def _format_messages(self, messages: List[ConversationMemory]) -> str:
+        speakers = {'user': 'User', 'agent': 'Coach'}
+        return "\n".join(
+            f"{speakers.get(message.message_type, message.message_type)}: {(message.content or '')[:300]}"
+            for message in messages
+        )
+
+    def _generate(self, prompt: str, fallback) -> str:
+        """Summarize with Gemini, falling back to an extractive summary"""
+        if settings.google_api_key:
+            try:
+                text = (summary_model.generate_content(prompt).text or "").strip()
+                if text:
+                    return text
+            except Exception as e:
+                logger.warning(f"Summary generation failed, using extractive summary: {e}")
+        with self.lock:
+            self.extractive_fallbacks += 1
+        return fallback()
+
+    def _fallback_summary(self, previous: str, messages: List[ConversationMemory], max_words: int) -> str:
+        user_messages = [message for message in messages if message.message_type == 'user' and message.content]
+        topics = Counter(
+            word for message in user_messages
+            for word in re.findall(r"[a-z]+", message.content.lower())
+            if len(word) > 3 and word not in EMBEDDING_STOP_WORDS
+        )
+        highlights = sorted(user_messages, key=lambda message: message.importance_score or 0.0, reverse=True)[:2]
+
+        latest = ""
+        if topics:
+            latest += f"Discussed {', '.join(word for word, _ in topics.most_common(6))}."
+        if highlights:
+            latest += " User said: " + "; ".join(
+                f'"{self._first_sentence(message.content)}"' for message in highlights
+            )
+
+        return self._trim_words(f"{previous} {latest}".strip(), max_words)
+
+    def _first_sentence(self, text: str) -> str:
+        return re.split(r"(?<=[.!?])\s", text.strip())[0][:120]
+
+    def _trim_words(self, text: str, max_words: int) -> str:
+        """Keep the most recent words when an extractive summary grows past its budget"""
+        words = text.split()
+        return " ".join(words[-max_words:]) if len(words) > max_words else text
+
+# Global conversation summarizer instance
+conversation_summarizer = ConversationSummarizer(
+    every_messages=settings.conversation_summary_every_messages,
+    max_users=settings.conversation_summary_cache_users
+)
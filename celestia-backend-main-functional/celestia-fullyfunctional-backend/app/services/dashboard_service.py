@@ -3,6 +3,8 @@ from datetime import date, datetime, timedelta
 from typing import Any, Dict, List, Optional
 
 from app.models.db_models import DailySummary, Meal, User
+from app.services.health_rules import health_rule_engine
+from app.services.user_context_cache import user_context_cache
 from sqlalchemy import and_, extract, func
 from sqlalchemy.orm import Session
 
@@ -360,6 +362,7 @@ class DashboardService:
             user.updated_at = datetime.now()
             
             self.db.commit()
+            user_context_cache.invalidate(user_id)
             return True
             
         except Exception as e:
@@ -534,47 +537,17 @@ class DashboardService:
                     "fat": day_summary.total_fat if day_summary else 0
                 })
             
-            # Deficiency analysis
-            deficiencies = []
-            
-            # Check protein deficiency
-            protein_goal = daily_goals.get("protein", 50)
-            if avg_protein < protein_goal * 0.8:  # Less than 80% of goal
-                deficiency_percentage = round(((protein_goal - avg_protein) / protein_goal * 100), 1)
-                deficiencies.append({
-                    "nutrient": "Protein",
-                    "severity": "high" if avg_protein < protein_goal * 0.6 else "moderate",
-                    "message": f"You're getting {deficiency_percentage}% less protein than recommended",
-                    "recommendation": "Consider adding lean meats, fish, eggs, or plant-based proteins to your meals"
-                })
-            
-            # Check fiber deficiency
-            fiber_goal = daily_goals.get("fiber", 25)
-            if avg_fiber < fiber_goal * 0.7:  # Less than 70% of goal
-                deficiency_percentage = round(((fiber_goal - avg_fiber) / fiber_goal * 100), 1)
-                deficiencies.append({
-                    "nutrient": "Fiber",
-                    "severity": "moderate",
-                    "message": f"Your fiber intake is {deficiency_percentage}% below recommended levels",
-                    "recommendation": "Add more fruits, vegetables, whole grains, and legumes to your diet"
-                })
-            
-            # Check calorie balance
-            calorie_goal = daily_goals.get("calories", 2000)
-            if avg_calories < calorie_goal * 0.8:
-                deficiencies.append({
-                    "nutrient": "Calories",
-                    "severity": "moderate",
-                    "message": "Your calorie intake may be too low for your goals",
-                    "recommendation": "Consider adding healthy, nutrient-dense snacks between meals"
-                })
-            elif avg_calories > calorie_goal * 1.2:
-                deficiencies.append({
-                    "nutrient": "Calories",
-                    "severity": "moderate", 
-                    "message": "Your calorie intake is above your daily goal",
-                    "recommendation": "Focus on portion control and nutrient-dense, lower-calorie foods"
-                })
+            # Deficiency analysis (thresholds live in the health rules file)
+            deficiencies = health_rule_engine.evaluate_deficiencies({
+                "avg_calories": avg_calories,
+                "avg_protein": avg_protein,
+                "avg_carbs": avg_carbs,
+                "avg_fat": avg_fat,
+                "avg_fiber": avg_fiber,
+                "goal_calories": daily_goals.get("calories", 2000),
+                "goal_protein": daily_goals.get("protein", 50),
+                "goal_fiber": daily_goals.get("fiber", 25)
+            })
             
             return {
                 "period": period_name,
@@ -1,20 +1,83 @@
 import json
+import re
 import uuid
 from datetime import datetime, timedelta
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional
 
 import google.generativeai as genai
 from app.config import settings
 from app.services.conversation_memory_service import ConversationMemoryService
+from app.services.conversation_summarizer import conversation_summarizer
 from app.services.health_monitoring_service import HealthMonitoringService
 from app.services.intelligent_meal_planner import IntelligentMealPlanner
+from app.services.meal_intent_classifier import intent_metrics, meal_intent_classifier
+from app.services.meal_memory_service import MealMemoryService
+from app.services.monitoring_pipeline import monitoring_pipeline
+from app.services.prompt_builder import PromptBuilder
 from app.services.smart_notification_service import SmartNotificationService
+from app.services.user_context_cache import user_context_cache
 from sqlalchemy.orm import Session
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
 
 # Configure Gemini AI
 genai.configure(api_key=settings.google_api_key)
 enhanced_agent_model = genai.GenerativeModel("models/gemini-2.0-flash")
 
+# Messages that refer back to the conversation ('it' and 'that' as whole words only)
+CONVERSATION_CUE_PATTERN = re.compile(r"you said|earlier|before|again|\b(?:it|that)\b")
+
+ENHANCED_PROMPT_INSTRUCTIONS = """CRITICAL INSTRUCTIONS:
+
+🎯 **QUESTION TYPE DETECTION** - Answer appropriately based on what user is asking:
+
+**PROFILE QUESTIONS** (e.g., "what are my dietary preferences", "what's my goal"):
+- Answer directly from their profile data above
+- Be clear and specific: "Your dietary preference is Eggetarian and your goal is Build Muscle"
+
+**GENERAL NUTRITION QUESTIONS** (e.g., "how many calories in apple", "what vitamins are in spinach"):
+- Provide accurate general nutrition information
+- Reference their profile when relevant (e.g., "For your muscle building goal, apples provide...")
+
+**MEAL HISTORY QUESTIONS** (e.g., "what did I eat", "my recent meals"):
+- Use their actual meal data from above
+- Be specific about foods, calories, and timing
+
+**PERSONALIZED ADVICE REQUESTS** (e.g., "what should I eat", "meal suggestions"):
+- Combine their profile + meal history + general nutrition knowledge
+- Give specific, actionable recommendations
+
+**VAGUE MESSAGES** (e.g., "..", "hi", "hello"):
+- Provide personalized check-in based on their profile
+
+**CORE RULES**:
+1. **ANSWER THE ACTUAL QUESTION** - Don't force meal history into every response
+2. **BE ACCURATE** - Use correct nutrition information for general questions
+3. **BE PERSONAL** - Reference their profile when relevant
+4. **BE CONCISE** - 2-3 sentences for simple questions
+5. **BE HELPFUL** - Focus on what they actually asked"""
+
+ENHANCED_PROMPT_EXAMPLES = """EXAMPLE RESPONSES BY QUESTION TYPE:
+
+**Profile Questions:**
+Q: "what are my dietary preferences and goal"
+A: "Your dietary preference is Eggetarian (vegetarian + eggs) and your goal is Build Muscle. You're also Moderately Active, which means you need adequate protein for muscle growth!"
+
+**General Nutrition Questions:**
+Q: "how many calories in an apple"
+A: "A medium apple has about 95 calories and 4g fiber. For your muscle building goal, pair it with some nuts or yogurt for added protein! 🍎"
+
+**Meal History Questions:**
+Q: "what did I eat today"
+A: "Today at 12:34 PM you had Chicken Biryani (1 small plate, 200g) with 410 calories and 24g protein - great protein choice for muscle building!"
+
+**Personalized Advice:**
+Q: "what should I eat for dinner"
+A: "For your Eggetarian muscle building goals, try paneer curry with quinoa, or a veggie omelet with whole grain toast. Aim for 25-30g protein! 💪"
+
+**Vague Messages:**
+Q: ".." or "hi"
+A: "Hey! How's your muscle building journey going? I see you're following an Eggetarian diet - have you hit your protein target today? Need any meal suggestions? 🥚💪\""""
+
 class EnhancedAgenticService:
     """
     Enhanced Agentic AI Service that integrates all advanced AI capabilities:
@@ -73,45 +136,156 @@ class EnhancedAgenticService:
         proactive monitoring, and intelligent responses
         """
         try:
-            # Get or create session
-            if not session_id:
-                session_id = self.conversation_memory.create_session_id()
-            
-            # Store user message in conversation memory
             user_context = context or {}
-            memory_entry = self.conversation_memory.store_conversation(
+            prepared = self._prepare_chat(user_id, message, session_id, user_context)
+            session_id = prepared['session_id']
+            
+            if prepared.get('direct_response'):
+                return prepared['direct_response']
+            
+            # Generate AI response with meal history context
+            agent_response = await run_in_threadpool(
+                self._generate_enhanced_response,
                 user_id=user_id,
-                session_id=session_id,
-                message_type='user',
-                content=message,
-                context_data=user_context
+                message=message,
+                context=prepared['enhanced_context']
             )
             
-            # Get contextual memory for enhanced responses
-            contextual_memories = self.conversation_memory.get_contextual_memory(
-                user_id=user_id,
-                current_context=user_context,
-                limit=5
+            return self._finalize_chat(user_id, message, user_context, prepared, agent_response)
+            
+        except Exception as e:
+            print(f"Error in enhanced chat: {e}")
+            return self._build_error_response(user_id, session_id)
+    
+    async def enhanced_chat_stream(
+        self,
+        user_id: int,
+        message: str,
+        session_id: Optional[str] = None,
+        context: Dict[str, Any] = None
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Streaming variant of enhanced_chat. Yields 'token' events as Gemini
+        produces text and a final 'done' event carrying the same metadata as
+        the non-streaming response once the reply has been stored in memory.
+        """
+        user_context = context or {}
+        if not session_id:
+            session_id = self.conversation_memory.create_session_id()
+        
+        # Emit the session id immediately so clients get a first byte before context gathering
+        yield {'type': 'session', 'session_id': session_id}
+        
+        try:
+            prepared = await run_in_threadpool(
+                self._prepare_chat, user_id, message, session_id, user_context
             )
             
-            # CRITICAL: Get user's actual meal history from database
-            # First detect if this is a specific meal history query
-            meal_query_info = self._detect_meal_history_query(message)
+            if prepared.get('direct_response'):
+                direct_response = prepared['direct_response']
+                yield {'type': 'token', 'text': direct_response['message']}
+                yield {'type': 'done', **direct_response}
+                return
             
-            if meal_query_info['is_meal_history_query']:
-                # Get targeted meal data for specific queries
-                user_meal_history = self._get_targeted_meal_data(user_id, meal_query_info)
-                if user_meal_history.get('formatted_response'):
-                    # For specific meal history queries, return the formatted response directly
-                    return {
-                        'message': user_meal_history['formatted_response'],
+            enhanced_context = prepared['enhanced_context']
+            prompt = self._build_enhanced_prompt(user_id, message, enhanced_context)
+            
+            chunks = []
+            try:
+                stream = await run_in_threadpool(
+                    enhanced_agent_model.generate_content, prompt, stream=True
+                )
+                async for chunk in iterate_in_threadpool(iter(stream)):
+                    text = self._chunk_text(chunk)
+                    if text:
+                        chunks.append(text)
+                        yield {'type': 'token', 'text': text}
+            except Exception as e:
+                print(f"Gemini streaming error: {e}")
+                if chunks:
+                    # The client already has part of the reply; a cut-off reply isn't stored
+                    yield {'type': 'error', 'message': 'Response stream interrupted', 'session_id': prepared['session_id']}
+                    return
+            
+            response_text = ''.join(chunks).strip()
+            if response_text:
+                response_analysis = self._analyze_response(response_text, enhanced_context)
+                agent_response = {
+                    'message': response_text,
+                    'response_type': response_analysis.get('type', 'general'),
+                    'confidence': response_analysis.get('confidence', 0.8),
+                    'actions': response_analysis.get('actions', []),
+                    'trigger_notifications': response_analysis.get('trigger_notifications', False)
+                }
+            else:
+                # Nothing was streamed - fall back to the retrying, non-streaming path
+                agent_response = await run_in_threadpool(
+                    self._generate_enhanced_response,
+                    user_id=user_id,
+                    message=message,
+                    context=enhanced_context
+                )
+                yield {'type': 'token', 'text': agent_response['message']}
+            
+            result = await run_in_threadpool(
+                self._finalize_chat, user_id, message, user_context, prepared, agent_response
+            )
+            yield {'type': 'done', **result}
+            
+        except Exception as e:
+            print(f"Error in enhanced chat stream: {e}")
+            error_response = self._build_error_response(user_id, session_id)
+            yield {'type': 'token', 'text': error_response['message']}
+            yield {'type': 'done', **error_response}
+    
+    def _chunk_text(self, chunk: Any) -> str:
+        """Safely extract text from a streamed Gemini chunk"""
+        try:
+            return chunk.text or ''
+        except Exception:
+            # Chunks without text parts (e.g. safety metadata) raise on .text
+            return ''
+    
+    def _prepare_chat(
+        self,
+        user_id: int,
+        message: str,
+        session_id: Optional[str],
+        user_context: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Store the user message and gather all context needed to answer it"""
+        # Get or create session
+        if not session_id:
+            session_id = self.conversation_memory.create_session_id()
+        
+        # Store user message in conversation memory
+        user_memory = self.conversation_memory.store_conversation(
+            user_id=user_id,
+            session_id=session_id,
+            message_type='user',
+            content=message,
+            context_data=user_context
+        )
+        
+        # Structured meal-history questions are answered straight from the database
+        meal_intent = meal_intent_classifier.classify(message)
+        if meal_intent['intent'] != 'none':
+            meal_answer = MealMemoryService(self.db).answer_intent(user_id, meal_intent, message.lower())
+            intent_metrics.record(meal_intent['intent'], answered=bool(meal_answer and meal_answer.get('result')))
+            
+            if meal_answer and meal_answer.get('result'):
+                return {
+                    'session_id': session_id,
+                    'direct_response': {
+                        'message': meal_answer['result'],
                         'response_type': 'meal_history',
                         'session_id': session_id,
                         'contextual_insights': {
-                            'memories_used': len(contextual_memories),
+                            'memories_used': 0,
                             'health_alerts': 0,
                             'urgent_alerts': 0,
-                            'meal_data_retrieved': True
+                            'meal_data_retrieved': True,
+                            'intent': meal_intent['intent']
                         },
                         'proactive_features': {
                             'notifications_generated': 0,
@@ -124,240 +298,167 @@ class EnhancedAgenticService:
                         'confidence': 0.95,
                         'timestamp': datetime.now().isoformat()
                     }
-            
-            # For general queries, get comprehensive meal history
-            user_meal_history = self._get_user_meal_history(user_id)
-            user_profile_data = self._get_user_profile_data(user_id)
-            
-            # Run proactive health monitoring
-            monitoring_results = self.health_monitor.run_health_monitoring(user_id)
-            
-            # Check for any urgent alerts
-            active_alerts = self.health_monitor.get_active_alerts(user_id)
-            urgent_alerts = [alert for alert in active_alerts if alert['severity'] in ['high', 'critical']]
-            
-            # Generate enhanced response using all available context
-            enhanced_context = {
-                **user_context,
-                'conversation_history': contextual_memories,
-                'health_alerts': active_alerts,
-                'monitoring_insights': monitoring_results,
-                'user_meal_history': user_meal_history,  # REAL meal data
-                'user_profile': user_profile_data,       # REAL user profile
-                'session_id': session_id
-            }
-            
-            # Enhance message context for vague inputs
-            enhanced_context = self._enhance_message_context(message, enhanced_context)
-            
-            # Generate AI response with meal history context
-            agent_response = await self._generate_enhanced_response(
-                user_id=user_id,
-                message=message,
-                context=enhanced_context
-            )
-            
-            # Store agent response in conversation memory
-            self.conversation_memory.store_conversation(
-                user_id=user_id,
-                session_id=session_id,
-                message_type='agent',
-                content=agent_response['message'],
-                context_data={
-                    'response_type': agent_response.get('response_type', 'general'),
-                    'confidence': agent_response.get('confidence', 0.8),
-                    'actions_suggested': agent_response.get('actions', [])
                 }
-            )
-            
-            # Generate smart notifications if appropriate
-            if agent_response.get('trigger_notifications', False):
-                notification_results = self.notification_service.generate_smart_notifications(user_id)
-            else:
-                notification_results = {'notifications_generated': 0}
-            
-            # Check if meal planning is needed
-            meal_plan_suggestion = None
-            if self._should_suggest_meal_planning(message, user_context):
-                meal_plan_suggestion = self._generate_meal_plan_suggestion(user_id)
-            
-            return {
-                'message': agent_response['message'],
+        else:
+            intent_metrics.record('none', answered=False)
+        
+        # Get contextual memory for enhanced responses
+        contextual_memories = self.conversation_memory.get_contextual_memory(
+            user_id=user_id,
+            current_context=user_context,
+            limit=5,
+            query_text=message,
+            exclude_ids=[user_memory.id] if user_memory else None
+        )
+        
+        # Rolling summaries stand in for older turns; only the latest turns are passed verbatim
+        conversation_summary = conversation_summarizer.get_summaries(self.db, user_id, session_id)
+        recent_turns = [
+            turn for turn in self.conversation_memory.get_session_history(user_id, session_id, limit=5)
+            if not user_memory or turn['id'] != user_memory.id
+        ]
+        
+        # For general queries, get comprehensive meal history
+        user_meal_history = self._get_user_meal_history(user_id)
+        user_profile_data = self._get_user_profile_data(user_id)
+        
+        # Proactive health monitoring runs in the background pipeline; read its latest snapshot
+        monitoring_snapshot = monitoring_pipeline.get_snapshot(user_id)
+        if monitoring_snapshot:
+            monitoring_results = {
+                **monitoring_snapshot['monitoring_results'],
+                'snapshot_version': monitoring_snapshot['version']
+            }
+            active_alerts = monitoring_snapshot['active_alerts']
+            urgent_alerts = monitoring_snapshot['urgent_alerts']
+        else:
+            monitoring_results = {'monitoring_completed': False, 'monitoring_pending': True}
+            active_alerts = []
+            urgent_alerts = []
+        
+        # Generate enhanced response using all available context
+        enhanced_context = {
+            **user_context,
+            'conversation_history': contextual_memories,
+            'conversation_summary': conversation_summary,
+            'recent_turns': recent_turns,
+            'health_alerts': active_alerts,
+            'monitoring_insights': monitoring_results,
+            'user_meal_history': user_meal_history,  # REAL meal data
+            'user_profile': user_profile_data,       # REAL user profile
+            'session_id': session_id
+        }
+        
+        # Enhance message context for vague inputs
+        enhanced_context = self._enhance_message_context(message, enhanced_context)
+        
+        return {
+            'session_id': session_id,
+            'contextual_memories': contextual_memories,
+            'monitoring_results': monitoring_results,
+            'active_alerts': active_alerts,
+            'urgent_alerts': urgent_alerts,
+            'enhanced_context': enhanced_context
+        }
+    
+    def _finalize_chat(
+        self,
+        user_id: int,
+        message: str,
+        user_context: Dict[str, Any],
+        prepared: Dict[str, Any],
+        agent_response: Dict[str, Any]
+    ) -> Dict[str, Any]:
+        """Persist the agent reply and run the proactive follow-ups"""
+        session_id = prepared['session_id']
+        contextual_memories = prepared['contextual_memories']
+        monitoring_results = prepared['monitoring_results']
+        active_alerts = prepared['active_alerts']
+        urgent_alerts = prepared['urgent_alerts']
+        
+        # Store agent response in conversation memory
+        self.conversation_memory.store_conversation(
+            user_id=user_id,
+            session_id=session_id,
+            message_type='agent',
+            content=agent_response['message'],
+            context_data={
                 'response_type': agent_response.get('response_type', 'general'),
-                'session_id': session_id,
-                'contextual_insights': {
-                    'memories_used': len(contextual_memories),
-                    'health_alerts': len(active_alerts),
-                    'urgent_alerts': len(urgent_alerts),
-                    'monitoring_completed': monitoring_results.get('monitoring_completed', False)
-                },
-                'proactive_features': {
-                    'notifications_generated': notification_results.get('notifications_generated', 0),
-                    'meal_plan_suggested': meal_plan_suggestion is not None,
-                    'health_insights': monitoring_results.get('insights_generated', 0)
-                },
-                'suggested_actions': agent_response.get('actions', []),
-                'meal_plan_suggestion': meal_plan_suggestion,
-                'urgent_alerts': urgent_alerts,
                 'confidence': agent_response.get('confidence', 0.8),
-                'timestamp': datetime.now().isoformat()
+                'actions_suggested': agent_response.get('actions', [])
             }
-            
-        except Exception as e:
-            print(f"Error in enhanced chat: {e}")
-            
-            # Even on error, provide personalized response based on available context
-            try:
-                user_profile_data = self._get_user_profile_data(user_id)
-                profile_data = user_profile_data.get('profile', {})
-                goal = profile_data.get('goal', 'your health goals')
-                diet_preference = profile_data.get('diet_preference', 'your dietary preferences')
-                
-                personalized_error = f"I'm experiencing a technical hiccup, but I'm still here to help with your {goal.lower()}! I can assist with nutrition advice, meal planning for your {diet_preference.lower()} diet, and tracking your progress. What would you like to know?"
-                
-                return {
-                    'message': personalized_error,
-                    'response_type': 'personalized_error_recovery',
-                    'session_id': session_id or 'unknown',
-                    'confidence': 0.7,
-                    'contextual_insights': {'error_handled_with_personalization': True},
-                    'timestamp': datetime.now().isoformat()
-                }
-            except:
-                # Absolute last resort - still try to be helpful
-                return {
-                    'message': "I'm having a brief technical issue, but I'm here to help with your nutrition and health goals! Please try your question again.",
-                    'response_type': 'error',
-                    'session_id': session_id or 'unknown',
-                    'confidence': 0.5,
-                    'timestamp': datetime.now().isoformat()
-                }
-    
-    def _detect_meal_history_query(self, message: str) -> Dict[str, Any]:
-        """Detect if user is asking about their meal history and extract timeframe"""
-        message_lower = message.lower()
+        )
         
-        query_info = {
-            'is_meal_history_query': False,
-            'timeframe': 'recent',  # recent, today, yesterday, week, month
-            'specific_request': None
-        }
+        # Generate smart notifications if appropriate
+        if agent_response.get('trigger_notifications', False):
+            notification_results = self.notification_service.generate_smart_notifications(user_id)
+        else:
+            notification_results = {'notifications_generated': 0}
         
-        # Detect meal history related queries
-        meal_keywords = [
-            'what did i eat', 'my meals', 'food history', 'eating pattern',
-            'past meals', 'yesterday', 'today', 'this week', 'last week',
-            'my food', 'nutrition summary', 'calories consumed', 'my diet',
-            'past 5 hours', 'past hours', 'recent hours'
-        ]
+        # Check if meal planning is needed
+        meal_plan_suggestion = None
+        if self._should_suggest_meal_planning(message, user_context):
+            meal_plan_suggestion = self._generate_meal_plan_suggestion(user_id)
         
-        if any(keyword in message_lower for keyword in meal_keywords):
-            query_info['is_meal_history_query'] = True
-            
-            # Detect timeframe
-            if any(word in message_lower for word in ['today', 'this morning', 'this afternoon']):
-                query_info['timeframe'] = 'today'
-            elif any(word in message_lower for word in ['yesterday', 'last night']):
-                query_info['timeframe'] = 'yesterday'
-            elif any(word in message_lower for word in ['this week', 'past week', 'weekly']):
-                query_info['timeframe'] = 'week'
-            elif any(word in message_lower for word in ['past 5 hours', '5 hours', 'recent hours', 'past hours']):
-                query_info['timeframe'] = 'recent_hours'
-            elif any(word in message_lower for word in ['month', 'monthly', 'past month']):
-                query_info['timeframe'] = 'month'
-            
-            # Detect specific requests
-            if any(word in message_lower for word in ['calories', 'calorie']):
-                query_info['specific_request'] = 'calories'
-            elif any(word in message_lower for word in ['protein', 'proteins']):
-                query_info['specific_request'] = 'protein'
-            elif any(word in message_lower for word in ['pattern', 'patterns', 'trend']):
-                query_info['specific_request'] = 'patterns'
-        
-        return query_info
-
-    def _get_targeted_meal_data(self, user_id: int, query_info: Dict[str, Any]) -> Dict[str, Any]:
-        """Get targeted meal data based on the user's specific query"""
+        return {
+            'message': agent_response['message'],
+            'response_type': agent_response.get('response_type', 'general'),
+            'session_id': session_id,
+            'contextual_insights': {
+                'memories_used': len(contextual_memories),
+                'health_alerts': len(active_alerts),
+                'urgent_alerts': len(urgent_alerts),
+                'monitoring_completed': monitoring_results.get('monitoring_completed', False)
+            },
+            'proactive_features': {
+                'notifications_generated': notification_results.get('notifications_generated', 0),
+                'meal_plan_suggested': meal_plan_suggestion is not None,
+                'health_insights': monitoring_results.get('insights_generated', 0)
+            },
+            'suggested_actions': agent_response.get('actions', []),
+            'meal_plan_suggestion': meal_plan_suggestion,
+            'urgent_alerts': urgent_alerts,
+            'confidence': agent_response.get('confidence', 0.8),
+            'timestamp': datetime.now().isoformat()
+        }
+    
+    def _build_error_response(self, user_id: int, session_id: Optional[str]) -> Dict[str, Any]:
+        """Build a personalized response when the chat pipeline fails"""
+        # Even on error, provide personalized response based on available context
         try:
-            from app.models.db_models import DailySummary, Meal
-
-            # Determine date range based on query
-            end_date = datetime.now().date()
-            
-            if query_info['timeframe'] == 'today':
-                start_date = end_date
-            elif query_info['timeframe'] == 'yesterday':
-                start_date = end_date - timedelta(days=1)
-                end_date = start_date
-            elif query_info['timeframe'] == 'week':
-                start_date = end_date - timedelta(days=7)
-            elif query_info['timeframe'] == 'recent_hours':
-                # For "past 5 hours" queries
-                start_datetime = datetime.now() - timedelta(hours=5)
-                meals = self.db.query(Meal).filter(
-                    Meal.user_id == user_id,
-                    Meal.upload_time >= start_datetime
-                ).order_by(Meal.upload_time.desc()).all()
-                
-                return self._format_recent_hours_meals(meals)
-            elif query_info['timeframe'] == 'month':
-                start_date = end_date - timedelta(days=30)
-            else:  # recent
-                start_date = end_date - timedelta(days=3)
-            
-            # Get meals for the timeframe
-            meals = self.db.query(Meal).filter(
-                Meal.user_id == user_id,
-                Meal.upload_date >= start_date,
-                Meal.upload_date <= end_date
-            ).order_by(Meal.upload_time.desc()).all()
-            
-            # Get daily summaries
-            summaries = self.db.query(DailySummary).filter(
-                DailySummary.user_id == user_id,
-                DailySummary.date >= start_date,
-                DailySummary.date <= end_date
-            ).all()
+            user_profile_data = self._get_user_profile_data(user_id)
+            profile_data = user_profile_data.get('profile', {})
+            goal = profile_data.get('goal', 'your health goals')
+            diet_preference = profile_data.get('diet_preference', 'your dietary preferences')
             
-            return self._format_targeted_meal_response(meals, summaries, query_info)
+            personalized_error = f"I'm experiencing a technical hiccup, but I'm still here to help with your {goal.lower()}! I can assist with nutrition advice, meal planning for your {diet_preference.lower()} diet, and tracking your progress. What would you like to know?"
             
-        except Exception as e:
-            print(f"Error getting targeted meal data: {e}")
-            return {'error': str(e)}
-
-    def _format_recent_hours_meals(self, meals: List) -> Dict[str, Any]:
-        """Format meals from recent hours for specific time-based queries"""
-        if not meals:
             return {
-                'formatted_response': "You haven't logged any meals in the past 5 hours.",
-                'meal_count': 0
+                'message': personalized_error,
+                'response_type': 'personalized_error_recovery',
+                'session_id': session_id or 'unknown',
+                'confidence': 0.7,
+                'contextual_insights': {'error_handled_with_personalization': True},
+                'timestamp': datetime.now().isoformat()
             }
-        
-        response_text = f"In the past 5 hours, you've had {len(meals)} meal(s):\n\n"
-        
-        for meal in meals:
-            time_str = meal.upload_time.strftime("%I:%M %p") if meal.upload_time else "Unknown time"
-            meal_type = meal.meal_type or "Meal"
-            
-            # Get food items using proper extraction
-            foods = self._extract_food_items(meal.analysis_data or {})
-            foods_text = ', '.join(foods) if foods else 'Food items'
-            
-            # Get nutrition
-            nutrition = meal.nutrition_summary or {}
-            calories = nutrition.get('total_calories', 'Unknown')
-            
-            response_text += f"**{time_str}** ({meal_type}): {foods_text}"
-            if calories != 'Unknown':
-                response_text += f" - {calories} calories"
-            response_text += "\n"
-        
-        return {
-            'formatted_response': response_text,
-            'meal_count': len(meals)
-        }
-
+        except:
+            # Absolute last resort - still try to be helpful
+            return {
+                'message': "I'm having a brief technical issue, but I'm here to help with your nutrition and health goals! Please try your question again.",
+                'response_type': 'error',
+                'session_id': session_id or 'unknown',
+                'confidence': 0.5,
+                'timestamp': datetime.now().isoformat()
+            }
+    
     def _get_user_meal_history(self, user_id: int, days_back: int = 7) -> Dict[str, Any]:
+        """Retrieve user's actual meal history (cached until the next meal log)"""
+        return user_context_cache.get_or_build(
+            user_id, f'meal_history:{days_back}',
+            lambda: self._load_user_meal_history(user_id, days_back)
+        )
+    
+    def _load_user_meal_history(self, user_id: int, days_back: int = 7) -> Dict[str, Any]:
         """Retrieve user's actual meal history from database"""
         try:
             from app.models.db_models import DailySummary, Meal
@@ -522,7 +623,7 @@ class EnhancedAgenticService:
         
         return context
 
-    async def _generate_enhanced_response(
+    def _generate_enhanced_response(
         self, 
         user_id: int, 
         message: str, 
@@ -615,7 +716,7 @@ Answer their actual question directly and helpfully."""
         return prompt
 
     def _build_enhanced_prompt(self, user_id: int, message: str, context: Dict[str, Any]) -> str:
-        """Build comprehensive prompt with all available context"""
+        """Build the prompt from all available context, fitted to the prompt token budget"""
         
         conversation_history = context.get('conversation_history', [])
         health_alerts = context.get('health_alerts', [])
@@ -626,114 +727,141 @@ Answer their actual question directly and helpfully."""
         # Check for urgent health alerts
         urgent_alerts = [alert for alert in health_alerts if alert.get('severity') in ['high', 'critical']]
         
-        # Format user's REAL meal data
-        meal_history_text = self._format_user_meal_history(user_meal_history)
-        user_profile_text = self._format_user_profile(user_profile)
-        
         # Check if this is a vague message requiring personalized check-in
         is_vague_input = context.get('requires_personalized_checkin', False)
         personalization_data = context.get('personalization_emphasis', {})
         
-        prompt = f"""
-        You are a friendly, concise AI Health Coach with access to THIS USER'S ACTUAL health data and meal history.
-        
-        USER PROFILE & GOALS:
-        {user_profile_text}
-        
-        USER'S ACTUAL MEAL HISTORY (Last 7 Days):
-        {meal_history_text}
-        
-        CONVERSATION CONTEXT:
-        {self._format_conversation_history(conversation_history)}
-        
-        HEALTH STATUS:
-        {f"⚠️ URGENT: {len(urgent_alerts)} critical health alert(s) - address immediately!" if urgent_alerts else f"✅ {len(health_alerts)} active health insights available"}
-        
-        USER MESSAGE: {message}
-        
-        {f'''
-        🎯 SPECIAL INSTRUCTION - VAGUE MESSAGE DETECTED:
-        The user sent a vague/unclear message. Provide a PERSONALIZED check-in based on their profile:
-        - Gender: {personalization_data.get('gender', 'Not specified')}
-        - Diet: {personalization_data.get('diet_preference', 'Not specified')}
-        - Goal: {personalization_data.get('goal', 'Not specified')}
-        - Activity: {personalization_data.get('activity', 'Not specified')}
-        
-        Give them a friendly, personalized greeting that:
-        1. References their specific goal and diet preference
-        2. Mentions something from their recent meal history
-        3. Asks about their current nutrition needs
-        4. Offers relevant suggestions based on their profile
-        
-        Example: "Hey! How's your [goal] journey going? I see you're following a [diet] approach - have you had enough protein today for your muscle building? Your last meal was [specific meal] at [time]. Need any [diet-appropriate] meal suggestions? 💪"
-        ''' if is_vague_input else ''}
-        
-        CRITICAL INSTRUCTIONS:
-        
-        🎯 **QUESTION TYPE DETECTION** - Answer appropriately based on what user is asking:
-        
-        **PROFILE QUESTIONS** (e.g., "what are my dietary preferences", "what's my goal"):
-        - Answer directly from their profile data above
-        - Be clear and specific: "Your dietary preference is Eggetarian and your goal is Build Muscle"
-        
-        **GENERAL NUTRITION QUESTIONS** (e.g., "how many calories in apple", "what vitamins are in spinach"):
-        - Provide accurate general nutrition information
-        - Reference their profile when relevant (e.g., "For your muscle building goal, apples provide...")
+        relevance = self._rank_prompt_sections(message, context)
+        conversation_text = self._format_conversation_history(
+            conversation_history, context.get('conversation_summary'), context.get('recent_turns')
+        )
         
-        **MEAL HISTORY QUESTIONS** (e.g., "what did I eat", "my recent meals"):
-        - Use their actual meal data from above
-        - Be specific about foods, calories, and timing
+        builder = PromptBuilder(settings.agent_prompt_token_budget)
+        builder.add(
+            'persona',
+            "You are a friendly, concise AI Health Coach with access to THIS USER'S ACTUAL health data and meal history.",
+            required=True
+        )
+        builder.add(
+            'profile',
+            f"USER PROFILE & GOALS:\n{self._format_user_profile(user_profile)}",
+            priority=relevance['profile']
+        )
+        builder.add(
+            'meal_history',
+            f"USER'S ACTUAL MEAL HISTORY (Last 7 Days):\n{self._format_user_meal_history(user_meal_history)}",
+            priority=relevance['meal_history']
+        )
+        builder.add(
+            'conversation',
+            f"CONVERSATION CONTEXT:\n{conversation_text}",
+            priority=relevance['conversation']
+        )
+        builder.add(
+            'health_status',
+            f"HEALTH STATUS:\n{self._format_health_status(health_alerts, urgent_alerts, monitoring_insights)}",
+            # Urgent alerts must always reach the model
+            priority=relevance['health_status'],
+            required=bool(urgent_alerts)
+        )
+        builder.add('message', f"USER MESSAGE: {message}", required=True)
+        
+        if is_vague_input:
+            builder.add('vague_instruction', f'''🎯 SPECIAL INSTRUCTION - VAGUE MESSAGE DETECTED:
+The user sent a vague/unclear message. Provide a PERSONALIZED check-in based on their profile:
+- Gender: {personalization_data.get('gender', 'Not specified')}
+- Diet: {personalization_data.get('diet_preference', 'Not specified')}
+- Goal: {personalization_data.get('goal', 'Not specified')}
+- Activity: {personalization_data.get('activity', 'Not specified')}
+
+Give them a friendly, personalized greeting that:
+1. References their specific goal and diet preference
+2. Mentions something from their recent meal history
+3. Asks about their current nutrition needs
+4. Offers relevant suggestions based on their profile
+
+Example: "Hey! How's your [goal] journey going? I see you're following a [diet] approach - have you had enough protein today for your muscle building? Your last meal was [specific meal] at [time]. Need any [diet-appropriate] meal suggestions? 💪"''', required=True)
         
-        **PERSONALIZED ADVICE REQUESTS** (e.g., "what should I eat", "meal suggestions"):
-        - Combine their profile + meal history + general nutrition knowledge
-        - Give specific, actionable recommendations
+        builder.add('instructions', ENHANCED_PROMPT_INSTRUCTIONS, required=True)
+        builder.add('examples', ENHANCED_PROMPT_EXAMPLES, priority=relevance['examples'])
+        builder.add('closing', "Remember: Use THEIR actual data, be specific, be helpful, be concise!", required=True)
         
-        **VAGUE MESSAGES** (e.g., "..", "hi", "hello"):
-        - Provide personalized check-in based on their profile
+        return builder.build()
+    
+    def _rank_prompt_sections(self, message: str, context: Dict[str, Any]) -> Dict[str, float]:
+        """Score optional prompt sections by how relevant they are to the message"""
+        message_lower = message.lower()
         
-        **CORE RULES**:
-        1. **ANSWER THE ACTUAL QUESTION** - Don't force meal history into every response
-        2. **BE ACCURATE** - Use correct nutrition information for general questions
-        3. **BE PERSONAL** - Reference their profile when relevant
-        4. **BE CONCISE** - 2-3 sentences for simple questions
-        5. **BE HELPFUL** - Focus on what they actually asked
+        relevance = {
+            'profile': 0.8,
+            'meal_history': 0.5,
+            'conversation': 0.4,
+            'health_status': 0.3,
+            'examples': 0.1
+        }
         
-        EXAMPLE RESPONSES BY QUESTION TYPE:
+        if any(word in message_lower for word in ['ate', 'eat', 'meal', 'food', 'today', 'yesterday', 'calorie', 'protein', 'breakfast', 'lunch', 'dinner']):
+            relevance['meal_history'] = 0.9
+        if any(word in message_lower for word in ['goal', 'prefer', 'diet', 'profile', 'allerg', 'target']):
+            relevance['profile'] = 1.0
+        if any(word in message_lower for word in ['health', 'alert', 'risk', 'concern', 'warning', 'deficien']):
+            relevance['health_status'] = 0.85
+        if CONVERSATION_CUE_PATTERN.search(message_lower):
+            relevance['conversation'] = 0.7
+        if context.get('requires_personalized_checkin'):
+            relevance['profile'] = 1.0
+            relevance['meal_history'] = 0.9
+        
+        return relevance
+    
+    def _format_health_status(
+        self,
+        health_alerts: List[Dict[str, Any]],
+        urgent_alerts: List[Dict[str, Any]],
+        monitoring_insights: Dict[str, Any]
+    ) -> str:
+        """Format alert status and monitoring insights for the prompt"""
+        if urgent_alerts:
+            formatted_text = f"⚠️ URGENT: {len(urgent_alerts)} critical health alert(s) - address immediately!\n"
+        else:
+            formatted_text = f"✅ {len(health_alerts)} active health insights available\n"
         
-        **Profile Questions:**
-        Q: "what are my dietary preferences and goal"
-        A: "Your dietary preference is Eggetarian (vegetarian + eggs) and your goal is Build Muscle. You're also Moderately Active, which means you need adequate protein for muscle growth!"
+        for alert in (urgent_alerts or health_alerts)[:5]:
+            formatted_text += f"- [{alert.get('severity', 'info')}] {alert.get('title', '')}: {alert.get('message', '')}\n"
         
-        **General Nutrition Questions:**
-        Q: "how many calories in an apple"
-        A: "A medium apple has about 95 calories and 4g fiber. For your muscle building goal, pair it with some nuts or yogurt for added protein! 🍎"
+        for insight in (monitoring_insights or {}).get('insights', [])[:3]:
+            if insight.get('title'):
+                formatted_text += f"- Insight: {insight['title']}\n"
         
-        **Meal History Questions:**
-        Q: "what did I eat today"
-        A: "Today at 12:34 PM you had Chicken Biryani (1 small plate, 200g) with 410 calories and 24g protein - great protein choice for muscle building!"
+        return formatted_text
+    
+    def _format_conversation_history(
+        self,
+        history: List[Dict[str, Any]],
+        summary: Optional[Dict[str, Optional[str]]] = None,
+        recent_turns: Optional[List[Dict[str, Any]]] = None
+    ) -> str:
+        """Format conversation summaries, recent turns and related memories for the prompt"""
+        summary = summary or {}
+        formatted = []
         
-        **Personalized Advice:**
-        Q: "what should I eat for dinner"
-        A: "For your Eggetarian muscle building goals, try paneer curry with quinoa, or a veggie omelet with whole grain toast. Aim for 25-30g protein! 💪"
+        # Summaries first: if the section is truncated, they are what survives
+        if summary.get('user_summary'):
+            formatted.append(f"- Long-term: {summary['user_summary']}")
+        if summary.get('session_summary'):
+            formatted.append(f"- This session so far: {summary['session_summary']}")
         
-        **Vague Messages:**
-        Q: ".." or "hi"
-        A: "Hey! How's your muscle building journey going? I see you're following an Eggetarian diet - have you hit your protein target today? Need any meal suggestions? 🥚💪"
+        for turn in (recent_turns or [])[-4:]:
+            formatted.append(f"- Recent {turn['message_type'].title()}: {turn['content'][:200]}")
         
-        Remember: Use THEIR actual data, be specific, be helpful, be concise!
-        """
+        recent_ids = {turn['id'] for turn in recent_turns or []}
+        for memory in history[:3]:
+            if memory['id'] not in recent_ids:
+                formatted.append(f"- Related earlier {memory['message_type'].title()}: {memory['content'][:100]}...")
         
-        return prompt
-    
-    def _format_conversation_history(self, history: List[Dict[str, Any]]) -> str:
-        """Format conversation history for prompt"""
-        if not history:
+        if not formatted:
             return "No previous conversation history"
         
-        formatted = []
-        for memory in history[-3:]:  # Last 3 exchanges
-            formatted.append(f"- {memory['message_type'].title()}: {memory['content'][:100]}...")
-        
         return "\n".join(formatted)
     
     def _format_user_profile(self, user_profile: Dict[str, Any]) -> str:
@@ -793,6 +921,12 @@ Answer their actual question directly and helpfully."""
             return "Error retrieving user profile"
 
     def _get_user_profile_data(self, user_id: int) -> Dict[str, Any]:
+        """Retrieve user's profile and goals (cached until profile or goals change)"""
+        return user_context_cache.get_or_build(
+            user_id, 'profile', lambda: self._load_user_profile_data(user_id)
+        )
+    
+    def _load_user_profile_data(self, user_id: int) -> Dict[str, Any]:
         """Retrieve user's profile and goals from database"""
         try:
             from app.models.db_models import User
@@ -946,70 +1080,18 @@ Answer their actual question directly and helpfully."""
         except Exception as e:
             print(f"Error generating health dashboard: {e}")
             return {'error': str(e)}
-
-    def _format_targeted_meal_response(self, meals: List, summaries: List, query_info: Dict[str, Any]) -> Dict[str, Any]:
-        """Format meal data based on specific user query with proper time display"""
-        timeframe = query_info['timeframe']
-        specific_request = query_info.get('specific_request')
-        
-        if not meals:
+    
+    def cleanup_old_data(self, days_old: int = 30, user_id: Optional[int] = None) -> Dict[str, Any]:
+        """Compact conversation memory and drop old sent notifications"""
+        try:
+            memory_results = self.conversation_memory.compact_memories(user_id=user_id, retention_days=days_old)
+            notifications_removed = self.notification_service.cleanup_old_notifications(days_old)
+            
             return {
-                'formatted_response': f"No meals found for {timeframe}.",
-                'meal_count': 0
+                'conversation_memory': memory_results,
+                'notifications_removed': notifications_removed
             }
-        
-        response_text = ""
-        
-        if timeframe == 'today':
-            response_text = f"Today you've had {len(meals)} meal(s):\n\n"
-        elif timeframe == 'yesterday':
-            response_text = f"Yesterday you had {len(meals)} meal(s):\n\n"
-        elif timeframe == 'week':
-            response_text = f"This week you've had {len(meals)} meal(s):\n\n"
-        else:
-            response_text = f"Recently you've had {len(meals)} meal(s):\n\n"
-        
-        # Add specific nutrition focus if requested
-        if specific_request == 'calories':
-            total_calories = sum([
-                meal.nutrition_summary.get('total_calories', 0) 
-                for meal in meals 
-                if meal.nutrition_summary
-            ])
-            response_text += f"**Total Calories: {total_calories:.0f}**\n\n"
-        elif specific_request == 'protein':
-            total_protein = sum([
-                meal.nutrition_summary.get('total_protein', 0) 
-                for meal in meals 
-                if meal.nutrition_summary
-            ])
-            response_text += f"**Total Protein: {total_protein:.0f}g**\n\n"
-        
-        # List meals with proper time formatting
-        for meal in meals[:10]:  # Show up to 10 meals
-            date_str = meal.upload_date.strftime("%m/%d") if meal.upload_date else "Unknown"
-            time_str = meal.upload_time.strftime("%I:%M %p") if meal.upload_time else "Unknown time"
-            meal_type = meal.meal_type or "Meal"
-            
-            # Get food items using proper extraction
-            foods = self._extract_food_items(meal.analysis_data or {})
-            foods_text = ', '.join(foods[:3]) if foods else 'Food items'
-            if len(foods) > 3:
-                foods_text += f" + {len(foods) - 3} more"
-            
-            # Get nutrition
-            nutrition = meal.nutrition_summary or {}
-            calories = nutrition.get('total_calories', 0)
-            protein = nutrition.get('total_protein', 0)
-            
-            response_text += f"• **{date_str} at {time_str}** ({meal_type}): {foods_text}"
-            if calories > 0:
-                response_text += f" - {calories:.0f} cal"
-            if protein > 0:
-                response_text += f", {protein:.0f}g protein"
-            response_text += "\n"
-        
-        return {
-            'formatted_response': response_text,
-            'meal_count': len(meals)
-        }
\ No newline at end of file
+            
+        except Exception as e:
+            print(f"Error cleaning up old data: {e}")
+            return {'error': str(e)}
@@ -0,0 +1,240 @@
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Dict, Any, List, Optional, Set, Tuple
+import heapq
+import re
+import time
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.db_models import Meal
+
+# Common Indian food variations; every name in a group is indexed under the group key
+FOOD_SYNONYMS: Dict[str, List[str]] = {
+    'dosa': ['dosai', 'dose', 'dosa', 'masala dosa', 'plain dosa'],
+    'masala dosa': ['masala dosai', 'masala dose', 'dosa masala'],
+    'idli': ['idly', 'idli', 'steamed rice cake'],
+    'biryani': ['biriyani', 'biryani', 'dum biryani', 'chicken biryani'],
+    'roti': ['chapati', 'roti', 'indian bread', 'wheat bread'],
+    'dal': ['daal', 'lentil', 'dal curry', 'lentil curry'],
+    'rice': ['steamed rice', 'white rice', 'basmati rice'],
+    'curry': ['sabzi', 'vegetable curry', 'gravy'],
+    'samosa': ['samosa', 'punjabi samosa', 'fried samosa'],
+    'paratha': ['parantha', 'stuffed paratha', 'aloo paratha']
+}
+
+# (meal_id, item position) identifies one food item
+Posting = Tuple[int, int]
+
+def normalize_food_name(name: str) -> str:
+    return " ".join(re.sub(r"[^a-z0-9\s]", " ", (name or "").lower()).split())
+
+def trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def synonym_keys(name: str) -> Set[str]:
+    """Synonym groups a (normalized) food name belongs to"""
+    keys = set()
+    for key, variants in FOOD_SYNONYMS.items():
+        if key in name or any(variant in name for variant in variants):
+            keys.add(key)
+    return keys
+
+class _UserFoodIndex:
+    def __init__(self):
+        self.ready = False
+        self.synced_at = 0.0
+        self.last_meal_id = 0
+        self.raw_items: Dict[Posting, Dict[str, Any]] = {}
+        self.meal_times: Dict[int, Optional[datetime]] = {}
+        # Distinct normalized names -> postings; the lookup tables point at names,
+        # so matching cost depends on the user's food vocabulary, not meal count
+        self.names: Dict[str, Set[Posting]] = {}
+        self.tokens: Dict[str, Set[str]] = {}
+        self.grams: Dict[str, Set[str]] = {}
+        self.synonyms: Dict[str, Set[str]] = {}
+        self.name_gram_counts: Dict[str, int] = {}
+
+    def add(self, meal_id: int, upload_time: Optional[datetime], analysis_data: Dict[str, Any]):
+        self.meal_times[meal_id] = upload_time
+        self.last_meal_id = max(self.last_meal_id, meal_id)
+
+        for position, item in enumerate((analysis_data or {}).get('items', []) or []):
+            if not isinstance(item, dict):
+                continue
+            name = normalize_food_name(item.get('name', ''))
+            if not name:
+                continue
+
+            posting = (meal_id, position)
+            self.raw_items[posting] = item
+
+            if name not in self.names:
+                self.names[name] = set()
+                for token in name.split():
+                    self.tokens.setdefault(token, set()).add(name)
+                name_grams = trigrams(name)
+                self.name_gram_counts[name] = len(name_grams)
+                for gram in name_grams:
+                    self.grams.setdefault(gram, set()).add(name)
+                for key in synonym_keys(name):
+                    self.synonyms.setdefault(key, set()).add(name)
+            self.names[name].add(posting)
+
+class FoodSearchIndex:
+    """
+    In-memory inverted index from food tokens, trigram shingles and synonym
+    groups to food names and from names to (meal_id, item) postings, one per user. Built lazily from the
+    user's full meal history, caught up incrementally by meal id and
+    updated on log_meal. At most max_users indexes are kept, least recently
+    searched evicted first.
+    """
+
+    def __init__(self, resync_seconds: int = 30, max_users: int = 1000):
+        self.lock = Lock()
+        self.resync_seconds = resync_seconds
+        self.max_users = max_users
+        self.users: 'OrderedDict[int, _UserFoodIndex]' = OrderedDict()
+
+    def add_meal(self, user_id: int, meal: Meal):
+        """Index a newly logged meal (no-op until the user's index has been built)"""
+        with self.lock:
+            index = self.users.get(user_id)
+            if index is not None and index.ready and meal.id not in index.meal_times:
+                index.add(meal.id, meal.upload_time, meal.analysis_data)
+
+    def invalidate(self, user_id: int):
+        with self.lock:
+            self.users.pop(user_id, None)
+
+    def _ensure_user(self, db: Session, user_id: int) -> _UserFoodIndex:
+        with self.lock:
+            index = self.users.get(user_id)
+            if index is None:
+                index = self.users[user_id] = _UserFoodIndex()
+                while len(self.users) > self.max_users:
+                    self.users.popitem(last=False)
+            self.users.move_to_end(user_id)
+            last_meal_id = index.last_meal_id
+            # log_meal keeps the index current in this process; resync periodically
+            # to pick up meals written by other workers
+            if index.ready and time.monotonic() - index.synced_at < self.resync_seconds:
+                return index
+
+        # Catch up on anything logged since the last sync (the whole history on first use)
+        new_meals = db.query(Meal.id, Meal.upload_time, Meal.analysis_data).filter(
+            Meal.user_id == user_id,
+            Meal.id > last_meal_id
+        ).order_by(Meal.id).all()
+
+        with self.lock:
+            for meal_id, upload_time, analysis_data in new_meals:
+                if meal_id not in index.meal_times:
+                    index.add(meal_id, upload_time, analysis_data)
+            index.ready = True
+            index.synced_at = time.monotonic()
+
+        return index
+
+    def search(
+        self,
+        db: Session,
+        user_id: int,
+        food_name: str,
+        limit: Optional[int] = None,
+        threshold: float = 0.6
+    ) -> List[Dict[str, Any]]:
+        """
+        Find the best-matching item per meal for a food name.
+        Returns dicts with meal_id, item, similarity_score and upload_time, best first.
+        """
+        query = normalize_food_name(food_name)
+        if not query:
+            return []
+
+        index = self._ensure_user(db, user_id)
+
+        with self.lock:
+            query_tokens = set(query.split())
+            query_grams = trigrams(query)
+            query_synonyms = {
+                key for key in FOOD_SYNONYMS if key in query or query in key
+            }
+
+            # Candidate names share a token, shingle or synonym group with the query
+            gram_hits: Dict[str, int] = {}
+            for gram in query_grams:
+                for name in index.grams.get(gram, ()):
+                    gram_hits[name] = gram_hits.get(name, 0) + 1
+
+            synonym_hits: Set[str] = set()
+            for key in query_synonyms:
+                synonym_hits.update(index.synonyms.get(key, ()))
+
+            candidates = set(gram_hits) | synonym_hits
+            for token in query_tokens:
+                candidates.update(index.tokens.get(token, ()))
+
+            best_per_meal: Dict[int, Tuple[float, Posting]] = {}
+            for name in candidates:
+                score = self._score(
+                    query, query_tokens, len(query_grams), name,
+                    index.name_gram_counts[name], gram_hits.get(name, 0), name in synonym_hits
+                )
+                if score <= threshold:
+                    continue
+                for posting in index.names[name]:
+                    meal_id = posting[0]
+                    if meal_id not in best_per_meal or score > best_per_meal[meal_id][0]:
+                        best_per_meal[meal_id] = (score, posting)
+
+            ranked = heapq.nlargest(
+                limit or len(best_per_meal),
+                best_per_meal.items(),
+                key=lambda entry: (entry[1][0], index.meal_times.get(entry[0]) or datetime.min)
+            )
+
+            return [
+                {
+                    'meal_id': meal_id,
+                    'item': index.raw_items[posting],
+                    'similarity_score': score,
+                    'upload_time': index.meal_times.get(meal_id)
+                }
+                for meal_id, (score, posting) in ranked
+            ]
+
+    def _score(
+        self,
+        query: str,
+        query_tokens: Set[str],
+        query_gram_count: int,
+        name: str,
+        name_gram_count: int,
+        shared_grams: int,
+        synonym_hit: bool
+    ) -> float:
+        # Exact substring match
+        if query in name or name in query:
+            return 1.0
+
+        # Word-based matching
+        name_tokens = set(name.split())
+        overlap = len(query_tokens & name_tokens)
+        if overlap:
+            word_similarity = overlap / len(query_tokens | name_tokens)
+            if word_similarity > 0.5:
+                return word_similarity
+
+        # Common Indian food variations
+        if synonym_hit:
+            return 0.9
+
+        # Fuzzy matching via trigram Dice coefficient
+        return 2 * shared_grams / (query_gram_count + name_gram_count)
+
+# Global food search index instance
+food_search_index = FoodSearchIndex(max_users=settings.food_index_max_users)
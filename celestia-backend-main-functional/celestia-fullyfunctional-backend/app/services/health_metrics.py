@@ -0,0 +1,184 @@
+from datetime import date
+from typing import Callable, Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.models.db_models import DailySummary
+
+SUMMARY_COLUMNS = ['user_id', 'date', 'calories', 'protein', 'carbs', 'fat', 'fiber']
+
+# Defaults used when a user has no daily goals set
+DEFAULT_GOAL_CALORIES = 2000
+DEFAULT_GOAL_PROTEIN = 60
+
+def load_summary_frame(db: Session, user_ids: List[int], since: date, chunk_size: int = 500) -> pd.DataFrame:
+    """Load DailySummary rows for many users into one columnar frame (one query per chunk of users)"""
+    rows = []
+    for start in range(0, len(user_ids), chunk_size):
+        rows.extend(db.query(
+            DailySummary.user_id, DailySummary.date,
+            DailySummary.total_calories, DailySummary.total_protein,
+            DailySummary.total_carbs, DailySummary.total_fat, DailySummary.total_fiber
+        ).filter(
+            DailySummary.user_id.in_(user_ids[start:start + chunk_size]),
+            DailySummary.date >= since
+        ).all())
+
+    frame = pd.DataFrame.from_records(rows, columns=SUMMARY_COLUMNS)
+    nutrients = SUMMARY_COLUMNS[2:]
+    frame[nutrients] = frame[nutrients].astype(float).fillna(0.0)
+    return frame
+
+# Per-day columns that day-count rule predicates can reference
+SUMMARY_DAY_COLUMNS = ['calories', 'protein', 'carbs', 'fat', 'fiber', 'goal_calories', 'goal_protein', 'calorie_deviation']
+
+# Per-user metrics computed by compute_summary_frame (day counts from the rule set are added to these)
+SUMMARY_METRIC_NAMES = [
+    'days', 'logged_days',
+    'avg_calories', 'avg_protein', 'avg_carbs', 'avg_fat',
+    'avg_calories_all', 'avg_protein_all', 'avg_carbs_all', 'avg_fat_all',
+    'min_calories', 'max_logged_calories', 'min_logged_calories', 'calorie_variability',
+    'recent_avg_calories', 'older_avg_calories',
+    'avg_protein_percent', 'avg_carb_percent', 'avg_fat_percent', 'protein_percent_variability',
+    'avg_calorie_deviation', 'calorie_adherence', 'protein_adherence',
+    'goal_calories', 'goal_protein', 'has_goals'
+]
+
+DayCountPredicate = Callable[[Dict[str, np.ndarray]], np.ndarray]
+
+def compute_summary_frame(
+    frame: pd.DataFrame,
+    goals: Optional[Dict[int, Dict[str, Any]]] = None,
+    day_counts: Optional[Dict[str, DayCountPredicate]] = None
+) -> pd.DataFrame:
+    """
+    Every daily-summary metric the monitoring rules need, computed for all
+    users in the frame in one grouped pass (one row per user). Averages
+    prefixed avg_ skip zero-valued days; avg_*_all include them. day_counts
+    maps a metric name to a compiled per-day predicate whose true days are
+    counted per user.
+    """
+    if frame.empty:
+        return pd.DataFrame(columns=SUMMARY_METRIC_NAMES + list(day_counts or {}))
+
+    goals = goals or {}
+    frame = frame.sort_values(['user_id', 'date'], ascending=[True, False], ignore_index=True)
+    users = frame['user_id']
+    calories, protein, carbs, fat = frame['calories'], frame['protein'], frame['carbs'], frame['fat']
+
+    goal_frame = pd.DataFrame(
+        [
+            {
+                'user_id': user_id,
+                'goal_calories': (goals.get(user_id) or {}).get('calories', DEFAULT_GOAL_CALORIES),
+                'goal_protein': (goals.get(user_id) or {}).get('protein', DEFAULT_GOAL_PROTEIN)
+            }
+            for user_id in users.unique()
+        ]
+    ).set_index('user_id')
+    goal_calories = pd.to_numeric(users.map(goal_frame['goal_calories']))
+    goal_protein = pd.to_numeric(users.map(goal_frame['goal_protein']))
+
+    positive_calories = calories.where(calories > 0)
+    # Rank of each day among the user's logged (non-zero) days, most recent first
+    positive_rank = positive_calories.notna().astype(int).groupby(users).cumsum() - 1
+    calorie_deviation = (calories - goal_calories).abs()
+
+    derived = pd.DataFrame({
+        'user_id': users,
+        'calories': calories,
+        'protein': protein,
+        'carbs': carbs,
+        'fat': fat,
+        'positive_calories': positive_calories,
+        'positive_protein': protein.where(protein > 0),
+        'positive_carbs': carbs.where(carbs > 0),
+        'positive_fat': fat.where(fat > 0),
+        'recent_calories': positive_calories.where(positive_rank < 3),
+        'older_calories': positive_calories.where(positive_rank >= 3),
+        'protein_percent': (protein * 4 / positive_calories) * 100,
+        'carb_percent': (carbs * 4 / positive_calories) * 100,
+        'fat_percent': (fat * 9 / positive_calories) * 100,
+        'calorie_deviation': calorie_deviation,
+        'calorie_on_target': calorie_deviation <= 200,
+        'protein_on_target': protein >= goal_protein * 0.8
+    })
+
+    day_columns = {
+        'calories': calories.to_numpy(), 'protein': protein.to_numpy(), 'carbs': carbs.to_numpy(),
+        'fat': fat.to_numpy(), 'fiber': frame['fiber'].to_numpy(),
+        'goal_calories': goal_calories.to_numpy(), 'goal_protein': goal_protein.to_numpy(),
+        'calorie_deviation': calorie_deviation.to_numpy()
+    }
+    for name, predicate in (day_counts or {}).items():
+        derived[name] = predicate(day_columns)
+
+    aggregated = derived.groupby('user_id').agg(
+        days=('calories', 'size'),
+        logged_days=('positive_calories', 'count'),
+        avg_calories=('positive_calories', 'mean'),
+        avg_protein=('positive_protein', 'mean'),
+        avg_carbs=('positive_carbs', 'mean'),
+        avg_fat=('positive_fat', 'mean'),
+        avg_calories_all=('calories', 'mean'),
+        avg_protein_all=('protein', 'mean'),
+        avg_carbs_all=('carbs', 'mean'),
+        avg_fat_all=('fat', 'mean'),
+        min_calories=('calories', 'min'),
+        max_logged_calories=('positive_calories', 'max'),
+        min_logged_calories=('positive_calories', 'min'),
+        calorie_variability=('positive_calories', 'std'),
+        recent_avg_calories=('recent_calories', 'mean'),
+        older_avg_calories=('older_calories', 'mean'),
+        avg_protein_percent=('protein_percent', 'mean'),
+        avg_carb_percent=('carb_percent', 'mean'),
+        avg_fat_percent=('fat_percent', 'mean'),
+        protein_percent_variability=('protein_percent', 'std'),
+        avg_calorie_deviation=('calorie_deviation', 'mean'),
+        calorie_adherence=('calorie_on_target', 'mean'),
+        protein_adherence=('protein_on_target', 'mean'),
+        **{name: (name, 'sum') for name in (day_counts or {})}
+    )
+
+    # With three or fewer logged days the recent/older split collapses to the overall mean
+    aggregated['older_avg_calories'] = aggregated['older_avg_calories'].fillna(aggregated['avg_calories'])
+    aggregated[['calorie_variability', 'protein_percent_variability']] = aggregated[
+        ['calorie_variability', 'protein_percent_variability']
+    ].fillna(0.0)
+
+    aggregated['goal_calories'] = goal_frame['goal_calories'].reindex(aggregated.index)
+    aggregated['goal_protein'] = goal_frame['goal_protein'].reindex(aggregated.index)
+    aggregated['has_goals'] = np.array([bool(goals.get(user_id)) for user_id in aggregated.index.tolist()])
+
+    return aggregated
+
+def summary_frame_to_metrics(aggregated: pd.DataFrame) -> Dict[int, Dict[str, Any]]:
+    """Per-user metric dicts with plain Python values (NaN becomes None)"""
+    # Column-wise tolist() keeps day counts as ints and yields plain Python values
+    columns = {name: aggregated[name].tolist() for name in aggregated.columns}
+    metrics = {}
+    for position, user_id in enumerate(aggregated.index.tolist()):
+        metrics[user_id] = {
+            name: (None if isinstance(values[position], float) and np.isnan(values[position]) else values[position])
+            for name, values in columns.items()
+        }
+    return metrics
+
+def compute_summary_metrics(
+    frame: pd.DataFrame,
+    goals: Optional[Dict[int, Dict[str, Any]]] = None,
+    day_counts: Optional[Dict[str, DayCountPredicate]] = None
+) -> Dict[int, Dict[str, Any]]:
+    """compute_summary_frame as {user_id: metrics}"""
+    return summary_frame_to_metrics(compute_summary_frame(frame, goals, day_counts))
+
+def calculate_balance_score(avg_protein: float, avg_carb: float, avg_fat: float) -> float:
+    """Calculate a balance score for macronutrients (0-1)"""
+    # Ideal ranges: Protein 15-25%, Carbs 45-65%, Fat 20-35%
+    protein_score = 1.0 if 15 <= avg_protein <= 25 else max(0, 1 - abs(avg_protein - 20) / 20)
+    carb_score = 1.0 if 45 <= avg_carb <= 65 else max(0, 1 - abs(avg_carb - 55) / 30)
+    fat_score = 1.0 if 20 <= avg_fat <= 35 else max(0, 1 - abs(avg_fat - 27.5) / 15)
+
+    return round((protein_score + carb_score + fat_score) / 3, 2)
@@ -0,0 +1,171 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Dict, Any, List, Optional
+import logging
+import time
+
+from sqlalchemy import desc
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.db_models import User, Meal
+from app.services.health_metrics import load_summary_frame, compute_summary_frame, summary_frame_to_metrics
+from app.services.health_rules import health_rule_engine
+from app.services.behavior_patterns import behavior_pattern_tracker
+from app.services.health_monitoring_service import HealthMonitoringService
+from app.services.monitoring_pipeline import monitoring_pipeline
+
+logger = logging.getLogger(__name__)
+
+class BatchHealthMonitor:
+    """
+    Population-wide health monitoring. Active users are split into chunks that
+    run on a worker pool; each chunk loads its summaries, goals and meals with
+    a handful of queries, computes metrics and evaluates the health rules for
+    all of its users in one vectorized pass, runs the meal-based checks, and
+    persists alerts, insights and patterns with bulk upserts in a single
+    commit. Results are published as monitoring snapshots so chat reads fresh
+    alerts without running monitoring.
+    """
+
+    def __init__(self, chunk_size: int = 500, max_workers: int = 4):
+        self.chunk_size = chunk_size
+        self.max_workers = max_workers
+        self.lock = Lock()
+        self.running = False
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def get_active_user_ids(self, db: Session, days: int = 14) -> List[int]:
+        """Users who logged a meal in the monitoring window"""
+        cutoff = date.today() - timedelta(days=days)
+        return [
+            row[0] for row in db.query(Meal.user_id).filter(
+                Meal.upload_date >= cutoff
+            ).distinct().order_by(Meal.user_id).all()
+        ]
+
+    def run(self, user_ids: Optional[List[int]] = None, days: int = 14) -> Dict[str, Any]:
+        """Monitor the given users (default: every active user) and report throughput"""
+        with self.lock:
+            if self.running:
+                return {'skipped': True, 'reason': 'batch already running'}
+            self.running = True
+
+        try:
+            started = time.perf_counter()
+
+            if user_ids is None:
+                db = SessionLocal()
+                try:
+                    user_ids = self.get_active_user_ids(db, days)
+                finally:
+                    db.close()
+
+            chunks = [user_ids[start:start + self.chunk_size] for start in range(0, len(user_ids), self.chunk_size)]
+            totals = defaultdict(int)
+
+            if chunks:
+                with ThreadPoolExecutor(
+                    max_workers=min(self.max_workers, len(chunks)),
+                    thread_name_prefix="health-batch"
+                ) as executor:
+                    for chunk_result in executor.map(lambda chunk: self._run_chunk(chunk, days), chunks):
+                        for key, value in chunk_result.items():
+                            totals[key] += value
+
+            elapsed = time.perf_counter() - started
+            result = {
+                'users_requested': len(user_ids),
+                'chunks': len(chunks),
+                **totals,
+                'elapsed_seconds': round(elapsed, 3),
+                'users_per_second': round(totals['users_monitored'] / elapsed, 1) if elapsed > 0 else 0.0,
+                'completed_at': datetime.now().isoformat()
+            }
+
+            with self.lock:
+                self.last_run = result
+
+            return result
+
+        finally:
+            with self.lock:
+                self.running = False
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'running': self.running,
+                'chunk_size': self.chunk_size,
+                'max_workers': self.max_workers,
+                'last_run': self.last_run
+            }
+
+    def _run_chunk(self, user_ids: List[int], days: int) -> Dict[str, int]:
+        db = SessionLocal()
+        try:
+            since = date.today() - timedelta(days=days)
+
+            goals = dict(db.query(User.id, User.daily_goals).filter(User.id.in_(user_ids)).all())
+            ruleset = health_rule_engine.get_ruleset()
+            summary_frame = compute_summary_frame(
+                load_summary_frame(db, user_ids, since, chunk_size=len(user_ids)),
+                goals,
+                ruleset.day_counts
+            )
+            metrics = summary_frame_to_metrics(summary_frame)
+            # Every alert rule evaluated once over the whole chunk's metric columns
+            rule_alerts = health_rule_engine.evaluate_alerts(
+                ruleset,
+                summary_frame.index.tolist(),
+                {name: summary_frame[name].to_numpy() for name in summary_frame.columns}
+            )
+
+            meals_by_user: Dict[int, List[Meal]] = defaultdict(list)
+            for meal in db.query(Meal).filter(
+                Meal.user_id.in_(user_ids),
+                Meal.upload_date >= since
+            ).order_by(desc(Meal.upload_time)).all():
+                meals_by_user[meal.user_id].append(meal)
+            patterns = behavior_pattern_tracker.load_patterns(db, user_ids)
+
+            health_monitor = HealthMonitoringService(db)
+            results = {}
+            failed = 0
+            for user_id in user_ids:
+                if user_id not in goals:
+                    continue
+                result = health_monitor.evaluate_user(
+                    user_id, meals_by_user.get(user_id, []), metrics.get(user_id), rule_alerts.get(user_id, []),
+                    patterns.get(user_id)
+                )
+                if result.get('error'):
+                    failed += 1
+                else:
+                    results[user_id] = result
+
+            writes = health_monitor.flush_pending_writes()
+            if writes.get('error'):
+                return {'users_monitored': 0, 'users_failed': len(user_ids)}
+
+            active_alerts = health_monitor.get_active_alerts_for_users(list(results))
+            for user_id, result in results.items():
+                monitoring_pipeline.publish_snapshot(user_id, 'batch', result, active_alerts.get(user_id, []))
+
+            return {'users_monitored': len(results), 'users_failed': failed, **writes}
+
+        except Exception as e:
+            logger.error(f"Batch health monitoring failed for a chunk of {len(user_ids)} users: {e}")
+            db.rollback()
+            return {'users_monitored': 0, 'users_failed': len(user_ids)}
+        finally:
+            db.close()
+
+# Global batch health monitor instance
+batch_health_monitor = BatchHealthMonitor(
+    chunk_size=settings.health_batch_chunk_size,
+    max_workers=settings.health_batch_workers
+)
@@ -1,21 +1,39 @@
-from datetime import datetime, timedelta, date
+from datetime import datetime, timedelta, date, time
 from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_, func
+from sqlalchemy import desc, and_, or_, func, insert, update
 from app.models.agentic_models import HealthAlert, UserBehaviorPattern, PredictiveInsight
 from app.models.db_models import User, Meal, DailySummary
+from app.services.health_metrics import load_summary_frame, compute_summary_metrics
+from app.services.health_rules import HealthRuleSet, health_rule_engine
+from app.services.behavior_patterns import BehaviorPatternState, behavior_pattern_tracker
 import json
-import statistics
+import re
+
+# Alerts are deduplicated per user, rule and window; the window length is also the alert's lifetime
+ALERT_WINDOW_DAYS = {
+    'nutrition_gap': 7,
+    'pattern_concern': 7,
+    'calorie_excess': 7,
+    'goal_deviation': 3,
+    'health_risk': 14
+}
+INSIGHT_WINDOW_DAYS = {'short_term': 7, 'medium_term': 30, 'long_term': 90}
+
+def window_start(days: int, today: Optional[date] = None) -> date:
+    """Start of the fixed-length window (aligned to date ordinals) that contains today"""
+    ordinal = (today or date.today()).toordinal()
+    return date.fromordinal(ordinal - ordinal % days)
+
+# Rows per INSERT ... ON CONFLICT statement (keeps bound parameters under SQLite's limit)
+UPSERT_CHUNK_SIZE = 500
 
 class HealthMonitoringService:
     def __init__(self, db: Session):
         self.db = db
-        self.alert_thresholds = {
-            'calorie_excess': 500,  # Calories above goal
-            'calorie_deficit': 300,  # Calories below goal
-            'protein_deficit': 20,   # Grams below recommended
-            'consecutive_days_concern': 3,  # Days of concerning pattern
-            'weight_change_concern': 2.0,  # Kg change threshold
+        # Alerts, insights and patterns are staged during a run and persisted by flush_pending_writes()
+        self.pending_writes: Dict[str, List[Tuple[Dict[str, Any], Optional[Dict[str, Any]]]]] = {
+            'alerts': [], 'insights': [], 'patterns': []
         }
     
     def run_health_monitoring(self, user_id: int) -> Dict[str, Any]:
@@ -27,37 +45,73 @@ class HealthMonitoringService:
             
             # Get recent data for analysis
             recent_meals = self._get_recent_meals(user_id, days=14)
-            daily_summaries = self._get_recent_summaries(user_id, days=14)
+            # All daily-summary metrics in one vectorized pass (None without summaries)
+            ruleset = health_rule_engine.get_ruleset()
+            metrics = self._get_summary_metrics(user_id, user.daily_goals, ruleset, days=14)
+            rule_alerts = health_rule_engine.evaluate_user_alerts(ruleset, user_id, metrics) if metrics else []
+            patterns = behavior_pattern_tracker.load_patterns(self.db, [user_id]).get(user_id)
+            
+            results = self.evaluate_user(user_id, recent_meals, metrics, rule_alerts, patterns)
             
+            # One upsert and commit for everything the run produced
+            writes = self.flush_pending_writes()
+            if writes.get('error'):
+                return {'error': writes['error']}
+            
+            return results
+            
+        except Exception as e:
+            print(f"Error in health monitoring: {e}")
+            return {'error': str(e)}
+    
+    def evaluate_user(
+        self, 
+        user_id: int, 
+        recent_meals: List[Meal], 
+        metrics: Optional[Dict[str, Any]],
+        rule_alerts: List[Dict[str, Any]],
+        patterns: Optional[Dict[str, Dict[str, Any]]] = None
+    ) -> Dict[str, Any]:
+        """
+        Run every monitoring check over data that has already been loaded for a
+        user. rule_alerts are the outputs of the declarative health rules that
+        fired for the user's summary metrics; patterns are the user's stored
+        behavior patterns (None if they have never been tracked).
+        """
+        try:
             # Run various monitoring checks
             alerts_generated = []
             patterns_updated = []
             insights_generated = []
             
             # 1. Nutritional monitoring
-            nutrition_alerts = self._monitor_nutrition_patterns(user_id, recent_meals, daily_summaries)
+            nutrition_alerts = self._monitor_nutrition_patterns(user_id, recent_meals, metrics)
             alerts_generated.extend(nutrition_alerts)
             
             # 2. Eating pattern monitoring
             pattern_alerts = self._monitor_eating_patterns(user_id, recent_meals)
             alerts_generated.extend(pattern_alerts)
             
-            # 3. Goal adherence monitoring
-            goal_alerts = self._monitor_goal_adherence(user_id, daily_summaries, user.daily_goals)
-            alerts_generated.extend(goal_alerts)
-            
-            # 4. Update behavior patterns
-            updated_patterns = self._update_behavior_patterns(user_id, recent_meals, daily_summaries)
+            # 3. Summary-metric rules: nutrition thresholds, goal adherence, health risks
+            for rule_alert in rule_alerts:
+                alerts_generated.append(self._create_alert(
+                    user_id=user_id,
+                    alert_type=rule_alert['alert_type'],
+                    severity=rule_alert['severity'],
+                    title=rule_alert['title'],
+                    message=rule_alert['message'],
+                    data_context=rule_alert.get('data_context', {}),
+                    rule_id=rule_alert['rule_id']
+                ))
+            
+            # 4. Behavior patterns
+            updated_patterns = self._update_behavior_patterns(user_id, recent_meals, patterns)
             patterns_updated.extend(updated_patterns)
             
             # 5. Generate predictive insights
-            predictions = self._generate_predictive_insights(user_id, recent_meals, daily_summaries)
+            predictions = self._generate_predictive_insights(user_id, recent_meals, metrics)
             insights_generated.extend(predictions)
             
-            # 6. Health risk assessment
-            risk_alerts = self._assess_health_risks(user_id, recent_meals, daily_summaries)
-            alerts_generated.extend(risk_alerts)
-            
             return {
                 'monitoring_completed': True,
                 'alerts_generated': len(alerts_generated),
@@ -77,80 +131,15 @@ class HealthMonitoringService:
         self, 
         user_id: int, 
         recent_meals: List[Meal], 
-        daily_summaries: List[DailySummary]
+        metrics: Optional[Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
-        """Monitor nutritional patterns and generate alerts"""
+        """Meal-based nutrition checks (summary thresholds live in the health rules file)"""
         alerts = []
         
-        if not daily_summaries:
+        if not metrics:
             return alerts
         
-        # Calculate average daily nutrition
-        avg_calories = statistics.mean([s.total_calories for s in daily_summaries if s.total_calories > 0])
-        avg_protein = statistics.mean([s.total_protein for s in daily_summaries if s.total_protein > 0])
-        avg_carbs = statistics.mean([s.total_carbs for s in daily_summaries if s.total_carbs > 0])
-        avg_fat = statistics.mean([s.total_fat for s in daily_summaries if s.total_fat > 0])
-        
-        # Check for concerning patterns
-        
-        # 1. Consistently low protein intake
-        low_protein_days = len([s for s in daily_summaries if s.total_protein < 50])
-        if low_protein_days >= 3:
-            alert = self._create_alert(
-                user_id=user_id,
-                alert_type='nutrition_gap',
-                severity='medium',
-                title='Low Protein Intake Detected',
-                message=f'You\'ve had low protein intake for {low_protein_days} days. Consider adding dal, paneer, eggs, or nuts to your meals.',
-                data_context={
-                    'avg_protein': round(avg_protein, 1),
-                    'low_protein_days': low_protein_days,
-                    'recommended_protein': 60,
-                    'suggestions': ['Add dal to lunch and dinner', 'Include paneer or curd', 'Snack on nuts or seeds']
-                }
-            )
-            alerts.append(alert)
-        
-        # 2. Excessive calorie intake pattern
-        high_calorie_days = len([s for s in daily_summaries if s.total_calories > 2500])
-        if high_calorie_days >= 3:
-            alert = self._create_alert(
-                user_id=user_id,
-                alert_type='calorie_excess',
-                severity='medium',
-                title='High Calorie Intake Pattern',
-                message=f'You\'ve exceeded 2500 calories for {high_calorie_days} days. Consider portion control and lighter evening meals.',
-                data_context={
-                    'avg_calories': round(avg_calories, 1),
-                    'high_calorie_days': high_calorie_days,
-                    'suggestions': ['Reduce rice/roti portions', 'Use less oil in cooking', 'Add more vegetables']
-                }
-            )
-            alerts.append(alert)
-        
-        # 3. Imbalanced macronutrient ratios
-        if avg_calories > 0:
-            protein_percent = (avg_protein * 4 / avg_calories) * 100
-            carbs_percent = (avg_carbs * 4 / avg_calories) * 100
-            fat_percent = (avg_fat * 9 / avg_calories) * 100
-            
-            if carbs_percent > 70:
-                alert = self._create_alert(
-                    user_id=user_id,
-                    alert_type='nutrition_gap',
-                    severity='low',
-                    title='High Carbohydrate Intake',
-                    message=f'Your diet is {carbs_percent:.1f}% carbohydrates. Consider balancing with more protein and healthy fats.',
-                    data_context={
-                        'carbs_percent': round(carbs_percent, 1),
-                        'protein_percent': round(protein_percent, 1),
-                        'fat_percent': round(fat_percent, 1),
-                        'suggestions': ['Replace some rice with dal', 'Add nuts to meals', 'Include more protein sources']
-                    }
-                )
-                alerts.append(alert)
-        
-        # 4. Micronutrient concerns (based on food variety)
+        # Micronutrient concerns (based on food variety)
         food_variety = self._analyze_food_variety(recent_meals)
         if food_variety['unique_foods'] < 15:
             alert = self._create_alert(
@@ -235,193 +224,49 @@ class HealthMonitoringService:
         
         return alerts
     
-    def _monitor_goal_adherence(
-        self, 
-        user_id: int, 
-        daily_summaries: List[DailySummary], 
-        daily_goals: Dict[str, Any]
-    ) -> List[Dict[str, Any]]:
-        """Monitor adherence to daily goals"""
-        alerts = []
-        
-        if not daily_goals or not daily_summaries:
-            return alerts
-        
-        goal_calories = daily_goals.get('calories', 2000)
-        goal_protein = daily_goals.get('protein', 60)
-        
-        # Calculate goal adherence
-        calorie_misses = 0
-        protein_misses = 0
-        
-        for summary in daily_summaries:
-            if abs(summary.total_calories - goal_calories) > self.alert_thresholds['calorie_excess']:
-                calorie_misses += 1
-            if summary.total_protein < (goal_protein - self.alert_thresholds['protein_deficit']):
-                protein_misses += 1
-        
-        # Generate alerts for poor adherence
-        if calorie_misses >= 4:
-            deviation = statistics.mean([abs(s.total_calories - goal_calories) for s in daily_summaries])
-            alert = self._create_alert(
-                user_id=user_id,
-                alert_type='goal_deviation',
-                severity='medium',
-                title='Calorie Goal Adherence Issue',
-                message=f'You\'ve missed your calorie goal for {calorie_misses} days with an average deviation of {deviation:.0f} calories.',
-                data_context={
-                    'goal_calories': goal_calories,
-                    'missed_days': calorie_misses,
-                    'avg_deviation': round(deviation, 1),
-                    'suggestions': ['Track meals more carefully', 'Plan meals in advance', 'Use smaller plates for portion control']
-                }
-            )
-            alerts.append(alert)
-        
-        if protein_misses >= 4:
-            avg_protein = statistics.mean([s.total_protein for s in daily_summaries])
-            alert = self._create_alert(
-                user_id=user_id,
-                alert_type='goal_deviation',
-                severity='medium',
-                title='Protein Goal Not Being Met',
-                message=f'You\'ve missed your protein goal for {protein_misses} days. Average intake: {avg_protein:.1f}g vs goal: {goal_protein}g.',
-                data_context={
-                    'goal_protein': goal_protein,
-                    'avg_protein': round(avg_protein, 1),
-                    'missed_days': protein_misses,
-                    'suggestions': ['Add dal to every meal', 'Include paneer or curd', 'Snack on nuts and seeds']
-                }
-            )
-            alerts.append(alert)
-        
-        return alerts
-    
-    def _assess_health_risks(
-        self, 
-        user_id: int, 
-        recent_meals: List[Meal], 
-        daily_summaries: List[DailySummary]
-    ) -> List[Dict[str, Any]]:
-        """Assess potential health risks based on eating patterns"""
-        alerts = []
-        
-        if not daily_summaries:
-            return alerts
-        
-        # 1. Diabetes risk assessment (high carb, low fiber pattern)
-        high_carb_days = len([s for s in daily_summaries if s.total_carbs > 300])
-        if high_carb_days >= 5:
-            alert = self._create_alert(
-                user_id=user_id,
-                alert_type='health_risk',
-                severity='high',
-                title='High Carbohydrate Intake Risk',
-                message='Consistently high carbohydrate intake may increase diabetes risk. Consider reducing refined carbs and adding fiber.',
-                data_context={
-                    'high_carb_days': high_carb_days,
-                    'avg_carbs': round(statistics.mean([s.total_carbs for s in daily_summaries]), 1),
-                    'risk_factors': ['High refined carb intake', 'Potential blood sugar spikes'],
-                    'recommendations': ['Choose brown rice over white', 'Add more vegetables', 'Include whole grains']
-                }
-            )
-            alerts.append(alert)
-        
-        # 2. Cardiovascular risk (high calorie, high fat pattern)
-        high_calorie_high_fat_days = len([
-            s for s in daily_summaries 
-            if s.total_calories > 2500 and s.total_fat > 80
-        ])
-        if high_calorie_high_fat_days >= 4:
-            alert = self._create_alert(
-                user_id=user_id,
-                alert_type='health_risk',
-                severity='high',
-                title='Cardiovascular Risk Pattern',
-                message='High calorie and fat intake pattern detected. This may increase cardiovascular risk.',
-                data_context={
-                    'concerning_days': high_calorie_high_fat_days,
-                    'avg_calories': round(statistics.mean([s.total_calories for s in daily_summaries]), 1),
-                    'avg_fat': round(statistics.mean([s.total_fat for s in daily_summaries]), 1),
-                    'recommendations': ['Use less oil in cooking', 'Choose lean proteins', 'Increase physical activity']
-                }
-            )
-            alerts.append(alert)
-        
-        # 3. Nutritional deficiency risk (very low calorie pattern)
-        very_low_calorie_days = len([s for s in daily_summaries if s.total_calories < 1200])
-        if very_low_calorie_days >= 3:
-            alert = self._create_alert(
-                user_id=user_id,
-                alert_type='health_risk',
-                severity='high',
-                title='Potential Nutritional Deficiency Risk',
-                message=f'Very low calorie intake for {very_low_calorie_days} days may lead to nutritional deficiencies.',
-                data_context={
-                    'low_calorie_days': very_low_calorie_days,
-                    'min_calories': min([s.total_calories for s in daily_summaries]),
-                    'recommendations': ['Ensure adequate calorie intake', 'Include nutrient-dense foods', 'Consider consulting a nutritionist']
-                }
-            )
-            alerts.append(alert)
-        
-        return alerts
-    
     def _update_behavior_patterns(
         self, 
         user_id: int, 
         recent_meals: List[Meal], 
-        daily_summaries: List[DailySummary]
+        patterns: Optional[Dict[str, Dict[str, Any]]]
     ) -> List[Dict[str, Any]]:
-        """Update user behavior patterns for predictive analytics"""
-        patterns_updated = []
-        
+        """
+        Behavior patterns are kept current incrementally as meals are logged
+        (see behavior_patterns), so this only reads them. Users whose patterns
+        have never been tracked are seeded from the recent meals already loaded
+        for this run.
+        """
         try:
-            # 1. Eating time patterns
-            eating_times = [m.upload_time.hour for m in recent_meals if m.upload_time]
-            if eating_times:
-                time_pattern = self._analyze_eating_time_pattern(eating_times)
-                self._update_pattern(user_id, 'eating_time', time_pattern)
-                patterns_updated.append({'type': 'eating_time', 'data': time_pattern})
-            
-            # 2. Food preference patterns
-            food_preferences = self._analyze_food_preferences(recent_meals)
-            self._update_pattern(user_id, 'food_preference', food_preferences)
-            patterns_updated.append({'type': 'food_preference', 'data': food_preferences})
-            
-            # 3. Calorie trend patterns
-            if daily_summaries:
-                calorie_trend = self._analyze_calorie_trend(daily_summaries)
-                self._update_pattern(user_id, 'calorie_trend', calorie_trend)
-                patterns_updated.append({'type': 'calorie_trend', 'data': calorie_trend})
-            
-            # 4. Macro balance patterns
-            if daily_summaries:
-                macro_balance = self._analyze_macro_balance(daily_summaries)
-                self._update_pattern(user_id, 'macro_balance', macro_balance)
-                patterns_updated.append({'type': 'macro_balance', 'data': macro_balance})
-            
-            return patterns_updated
+            if patterns is None:
+                state = BehaviorPatternState.from_meals(recent_meals)
+                patterns = state.patterns()
+                for row in state.rows(user_id):
+                    self.pending_writes['patterns'].append((row, None))
+            
+            return [
+                {'type': pattern_type, 'data': pattern_data}
+                for pattern_type, pattern_data in patterns.items() if pattern_data
+            ]
             
         except Exception as e:
             print(f"Error updating behavior patterns: {e}")
-            return patterns_updated
+            return []
     
     def _generate_predictive_insights(
         self, 
         user_id: int, 
         recent_meals: List[Meal], 
-        daily_summaries: List[DailySummary]
+        metrics: Optional[Dict[str, Any]]
     ) -> List[Dict[str, Any]]:
         """Generate predictive insights about user's health trajectory"""
         insights = []
         
-        if len(daily_summaries) < 7:
+        if not metrics or metrics['days'] < 7:
             return insights
         
         try:
             # 1. Weight trend prediction (based on calorie patterns)
-            calorie_trend = self._predict_weight_trend(daily_summaries)
+            calorie_trend = self._predict_weight_trend(metrics)
             if calorie_trend['prediction'] != 'stable':
                 insight = self._create_insight(
                     user_id=user_id,
@@ -435,7 +280,7 @@ class HealthMonitoringService:
                 insights.append(insight)
             
             # 2. Goal achievement prediction
-            goal_prediction = self._predict_goal_achievement(user_id, daily_summaries)
+            goal_prediction = self._predict_goal_achievement(metrics)
             if goal_prediction:
                 insight = self._create_insight(
                     user_id=user_id,
@@ -449,7 +294,7 @@ class HealthMonitoringService:
                 insights.append(insight)
             
             # 3. Health risk prediction
-            risk_prediction = self._predict_health_risks(daily_summaries)
+            risk_prediction = self._predict_health_risks(metrics)
             if risk_prediction['risk_level'] != 'low':
                 insight = self._create_insight(
                     user_id=user_id,
@@ -470,39 +315,45 @@ class HealthMonitoringService:
     
     def get_active_alerts(self, user_id: int) -> List[Dict[str, Any]]:
         """Get all active alerts for a user"""
+        return self.get_active_alerts_for_users([user_id]).get(user_id, [])
+    
+    def get_active_alerts_for_users(self, user_ids: List[int]) -> Dict[int, List[Dict[str, Any]]]:
+        """Get active alerts for many users with one query per chunk of users"""
+        alerts_by_user = {user_id: [] for user_id in user_ids}
         try:
-            alerts = self.db.query(HealthAlert).filter(
-                and_(
-                    HealthAlert.user_id == user_id,
-                    HealthAlert.is_dismissed == False,
-                    or_(
-                        HealthAlert.expires_at.is_(None),
-                        HealthAlert.expires_at > datetime.now()
+            for start in range(0, len(user_ids), 500):
+                alerts = self.db.query(HealthAlert).filter(
+                    and_(
+                        HealthAlert.user_id.in_(user_ids[start:start + 500]),
+                        HealthAlert.is_dismissed == False,
+                        or_(
+                            HealthAlert.expires_at.is_(None),
+                            HealthAlert.expires_at > datetime.now()
+                        )
                     )
-                )
-            ).order_by(
-                desc(HealthAlert.severity),
-                desc(HealthAlert.triggered_at)
-            ).all()
-            
-            return [
-                {
-                    'id': alert.id,
-                    'alert_type': alert.alert_type,
-                    'severity': alert.severity,
-                    'title': alert.title,
-                    'message': alert.message,
-                    'data_context': alert.data_context,
-                    'is_read': alert.is_read,
-                    'triggered_at': alert.triggered_at.isoformat(),
-                    'expires_at': alert.expires_at.isoformat() if alert.expires_at else None
-                }
-                for alert in alerts
-            ]
+                ).order_by(
+                    desc(HealthAlert.severity),
+                    desc(HealthAlert.triggered_at)
+                ).all()
+                
+                for alert in alerts:
+                    alerts_by_user[alert.user_id].append({
+                        'id': alert.id,
+                        'alert_type': alert.alert_type,
+                        'severity': alert.severity,
+                        'title': alert.title,
+                        'message': alert.message,
+                        'data_context': alert.data_context,
+                        'is_read': alert.is_read,
+                        'triggered_at': alert.triggered_at.isoformat(),
+                        'expires_at': alert.expires_at.isoformat() if alert.expires_at else None
+                    })
+            
+            return alerts_by_user
             
         except Exception as e:
             print(f"Error getting active alerts: {e}")
-            return []
+            return alerts_by_user
     
     def dismiss_alert(self, user_id: int, alert_id: int) -> bool:
         """Dismiss a specific alert"""
@@ -559,98 +410,227 @@ class HealthMonitoringService:
             )
         ).order_by(desc(Meal.upload_time)).all()
     
-    def _get_recent_summaries(self, user_id: int, days: int = 14) -> List[DailySummary]:
-        """Get recent daily summaries for analysis"""
-        cutoff_date = date.today() - timedelta(days=days)
-        return self.db.query(DailySummary).filter(
-            and_(
-                DailySummary.user_id == user_id,
-                DailySummary.date >= cutoff_date
-            )
-        ).order_by(desc(DailySummary.date)).all()
+    def _get_summary_metrics(
+        self, 
+        user_id: int, 
+        daily_goals: Optional[Dict[str, Any]], 
+        ruleset: HealthRuleSet, 
+        days: int = 14
+    ) -> Optional[Dict[str, Any]]:
+        """Load recent daily summaries as a frame and compute every monitoring metric at once"""
+        frame = load_summary_frame(self.db, [user_id], date.today() - timedelta(days=days))
+        return compute_summary_metrics(frame, {user_id: daily_goals}, ruleset.day_counts).get(user_id)
     
     def _create_alert(self, **kwargs) -> Dict[str, Any]:
-        """Create and store a health alert"""
+        """Stage a health alert, keyed by rule and alert window, for the run's upsert"""
+        window_days = ALERT_WINDOW_DAYS.get(kwargs['alert_type'], 7)
+        start = window_start(window_days)
+        # Rules file alerts are keyed by rule id (their titles are templates and can be
+        # edited); the hand-coded alerts above have fixed titles that identify them
+        if kwargs.get('rule_id'):
+            rule = f"rule-{kwargs['rule_id']}"
+        else:
+            rule = re.sub(r'[^a-z0-9]+', '_', kwargs['title'].lower()).strip('_')
+        
+        row = {
+            'user_id': kwargs['user_id'],
+            'alert_type': kwargs['alert_type'],
+            'severity': kwargs['severity'],
+            'title': kwargs['title'],
+            'message': kwargs['message'],
+            'data_context': kwargs.get('data_context', {}),
+            'dedup_key': f"{kwargs['alert_type']}:{rule}:{start.isoformat()}",
+            # Alerts expire with their window; a pattern that persists is raised again in the next one
+            'expires_at': datetime.combine(start + timedelta(days=window_days), time.min)
+        }
+        
+        # 'id' is filled in once the run is flushed
+        alert = {
+            'alert_type': row['alert_type'],
+            'severity': row['severity'],
+            'title': row['title'],
+            'message': row['message'],
+            'data_context': row['data_context'],
+            'triggered_at': datetime.now().isoformat()
+        }
+        self.pending_writes['alerts'].append((row, alert))
+        return alert
+    
+    def _create_insight(self, **kwargs) -> Dict[str, Any]:
+        """Stage a predictive insight, keyed by type and time-horizon window, for the run's upsert"""
+        window_days = INSIGHT_WINDOW_DAYS.get(kwargs['time_horizon'], 30)
+        start = window_start(window_days)
+        
+        row = {
+            'user_id': kwargs['user_id'],
+            'insight_type': kwargs['insight_type'],
+            'title': kwargs['title'],
+            'description': kwargs['description'],
+            'prediction_data': kwargs.get('prediction_data', {}),
+            'confidence_level': kwargs.get('confidence_level', 0.5),
+            'time_horizon': kwargs['time_horizon'],
+            'actionable_recommendations': kwargs.get('actionable_recommendations', []),
+            'is_active': True,
+            'dedup_key': f"{kwargs['insight_type']}:{start.isoformat()}",
+            'expires_at': datetime.combine(start + timedelta(days=window_days), time.min)
+        }
+        
+        insight = {
+            'insight_type': row['insight_type'],
+            'title': row['title'],
+            'description': row['description'],
+            'prediction_data': row['prediction_data'],
+            'confidence_level': row['confidence_level'],
+            'time_horizon': row['time_horizon'],
+            'created_at': datetime.now().isoformat()
+        }
+        self.pending_writes['insights'].append((row, insight))
+        return insight
+    
+    def flush_pending_writes(self) -> Dict[str, int]:
+        """
+        Persist staged alerts, insights and patterns for every user in the run
+        with bulk statements and a single commit. Alerts and insights are
+        upserted with INSERT ... ON CONFLICT on the unique (user_id, dedup_key),
+        so repeated or concurrent runs within a window refresh one row (keeping
+        its read/dismissed state); patterns are keyed by (user_id, pattern_type).
+        """
+        pending = self.pending_writes
+        self.pending_writes = {'alerts': [], 'insights': [], 'patterns': []}
+        counts = {'alerts_upserted': 0, 'insights_upserted': 0, 'patterns_inserted': 0, 'patterns_updated': 0}
+        
         try:
-            # Set expiration time based on alert type
-            expires_at = None
-            if kwargs['alert_type'] in ['nutrition_gap', 'pattern_concern']:
-                expires_at = datetime.now() + timedelta(days=7)
-            elif kwargs['alert_type'] == 'goal_deviation':
-                expires_at = datetime.now() + timedelta(days=3)
-            elif kwargs['alert_type'] == 'health_risk':
-                expires_at = datetime.now() + timedelta(days=14)
-            
-            alert = HealthAlert(
-                user_id=kwargs['user_id'],
-                alert_type=kwargs['alert_type'],
-                severity=kwargs['severity'],
-                title=kwargs['title'],
-                message=kwargs['message'],
-                data_context=kwargs.get('data_context', {}),
-                expires_at=expires_at
-            )
+            now = datetime.now()
+            
+            for kind, model, refreshed_field in [
+                ('alerts', HealthAlert, 'triggered_at'),
+                ('insights', PredictiveInsight, 'created_at')
+            ]:
+                if not pending[kind]:
+                    continue
+                
+                # The last staged row per key wins
+                latest = {(row['user_id'], row['dedup_key']): row for row, _ in pending[kind]}
+                ids = self._upsert_by_dedup_key(model, list(latest.values()), refreshed_field, now)
+                counts[f'{kind}_upserted'] = len(latest)
+                
+                # Hand the stored row ids back to the dicts the rules returned
+                for row, result in pending[kind]:
+                    result['id'] = ids.get((row['user_id'], row['dedup_key']))
             
-            self.db.add(alert)
-            self.db.commit()
-            self.db.refresh(alert)
+            if pending['patterns']:
+                latest = {(row['user_id'], row['pattern_type']): row for row, _ in pending['patterns']}
+                existing = self._load_ids_by_key(UserBehaviorPattern, UserBehaviorPattern.pattern_type, latest)
+                
+                inserts, updates = [], []
+                for key, row in latest.items():
+                    if key in existing:
+                        updates.append({'id': existing[key], **row, 'last_updated': now})
+                    else:
+                        inserts.append(row)
+                
+                if inserts:
+                    self.db.execute(insert(UserBehaviorPattern), inserts)
+                if updates:
+                    # ORM bulk UPDATE by primary key (executemany)
+                    self.db.execute(update(UserBehaviorPattern), updates)
+                counts['patterns_inserted'], counts['patterns_updated'] = len(inserts), len(updates)
             
-            return {
-                'id': alert.id,
-                'alert_type': alert.alert_type,
-                'severity': alert.severity,
-                'title': alert.title,
-                'message': alert.message,
-                'data_context': alert.data_context,
-                'triggered_at': alert.triggered_at.isoformat()
-            }
+            self.db.commit()
+            return counts
             
         except Exception as e:
-            print(f"Error creating alert: {e}")
+            print(f"Error flushing monitoring writes: {e}")
             self.db.rollback()
-            return {}
+            return {'error': str(e)}
     
-    def _create_insight(self, **kwargs) -> Dict[str, Any]:
-        """Create and store a predictive insight"""
+    def _upsert_by_dedup_key(self, model, rows: List[Dict[str, Any]], refreshed_field: str, now: datetime) -> Dict[Tuple, int]:
+        """INSERT ... ON CONFLICT (user_id, dedup_key) DO UPDATE; returns (user_id, dedup_key) -> id"""
+        dialect = self.db.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            return self._upsert_by_select(model, rows, refreshed_field, now)
+        
+        ids = {}
+        for start in range(0, len(rows), UPSERT_CHUNK_SIZE):
+            statement = dialect_insert(model).values(rows[start:start + UPSERT_CHUNK_SIZE])
+            # Refresh everything the rule produced; is_read/is_dismissed are left alone
+            refreshed = {
+                column: statement.excluded[column]
+                for column in rows[0] if column not in ('user_id', 'dedup_key')
+            }
+            refreshed[refreshed_field] = now
+            statement = statement.on_conflict_do_update(
+                index_elements=['user_id', 'dedup_key'], set_=refreshed
+            ).returning(model.id, model.user_id, model.dedup_key)
+            for row_id, user_id, dedup_key in self.db.execute(statement):
+                ids[(user_id, dedup_key)] = row_id
+        return ids
+    
+    def _upsert_by_select(self, model, rows: List[Dict[str, Any]], refreshed_field: str, now: datetime) -> Dict[Tuple, int]:
+        """
+        Upsert for dialects without ON CONFLICT: look up the stored keys, then
+        bulk insert the new rows and bulk update the rest in the run's
+        transaction (the unique constraint still rejects a concurrent duplicate)
+        """
+        keyed = {(row['user_id'], row['dedup_key']): row for row in rows}
+        ids = self._load_ids_by_key(model, model.dedup_key, keyed)
+        
+        inserts = [row for key, row in keyed.items() if key not in ids]
+        updates = [
+            {
+                'id': ids[key],
+                **{column: value for column, value in row.items() if column not in ('user_id', 'dedup_key')},
+                refreshed_field: now
+            }
+            for key, row in keyed.items() if key in ids
+        ]
+        if inserts:
+            self.db.execute(insert(model), inserts)
+            ids.update(self._load_ids_by_key(
+                model, model.dedup_key, {(row['user_id'], row['dedup_key']): row for row in inserts}
+            ))
+        if updates:
+            self.db.execute(update(model), updates)
+        return ids
+    
+    def prune_expired(self, grace_days: int = 7) -> Dict[str, int]:
+        """Delete alerts and insights that expired more than grace_days ago"""
         try:
-            # Set expiration based on time horizon
-            expires_at = datetime.now() + timedelta(days=30)
-            if kwargs['time_horizon'] == 'short_term':
-                expires_at = datetime.now() + timedelta(days=7)
-            elif kwargs['time_horizon'] == 'long_term':
-                expires_at = datetime.now() + timedelta(days=90)
-            
-            insight = PredictiveInsight(
-                user_id=kwargs['user_id'],
-                insight_type=kwargs['insight_type'],
-                title=kwargs['title'],
-                description=kwargs['description'],
-                prediction_data=kwargs.get('prediction_data', {}),
-                confidence_level=kwargs.get('confidence_level', 0.5),
-                time_horizon=kwargs['time_horizon'],
-                actionable_recommendations=kwargs.get('actionable_recommendations', []),
-                expires_at=expires_at
-            )
+            cutoff = datetime.now() - timedelta(days=grace_days)
             
-            self.db.add(insight)
-            self.db.commit()
-            self.db.refresh(insight)
+            alerts_deleted = self.db.query(HealthAlert).filter(
+                HealthAlert.expires_at < cutoff
+            ).delete(synchronize_session=False)
             
-            return {
-                'id': insight.id,
-                'insight_type': insight.insight_type,
-                'title': insight.title,
-                'description': insight.description,
-                'prediction_data': insight.prediction_data,
-                'confidence_level': insight.confidence_level,
-                'time_horizon': insight.time_horizon,
-                'created_at': insight.created_at.isoformat()
-            }
+            insights_deleted = self.db.query(PredictiveInsight).filter(
+                PredictiveInsight.expires_at < cutoff
+            ).delete(synchronize_session=False)
+            
+            self.db.commit()
+            return {'alerts_deleted': alerts_deleted, 'insights_deleted': insights_deleted}
             
         except Exception as e:
-            print(f"Error creating insight: {e}")
+            print(f"Error pruning expired alerts: {e}")
             self.db.rollback()
-            return {}
+            return {'error': str(e)}
+    
+    def _load_ids_by_key(self, model, key_column, keys: Dict[Tuple, Any]) -> Dict[Tuple, int]:
+        """Map (user_id, key) to the id of the newest stored row for each staged key"""
+        user_ids = list({user_id for user_id, _ in keys})
+        key_values = list({key for _, key in keys})
+        found = {}
+        for start in range(0, len(user_ids), 500):
+            rows = self.db.query(model.id, model.user_id, key_column).filter(
+                model.user_id.in_(user_ids[start:start + 500]),
+                key_column.in_(key_values)
+            ).order_by(model.id).all()
+            for row_id, user_id, key in rows:
+                found[(user_id, key)] = row_id
+        return found
     
     def _analyze_food_variety(self, meals: List[Meal]) -> Dict[str, Any]:
         """Analyze food variety in recent meals"""
@@ -673,191 +653,12 @@ class HealthMonitoringService:
             'variety_score': min(len(all_foods) / 20, 1.0)  # Score out of 1.0
         }
     
-    def _analyze_eating_time_pattern(self, eating_times: List[int]) -> Dict[str, Any]:
-        """Analyze eating time patterns"""
-        if not eating_times:
-            return {}
-        
-        breakfast_times = [t for t in eating_times if 5 <= t <= 11]
-        lunch_times = [t for t in eating_times if 11 < t <= 16]
-        dinner_times = [t for t in eating_times if 16 < t <= 23]
-        
-        return {
-            'avg_breakfast_time': statistics.mean(breakfast_times) if breakfast_times else None,
-            'avg_lunch_time': statistics.mean(lunch_times) if lunch_times else None,
-            'avg_dinner_time': statistics.mean(dinner_times) if dinner_times else None,
-            'eating_window': max(eating_times) - min(eating_times) if eating_times else 0,
-            'meal_frequency': len(eating_times),
-            'late_meals': len([t for t in eating_times if t >= 21])
-        }
-    
-    def _analyze_food_preferences(self, meals: List[Meal]) -> Dict[str, Any]:
-        """Analyze food preferences from meal history"""
-        cuisine_types = {}
-        cooking_methods = {}
-        ingredients = {}
-        
-        for meal in meals:
-            if meal.analysis_data and meal.analysis_data.get('items'):
-                for item in meal.analysis_data['items']:
-                    food_name = item.get('name', '').lower()
-                    
-                    # Simple cuisine classification
-                    if any(word in food_name for word in ['dal', 'curry', 'rice', 'roti', 'sabzi']):
-                        cuisine_types['indian'] = cuisine_types.get('indian', 0) + 1
-                    elif any(word in food_name for word in ['pasta', 'pizza', 'bread']):
-                        cuisine_types['western'] = cuisine_types.get('western', 0) + 1
-                    elif any(word in food_name for word in ['noodles', 'fried rice']):
-                        cuisine_types['chinese'] = cuisine_types.get('chinese', 0) + 1
-                    
-                    # Cooking methods
-                    if any(word in food_name for word in ['fried', 'fry']):
-                        cooking_methods['fried'] = cooking_methods.get('fried', 0) + 1
-                    elif any(word in food_name for word in ['steamed', 'boiled']):
-                        cooking_methods['steamed'] = cooking_methods.get('steamed', 0) + 1
-                    elif any(word in food_name for word in ['grilled', 'roasted']):
-                        cooking_methods['grilled'] = cooking_methods.get('grilled', 0) + 1
-        
-        return {
-            'cuisine_preferences': cuisine_types,
-            'cooking_methods': cooking_methods,
-            'total_meals_analyzed': len(meals)
-        }
-    
-    def _analyze_calorie_trend(self, daily_summaries: List[DailySummary]) -> Dict[str, Any]:
-        """Analyze calorie intake trends"""
-        if len(daily_summaries) < 3:
-            return {}
-        
-        calories = [s.total_calories for s in daily_summaries if s.total_calories > 0]
-        if not calories:
-            return {}
-        
-        # Calculate trend
-        avg_calories = statistics.mean(calories)
-        recent_avg = statistics.mean(calories[:3]) if len(calories) >= 3 else avg_calories
-        older_avg = statistics.mean(calories[3:]) if len(calories) > 3 else avg_calories
-        
-        trend = 'stable'
-        if recent_avg > older_avg + 200:
-            trend = 'increasing'
-        elif recent_avg < older_avg - 200:
-            trend = 'decreasing'
-        
-        return {
-            'avg_calories': round(avg_calories, 1),
-            'recent_avg': round(recent_avg, 1),
-            'trend': trend,
-            'variability': round(statistics.stdev(calories) if len(calories) > 1 else 0, 1),
-            'max_calories': max(calories),
-            'min_calories': min(calories)
-        }
-    
-    def _analyze_macro_balance(self, daily_summaries: List[DailySummary]) -> Dict[str, Any]:
-        """Analyze macronutrient balance patterns"""
-        if not daily_summaries:
-            return {}
-        
-        protein_ratios = []
-        carb_ratios = []
-        fat_ratios = []
-        
-        for summary in daily_summaries:
-            if summary.total_calories > 0:
-                protein_ratio = (summary.total_protein * 4 / summary.total_calories) * 100
-                carb_ratio = (summary.total_carbs * 4 / summary.total_calories) * 100
-                fat_ratio = (summary.total_fat * 9 / summary.total_calories) * 100
-                
-                protein_ratios.append(protein_ratio)
-                carb_ratios.append(carb_ratio)
-                fat_ratios.append(fat_ratio)
-        
-        if not protein_ratios:
-            return {}
-        
-        return {
-            'avg_protein_percent': round(statistics.mean(protein_ratios), 1),
-            'avg_carb_percent': round(statistics.mean(carb_ratios), 1),
-            'avg_fat_percent': round(statistics.mean(fat_ratios), 1),
-            'protein_consistency': round(statistics.stdev(protein_ratios) if len(protein_ratios) > 1 else 0, 1),
-            'balance_score': self._calculate_balance_score(protein_ratios, carb_ratios, fat_ratios)
-        }
-    
-    def _calculate_balance_score(self, protein_ratios: List[float], carb_ratios: List[float], fat_ratios: List[float]) -> float:
-        """Calculate a balance score for macronutrients (0-1)"""
-        if not protein_ratios:
-            return 0.0
-        
-        avg_protein = statistics.mean(protein_ratios)
-        avg_carb = statistics.mean(carb_ratios)
-        avg_fat = statistics.mean(fat_ratios)
-        
-        # Ideal ranges: Protein 15-25%, Carbs 45-65%, Fat 20-35%
-        protein_score = 1.0 if 15 <= avg_protein <= 25 else max(0, 1 - abs(avg_protein - 20) / 20)
-        carb_score = 1.0 if 45 <= avg_carb <= 65 else max(0, 1 - abs(avg_carb - 55) / 30)
-        fat_score = 1.0 if 20 <= avg_fat <= 35 else max(0, 1 - abs(avg_fat - 27.5) / 15)
-        
-        return round((protein_score + carb_score + fat_score) / 3, 2)
-    
-    def _update_pattern(self, user_id: int, pattern_type: str, pattern_data: Dict[str, Any]):
-        """Update or create a behavior pattern"""
-        try:
-            existing_pattern = self.db.query(UserBehaviorPattern).filter(
-                and_(
-                    UserBehaviorPattern.user_id == user_id,
-                    UserBehaviorPattern.pattern_type == pattern_type
-                )
-            ).first()
-            
-            confidence_score = self._calculate_pattern_confidence(pattern_data)
-            
-            if existing_pattern:
-                existing_pattern.pattern_data = pattern_data
-                existing_pattern.confidence_score = confidence_score
-                existing_pattern.last_updated = datetime.now()
-            else:
-                new_pattern = UserBehaviorPattern(
-                    user_id=user_id,
-                    pattern_type=pattern_type,
-                    pattern_data=pattern_data,
-                    confidence_score=confidence_score
-                )
-                self.db.add(new_pattern)
-            
-            self.db.commit()
-            
-        except Exception as e:
-            print(f"Error updating pattern: {e}")
-            self.db.rollback()
-    
-    def _calculate_pattern_confidence(self, pattern_data: Dict[str, Any]) -> float:
-        """Calculate confidence score for a pattern based on data quality"""
-        if not pattern_data:
-            return 0.0
-        
-        # Base confidence
-        confidence = 0.5
-        
-        # Increase confidence based on data completeness
-        if pattern_data.get('total_meals_analyzed', 0) > 10:
-            confidence += 0.2
-        if pattern_data.get('variability', 0) < 50:  # Low variability = more consistent pattern
-            confidence += 0.2
-        if len(pattern_data) > 3:  # More data points
-            confidence += 0.1
-        
-        return min(confidence, 1.0)
-    
-    def _predict_weight_trend(self, daily_summaries: List[DailySummary]) -> Dict[str, Any]:
+    def _predict_weight_trend(self, metrics: Dict[str, Any]) -> Dict[str, Any]:
         """Predict weight trend based on calorie patterns"""
-        if len(daily_summaries) < 7:
+        if metrics['days'] < 7 or not metrics['logged_days']:
             return {'prediction': 'stable', 'confidence': 0.0}
         
-        calories = [s.total_calories for s in daily_summaries if s.total_calories > 0]
-        if not calories:
-            return {'prediction': 'stable', 'confidence': 0.0}
-        
-        avg_calories = statistics.mean(calories)
+        avg_calories = metrics['avg_calories']
         
         # Simple prediction based on average calorie intake
         # Assuming maintenance calories around 2000-2200 for average person
@@ -887,18 +688,14 @@ class HealthMonitoringService:
             'calorie_surplus_deficit': round(avg_calories - maintenance_calories, 1)
         }
     
-    def _predict_goal_achievement(self, user_id: int, daily_summaries: List[DailySummary]) -> Optional[Dict[str, Any]]:
+    def _predict_goal_achievement(self, metrics: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """Predict goal achievement based on current patterns"""
-        user = self.db.query(User).filter(User.id == user_id).first()
-        if not user or not user.daily_goals or not daily_summaries:
+        if not metrics['has_goals']:
             return None
         
-        goal_calories = user.daily_goals.get('calories', 2000)
-        goal_protein = user.daily_goals.get('protein', 60)
-        
-        # Calculate adherence rates
-        calorie_adherence = len([s for s in daily_summaries if abs(s.total_calories - goal_calories) <= 200]) / len(daily_summaries)
-        protein_adherence = len([s for s in daily_summaries if s.total_protein >= goal_protein * 0.8]) / len(daily_summaries)
+        # Share of days within 200 kcal of goal / at 80% of protein goal
+        calorie_adherence = metrics['calorie_adherence']
+        protein_adherence = metrics['protein_adherence']
         
         overall_adherence = (calorie_adherence + protein_adherence) / 2
         
@@ -921,18 +718,18 @@ class HealthMonitoringService:
             'overall_adherence': round(overall_adherence * 100, 1)
         }
     
-    def _predict_health_risks(self, daily_summaries: List[DailySummary]) -> Dict[str, Any]:
+    def _predict_health_risks(self, metrics: Dict[str, Any]) -> Dict[str, Any]:
         """Predict potential health risks based on eating patterns"""
-        if not daily_summaries:
+        if not metrics:
             return {'risk_level': 'low', 'confidence': 0.0}
         
         risk_factors = []
         risk_score = 0
         
-        # Calculate averages
-        avg_calories = statistics.mean([s.total_calories for s in daily_summaries if s.total_calories > 0])
-        avg_carbs = statistics.mean([s.total_carbs for s in daily_summaries if s.total_carbs > 0])
-        avg_fat = statistics.mean([s.total_fat for s in daily_summaries if s.total_fat > 0])
+        # Averages over logged (non-zero) days
+        avg_calories = metrics['avg_calories'] or 0.0
+        avg_carbs = metrics['avg_carbs'] or 0.0
+        avg_fat = metrics['avg_fat'] or 0.0
         
         # Risk factor analysis
         if avg_calories > 2500:
@@ -960,7 +757,7 @@ class HealthMonitoringService:
         
         return {
             'risk_level': risk_level,
-            'confidence': 0.6 + (len(daily_summaries) / 20),  # Higher confidence with more data
+            'confidence': 0.6 + (metrics['days'] / 20),  # Higher confidence with more data
             'description': description,
             'risk_factors': risk_factors,
             'risk_score': risk_score
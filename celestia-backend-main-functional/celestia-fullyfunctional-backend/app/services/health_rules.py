@@ -0,0 +1,375 @@
+from string import Formatter
+from threading import Lock
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
+import ast
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from app.config import settings
+from app.services.health_metrics import SUMMARY_DAY_COLUMNS, SUMMARY_METRIC_NAMES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_RULES_PATH = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'rules', 'health_rules.json')
+
+# Functions rule expressions may call, mapped to their elementwise numpy versions
+RULE_FUNCTIONS = {'abs': np.abs, 'round': np.round, 'min': np.minimum, 'max': np.maximum}
+
+# Columns the dashboard deficiency rules are evaluated over
+DEFICIENCY_COLUMNS = [
+    'avg_calories', 'avg_protein', 'avg_carbs', 'avg_fat', 'avg_fiber',
+    'goal_calories', 'goal_protein', 'goal_fiber'
+]
+
+_ALLOWED_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Mod, ast.Pow,
+    ast.Compare, ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.Eq, ast.NotEq,
+    ast.Name, ast.Load, ast.Constant, ast.Call
+)
+
+Predicate = Callable[[Dict[str, np.ndarray]], np.ndarray]
+
+class RuleCompileError(ValueError):
+    pass
+
+class _Vectorize(ast.NodeTransformer):
+    """Rewrite and/or/not and chained comparisons into elementwise numpy operators"""
+
+    def visit_BoolOp(self, node):
+        self.generic_visit(node)
+        op = ast.BitAnd() if isinstance(node.op, ast.And) else ast.BitOr()
+        result = node.values[0]
+        for value in node.values[1:]:
+            result = ast.BinOp(left=result, op=op, right=value)
+        return result
+
+    def visit_UnaryOp(self, node):
+        self.generic_visit(node)
+        if isinstance(node.op, ast.Not):
+            return ast.UnaryOp(op=ast.Invert(), operand=node.operand)
+        return node
+
+    def visit_Compare(self, node):
+        self.generic_visit(node)
+        if len(node.ops) == 1:
+            return node
+        # a < b < c  ->  (a < b) & (b < c)
+        left, result = node.left, None
+        for op, right in zip(node.ops, node.comparators):
+            part = ast.Compare(left=left, ops=[op], comparators=[right])
+            result = part if result is None else ast.BinOp(left=result, op=ast.BitAnd(), right=part)
+            left = right
+        return result
+
+def compile_expression(expression: str, names: Set[str]) -> Tuple[Predicate, Set[str]]:
+    """
+    Compile a rule expression (Python syntax: arithmetic, comparisons, and/or/not,
+    abs/round/min/max) into a function over a dict of column arrays.
+    Returns the function and the column names it reads.
+    """
+    try:
+        tree = ast.parse(str(expression), mode='eval')
+    except SyntaxError as e:
+        raise RuleCompileError(f"invalid expression {expression!r}: {e.msg}")
+
+    referenced = set()
+    for node in ast.walk(tree):
+        if not isinstance(node, _ALLOWED_NODES):
+            raise RuleCompileError(f"{type(node).__name__} is not allowed in {expression!r}")
+        if isinstance(node, ast.Call):
+            if not isinstance(node.func, ast.Name) or node.func.id not in RULE_FUNCTIONS or node.keywords:
+                raise RuleCompileError(f"only {', '.join(RULE_FUNCTIONS)} can be called in {expression!r}")
+        elif isinstance(node, ast.Name) and node.id not in RULE_FUNCTIONS:
+            if node.id not in names:
+                raise RuleCompileError(f"unknown name {node.id!r} in {expression!r}")
+            referenced.add(node.id)
+        elif isinstance(node, ast.Constant) and not isinstance(node.value, (int, float)):
+            raise RuleCompileError(f"only numeric constants are allowed in {expression!r}")
+
+    code = compile(ast.fix_missing_locations(_Vectorize().visit(tree)), '<health-rule>', 'eval')
+    scope = {'__builtins__': {}, **RULE_FUNCTIONS}
+
+    def evaluate(columns: Dict[str, np.ndarray]) -> np.ndarray:
+        with np.errstate(all='ignore'):
+            return eval(code, scope, columns)
+
+    return evaluate, referenced
+
+def _to_python_list(values: np.ndarray) -> List[Any]:
+    """Plain Python values for an array (NaN becomes None)"""
+    return [None if isinstance(value, float) and value != value else value for value in values.tolist()]
+
+def _copy_literal(value: Any) -> Any:
+    if isinstance(value, list):
+        return [_copy_literal(item) for item in value]
+    if isinstance(value, dict):
+        return {key: _copy_literal(item) for key, item in value.items()}
+    return value
+
+class CompiledRule:
+    """
+    One rule: a 'when' predicate, named 'let' values, and an output template
+    whose strings are either '=expression' values or format templates over
+    the columns and let values.
+    """
+
+    def __init__(self, spec: Dict[str, Any], output_key: str, names: Set[str]):
+        self.id = spec.get('id')
+        if not self.id:
+            raise RuleCompileError(f"rule without an id: {spec}")
+        if output_key not in spec:
+            raise RuleCompileError(f"rule {self.id} has no '{output_key}' section")
+
+        try:
+            self.when, self.reads = compile_expression(spec['when'], names)
+
+            self.lets: List[Tuple[str, Predicate]] = []
+            available = set(names)
+            for name, expression in (spec.get('let') or {}).items():
+                predicate, reads = compile_expression(expression, available)
+                self.lets.append((name, predicate))
+                self.reads |= reads
+                available.add(name)
+
+            # First matching 'severity_when' entry overrides output['severity']
+            self.severity_when = []
+            for severity, expression in (spec.get('severity_when') or {}).items():
+                predicate, reads = compile_expression(expression, available)
+                self.severity_when.append((severity, predicate))
+                self.reads |= reads
+
+            self.expressions: Dict[str, Predicate] = {}
+            self.template_fields: Set[str] = set()
+            self.output = self._compile_output(spec[output_key], available)
+        except RuleCompileError as e:
+            raise RuleCompileError(f"rule {self.id}: {e}")
+
+        self.let_names = {name for name, _ in self.lets}
+
+    def _compile_output(self, template: Any, available: Set[str]) -> Any:
+        if isinstance(template, (dict, list)):
+            items = template.items() if isinstance(template, dict) else enumerate(template)
+            compiled = [(key, self._compile_output(value, available)) for key, value in items]
+            # Subtrees without expressions or templates (suggestion lists etc.) are rendered as-is
+            if all(node[0] == 'literal' for _, node in compiled):
+                return ('literal', template)
+            if isinstance(template, dict):
+                return ('dict', compiled)
+            return ('list', [node for _, node in compiled])
+        if isinstance(template, str) and template.startswith('='):
+            predicate, reads = compile_expression(template[1:], available)
+            self.expressions[template] = predicate
+            self.reads |= reads
+            return ('expr', template)
+        if isinstance(template, str) and '{' in template:
+            fields = {field.split('.')[0].split('[')[0] for _, field, _, _ in Formatter().parse(template) if field}
+            unknown = fields - available
+            if unknown:
+                raise RuleCompileError(f"unknown template field(s) {', '.join(sorted(unknown))}")
+            self.template_fields |= fields
+            return ('template', template)
+        return ('literal', template)
+
+    def evaluate(self, columns: Dict[str, np.ndarray], size: int) -> List[Tuple[int, Dict[str, Any]]]:
+        """(row, output) for every row the rule fires on"""
+        fired = np.flatnonzero(np.broadcast_to(np.asarray(self.when(columns), dtype=bool), (size,)))
+        if len(fired) == 0:
+            return []
+
+        # Everything below only runs over the rows that fired
+        scope = {name: np.asarray(columns[name])[fired] for name in (self.reads | self.template_fields) - self.let_names}
+        for name, predicate in self.lets:
+            scope[name] = np.broadcast_to(predicate(scope), (len(fired),))
+
+        values = {
+            key: _to_python_list(np.broadcast_to(predicate(scope), (len(fired),)))
+            for key, predicate in self.expressions.items()
+        }
+        template_values = {name: _to_python_list(scope[name]) for name in self.template_fields}
+        severities = [
+            (severity, np.broadcast_to(np.asarray(predicate(scope), dtype=bool), (len(fired),)))
+            for severity, predicate in self.severity_when
+        ]
+
+        results = []
+        for position, row in enumerate(fired.tolist()):
+            row_scope = {name: column[position] for name, column in template_values.items()}
+            output = self._render(self.output, values, row_scope, position)
+            for severity, matches in severities:
+                if matches[position]:
+                    output['severity'] = severity
+                    break
+            results.append((row, output))
+        return results
+
+    def _render(self, template: Any, values: Dict[str, List[Any]], row_scope: Dict[str, Any], position: int) -> Any:
+        kind, value = template
+        if kind == 'literal':
+            return _copy_literal(value)
+        if kind == 'expr':
+            return values[value][position]
+        if kind == 'template':
+            return value.format(**row_scope)
+        if kind == 'dict':
+            return {key: self._render(node, values, row_scope, position) for key, node in value}
+        return [self._render(node, values, row_scope, position) for node in value]
+
+class HealthRuleSet:
+    """A compiled rules file: day-count predicates, monitoring alert rules and dashboard deficiency rules"""
+
+    def __init__(self, spec: Dict[str, Any], source: str = ''):
+        self.source = source
+        self.version = spec.get('version')
+
+        self.day_counts: Dict[str, Predicate] = {}
+        for name, expression in (spec.get('day_counts') or {}).items():
+            try:
+                self.day_counts[name], _ = compile_expression(expression, set(SUMMARY_DAY_COLUMNS))
+            except RuleCompileError as e:
+                raise RuleCompileError(f"day count {name}: {e}")
+
+        alert_names = set(SUMMARY_METRIC_NAMES) | set(self.day_counts)
+        self.alerts = [CompiledRule(rule, 'alert', alert_names) for rule in spec.get('alerts', [])]
+        self.deficiencies = [CompiledRule(rule, 'deficiency', set(DEFICIENCY_COLUMNS)) for rule in spec.get('deficiencies', [])]
+
+        ids = [rule.id for rule in self.alerts + self.deficiencies]
+        duplicates = {rule_id for rule_id in ids if ids.count(rule_id) > 1}
+        if duplicates:
+            raise RuleCompileError(f"duplicate rule ids: {', '.join(sorted(duplicates))}")
+
+    def evaluate(self, rules: List[CompiledRule], columns: Dict[str, np.ndarray], size: int) -> List[List[Dict[str, Any]]]:
+        """Outputs of every rule that fires, per row"""
+        per_row: List[List[Dict[str, Any]]] = [[] for _ in range(size)]
+        for rule in rules:
+            try:
+                for row, output in rule.evaluate(columns, size):
+                    per_row[row].append({'rule_id': rule.id, **output})
+            except Exception as e:
+                logger.error(f"Health rule {rule.id} failed: {e}")
+        return per_row
+
+class HealthRuleEngine:
+    """
+    Loads the declarative health rules file, compiles it into vectorized
+    predicates and reloads it when the file changes (checked at most every
+    few seconds), keeping the last good rule set if a new one fails to compile.
+    """
+
+    def __init__(self, path: str, reload_check_seconds: float = 2.0):
+        self.path = path
+        self.reload_check_seconds = reload_check_seconds
+        self.lock = Lock()
+        self.ruleset: Optional[HealthRuleSet] = None
+        self.mtime: Optional[float] = None
+        self.checked_at = 0.0
+        self.loaded_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.reloads = 0
+        # section -> evaluation counters
+        self.timings: Dict[str, Dict[str, float]] = {}
+
+    def get_ruleset(self) -> HealthRuleSet:
+        with self.lock:
+            now = time.monotonic()
+            if self.ruleset is not None and now - self.checked_at < self.reload_check_seconds:
+                return self.ruleset
+            self.checked_at = now
+
+            try:
+                mtime = os.path.getmtime(self.path)
+            except OSError as e:
+                if self.ruleset is None:
+                    raise RuleCompileError(f"health rules file not readable: {e}")
+                self.last_error = str(e)
+                return self.ruleset
+
+            if mtime != self.mtime:
+                try:
+                    with open(self.path, encoding='utf-8') as rules_file:
+                        ruleset = HealthRuleSet(json.load(rules_file), source=self.path)
+                    self.ruleset, self.mtime = ruleset, mtime
+                    self.loaded_at = time.time()
+                    self.last_error = None
+                    self.reloads += 1
+                    logger.info(
+                        f"Loaded health rules v{ruleset.version}: {len(ruleset.day_counts)} day counts, "
+                        f"{len(ruleset.alerts)} alert rules, {len(ruleset.deficiencies)} deficiency rules"
+                    )
+                except (OSError, ValueError) as e:
+                    self.last_error = str(e)
+                    logger.error(f"Health rules reload failed, keeping the previous rules: {e}")
+                    if self.ruleset is None:
+                        raise
+                    # Don't retry the same broken file on every check
+                    self.mtime = mtime
+
+            return self.ruleset
+
+    def evaluate_alerts(
+        self,
+        ruleset: HealthRuleSet,
+        user_ids: List[int],
+        columns: Dict[str, np.ndarray]
+    ) -> Dict[int, List[Dict[str, Any]]]:
+        """Alert rule outputs per user, evaluated over one column array per metric"""
+        started = time.perf_counter()
+        per_row = ruleset.evaluate(ruleset.alerts, columns, len(user_ids))
+        self._record('alerts', len(user_ids), len(ruleset.alerts), time.perf_counter() - started)
+        return dict(zip(user_ids, per_row))
+
+    def evaluate_user_alerts(self, ruleset: HealthRuleSet, user_id: int, metrics: Dict[str, Any]) -> List[Dict[str, Any]]:
+        columns = {
+            name: np.array([np.nan if value is None else value])
+            for name, value in metrics.items()
+        }
+        return self.evaluate_alerts(ruleset, [user_id], columns)[user_id]
+
+    def evaluate_deficiencies(self, values: Dict[str, float]) -> List[Dict[str, Any]]:
+        ruleset = self.get_ruleset()
+        started = time.perf_counter()
+        columns = {name: np.array([values.get(name, np.nan)], dtype=float) for name in DEFICIENCY_COLUMNS}
+        outputs = ruleset.evaluate(ruleset.deficiencies, columns, 1)[0]
+        self._record('deficiencies', 1, len(ruleset.deficiencies), time.perf_counter() - started)
+        return [{key: value for key, value in output.items() if key != 'rule_id'} for output in outputs]
+
+    def _record(self, section: str, rows: int, rules: int, elapsed: float):
+        with self.lock:
+            timing = self.timings.setdefault(
+                section, {'evaluations': 0, 'rows': 0, 'rule_rows': 0, 'total_ms': 0.0, 'last_ms': 0.0}
+            )
+            timing['evaluations'] += 1
+            timing['rows'] += rows
+            timing['rule_rows'] += rows * rules
+            timing['total_ms'] += elapsed * 1000
+            timing['last_ms'] = round(elapsed * 1000, 3)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            ruleset = self.ruleset
+            return {
+                'path': self.path,
+                'version': ruleset.version if ruleset else None,
+                'day_counts': len(ruleset.day_counts) if ruleset else 0,
+                'alert_rules': len(ruleset.alerts) if ruleset else 0,
+                'deficiency_rules': len(ruleset.deficiencies) if ruleset else 0,
+                'reloads': self.reloads,
+                'loaded_at': self.loaded_at,
+                'last_error': self.last_error,
+                'timings': {
+                    section: {
+                        **timing,
+                        'total_ms': round(timing['total_ms'], 3),
+                        'rule_rows_per_second': round(timing['rule_rows'] / (timing['total_ms'] / 1000), 1)
+                        if timing['total_ms'] > 0 else None
+                    }
+                    for section, timing in self.timings.items()
+                }
+            }
+
+# Global health rule engine instance
+health_rule_engine = HealthRuleEngine(settings.health_rules_path or DEFAULT_RULES_PATH)
@@ -0,0 +1,148 @@
+import hashlib
+import io
+import time
+from typing import Any, BinaryIO, Dict, Optional, Union
+
+import numpy as np
+from fastapi import UploadFile
+from PIL import Image, ImageOps
+
+from app.config import settings
+
+UPLOAD_CHUNK_SIZE = 256 * 1024
+
+# Side of the grayscale thumbnail the blur and exposure checks run on
+QUALITY_CHECK_EDGE = 512
+
+FORMATS = {
+    'jpeg': ('JPEG', 'image/jpeg'),
+    'webp': ('WEBP', 'image/webp')
+}
+
+class ImageRejected(ValueError):
+    """Raised when an image is too blurry or too dark to be worth analyzing"""
+
+class UploadTooLarge(ValueError):
+    """Raised when an upload exceeds the configured byte limit"""
+
+async def read_upload(file: UploadFile, max_bytes: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Stream an upload in fixed-size chunks, enforcing the byte limit and
+    hashing as it goes, then rewind it. Only one chunk is held in memory;
+    the spooled upload itself is handed to preprocess_image.
+    """
+    max_bytes = max_bytes or settings.image_upload_max_bytes
+    if file.size is not None and file.size > max_bytes:
+        raise UploadTooLarge(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        chunk = await file.read(UPLOAD_CHUNK_SIZE)
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLarge(f"Image is larger than {max_bytes // (1024 * 1024)} MB")
+        digest.update(chunk)
+
+    await file.seek(0)
+    return {'sha256': digest.hexdigest(), 'bytes': size}
+
+def laplacian_variance(gray: np.ndarray) -> float:
+    """Variance of the 4-neighbour Laplacian; low values mean few edges, i.e. blur"""
+    gray = gray.astype(np.float32)
+    laplacian = (
+        gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+        - 4 * gray[1:-1, 1:-1]
+    )
+    return float(laplacian.var())
+
+def check_image_quality(image: Image.Image) -> Dict[str, float]:
+    """Sharpness and mean brightness (0-255) measured on a small grayscale copy"""
+    gray = image.convert('L')
+    gray.thumbnail((QUALITY_CHECK_EDGE, QUALITY_CHECK_EDGE), Image.Resampling.BILINEAR)
+    pixels = np.asarray(gray)
+    return {
+        'sharpness': round(laplacian_variance(pixels), 2),
+        'brightness': round(float(pixels.mean()), 2)
+    }
+
+def preprocess_image(
+    source: Union[bytes, BinaryIO, Image.Image],
+    max_edge: Optional[int] = None,
+    quality: Optional[int] = None,
+    image_format: Optional[str] = None,
+    check_quality: bool = True
+) -> Dict[str, Any]:
+    """
+    Prepare an uploaded photo (bytes, a file object or a PIL image) for the
+    vision model: decode at reduced size,
+    apply the EXIF orientation, downscale to max_edge, reject blurry or dark
+    shots and re-encode without metadata. Returns the encoded bytes with
+    their mime type, ready to send as an inline image part.
+    """
+    started = time.perf_counter()
+    max_edge = max_edge or settings.image_max_edge
+    quality = quality or settings.image_quality
+    save_format, mime_type = FORMATS.get((image_format or settings.image_format).lower(), FORMATS['jpeg'])
+
+    if isinstance(source, Image.Image):
+        image = source
+        original_bytes = None
+        original_size = image.size
+    else:
+        if isinstance(source, bytes):
+            original_bytes = len(source)
+            source = io.BytesIO(source)
+        else:
+            original_bytes = source.seek(0, io.SEEK_END)
+            source.seek(0)
+        image = Image.open(source)
+        original_size = image.size
+        # JPEGs can be decoded straight at 1/2, 1/4 or 1/8 scale, so only the
+        # reduced image is ever materialized
+        image.draft('RGB', (max_edge, max_edge))
+        if image.size[0] * image.size[1] > settings.image_max_pixels:
+            raise ImageRejected("Image resolution is too large. Please upload a smaller photo.")
+
+    image = ImageOps.exif_transpose(image)
+
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        rgba = image.convert('RGBA')
+        image = Image.new('RGB', rgba.size, (255, 255, 255))
+        image.paste(rgba, mask=rgba.getchannel('A'))
+    elif image.mode != 'RGB':
+        image = image.convert('RGB')
+
+    if max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.Resampling.LANCZOS, reducing_gap=2.0)
+
+    metrics = check_image_quality(image)
+    if check_quality:
+        if metrics['brightness'] < settings.image_min_brightness:
+            raise ImageRejected("Image is too dark. Please retake the photo in better light.")
+        if metrics['sharpness'] < settings.image_min_sharpness:
+            raise ImageRejected("Image is too blurry. Please hold the camera steady and retake the photo.")
+
+    # Saving without exif/icc_profile drops the original metadata
+    output = io.BytesIO()
+    image.save(output, format=save_format, quality=quality)
+    data = output.getvalue()
+
+    return {
+        'mime_type': mime_type,
+        'data': data,
+        'width': image.width,
+        'height': image.height,
+        'original_width': original_size[0],
+        'original_height': original_size[1],
+        'original_bytes': original_bytes,
+        'bytes': len(data),
+        **metrics,
+        'preprocess_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+
+def as_image_part(prepared: Dict[str, Any]) -> Dict[str, Any]:
+    """Inline image part for generate_content"""
+    return {'mime_type': prepared['mime_type'], 'data': prepared['data']}
@@ -4,6 +4,7 @@ from sqlalchemy.orm import Session
 from sqlalchemy import desc, and_
 from app.models.agentic_models import MealPlan, MealPlanItem, UserBehaviorPattern
 from app.models.db_models import User, Meal, DailySummary
+from app.services.structured_output import parse_structured_output
 import json
 import random
 import google.generativeai as genai
@@ -399,11 +400,9 @@ class IntelligentMealPlanner:
         """Parse AI response into structured meal data"""
         try:
             # Try to extract JSON from the response
-            import re
-            json_match = re.search(r'\{.*\}', response_text, re.DOTALL)
-            if json_match:
-                json_str = json_match.group()
-                return json.loads(json_str)
+            meal_data = parse_structured_output(response_text, partial=False)
+            if meal_data:
+                return meal_data
             else:
                 # Fallback: create a basic structure
                 return self._create_fallback_meal()
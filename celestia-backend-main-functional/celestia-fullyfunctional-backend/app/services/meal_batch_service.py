@@ -0,0 +1,95 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Union
+import time
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.db_models import User
+from app.services.analysis_service import (analyze_food_batch, analyze_food_image,
+                                           generate_clarifying_questions,
+                                           portion_estimation)
+from app.services.nutrition_service import nutrition_lookup
+from app.services.recommendations_service import (healthy_swaps,
+                                                  personalized_recommendations)
+from app.services.user_service import log_meals_bulk
+
+def enrich_analysis(analysis_data: Dict[str, Any], user: Optional[User] = None) -> Dict[str, Any]:
+    """Portion estimates, nutrition summary and recommendations for one analysis"""
+    recommendations = {"swaps": healthy_swaps(analysis_data)}
+    if user:
+        recommendations["personalized"] = personalized_recommendations(analysis_data, user.profile)
+
+    return {
+        "portion_estimates": portion_estimation(analysis_data),
+        "nutrition_summary": nutrition_lookup(analysis_data),
+        "recommendations": recommendations
+    }
+
+def analyze_meals(db: Session, user: Optional[User], inputs: List[Union[Dict[str, Any], str]]) -> Dict[str, Any]:
+    """
+    Analyze and log several meals (preprocessed photos or text descriptions).
+    Inputs are packed items_per_request at a time into model requests; a
+    request whose answer can't be matched to its inputs falls back to one
+    request per meal. Post-processing runs in parallel across meals and all
+    meals are logged in one transaction.
+    """
+    started = time.perf_counter()
+    user_profile = user.profile if user else {}
+    per_request = max(1, settings.analysis_batch_items_per_request)
+    chunks = [inputs[start:start + per_request] for start in range(0, len(inputs), per_request)]
+    model_requests = len(chunks)
+
+    with ThreadPoolExecutor(
+        max_workers=max(1, min(settings.analysis_batch_workers, len(inputs))),
+        thread_name_prefix="meal-batch"
+    ) as executor:
+        analyses = []
+        for chunk, chunk_analyses in zip(chunks, list(executor.map(lambda chunk: analyze_food_batch(chunk, user_profile), chunks))):
+            if chunk_analyses is None:
+                chunk_analyses = list(executor.map(lambda meal: analyze_food_image(meal, user_profile), chunk))
+                model_requests += len(chunk)
+            analyses.extend(chunk_analyses)
+
+        detected = [index for index, analysis_data in enumerate(analyses) if analysis_data and analysis_data.get('items')]
+        enriched = dict(zip(detected, executor.map(
+            lambda index: enrich_analysis(analyses[index], user),
+            detected
+        )))
+
+    meals = []
+    for index, meal_input in enumerate(inputs):
+        result = {
+            "index": index,
+            "input": "text" if isinstance(meal_input, str) else "image"
+        }
+        if index not in enriched:
+            result["error"] = "No food items detected. Please try a clearer image or a more detailed description."
+            meals.append(result)
+            continue
+
+        analysis_data = analyses[index]
+        result.update({"analysis_data": analysis_data, **enriched[index]})
+        if analysis_data.get('need_clarification', False):
+            result["questions"] = generate_clarifying_questions(analysis_data)
+        meals.append(result)
+
+    logged = []
+    if user and enriched:
+        try:
+            logged = log_meals_bulk(db, user.id, [
+                {"analysis_data": analyses[index], **enriched[index]} for index in detected
+            ])
+            for index, meal in zip(detected, logged):
+                meals[index]["meal_id"] = meal.id
+        except Exception as e:
+            print(f"Failed to log meal batch: {e}")
+
+    return {
+        "meals": meals,
+        "analyzed": len(enriched),
+        "failed": len(inputs) - len(enriched),
+        "logged": len(logged),
+        "model_requests": model_requests,
+        "elapsed_seconds": round(time.perf_counter() - started, 3)
+    }
@@ -0,0 +1,213 @@
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Dict, Any, List, Optional, Pattern, Tuple
+import re
+
+# Intent patterns are tried in order; the first match wins. More specific
+# phrasings ("what did I eat with X") must come before general ones ("what did I eat").
+INTENT_PATTERNS: List[Tuple[str, List[str]]] = [
+    ('co_occurrence', [
+        r"\bwhat (?:else )?did i (?:eat|have) (?:along )?with (?P<food>.+)",
+        r"\bwhat (?:goes|went|did i pair) with (?P<food>.+)",
+        r"\bwhat else did i (?:eat|have) when i (?:ate|had) (?P<food>.+)",
+    ]),
+    ('frequency', [
+        r"\bhow (?:often|frequently) (?:do|did|have) i (?:eat|eaten|had|have) (?P<food>.+)",
+        r"\bhow many times (?:do|did|have) i (?:eat|eaten|had|have) (?P<food>.+)",
+        r"\bhow (?:often|frequently) (?:is|was) (?P<food>.+?) in my (?:diet|meals)",
+    ]),
+    ('when_eaten', [
+        r"\bwhen (?:did|do|was) i (?:last )?(?:eat|have|had|ate) (?P<food>.+)",
+        r"\bwhen was the last time i (?:ate|had|eaten) (?P<food>.+)",
+        r"\b(?:the )?last time i (?:ate|had|eaten) (?P<food>.+)",
+        r"\bwhat time did i (?:eat|have) (?P<food>.+)",
+    ]),
+    ('nutrient_total', [
+        r"\bhow (?:much|many) (?:grams of )?(?P<nutrient>calories|calorie|kcal|protein|carbs|carbohydrates|fat|fats|fiber|fibre)\b.*\b(?:did|have|had|i)\b",
+        r"\b(?:my|total) (?P<nutrient>calorie|calories|protein|carb|carbs|fat|fiber|fibre) (?:intake|total|consumed|count)\b",
+        r"\b(?P<nutrient>calories|protein) consumed\b",
+    ]),
+    ('meal_log', [
+        r"\bwhat (?:did|have) i (?:eat|eaten|had|have)\b",
+        r"\bwhat i (?:ate|had)\b",
+        r"\b(?:my|past|recent|previous) meals\b",
+        r"\bfood history\b",
+        r"\bshow (?:me )?my (?:meals|food|diet|food log)\b",
+        r"\b(?:list|show) (?:the )?meals\b",
+    ]),
+]
+
+# nutrient_total and meal_log are answered from the meal log without the LLM,
+# so they need a cue that the question is about what was eaten (or a time
+# range), and are never used for advice questions about what to eat.
+HISTORY_INTENTS = {'nutrient_total', 'meal_log'}
+HISTORY_CUE_PATTERN = (
+    r"\b(?:did i|have i (?:had|eaten|consumed|logged)|i(?:'ve| have)? (?:ate|had|eaten|consumed|logged)"
+    r"|what i (?:ate|had)|so far|food (?:history|log)|meal (?:history|log)|logged|(?:show|list)(?: me)?)\b"
+)
+ADVICE_CUE_PATTERN = (
+    r"\b(?:should|shall|need|needs|recommended|recommend|recommendation|ideal|enough|tips?|advice|advise"
+    r"|suggest|suggestions?|how (?:to|can i|do i)|is it (?:ok|okay|fine|good|bad|healthy))\b"
+)
+
+TIME_RANGE_PATTERNS: List[Tuple[str, str]] = [
+    ('hours', r"\b(?:past|last|previous) (?P<n>\d+) hours?\b"),
+    ('days', r"\b(?:past|last|previous) (?P<n>\d+) days?\b"),
+    ('today', r"\b(?:today|this morning|this afternoon|this evening|tonight|so far)\b"),
+    ('yesterday', r"\b(?:yesterday|last night)\b"),
+    ('week', r"\b(?:this week|past week|last week|weekly|last 7 days)\b"),
+    ('month', r"\b(?:this month|past month|last month|monthly|last 30 days)\b"),
+]
+
+NUTRIENT_PATTERN = r"\b(?P<nutrient>calories|calorie|kcal|protein|carbs|carb|carbohydrates|fat|fats|fiber|fibre)\b"
+
+NUTRIENT_ALIASES = {
+    'calorie': 'calories', 'calories': 'calories', 'kcal': 'calories',
+    'protein': 'protein',
+    'carb': 'carbs', 'carbs': 'carbs', 'carbohydrates': 'carbs',
+    'fat': 'fat', 'fats': 'fat',
+    'fiber': 'fiber', 'fibre': 'fiber',
+}
+
+# Words that trail the food slot but are not part of the food name
+FOOD_STOP_WORDS = {
+    'a', 'an', 'the', 'some', 'my', 'any', 'last', 'recently', 'ever', 'lately',
+    'for', 'at', 'on', 'in', 'this', 'past', 'time', 'times', 'again', 'before',
+    'breakfast', 'lunch', 'dinner', 'snack', 'meal', 'meals', 'today', 'yesterday',
+    'week', 'month', 'usually', 'normally', 'please', 'i', 'me', 'did', 'do'
+}
+
+class MealIntentClassifier:
+    """
+    Rule-based classifier for structured meal-history questions.
+    Patterns are compiled once into one alternation per intent and slots
+    (food, time range, nutrient) are extracted from the match.
+    """
+
+    def __init__(self):
+        self.intent_automata: List[Tuple[str, Pattern]] = [
+            (intent, re.compile("|".join(f"(?:{p})" for p in self._rename_groups(patterns)), re.IGNORECASE))
+            for intent, patterns in INTENT_PATTERNS
+        ]
+        self.time_automata = [
+            (label, re.compile(pattern, re.IGNORECASE)) for label, pattern in TIME_RANGE_PATTERNS
+        ]
+        self.time_strip = re.compile("|".join(pattern for _, pattern in TIME_RANGE_PATTERNS).replace("?P<n>", ""), re.IGNORECASE)
+        self.nutrient_automaton = re.compile(NUTRIENT_PATTERN, re.IGNORECASE)
+        self.history_cue = re.compile(HISTORY_CUE_PATTERN, re.IGNORECASE)
+        self.advice_cue = re.compile(ADVICE_CUE_PATTERN, re.IGNORECASE)
+
+    def _rename_groups(self, patterns: List[str]) -> List[str]:
+        """Named groups must be unique across an alternation, so suffix them per pattern"""
+        return [
+            re.sub(r"\?P<(\w+)>", lambda m, i=i: f"?P<{m.group(1)}_{i}>", pattern)
+            for i, pattern in enumerate(patterns)
+        ]
+
+    def classify(self, message: str, now: Optional[datetime] = None) -> Dict[str, Any]:
+        """Classify a chat message and extract its slots"""
+        now = now or datetime.now()
+        text = " ".join(message.lower().split())
+
+        intent = 'none'
+        groups: Dict[str, str] = {}
+        for name, automaton in self.intent_automata:
+            match = automaton.search(text)
+            if match:
+                intent = name
+                groups = {key.rsplit('_', 1)[0]: value for key, value in match.groupdict().items() if value}
+                break
+
+        time_range = self._extract_time_range(text, now)
+        if intent in HISTORY_INTENTS and (
+            self.advice_cue.search(text) or not (time_range or self.history_cue.search(text))
+        ):
+            intent, groups = 'none', {}
+
+        nutrient = groups.get('nutrient')
+        if not nutrient:
+            nutrient_match = self.nutrient_automaton.search(text)
+            nutrient = nutrient_match.group('nutrient') if nutrient_match else None
+
+        return {
+            'intent': intent,
+            'food': self._clean_food(groups.get('food', '')),
+            'time_range': time_range,
+            'nutrient': NUTRIENT_ALIASES.get(nutrient) if nutrient else None
+        }
+
+    def _extract_time_range(self, text: str, now: datetime) -> Optional[Dict[str, Any]]:
+        today_start = now.replace(hour=0, minute=0, second=0, microsecond=0)
+
+        for label, automaton in self.time_automata:
+            match = automaton.search(text)
+            if not match:
+                continue
+
+            if label == 'hours':
+                hours = int(match.group('n'))
+                return {'label': f'past {hours} hours', 'start': now - timedelta(hours=hours), 'end': now}
+            if label == 'days':
+                days = int(match.group('n'))
+                return {'label': f'past {days} days', 'start': today_start - timedelta(days=days), 'end': now}
+            if label == 'today':
+                return {'label': 'today', 'start': today_start, 'end': now}
+            if label == 'yesterday':
+                return {'label': 'yesterday', 'start': today_start - timedelta(days=1), 'end': today_start}
+            if label == 'week':
+                return {'label': 'this week', 'start': today_start - timedelta(days=7), 'end': now}
+            if label == 'month':
+                return {'label': 'this month', 'start': today_start - timedelta(days=30), 'end': now}
+
+        return None
+
+    def _clean_food(self, raw: str) -> str:
+        """Strip time phrases, punctuation and filler words from the food slot"""
+        if not raw:
+            return ''
+
+        text = self.time_strip.sub(' ', raw)
+        text = re.sub(r"[^\w\s'-]", ' ', text)
+        words = text.split()
+
+        while words and words[0] in FOOD_STOP_WORDS:
+            words.pop(0)
+        while words and words[-1] in FOOD_STOP_WORDS:
+            words.pop()
+
+        return ' '.join(words)
+
+class IntentMetrics:
+    """Per-intent counters for how often the rule-based fast path answers a message"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counts: Dict[str, Dict[str, int]] = {}
+
+    def record(self, intent: str, answered: bool):
+        with self.lock:
+            counts = self.counts.setdefault(intent, {'seen': 0, 'answered': 0})
+            counts['seen'] += 1
+            if answered:
+                counts['answered'] += 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            total_seen = sum(counts['seen'] for counts in self.counts.values())
+            total_answered = sum(counts['answered'] for counts in self.counts.values())
+            return {
+                'total_messages': total_seen,
+                'answered_directly': total_answered,
+                'fast_path_rate': round(total_answered / total_seen, 3) if total_seen else 0.0,
+                'intents': {
+                    intent: {
+                        **counts,
+                        'hit_rate': round(counts['answered'] / counts['seen'], 3) if counts['seen'] else 0.0
+                    }
+                    for intent, counts in self.counts.items()
+                }
+            }
+
+# Global classifier and metrics instances
+meal_intent_classifier = MealIntentClassifier()
+intent_metrics = IntentMetrics()
@@ -3,113 +3,51 @@ from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy.orm import Session
 from sqlalchemy import func, and_, or_, text
 from app.models.db_models import User, Meal, DailySummary
+from app.services.food_index import food_search_index
+from app.services.meal_intent_classifier import meal_intent_classifier
 import re
-from difflib import SequenceMatcher
 
 class MealMemoryService:
     def __init__(self, db: Session):
         self.db = db
     
     def search_meals_by_food_name(self, user_id: int, food_name: str, limit: int = 10) -> List[Dict[str, Any]]:
-        """Search for meals containing specific food items using semantic matching"""
+        """Search the user's full meal history for a food using the inverted food index"""
         try:
-            # Get all meals for the user
-            meals = self.db.query(Meal).filter(
-                Meal.user_id == user_id
-            ).order_by(Meal.upload_time.desc()).limit(100).all()  # Search in recent 100 meals
+            matches = food_search_index.search(self.db, user_id, food_name, limit=limit)
+            if not matches:
+                return []
             
-            matching_meals = []
-            food_name_lower = food_name.lower()
+            meals = {
+                meal.id: meal for meal in self.db.query(Meal).filter(
+                    Meal.id.in_([match['meal_id'] for match in matches])
+                ).all()
+            }
             
-            for meal in meals:
-                if not meal.analysis_data or not meal.analysis_data.get('items'):
+            matching_meals = []
+            for match in matches:
+                meal = meals.get(match['meal_id'])
+                if not meal:
                     continue
                 
-                # Check each food item in the meal
-                for item in meal.analysis_data.get('items', []):
-                    item_name = item.get('name', '').lower()
-                    
-                    # Multiple matching strategies
-                    similarity_score = self._calculate_food_similarity(food_name_lower, item_name)
-                    
-                    if similarity_score > 0.6:  # 60% similarity threshold
-                        meal_data = {
-                            'meal_id': meal.id,
-                            'upload_date': meal.upload_date.isoformat() if meal.upload_date else None,
-                            'upload_time': meal.upload_time.isoformat() if meal.upload_time else None,
-                            'day_of_week': meal.day_of_week,
-                            'matched_item': item,
-                            'similarity_score': similarity_score,
-                            'all_items': meal.analysis_data.get('items', []),
-                            'total_calories': meal.analysis_data.get('total_calories', 0),
-                            'meal_type': self._determine_meal_type(meal.upload_time) if meal.upload_time else 'unknown'
-                        }
-                        matching_meals.append(meal_data)
-                        break  # Found a match in this meal, move to next meal
-            
-            # Sort by similarity score and upload time
-            matching_meals.sort(key=lambda x: (x['similarity_score'], x['upload_time']), reverse=True)
+                matching_meals.append({
+                    'meal_id': meal.id,
+                    'upload_date': meal.upload_date.isoformat() if meal.upload_date else None,
+                    'upload_time': meal.upload_time.isoformat() if meal.upload_time else None,
+                    'day_of_week': meal.day_of_week,
+                    'matched_item': match['item'],
+                    'similarity_score': match['similarity_score'],
+                    'all_items': meal.analysis_data.get('items', []),
+                    'total_calories': meal.analysis_data.get('total_calories', 0),
+                    'meal_type': self._determine_meal_type(meal.upload_time) if meal.upload_time else 'unknown'
+                })
             
-            return matching_meals[:limit]
+            return matching_meals
             
         except Exception as e:
             print(f"Error searching meals by food name: {e}")
             return []
     
-    def _calculate_food_similarity(self, search_term: str, food_name: str) -> float:
-        """Calculate similarity between search term and food name using multiple strategies"""
-        
-        # Strategy 1: Exact substring match
-        if search_term in food_name or food_name in search_term:
-            return 1.0
-        
-        # Strategy 2: Word-based matching
-        search_words = set(search_term.split())
-        food_words = set(food_name.split())
-        
-        if search_words.intersection(food_words):
-            word_overlap = len(search_words.intersection(food_words))
-            total_words = len(search_words.union(food_words))
-            word_similarity = word_overlap / total_words
-            if word_similarity > 0.5:
-                return word_similarity
-        
-        # Strategy 3: Sequence matching
-        sequence_similarity = SequenceMatcher(None, search_term, food_name).ratio()
-        
-        # Strategy 4: Common Indian food variations
-        variations = self._get_food_variations(search_term)
-        for variation in variations:
-            if variation in food_name:
-                return 0.9
-        
-        return max(sequence_similarity, 0.0)
-    
-    def _get_food_variations(self, food_name: str) -> List[str]:
-        """Get common variations of Indian food names"""
-        variations = []
-        
-        # Common Indian food variations
-        food_mappings = {
-            'dosa': ['dosai', 'dose', 'dosa', 'masala dosa', 'plain dosa'],
-            'masala dosa': ['masala dosai', 'masala dose', 'dosa masala'],
-            'idli': ['idly', 'idli', 'steamed rice cake'],
-            'biryani': ['biriyani', 'biryani', 'dum biryani', 'chicken biryani'],
-            'roti': ['chapati', 'roti', 'indian bread', 'wheat bread'],
-            'dal': ['daal', 'lentil', 'dal curry', 'lentil curry'],
-            'rice': ['steamed rice', 'white rice', 'basmati rice'],
-            'curry': ['sabzi', 'vegetable curry', 'gravy'],
-            'samosa': ['samosa', 'punjabi samosa', 'fried samosa'],
-            'paratha': ['parantha', 'stuffed paratha', 'aloo paratha']
-        }
-        
-        food_lower = food_name.lower()
-        for key, values in food_mappings.items():
-            if key in food_lower or food_lower in key:
-                variations.extend(values)
-        
-        return variations
-    
     def get_food_frequency_analysis(self, user_id: int, food_name: str, days: int = 30) -> Dict[str, Any]:
         """Analyze how frequently a user eats a specific food"""
         try:
@@ -244,23 +182,150 @@ class MealMemoryService:
         """Process natural language queries about meals"""
         query_lower = query.lower()
         
-        # Query type detection
-        if any(word in query_lower for word in ['when', 'what time', 'date']):
-            return self._handle_when_query(user_id, query_lower)
-        elif any(word in query_lower for word in ['how often', 'frequency', 'how many times']):
-            return self._handle_frequency_query(user_id, query_lower)
-        elif any(word in query_lower for word in ['what did i eat with', 'what else', 'together']):
-            return self._handle_context_query(user_id, query_lower)
-        elif any(word in query_lower for word in ['last time', 'recent', 'latest']):
-            return self._handle_last_time_query(user_id, query_lower)
-        else:
-            # Default to food search
-            return self._handle_general_food_search(user_id, query_lower)
+        intent = meal_intent_classifier.classify(query)
+        answer = self.answer_intent(user_id, intent, query_lower)
+        if answer:
+            return answer
+        
+        # Default to food search
+        return self._handle_general_food_search(user_id, query_lower)
+    
+    def answer_intent(self, user_id: int, intent: Dict[str, Any], query: str = '') -> Optional[Dict[str, Any]]:
+        """
+        Answer a classified meal-history question straight from the database.
+        Returns None when the intent is not structured or a required slot is missing.
+        """
+        try:
+            intent_name = intent.get('intent')
+            food_name = intent.get('food')
+            time_range = intent.get('time_range')
+            
+            if intent_name == 'when_eaten' and food_name:
+                return self._handle_when_query(user_id, query, food_name=food_name)
+            if intent_name == 'frequency' and food_name:
+                days = max((datetime.now() - time_range['start']).days, 1) if time_range else 30
+                return self._handle_frequency_query(user_id, query, food_name=food_name, days=days)
+            if intent_name == 'co_occurrence' and food_name:
+                return self._handle_context_query(user_id, query, food_name=food_name)
+            if intent_name == 'meal_log':
+                return self._handle_meal_log_query(user_id, time_range, intent.get('nutrient'))
+            if intent_name == 'nutrient_total' and intent.get('nutrient'):
+                return self._handle_nutrient_total_query(user_id, time_range, intent['nutrient'])
+            
+            return None
+            
+        except Exception as e:
+            print(f"Error answering meal intent: {e}")
+            return None
+    
+    def _get_meals_in_range(self, user_id: int, time_range: Dict[str, Any]) -> List[Meal]:
+        return self.db.query(Meal).filter(
+            and_(
+                Meal.user_id == user_id,
+                Meal.upload_time >= time_range['start'],
+                Meal.upload_time < time_range['end'] + timedelta(seconds=1)
+            )
+        ).order_by(Meal.upload_time.desc()).all()
+    
+    def _default_time_range(self, label: str, days: int) -> Dict[str, Any]:
+        now = datetime.now()
+        start = now.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=days)
+        return {'label': label, 'start': start, 'end': now}
+    
+    def _meal_nutrient_total(self, meal: Meal, nutrient: str) -> float:
+        """Read a meal's nutrient total from its analysis, falling back to the nutrition summary"""
+        key = f'total_{nutrient}'
+        value = (meal.analysis_data or {}).get(key) or (meal.nutrition_summary or {}).get(key) or 0
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return 0.0
+    
+    def _handle_meal_log_query(self, user_id: int, time_range: Optional[Dict[str, Any]], nutrient: Optional[str] = None) -> Dict[str, Any]:
+        """Handle 'what did I eat today / yesterday / this week' queries"""
+        time_range = time_range or self._default_time_range('recently', 3)
+        label = time_range['label']
+        meals = self._get_meals_in_range(user_id, time_range)
+        
+        if not meals:
+            return {
+                'query_type': 'meal_log',
+                'time_range': label,
+                'result': f"You haven't logged any meals {self._describe_range(label)}.",
+                'meal_count': 0
+            }
+        
+        response = f"{self._describe_range(label).capitalize()} you've had {len(meals)} meal(s):\n\n"
+        
+        if nutrient:
+            total = sum(self._meal_nutrient_total(meal, nutrient) for meal in meals)
+            unit = '' if nutrient == 'calories' else 'g'
+            response += f"**Total {nutrient.capitalize()}: {total:.0f}{unit}**\n\n"
+        
+        for meal in meals[:10]:  # Show up to 10 meals
+            date_str = meal.upload_date.strftime("%m/%d") if meal.upload_date else "Unknown"
+            time_str = meal.upload_time.strftime("%I:%M %p") if meal.upload_time else "Unknown time"
+            meal_type = meal.meal_type or self._determine_meal_type(meal.upload_time)
+            
+            items = [item.get('name', 'Unknown') for item in (meal.analysis_data or {}).get('items', []) if isinstance(item, dict)]
+            foods_text = ', '.join(items[:3]) if items else 'Food items'
+            if len(items) > 3:
+                foods_text += f" + {len(items) - 3} more"
+            
+            calories = self._meal_nutrient_total(meal, 'calories')
+            protein = self._meal_nutrient_total(meal, 'protein')
+            
+            response += f"• **{date_str} at {time_str}** ({meal_type}): {foods_text}"
+            if calories > 0:
+                response += f" - {calories:.0f} cal"
+            if protein > 0:
+                response += f", {protein:.0f}g protein"
+            response += "\n"
+        
+        return {
+            'query_type': 'meal_log',
+            'time_range': label,
+            'result': response.strip(),
+            'meal_count': len(meals)
+        }
+    
+    def _handle_nutrient_total_query(self, user_id: int, time_range: Optional[Dict[str, Any]], nutrient: str) -> Dict[str, Any]:
+        """Handle 'how much protein did I have today' queries"""
+        time_range = time_range or self._default_time_range('today', 0)
+        label = time_range['label']
+        meals = self._get_meals_in_range(user_id, time_range)
+        
+        total = sum(self._meal_nutrient_total(meal, nutrient) for meal in meals)
+        unit = ' kcal' if nutrient == 'calories' else 'g'
+        
+        response = f"{self._describe_range(label).capitalize()} you've had {total:.0f}{unit} of {nutrient} across {len(meals)} meal(s)."
+        
+        # Compare single-day totals with the user's daily goal
+        if label in ['today', 'yesterday']:
+            user = self.db.query(User).filter(User.id == user_id).first()
+            goal = (user.daily_goals or {}).get(nutrient) if user else None
+            if goal:
+                percent = total / goal * 100
+                response += f" That's {percent:.0f}% of your daily goal of {goal}{unit}."
+        
+        return {
+            'query_type': 'nutrient_total',
+            'time_range': label,
+            'nutrient': nutrient,
+            'total': round(total, 1),
+            'meal_count': len(meals),
+            'result': response
+        }
+    
+    def _describe_range(self, label: str) -> str:
+        if label in ['today', 'yesterday', 'recently']:
+            return label
+        return f"in the {label}" if label.startswith('past') else label
     
-    def _handle_when_query(self, user_id: int, query: str) -> Dict[str, Any]:
+    def _handle_when_query(self, user_id: int, query: str, food_name: Optional[str] = None) -> Dict[str, Any]:
         """Handle 'when did I eat...' queries"""
         # Extract food name from query
-        food_name = self._extract_food_name_from_query(query)
+        food_name = food_name or self._extract_food_name_from_query(query)
         
         if not food_name:
             return {'error': 'Could not identify food item in query'}
@@ -296,20 +361,20 @@ class MealMemoryService:
             'total_occurrences': len(matching_meals)
         }
     
-    def _handle_frequency_query(self, user_id: int, query: str) -> Dict[str, Any]:
+    def _handle_frequency_query(self, user_id: int, query: str, food_name: Optional[str] = None, days: int = 30) -> Dict[str, Any]:
         """Handle 'how often do I eat...' queries"""
-        food_name = self._extract_food_name_from_query(query)
+        food_name = food_name or self._extract_food_name_from_query(query)
         
         if not food_name:
             return {'error': 'Could not identify food item in query'}
         
-        frequency_data = self.get_food_frequency_analysis(user_id, food_name, days=30)
+        frequency_data = self.get_food_frequency_analysis(user_id, food_name, days=days)
         
         if frequency_data.get('total_occurrences', 0) == 0:
             return {
                 'query_type': 'frequency',
                 'food_name': food_name,
-                'result': f"You haven't eaten {food_name} in the last 30 days, or it might be recorded under a different name."
+                'result': f"You haven't eaten {food_name} in the last {days} days, or it might be recorded under a different name."
             }
         
         freq_per_week = frequency_data['frequency_per_week']
@@ -323,7 +388,7 @@ class MealMemoryService:
             frequency_desc = "occasionally"
         
         response = f"You eat {food_name} {frequency_desc} - about {freq_per_week} times per week. "
-        response += f"In the last 30 days, you've had it {total_times} times."
+        response += f"In the last {days} days, you've had it {total_times} times."
         
         if frequency_data['most_common_meal_type']:
             response += f" You usually have it for {frequency_data['most_common_meal_type']}."
@@ -335,9 +400,9 @@ class MealMemoryService:
             'frequency_data': frequency_data
         }
     
-    def _handle_context_query(self, user_id: int, query: str) -> Dict[str, Any]:
+    def _handle_context_query(self, user_id: int, query: str, food_name: Optional[str] = None) -> Dict[str, Any]:
         """Handle 'what did I eat with...' queries"""
-        food_name = self._extract_food_name_from_query(query)
+        food_name = food_name or self._extract_food_name_from_query(query)
         
         if not food_name:
             return {'error': 'Could not identify food item in query'}
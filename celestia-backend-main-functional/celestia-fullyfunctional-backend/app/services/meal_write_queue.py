@@ -0,0 +1,274 @@
+from collections import defaultdict, deque
+from datetime import date, datetime
+from threading import Event, Lock, Thread
+from typing import Dict, Any, List, Set, Tuple
+import logging
+import time
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.db_models import User, Meal
+from app.services.user_service import after_daily_summaries_updated, after_meals_logged
+
+logger = logging.getLogger(__name__)
+
+MAX_WRITE_ATTEMPTS = 3
+
+class MealWriteBehindQueue:
+    """
+    Write-behind persistence for analyzed meals. Analysis endpoints enqueue
+    the meal and respond right away; a background thread writes everything
+    queued since its last pass in one transaction. Daily summaries are
+    marked dirty per (user_id, date) and recomputed on a slower cadence, so
+    a burst of meals costs one summary update per user and day.
+    """
+
+    def __init__(self, flush_seconds: float = 0.5, summary_seconds: float = 5.0, max_batch: int = 500):
+        self.flush_seconds = flush_seconds
+        self.summary_seconds = summary_seconds
+        self.max_batch = max_batch
+
+        self.lock = Lock()
+        self.pending: deque = deque()
+        self.dirty_summaries: Set[Tuple[int, date]] = set()
+        # (user_id, date) -> failed summary updates so far
+        self.summary_attempts: Dict[Tuple[int, date], int] = {}
+        self.wake = Event()
+        self.stopping = False
+        self.thread = None
+
+        self.meals_queued = 0
+        self.meals_written = 0
+        self.meals_dropped = 0
+        self.summaries_written = 0
+        self.summaries_dropped = 0
+        self.flushes = 0
+        self.last_flush_ms = None
+
+    def enqueue(self, user_id: int, analysis_data: Dict, portion_estimates: Dict,
+                nutrition_summary: Dict, recommendations: Dict) -> bool:
+        """Queue a meal for logging; it is timestamped now, not when it's written"""
+        with self.lock:
+            if self.stopping:
+                logger.warning(f"Meal write queue is shut down; meal for user {user_id} not queued")
+                return False
+            self.pending.append({
+                'user_id': user_id,
+                'analysis_data': analysis_data or {},
+                'portion_estimates': portion_estimates or {},
+                'nutrition_summary': nutrition_summary or {},
+                'recommendations': recommendations or {},
+                'logged_at': datetime.now(),
+                'attempts': 0
+            })
+            self.meals_queued += 1
+            self._ensure_thread()
+        return True
+
+    def flush(self) -> Dict[str, int]:
+        """Write every queued meal and dirty summary now"""
+        written = 0
+        while True:
+            result = self._write_meals()
+            written += result
+            with self.lock:
+                if not self.pending or result == 0:
+                    break
+        summaries = self._write_summaries()
+        return {'meals_written': written, 'summaries_written': summaries}
+
+    def shutdown(self):
+        """Stop accepting meals and write out everything still queued"""
+        with self.lock:
+            self.stopping = True
+        self.wake.set()
+        if self.thread:
+            self.thread.join(timeout=10)
+        self.flush()
+
+        with self.lock:
+            unwritten_meals = len(self.pending)
+            unwritten_summaries = len(self.dirty_summaries)
+        if unwritten_meals or unwritten_summaries:
+            logger.error(f"Meal write queue shut down with {unwritten_meals} meals and "
+                         f"{unwritten_summaries} daily summaries unwritten; they are lost")
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'running': bool(self.thread and self.thread.is_alive()),
+                'pending_meals': len(self.pending),
+                'dirty_summaries': len(self.dirty_summaries),
+                'meals_queued': self.meals_queued,
+                'meals_written': self.meals_written,
+                'meals_dropped': self.meals_dropped,
+                'summaries_written': self.summaries_written,
+                'summaries_dropped': self.summaries_dropped,
+                'flushes': self.flushes,
+                'last_flush_ms': self.last_flush_ms
+            }
+
+    def _ensure_thread(self):
+        if self.thread is None or not self.thread.is_alive():
+            self.thread = Thread(target=self._run, name="meal-write-behind", daemon=True)
+            self.thread.start()
+
+    def _run(self):
+        next_summary_flush = time.monotonic() + self.summary_seconds
+        while True:
+            self.wake.wait(self.flush_seconds)
+            self.wake.clear()
+            with self.lock:
+                stopping = self.stopping
+            if stopping:
+                return
+
+            try:
+                # Let a burst accumulate, then write it in one transaction
+                self._write_meals()
+                if time.monotonic() >= next_summary_flush:
+                    self._write_summaries()
+                    next_summary_flush = time.monotonic() + self.summary_seconds
+            except Exception as e:
+                logger.error(f"Meal write-behind error: {e}")
+
+    def _write_meals(self) -> int:
+        with self.lock:
+            batch = [self.pending.popleft() for _ in range(min(self.max_batch, len(self.pending)))]
+        if not batch:
+            return 0
+
+        started = time.perf_counter()
+        db = SessionLocal()
+        try:
+            written = self._insert_meals(db, batch)
+        except Exception as e:
+            # Write the entries one at a time so a bad row only fails itself
+            logger.error(f"Failed to write {len(batch)} queued meals, retrying individually: {e}")
+            db.rollback()
+            written = []
+            for entry in batch:
+                try:
+                    written.extend(self._insert_meals(db, [entry]))
+                except Exception as entry_error:
+                    db.rollback()
+                    self._retry_or_drop(entry, entry_error)
+
+        dirty = {(meal.user_id, meal.upload_date) for meal in written}
+        try:
+            meals_by_user: Dict[int, List[Meal]] = defaultdict(list)
+            for meal in written:
+                meals_by_user[meal.user_id].append(meal)
+            for user_id, user_meals in meals_by_user.items():
+                # Monitoring and agent context are refreshed once the daily summaries land
+                after_meals_logged(db, user_id, user_meals, summaries_updated=False)
+        except Exception as e:
+            logger.error(f"Post-write updates for queued meals failed: {e}")
+            db.rollback()
+        finally:
+            db.close()
+
+        with self.lock:
+            self.dirty_summaries.update(dirty)
+            self.meals_written += len(written)
+            self.flushes += 1
+            self.last_flush_ms = round((time.perf_counter() - started) * 1000, 1)
+        return len(written)
+
+    def _insert_meals(self, db, entries: List[Dict[str, Any]]) -> List[Meal]:
+        """Insert queued meals and bump the users' last meal time in one transaction"""
+        meals = [
+            Meal(
+                user_id=entry['user_id'],
+                analysis_data=entry['analysis_data'],
+                portion_estimates=entry['portion_estimates'],
+                nutrition_summary=entry['nutrition_summary'],
+                recommendations=entry['recommendations'],
+                upload_date=entry['logged_at'].date(),
+                upload_time=entry['logged_at'],
+                day_of_week=entry['logged_at'].strftime("%A")
+            )
+            for entry in entries
+        ]
+        db.add_all(meals)
+
+        # Update users' last meal time for reminder tracking
+        last_meal_times: Dict[int, datetime] = {}
+        for entry in entries:
+            last_meal_times[entry['user_id']] = max(entry['logged_at'], last_meal_times.get(entry['user_id'], entry['logged_at']))
+        for user in db.query(User).filter(User.id.in_(list(last_meal_times))).all():
+            if user.last_meal_time is None or user.last_meal_time.replace(tzinfo=None) < last_meal_times[user.id]:
+                user.last_meal_time = last_meal_times[user.id]
+
+        db.commit()
+        return meals
+
+    def _retry_or_drop(self, entry: Dict[str, Any], error: Exception):
+        entry['attempts'] += 1
+        with self.lock:
+            if entry['attempts'] < MAX_WRITE_ATTEMPTS:
+                self.pending.appendleft(entry)
+                return
+            self.meals_dropped += 1
+        logger.error(f"Dropping queued meal for user {entry['user_id']} after {entry['attempts']} attempts: {error}")
+
+    def _write_summaries(self) -> int:
+        with self.lock:
+            keys = sorted(self.dirty_summaries)
+            self.dirty_summaries.clear()
+        if not keys:
+            return 0
+
+        from app.services.dashboard_service import DashboardService
+
+        db = SessionLocal()
+        written = 0
+        updated_users: Set[int] = set()
+        failed: Set[Tuple[int, date]] = set()
+        try:
+            dashboard_service = DashboardService(db)
+            for key in keys:
+                user_id, summary_date = key
+                try:
+                    # Returns {} after rolling back on error
+                    result = dashboard_service.create_or_update_daily_summary(user_id, summary_date)
+                except Exception as e:
+                    logger.error(f"Failed to update daily summary for user {user_id} on {summary_date}: {e}")
+                    db.rollback()
+                    result = None
+                if result:
+                    updated_users.add(user_id)
+                    written += 1
+                else:
+                    failed.add(key)
+        finally:
+            db.close()
+
+        # Agent context and health monitoring read the summaries just written
+        for user_id in updated_users:
+            after_daily_summaries_updated(user_id)
+
+        dropped = []
+        with self.lock:
+            self.summaries_written += written
+            for key in keys:
+                if key not in failed:
+                    self.summary_attempts.pop(key, None)
+            for key in failed:
+                self.summary_attempts[key] = self.summary_attempts.get(key, 0) + 1
+                if self.summary_attempts[key] < MAX_WRITE_ATTEMPTS:
+                    self.dirty_summaries.add(key)
+                else:
+                    del self.summary_attempts[key]
+                    dropped.append(key)
+            self.summaries_dropped += len(dropped)
+        for user_id, summary_date in dropped:
+            logger.error(f"Giving up on the daily summary for user {user_id} on {summary_date} "
+                         f"after {MAX_WRITE_ATTEMPTS} attempts; it is rebuilt on the user's next meal")
+        return written
+
+# Global meal write-behind queue instance
+meal_write_queue = MealWriteBehindQueue(
+    flush_seconds=settings.meal_write_flush_seconds,
+    summary_seconds=settings.meal_summary_flush_seconds
+)
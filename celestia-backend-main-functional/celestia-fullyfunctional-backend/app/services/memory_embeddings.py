@@ -0,0 +1,293 @@
+from collections import OrderedDict
+from datetime import datetime
+from threading import Lock
+from typing import Dict, Any, List, Optional, Tuple
+import hashlib
+import os
+import re
+import time
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models.agentic_models import ConversationMemory
+
+EMBEDDING_DTYPE = np.float32
+
+# Rows a user's index starts with; it doubles as memories are added
+INITIAL_INDEX_CAPACITY = 8
+
+# Words too common in chat to say anything about what a message is about
+EMBEDDING_STOP_WORDS = {
+    'a', 'an', 'the', 'and', 'or', 'but', 'is', 'are', 'was', 'were', 'be', 'been',
+    'i', 'me', 'my', 'you', 'your', 'it', 'its', 'this', 'that', 'to', 'of', 'in',
+    'on', 'for', 'with', 'at', 'by', 'from', 'as', 'so', 'do', 'did', 'does', 'can',
+    'could', 'should', 'would', 'will', 'what', 'how', 'have', 'has', 'had', 'am',
+    'about', 'just', 'some', 'any', 'please', 'get', 'got'
+}
+
+class HashingEmbedder:
+    """
+    Dependency-free text embedder: word unigrams, word bigrams and character
+    trigrams are hashed into a fixed number of signed buckets and L2-normalized.
+    Deterministic across processes (blake2b, not Python's salted hash).
+    """
+
+    name = 'hashing'
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> Tuple[List[int], List[float]]:
+        words = [
+            word for word in re.findall(r"[a-z0-9]+", (text or "").lower())
+            if word not in EMBEDDING_STOP_WORDS
+        ]
+
+        features: List[Tuple[str, float]] = [(f"w:{word}", 1.0) for word in words]
+        features += [(f"b:{a} {b}", 0.5) for a, b in zip(words, words[1:])]
+        # Character trigrams let related word forms (allergy/allergic, protein/proteins) overlap
+        for word in words:
+            padded = f"<{word}>"
+            features += [(f"c:{padded[i:i + 3]}", 0.25) for i in range(len(padded) - 2)]
+
+        indices, weights = [], []
+        for feature, weight in features:
+            digest = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+            indices.append(digest % self.dim)
+            weights.append(weight if digest >> 63 else -weight)
+        return indices, weights
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = np.zeros((len(texts), self.dim), dtype=EMBEDDING_DTYPE)
+        for row, text in enumerate(texts):
+            indices, weights = self._features(text)
+            if indices:
+                np.add.at(vectors[row], indices, weights)
+        # Sublinear term frequency, then unit length so a dot product is the cosine
+        vectors = np.sign(vectors) * np.log1p(np.abs(vectors))
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+class LocalModelEmbedder:
+    """Sentence-transformers model loaded from a local directory on CPU (never downloads)"""
+
+    name = 'local_model'
+
+    def __init__(self, model_path: str):
+        from sentence_transformers import SentenceTransformer
+
+        self.model = SentenceTransformer(model_path, device='cpu')
+        self.dim = self.model.get_sentence_embedding_dimension()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        vectors = self.model.encode(texts, batch_size=32, normalize_embeddings=True, show_progress_bar=False)
+        return np.asarray(vectors, dtype=EMBEDDING_DTYPE)
+
+def create_embedder():
+    """Use the configured local model when it is available, otherwise the hashing vectorizer"""
+    model_path = settings.memory_embedding_model_path
+    if model_path and os.path.isdir(model_path):
+        try:
+            return LocalModelEmbedder(model_path)
+        except Exception as e:
+            print(f"Error loading local embedding model, using hashing vectorizer: {e}")
+    return HashingEmbedder(dim=settings.memory_embedding_dim)
+
+def vector_to_bytes(vector: np.ndarray) -> bytes:
+    return np.asarray(vector, dtype=EMBEDDING_DTYPE).tobytes()
+
+def bytes_to_vector(data: Optional[bytes], dim: int) -> Optional[np.ndarray]:
+    """Decode a stored embedding; None when missing or written by a model of another size"""
+    if not data or len(data) != dim * np.dtype(EMBEDDING_DTYPE).itemsize:
+        return None
+    return np.frombuffer(data, dtype=EMBEDDING_DTYPE)
+
+class _UserVectorIndex:
+    def __init__(self, dim: int):
+        self.ready = False
+        self.synced_at = 0.0
+        self.last_memory_id = 0
+        self.size = 0
+        # Row-major matrix grown by doubling; rows [0, size) are live
+        self.vectors = np.zeros((INITIAL_INDEX_CAPACITY, dim), dtype=EMBEDDING_DTYPE)
+        self.ids = np.zeros(INITIAL_INDEX_CAPACITY, dtype=np.int64)
+        self.created = np.zeros(INITIAL_INDEX_CAPACITY, dtype=np.float64)
+        self.positions: Dict[int, int] = {}
+
+    def add(self, memory_id: int, vector: np.ndarray, created_at: Optional[datetime]):
+        if memory_id in self.positions:
+            return
+        if self.size == len(self.ids):
+            capacity = len(self.ids) * 2
+            self.vectors = np.resize(self.vectors, (capacity, self.vectors.shape[1]))
+            self.ids = np.resize(self.ids, capacity)
+            self.created = np.resize(self.created, capacity)
+
+        self.vectors[self.size] = vector
+        self.ids[self.size] = memory_id
+        self.created[self.size] = created_at.timestamp() if created_at else time.time()
+        self.positions[memory_id] = self.size
+        self.last_memory_id = max(self.last_memory_id, memory_id)
+        self.size += 1
+
+    def remove(self, memory_id: int):
+        """Swap the last row into the removed slot"""
+        position = self.positions.pop(memory_id, None)
+        if position is None:
+            return
+        last = self.size - 1
+        if position != last:
+            self.vectors[position] = self.vectors[last]
+            self.ids[position] = self.ids[last]
+            self.created[position] = self.created[last]
+            self.positions[int(self.ids[position])] = position
+        self.size = last
+
+class MemoryVectorIndex:
+    """
+    Per-user in-memory matrix of conversation memory embeddings. Built lazily
+    from the stored float32 vectors (embedding any rows that lack one),
+    caught up by memory id and updated on store_conversation. A query is one
+    matrix-vector product plus an argpartition for the top k. At most
+    max_users indexes are kept, least recently searched evicted first; an
+    evicted user's index is rebuilt from the stored vectors on their next search.
+    """
+
+    def __init__(self, resync_seconds: int = 30, max_users: int = 1000):
+        self.lock = Lock()
+        self.resync_seconds = resync_seconds
+        self.max_users = max_users
+        self.embedder = None
+        self.users: 'OrderedDict[int, _UserVectorIndex]' = OrderedDict()
+
+    def get_embedder(self):
+        with self.lock:
+            if self.embedder is None:
+                self.embedder = create_embedder()
+            return self.embedder
+
+    def embed_text(self, text: str) -> np.ndarray:
+        return self.get_embedder().embed([text])[0]
+
+    def add_memory(self, user_id: int, memory_id: int, vector: np.ndarray, created_at: Optional[datetime]):
+        """Index a newly stored memory (no-op until the user's index has been built)"""
+        with self.lock:
+            index = self.users.get(user_id)
+            if index is not None and index.ready:
+                index.add(memory_id, vector, created_at)
+
+    def remove_memories(self, user_id: int, memory_ids: List[int]):
+        with self.lock:
+            index = self.users.get(user_id)
+            if index is not None:
+                for memory_id in memory_ids:
+                    index.remove(memory_id)
+
+    def invalidate(self, user_id: int):
+        with self.lock:
+            self.users.pop(user_id, None)
+
+    def _ensure_user(self, db: Session, user_id: int) -> _UserVectorIndex:
+        embedder = self.get_embedder()
+
+        with self.lock:
+            index = self.users.get(user_id)
+            if index is None:
+                index = self.users[user_id] = _UserVectorIndex(embedder.dim)
+                while len(self.users) > self.max_users:
+                    self.users.popitem(last=False)
+            self.users.move_to_end(user_id)
+            last_memory_id = index.last_memory_id
+            if index.ready and time.monotonic() - index.synced_at < self.resync_seconds:
+                return index
+
+        rows = db.query(
+            ConversationMemory.id, ConversationMemory.embedding, ConversationMemory.created_at
+        ).filter(
+            ConversationMemory.user_id == user_id,
+            ConversationMemory.id > last_memory_id
+        ).order_by(ConversationMemory.id).all()
+
+        vectors = {memory_id: bytes_to_vector(data, embedder.dim) for memory_id, data, _ in rows}
+        missing = [memory_id for memory_id, vector in vectors.items() if vector is None]
+        if missing:
+            vectors.update(self._backfill(db, missing))
+
+        with self.lock:
+            for memory_id, _, created_at in rows:
+                if vectors.get(memory_id) is not None:
+                    index.add(memory_id, vectors[memory_id], created_at)
+            index.ready = True
+            index.synced_at = time.monotonic()
+
+        return index
+
+    def _backfill(self, db: Session, memory_ids: List[int]) -> Dict[int, np.ndarray]:
+        """Embed memories stored before embeddings existed (or by another model) and persist them"""
+        embedded: Dict[int, np.ndarray] = {}
+        try:
+            for start in range(0, len(memory_ids), 256):
+                batch = db.query(ConversationMemory).filter(
+                    ConversationMemory.id.in_(memory_ids[start:start + 256])
+                ).all()
+                matrix = self.get_embedder().embed([memory.content or "" for memory in batch])
+                for memory, vector in zip(batch, matrix):
+                    memory.embedding = vector_to_bytes(vector)
+                    embedded[memory.id] = vector
+            db.commit()
+        except Exception as e:
+            print(f"Error backfilling memory embeddings: {e}")
+            db.rollback()
+        return embedded
+
+    def search(
+        self,
+        db: Session,
+        user_id: int,
+        query_text: str,
+        k: int = 10,
+        since: Optional[datetime] = None,
+        exclude_ids: Optional[List[int]] = None,
+        min_similarity: float = 0.15
+    ) -> List[Tuple[int, float]]:
+        """Return (memory_id, cosine_similarity) pairs for the k nearest memories, best first"""
+        if not query_text or not query_text.strip():
+            return []
+
+        index = self._ensure_user(db, user_id)
+        query = self.embed_text(query_text)
+
+        with self.lock:
+            if index.size == 0:
+                return []
+            similarities = index.vectors[:index.size] @ query
+            ids = index.ids[:index.size]
+
+            mask = similarities >= min_similarity
+            if since is not None:
+                mask &= index.created[:index.size] >= since.timestamp()
+            if exclude_ids:
+                mask &= ~np.isin(ids, exclude_ids)
+
+            candidates = np.flatnonzero(mask)
+            if len(candidates) > k:
+                top = np.argpartition(-similarities[candidates], k - 1)[:k]
+                candidates = candidates[top]
+
+            order = candidates[np.argsort(-similarities[candidates])]
+            return [(int(ids[row]), round(float(similarities[row]), 4)) for row in order]
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'embedder': self.embedder.name if self.embedder else None,
+                'dimensions': self.embedder.dim if self.embedder else None,
+                'indexed_users': len(self.users),
+                'max_users': self.max_users,
+                'indexed_memories': sum(index.size for index in self.users.values())
+            }
+
+# Global memory vector index instance
+memory_vector_index = MemoryVectorIndex(max_users=settings.memory_index_max_users)
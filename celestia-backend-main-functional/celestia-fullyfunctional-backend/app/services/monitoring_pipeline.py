@@ -0,0 +1,143 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import Dict, Any, List, Optional
+import logging
+
+from app.config import settings
+from app.database import SessionLocal
+from app.services.health_monitoring_service import HealthMonitoringService
+
+logger = logging.getLogger(__name__)
+
+class MonitoringPipeline:
+    """
+    Event-driven background pipeline for proactive health monitoring.
+    Monitoring runs off the request path (on meal log or on a schedule) and
+    publishes a versioned per-user snapshot that chat reads without touching
+    the user's history. Snapshots are kept for the max_users most recently
+    read or refreshed users.
+    """
+
+    def __init__(self, max_workers: int = 2, max_users: int = 1000):
+        self.max_workers = max_workers
+        self.max_users = max_users
+        self.executor = None
+        self.lock = Lock()
+        # user_id -> latest snapshot, least recently used first
+        self.snapshots: 'OrderedDict[int, Dict[str, Any]]' = OrderedDict()
+        # user_id -> True if another refresh was requested while one is in flight
+        self.in_flight: Dict[int, bool] = {}
+        self.max_age = timedelta(minutes=settings.monitoring_snapshot_max_age_minutes)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="health-monitoring"
+            )
+        return self.executor
+
+    def request_refresh(self, user_id: int, reason: str = "on_demand") -> bool:
+        """Queue a monitoring run for a user. Requests for a user already queued are coalesced."""
+        with self.lock:
+            if user_id in self.in_flight:
+                self.in_flight[user_id] = True
+                return False
+            self.in_flight[user_id] = False
+
+        try:
+            self._get_executor().submit(self._run, user_id, reason)
+            return True
+        except RuntimeError as e:
+            # Executor already shut down
+            logger.warning(f"Monitoring pipeline unavailable for user {user_id}: {e}")
+            with self.lock:
+                self.in_flight.pop(user_id, None)
+            return False
+
+    def get_snapshot(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """
+        Get the latest monitoring snapshot for a user. Missing or stale snapshots
+        trigger a background refresh; the stale snapshot is still returned.
+        """
+        with self.lock:
+            snapshot = self.snapshots.get(user_id)
+            if snapshot is not None:
+                self.snapshots.move_to_end(user_id)
+
+        if snapshot is None or datetime.now() - snapshot['generated_at'] > self.max_age:
+            self.request_refresh(user_id, reason="stale_snapshot")
+
+        return snapshot
+
+    def invalidate(self, user_id: int):
+        """Drop a user's snapshot so the next read triggers a fresh run"""
+        with self.lock:
+            self.snapshots.pop(user_id, None)
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'snapshots_cached': len(self.snapshots),
+                'max_users': self.max_users,
+                'runs_in_flight': len(self.in_flight),
+                'max_workers': self.max_workers
+            }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _run(self, user_id: int, reason: str):
+        db = SessionLocal()
+        try:
+            health_monitor = HealthMonitoringService(db)
+            monitoring_results = health_monitor.run_health_monitoring(user_id)
+            active_alerts = health_monitor.get_active_alerts(user_id)
+            self.publish_snapshot(user_id, reason, monitoring_results, active_alerts)
+        except Exception as e:
+            logger.error(f"Health monitoring run failed for user {user_id}: {e}")
+        finally:
+            db.close()
+            with self.lock:
+                rerun = self.in_flight.pop(user_id, False)
+            if rerun:
+                self.request_refresh(user_id, reason=reason)
+
+    def publish_snapshot(
+        self,
+        user_id: int,
+        reason: str,
+        monitoring_results: Dict[str, Any],
+        active_alerts: List[Dict[str, Any]]
+    ):
+        """Store a monitoring result as the user's latest snapshot (also used by batch runs)"""
+        with self.lock:
+            previous = self.snapshots.get(user_id)
+            self.snapshots[user_id] = {
+                'user_id': user_id,
+                'version': (previous['version'] + 1) if previous else 1,
+                'generated_at': datetime.now(),
+                'reason': reason,
+                'monitoring_results': {
+                    'monitoring_completed': monitoring_results.get('monitoring_completed', False),
+                    'alerts_generated': monitoring_results.get('alerts_generated', 0),
+                    'patterns_updated': monitoring_results.get('patterns_updated', 0),
+                    'insights_generated': monitoring_results.get('insights_generated', 0),
+                    'insights': monitoring_results.get('insights', []),
+                    'monitoring_date': monitoring_results.get('monitoring_date')
+                },
+                'active_alerts': active_alerts,
+                'urgent_alerts': [
+                    alert for alert in active_alerts if alert['severity'] in ['high', 'critical']
+                ]
+            }
+            self.snapshots.move_to_end(user_id)
+            while len(self.snapshots) > self.max_users:
+                self.snapshots.popitem(last=False)
+
+# Global monitoring pipeline instance
+monitoring_pipeline = MonitoringPipeline(max_users=settings.monitoring_snapshot_max_users)
@@ -0,0 +1,114 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Dict, Any, List, Optional
+import logging
+import time
+
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.db_models import User, Meal
+from app.services.smart_notification_service import SmartNotificationService
+
+logger = logging.getLogger(__name__)
+
+class BatchNotificationGenerator:
+    """
+    Generates the next days_ahead days of smart notifications for many users
+    in one pass. Each chunk of users loads goals and behavior patterns with
+    one query each, builds every user's notifications in memory and stores
+    them with one deduplicated bulk insert and commit. Runs open their own
+    sessions, so they are safe to start from background tasks.
+    """
+
+    def __init__(self, chunk_size: int = 500, days_ahead: int = 3):
+        self.chunk_size = chunk_size
+        self.days_ahead = days_ahead
+        # Runs are serialized so two of them can't schedule the same reminder
+        self.run_lock = Lock()
+        self.lock = Lock()
+        self.last_run: Optional[Dict[str, Any]] = None
+
+    def get_active_user_ids(self, db: Session, days: int = 14) -> List[int]:
+        """Users who logged a meal recently"""
+        cutoff = date.today() - timedelta(days=days)
+        return [
+            row[0] for row in db.query(Meal.user_id).filter(
+                Meal.upload_date >= cutoff
+            ).distinct().order_by(Meal.user_id).all()
+        ]
+
+    def run(self, user_ids: Optional[List[int]] = None, days_ahead: Optional[int] = None) -> Dict[str, Any]:
+        """Schedule notifications for the given users (default: every recently active user)"""
+        days_ahead = days_ahead or self.days_ahead
+
+        with self.run_lock:
+            started = time.perf_counter()
+
+            if user_ids is None:
+                db = SessionLocal()
+                try:
+                    user_ids = self.get_active_user_ids(db)
+                finally:
+                    db.close()
+
+            totals = defaultdict(int)
+            for start in range(0, len(user_ids), self.chunk_size):
+                for key, value in self._run_chunk(user_ids[start:start + self.chunk_size], days_ahead).items():
+                    totals[key] += value
+
+            elapsed = time.perf_counter() - started
+            result = {
+                'users_requested': len(user_ids),
+                'days_ahead': days_ahead,
+                **totals,
+                'elapsed_seconds': round(elapsed, 3),
+                'users_per_second': round(totals['users_processed'] / elapsed, 1) if elapsed > 0 else 0.0,
+                'completed_at': datetime.now().isoformat()
+            }
+
+        with self.lock:
+            self.last_run = result
+
+        return result
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                'running': self.run_lock.locked(),
+                'chunk_size': self.chunk_size,
+                'days_ahead': self.days_ahead,
+                'last_run': self.last_run
+            }
+
+    def _run_chunk(self, user_ids: List[int], days_ahead: int) -> Dict[str, int]:
+        db = SessionLocal()
+        try:
+            goals = dict(db.query(User.id, User.daily_goals).filter(User.id.in_(user_ids)).all())
+
+            notification_service = SmartNotificationService(db)
+            patterns = notification_service.get_patterns_for_users(list(goals))
+
+            for user_id, daily_goals in goals.items():
+                notification_service.build_notifications(user_id, daily_goals or {}, patterns.get(user_id, {}), days_ahead)
+
+            writes = notification_service.flush_pending_notifications()
+            if writes.get('error'):
+                return {'users_processed': 0, 'users_failed': len(user_ids)}
+
+            return {'users_processed': len(goals), **writes}
+
+        except Exception as e:
+            logger.error(f"Notification generation failed for a chunk of {len(user_ids)} users: {e}")
+            db.rollback()
+            return {'users_processed': 0, 'users_failed': len(user_ids)}
+        finally:
+            db.close()
+
+# Global batch notification generator instance
+batch_notification_generator = BatchNotificationGenerator(
+    chunk_size=settings.notification_batch_chunk_size,
+    days_ahead=settings.notification_days_ahead
+)
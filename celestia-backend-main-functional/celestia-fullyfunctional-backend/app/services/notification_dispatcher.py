@@ -0,0 +1,409 @@
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from threading import Event, Lock, Thread
+from typing import Dict, Any, List, Optional, Tuple
+import heapq
+import logging
+
+from sqlalchemy import and_, func, update
+
+from app.config import settings
+from app.database import SessionLocal
+from app.models.agentic_models import SmartNotification
+from app.models.db_models import User
+from app.services.notification_service import NotificationService
+from app.services.smart_notification_service import SmartNotificationService
+
+logger = logging.getLogger(__name__)
+
+def _local_naive(value: datetime) -> datetime:
+    """Compare scheduled times as naive local times, whatever the backend stored"""
+    if value.tzinfo is not None:
+        return value.astimezone().replace(tzinfo=None)
+    return value
+
+def _in_quiet_hours(preferences: Dict[str, Any], hour: int) -> bool:
+    quiet_start = preferences.get("quiet_hours_start", 22)
+    quiet_end = preferences.get("quiet_hours_end", 7)
+    if quiet_start > quiet_end:
+        return hour >= quiet_start or hour < quiet_end
+    return quiet_start <= hour < quiet_end
+
+def _quiet_hours_end(preferences: Dict[str, Any], now: datetime) -> datetime:
+    """The next time quiet hours end, in naive local time"""
+    end = now.replace(hour=preferences.get("quiet_hours_end", 7), minute=0, second=0, microsecond=0)
+    return end if end > now else end + timedelta(days=1)
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    index = min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+class NotificationDispatcher:
+    """
+    Delivers smart notifications when they fall due.
+    A background thread polls the (is_sent, scheduled_time) index for rows due
+    within the next poll window and keeps them in an in-memory heap ordered by
+    scheduled time, sleeping until the earliest one is due. Due rows are claimed
+    in batches with a conditional update, so a row is delivered once even with
+    several workers or processes, then sent over the user's enabled channels.
+    Claims left unfinished (the process died mid-delivery) are released again
+    by a later poll once claim_timeout has passed. Notifications falling in the
+    user's quiet hours are rescheduled for when quiet hours end. Rows more
+    than max_lateness past their scheduled time (a backlog after downtime) are
+    marked expired instead of being delivered late.
+    Recurring notifications get their next occurrence in one bulk insert per batch.
+    """
+
+    def __init__(self, batch_size: int = 200, poll_seconds: int = 30,
+                 max_attempts: int = 3, delivery_workers: int = 4, claim_timeout_seconds: int = 600,
+                 max_lateness_minutes: int = 60):
+        self.batch_size = batch_size
+        self.poll_interval = timedelta(seconds=poll_seconds)
+        self.max_attempts = max_attempts
+        self.delivery_workers = delivery_workers
+        self.retry_delay = timedelta(minutes=1)
+        self.claim_timeout = timedelta(seconds=claim_timeout_seconds)
+        # 0 delivers notifications however late they are
+        self.max_lateness = timedelta(minutes=max_lateness_minutes) if max_lateness_minutes > 0 else None
+
+        self.heap: List[Tuple[datetime, int]] = []
+        self.queued = set()
+        self.stop_event = Event()
+        self.thread = None
+        self.executor = None
+
+        self.lock = Lock()
+        self.lateness = deque(maxlen=10000)  # seconds between scheduled and delivered
+        self.counts = {'delivered': 0, 'in_app': 0, 'failed': 0, 'retried': 0, 'deferred': 0,
+                       'reclaimed': 0, 'expired': 0, 'recurring_scheduled': 0}
+        self.last_poll = None
+
+    def start(self):
+        """Start the dispatcher thread"""
+        if self.thread and self.thread.is_alive():
+            return
+
+        self.stop_event.clear()
+        self.executor = ThreadPoolExecutor(
+            max_workers=self.delivery_workers,
+            thread_name_prefix="notification-delivery"
+        )
+        self.thread = Thread(target=self._run, name="notification-dispatcher", daemon=True)
+        self.thread.start()
+        logger.info("Notification dispatcher started")
+
+    def shutdown(self):
+        """
+        Stop the dispatcher, waiting for the batch being delivered. Rows left
+        claimed but unfinished are released by a later poll after claim_timeout.
+        """
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join(timeout=30)
+        if self.executor:
+            self.executor.shutdown(wait=True)
+        logger.info("Notification dispatcher stopped")
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            ordered = sorted(self.lateness)
+            lateness = {
+                'samples': len(ordered),
+                'p50_seconds': round(_percentile(ordered, 0.50), 3) if ordered else None,
+                'p99_seconds': round(_percentile(ordered, 0.99), 3) if ordered else None,
+                'max_seconds': round(ordered[-1], 3) if ordered else None
+            }
+            return {
+                'running': bool(self.thread and self.thread.is_alive()),
+                'queued': len(self.heap),
+                'batch_size': self.batch_size,
+                'poll_seconds': self.poll_interval.total_seconds(),
+                'last_poll': self.last_poll.isoformat() if self.last_poll else None,
+                'counts': dict(self.counts),
+                'lateness': lateness
+            }
+
+    def _run(self):
+        next_poll = datetime.now()
+        while not self.stop_event.is_set():
+            try:
+                now = datetime.now()
+                if now >= next_poll:
+                    self.poll(now)
+                    next_poll = now + self.poll_interval
+
+                due = self._pop_due(now)
+                if due:
+                    self.dispatch(due)
+                    continue
+
+                wake_at = min(next_poll, self.heap[0][0]) if self.heap else next_poll
+                self.stop_event.wait(max((wake_at - datetime.now()).total_seconds(), 0.05))
+            except Exception as e:
+                logger.error(f"Notification dispatcher error: {e}")
+                self.stop_event.wait(self.poll_interval.total_seconds())
+
+    def poll(self, now: Optional[datetime] = None) -> int:
+        """Queue unsent notifications due before the next poll; returns how many were added"""
+        now = now or datetime.now()
+        horizon = now + self.poll_interval * 2
+
+        db = SessionLocal()
+        try:
+            reclaimed = self._release_stale_claims(db, now)
+            expired = self.expire_overdue(db, now)
+            rows = db.query(SmartNotification.id, SmartNotification.scheduled_time).filter(
+                and_(
+                    SmartNotification.is_sent == False,
+                    SmartNotification.scheduled_time <= horizon
+                )
+            ).order_by(SmartNotification.scheduled_time).limit(self.batch_size * 50).all()
+        finally:
+            db.close()
+
+        added = 0
+        for notification_id, scheduled_time in rows:
+            if notification_id in self.queued or scheduled_time is None:
+                continue
+            heapq.heappush(self.heap, (_local_naive(scheduled_time), notification_id))
+            self.queued.add(notification_id)
+            added += 1
+
+        with self.lock:
+            self.last_poll = now
+            self.counts['reclaimed'] += reclaimed
+            self.counts['expired'] += expired
+        return added
+
+    def expire_overdue(self, db, now: Optional[datetime] = None) -> int:
+        """
+        Mark unsent notifications more than max_lateness overdue as expired
+        without delivering them; recurring ones get their next (future)
+        occurrence. Returns how many were expired.
+        """
+        if self.max_lateness is None:
+            return 0
+        now = now or datetime.now()
+        try:
+            expired = db.execute(
+                update(SmartNotification)
+                .where(and_(
+                    SmartNotification.is_sent == False,
+                    SmartNotification.scheduled_time < now - self.max_lateness
+                ))
+                .values(is_sent=True, sent_at=now, delivery_status='expired')
+                .returning(SmartNotification.id, SmartNotification.is_recurring)
+            ).all()
+            db.commit()
+
+            recurring_ids = [notification_id for notification_id, is_recurring in expired if is_recurring]
+            if recurring_ids:
+                recurring = db.query(SmartNotification).filter(SmartNotification.id.in_(recurring_ids)).all()
+                SmartNotificationService(db).schedule_next_occurrences(recurring)
+        except Exception as e:
+            logger.error(f"Failed to expire overdue notifications: {e}")
+            db.rollback()
+            return 0
+
+        if expired:
+            logger.warning(f"Expired {len(expired)} notifications more than {self.max_lateness} overdue")
+        return len(expired)
+
+    def _release_stale_claims(self, db, now: datetime) -> int:
+        """
+        Make rows claimed longer than claim_timeout ago without a recorded
+        outcome due again, or mark them failed once out of attempts.
+        """
+        stale = and_(
+            SmartNotification.is_sent == True,
+            SmartNotification.delivery_status == 'claimed',
+            SmartNotification.sent_at < now - self.claim_timeout
+        )
+        try:
+            failed = db.execute(
+                update(SmartNotification)
+                .where(and_(stale, SmartNotification.delivery_attempts >= self.max_attempts))
+                .values(delivery_status='failed')
+            ).rowcount
+            released = db.execute(
+                update(SmartNotification)
+                .where(stale)
+                .values(is_sent=False, sent_at=None, delivery_status='retry')
+            ).rowcount
+            db.commit()
+        except Exception as e:
+            logger.error(f"Failed to release stale notification claims: {e}")
+            db.rollback()
+            return 0
+
+        if failed or released:
+            logger.warning(f"Released {released} stale notification claims, {failed} out of attempts")
+        return released
+
+    def _pop_due(self, now: datetime) -> List[int]:
+        due = []
+        while self.heap and self.heap[0][0] <= now and len(due) < self.batch_size:
+            _, notification_id = heapq.heappop(self.heap)
+            self.queued.discard(notification_id)
+            due.append(notification_id)
+        return due
+
+    def dispatch(self, notification_ids: List[int]) -> Dict[str, int]:
+        """Claim and deliver a batch of due notifications"""
+        db = SessionLocal()
+        try:
+            claimed_at = datetime.now()
+            claimed = db.execute(
+                update(SmartNotification)
+                .where(and_(SmartNotification.id.in_(notification_ids), SmartNotification.is_sent == False))
+                .values(
+                    is_sent=True,
+                    sent_at=claimed_at,
+                    delivery_status='claimed',
+                    delivery_attempts=func.coalesce(SmartNotification.delivery_attempts, 0) + 1
+                )
+                .returning(SmartNotification.id)
+            ).scalars().all()
+            db.commit()
+
+            if not claimed:
+                return {'claimed': 0}
+
+            rows = db.query(SmartNotification, User).join(
+                User, User.id == SmartNotification.user_id
+            ).filter(SmartNotification.id.in_(claimed)).all()
+
+            items = [
+                {
+                    'id': notification.id,
+                    'user_id': notification.user_id,
+                    'notification_type': notification.notification_type,
+                    'title': notification.title,
+                    'message': notification.message,
+                    'phone_number': user.phone_number if user.phone_verified else None,
+                    'email': user.email,
+                    'preferences': user.notification_preferences or {}
+                }
+                for notification, user in rows
+            ]
+            statuses = dict(zip(
+                [item['id'] for item in items],
+                self.executor.map(self._deliver, items) if self.executor else map(self._deliver, items)
+            ))
+            delivered_at = datetime.now()
+
+            preferences = {item['id']: item['preferences'] for item in items}
+            finished, retry, deferred = [], [], []
+            for notification, _ in rows:
+                status = statuses[notification.id]
+                if status == 'quiet_hours':
+                    deferred.append((notification, _quiet_hours_end(preferences[notification.id], delivered_at)))
+                elif status == 'failed' and (notification.delivery_attempts or 0) < self.max_attempts:
+                    retry.append(notification)
+                else:
+                    finished.append((notification, status))
+
+            if finished:
+                db.execute(update(SmartNotification), [
+                    {'id': notification.id, 'delivery_status': status, 'sent_at': delivered_at}
+                    for notification, status in finished
+                ])
+            if retry:
+                db.execute(update(SmartNotification), [
+                    {'id': notification.id, 'is_sent': False, 'sent_at': None, 'delivery_status': 'retry'}
+                    for notification in retry
+                ])
+            if deferred:
+                # Not a delivery attempt; due again when quiet hours end
+                db.execute(update(SmartNotification), [
+                    {'id': notification.id, 'is_sent': False, 'sent_at': None, 'delivery_status': None,
+                     'scheduled_time': resume_at, 'delivery_attempts': max((notification.delivery_attempts or 1) - 1, 0)}
+                    for notification, resume_at in deferred
+                ])
+            db.commit()
+
+            # Next occurrences of every finished recurring notification in one insert
+            recurring = [notification for notification, _ in finished if notification.is_recurring]
+            writes = SmartNotificationService(db).schedule_next_occurrences(recurring) if recurring else {}
+
+            retry_at = delivered_at + self.retry_delay
+            with self.lock:
+                for notification, status in finished:
+                    self.counts[status] += 1
+                    self.lateness.append(
+                        (delivered_at - _local_naive(notification.scheduled_time)).total_seconds()
+                    )
+                self.counts['retried'] += len(retry)
+                self.counts['deferred'] += len(deferred)
+                self.counts['recurring_scheduled'] += writes.get('notifications_inserted', 0)
+
+            for notification in retry:
+                heapq.heappush(self.heap, (retry_at, notification.id))
+                self.queued.add(notification.id)
+            for notification, resume_at in deferred:
+                heapq.heappush(self.heap, (resume_at, notification.id))
+                self.queued.add(notification.id)
+
+            return {
+                'claimed': len(claimed),
+                'finished': len(finished),
+                'retried': len(retry),
+                'deferred': len(deferred),
+                'recurring_scheduled': writes.get('notifications_inserted', 0)
+            }
+
+        except Exception as e:
+            logger.error(f"Failed to dispatch {len(notification_ids)} notifications: {e}")
+            db.rollback()
+            return {'claimed': 0, 'error': str(e)}
+        finally:
+            db.close()
+
+    def _deliver(self, item: Dict[str, Any]) -> str:
+        """Send one notification over the user's enabled channels"""
+        preferences = item['preferences']
+        if _in_quiet_hours(preferences, datetime.now().hour):
+            return 'quiet_hours'
+
+        use_whatsapp = bool(item['phone_number']) and preferences.get("whatsapp_enabled", True)
+        use_email = bool(item['email']) and preferences.get("email_enabled", True)
+        if not use_whatsapp and not use_email:
+            return 'in_app'
+
+        db = SessionLocal()
+        try:
+            notification_service = NotificationService(db)
+            results = []
+            if use_whatsapp:
+                results.append(notification_service.send_whatsapp_message(
+                    to_number=item['phone_number'],
+                    message=f"{item['title']}\n\n{item['message']}",
+                    user_id=item['user_id'],
+                    notification_type=item['notification_type']
+                ))
+            if use_email:
+                results.append(notification_service.send_email(
+                    to_email=item['email'],
+                    subject=item['title'],
+                    body=item['message'],
+                    user_id=item['user_id'],
+                    notification_type=item['notification_type']
+                ))
+            return 'delivered' if any(result.get("success") for result in results) else 'failed'
+
+        except Exception as e:
+            logger.warning(f"Delivery of notification {item['id']} failed: {e}")
+            return 'failed'
+        finally:
+            db.close()
+
+# Global notification dispatcher instance
+notification_dispatcher = NotificationDispatcher(
+    batch_size=settings.notification_dispatch_batch_size,
+    poll_seconds=settings.notification_dispatch_poll_seconds,
+    max_attempts=settings.notification_dispatch_max_attempts,
+    delivery_workers=settings.notification_dispatch_workers,
+    claim_timeout_seconds=settings.notification_dispatch_claim_timeout_seconds,
+    max_lateness_minutes=settings.notification_dispatch_max_lateness_minutes
+)
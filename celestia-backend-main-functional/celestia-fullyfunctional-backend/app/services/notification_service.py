@@ -15,7 +15,9 @@ from sqlalchemy.orm import Session
 from sqlalchemy import and_, or_
 
 from app.config import settings
+from app.models.agentic_models import SmartNotification
 from app.models.db_models import User, NotificationLog, Meal, DailySummary
+from app.services.user_context_cache import user_context_cache
 import google.generativeai as genai
 
 # Configure Gemini for content generation
@@ -272,6 +274,14 @@ Let's start your healthy journey! 💪"""
             current_time = datetime.now()
             current_hour = current_time.hour
             
+            # Users with a pending smart meal reminder get theirs from the notification dispatcher
+            pending_smart_reminders = self.db.query(SmartNotification.user_id).filter(
+                and_(
+                    SmartNotification.notification_type == "meal_reminder",
+                    SmartNotification.is_sent == False
+                )
+            )
+            
             # Get users who need reminders
             users_needing_reminders = self.db.query(User).filter(
                 and_(
@@ -280,7 +290,8 @@ Let's start your healthy journey! 💪"""
                     or_(
                         User.last_meal_time.is_(None),
                         User.last_meal_time < current_time - timedelta(hours=5)
-                    )
+                    ),
+                    ~User.id.in_(pending_smart_reminders)
                 )
             ).all()
             
@@ -750,6 +761,7 @@ FITKIT Team 🌟"""
             user.notification_preferences = current_prefs
             
             self.db.commit()
+            user_context_cache.invalidate(user_id)
             
             return {
                 "success": True,
@@ -20,6 +20,7 @@ from sqlalchemy import and_
 
 from app.models.db_models import User, Meal, DailySummary
 from app.config import settings
+from app.services.structured_output import parse_structured_output
 import google.generativeai as genai
 
 # Configure Gemini for insights generation
@@ -233,12 +234,9 @@ class PDFReportService:
             response = insights_model.generate_content(prompt)
             
             # Parse JSON response
-            import json
-            import re
-            
-            json_match = re.search(r'\{.*\}', response.text, re.DOTALL)
-            if json_match:
-                return json.loads(json_match.group())
+            insights = parse_structured_output(response.text, partial=False)
+            if insights:
+                return insights
             else:
                 return self._get_fallback_insights(user, summaries_data)
                 
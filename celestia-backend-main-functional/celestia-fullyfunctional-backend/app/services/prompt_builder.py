@@ -0,0 +1,101 @@
+from typing import Dict, Any, List
+import math
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate for Gemini prompts (~4 characters per token)"""
+    if not text:
+        return 0
+    return math.ceil(len(text) / 4)
+
+class PromptBuilder:
+    """
+    Assemble a prompt from named sections under a token budget.
+    Required sections are always kept. Optional sections are considered in
+    priority order: each one that fits the remaining budget is kept whole,
+    one that does not is cut down to whole lines or skipped, and smaller
+    lower-priority sections after it may still be admitted. Kept sections
+    are emitted in the order they were added.
+    """
+
+    def __init__(self, token_budget: int):
+        self.token_budget = token_budget
+        self.sections: List[Dict[str, Any]] = []
+        self.report: Dict[str, Any] = {}
+
+    def add(self, name: str, text: str, priority: float = 0.5, required: bool = False) -> 'PromptBuilder':
+        if text and text.strip():
+            self.sections.append({
+                'name': name,
+                'text': text.strip(),
+                'priority': priority,
+                'required': required,
+                'order': len(self.sections)
+            })
+        return self
+
+    def build(self) -> str:
+        kept: Dict[int, str] = {}
+        report = {}
+
+        used = 0
+        for section in self.sections:
+            if section['required']:
+                kept[section['order']] = section['text']
+                used += estimate_tokens(section['text'])
+                report[section['name']] = {'tokens': estimate_tokens(section['text']), 'status': 'required'}
+
+        optional = sorted(
+            [section for section in self.sections if not section['required']],
+            key=lambda section: (-section['priority'], section['order'])
+        )
+
+        for section in optional:
+            remaining = self.token_budget - used
+            tokens = estimate_tokens(section['text'])
+
+            if tokens <= remaining:
+                kept[section['order']] = section['text']
+                used += tokens
+                report[section['name']] = {'tokens': tokens, 'status': 'included'}
+                continue
+
+            truncated = self._truncate_lines(section['text'], remaining)
+            if truncated:
+                kept[section['order']] = truncated
+                used += estimate_tokens(truncated)
+                report[section['name']] = {'tokens': estimate_tokens(truncated), 'status': 'truncated'}
+            else:
+                report[section['name']] = {'tokens': 0, 'status': 'dropped'}
+
+        self.report = {
+            'token_budget': self.token_budget,
+            'estimated_tokens': used,
+            'sections': report
+        }
+
+        return "\n\n".join(kept[order] for order in sorted(kept))
+
+    def _truncate_lines(self, text: str, max_tokens: int) -> str:
+        """Keep the section heading plus as many leading lines as fit"""
+        lines = text.split("\n")
+        if len(lines) < 2 or max_tokens <= 0:
+            return ""
+
+        marker = "- ... (further entries omitted)"
+        budget = max_tokens - estimate_tokens(marker)
+        kept = [lines[0]]
+        size = estimate_tokens(lines[0])
+
+        for line in lines[1:]:
+            line_tokens = estimate_tokens(line + "\n")
+            if size + line_tokens > budget:
+                break
+            kept.append(line)
+            size += line_tokens
+
+        # A heading on its own is not worth the space
+        if len(kept) == 1:
+            return ""
+
+        kept.append(marker)
+        return "\n".join(kept)
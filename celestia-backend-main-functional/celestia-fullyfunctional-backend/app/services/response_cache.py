@@ -0,0 +1,279 @@
+from collections import OrderedDict
+from threading import Event, Lock
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+
+from fastapi import Response
+
+from app.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Cache name reported in Cache-Status headers (RFC 9211)
+CACHE_NAME = "nutre-vida"
+
+# Expired and overflow spill rows are pruned every this many spilled entries
+SPILL_PRUNE_EVERY = 200
+
+class _Flight:
+    """One upstream computation that identical concurrent requests wait on"""
+
+    def __init__(self):
+        self.done = Event()
+        self.payload: Optional[str] = None
+        self.error: Optional[BaseException] = None
+
+def canonical_key(namespace: str, body: Any) -> str:
+    """Hash of the endpoint and its JSON body with keys sorted and whitespace dropped"""
+    canonical = json.dumps(body, sort_keys=True, separators=(',', ':'), ensure_ascii=False, default=str)
+    return hashlib.sha256(f"{namespace}\n{canonical}".encode('utf-8')).hexdigest()
+
+class ResponseCache:
+    """
+    Response cache for AI endpoints that are pure functions of their JSON
+    body. Entries are keyed by a hash of the canonicalized body, expire after
+    a TTL and live in a size-bounded in-memory LRU; with a spill path set,
+    entries evicted from memory move to a SQLite file and are promoted back
+    on their next hit. Identical requests arriving while the first is still
+    computing wait for its result instead of making their own model call.
+    Values are stored as JSON, so callers always get their own copy.
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl_seconds: int = 3600, spill_path: str = "",
+                 spill_max_entries: int = 20000, flight_timeout_seconds: float = 120):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.spill_path = spill_path
+        self.spill_max_entries = spill_max_entries
+        self.flight_timeout_seconds = flight_timeout_seconds
+
+        self.lock = Lock()
+        # key -> (expires_at, JSON payload), least recently used first
+        self.entries: 'OrderedDict[str, Tuple[float, str]]' = OrderedDict()
+        self.inflight: Dict[str, _Flight] = {}
+
+        self.spill_lock = Lock()
+        self.spill_db: Optional[sqlite3.Connection] = None
+        self.spilled_since_prune = 0
+
+        self.hits = 0
+        self.spill_hits = 0
+        self.misses = 0
+        self.collapsed = 0
+        self.stored = 0
+        self.evicted = 0
+
+    def get_or_compute(self, namespace: str, body: Any, compute: Callable[[], Any],
+                       cacheable: Optional[Callable[[Any], bool]] = None) -> Tuple[Any, str]:
+        """
+        The response for (namespace, body) and its Cache-Status value. On a
+        miss compute() runs once for all concurrent identical requests; its
+        result is stored unless cacheable rejects it (e.g. a fallback answer
+        after a failed model call). Exceptions reach every waiting request
+        and are never cached.
+        """
+        key = canonical_key(namespace, body)
+        now = time.time()
+
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] > now:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return json.loads(entry[1]), self._status('hit', ttl=entry[0] - now)
+            if entry:
+                del self.entries[key]
+
+            flight = self.inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = _Flight()
+                self.inflight[key] = flight
+
+        if not leader:
+            return self._follow(flight, compute)
+
+        try:
+            spilled = self._spill_get(key, now)
+            if spilled is not None:
+                expires_at, payload = spilled
+                self._store(key, expires_at, payload)
+                with self.lock:
+                    self.spill_hits += 1
+                flight.payload = payload
+                return json.loads(payload), self._status('hit', ttl=expires_at - now, detail='spill')
+
+            with self.lock:
+                self.misses += 1
+            value = compute()
+            payload = json.dumps(value, default=str)
+            flight.payload = payload
+
+            if cacheable is not None and not cacheable(value):
+                return json.loads(payload), self._status('fwd=miss')
+
+            self._store(key, time.time() + self.ttl_seconds, payload)
+            with self.lock:
+                self.stored += 1
+            return json.loads(payload), self._status('fwd=miss', 'stored')
+
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            flight.done.set()
+
+    def clear(self):
+        """Drop every cached response, in memory and spilled"""
+        with self.lock:
+            self.entries.clear()
+        with self.spill_lock:
+            db = self._spill_connection()
+            if db is not None:
+                db.execute("DELETE FROM response_cache")
+                db.commit()
+
+    def close(self):
+        with self.spill_lock:
+            if self.spill_db is not None:
+                self.spill_db.close()
+                self.spill_db = None
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.spill_lock:
+            db = self._spill_connection()
+            spilled = db.execute("SELECT COUNT(*) FROM response_cache").fetchone()[0] if db is not None else None
+
+        with self.lock:
+            served = self.hits + self.spill_hits + self.misses + self.collapsed
+            return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'spill_entries': spilled,
+                'in_flight': len(self.inflight),
+                'hits': self.hits,
+                'spill_hits': self.spill_hits,
+                'misses': self.misses,
+                'collapsed': self.collapsed,
+                'stored': self.stored,
+                'evicted': self.evicted,
+                'hit_rate': round((self.hits + self.spill_hits + self.collapsed) / served, 3) if served else None
+            }
+
+    def _follow(self, flight: _Flight, compute: Callable[[], Any]) -> Tuple[Any, str]:
+        """Wait for the identical request already computing; compute alone if it takes too long"""
+        if not flight.done.wait(self.flight_timeout_seconds):
+            logger.warning("Response cache: in-flight request timed out, computing separately")
+            return compute(), self._status('fwd=miss')
+
+        if flight.error is not None:
+            raise flight.error
+        with self.lock:
+            self.collapsed += 1
+        return json.loads(flight.payload), self._status('fwd=miss', 'collapsed')
+
+    def _status(self, *params: str, ttl: Optional[float] = None, detail: Optional[str] = None) -> str:
+        parts = [CACHE_NAME, *params]
+        if ttl is not None:
+            parts.append(f"ttl={int(ttl)}")
+        if detail:
+            parts.append(f"detail={detail}")
+        return '; '.join(parts)
+
+    def _store(self, key: str, expires_at: float, payload: str):
+        evicted: List[Tuple[str, float, str]] = []
+        with self.lock:
+            self.entries[key] = (expires_at, payload)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                old_key, (old_expires_at, old_payload) = self.entries.popitem(last=False)
+                evicted.append((old_key, old_expires_at, old_payload))
+            self.evicted += len(evicted)
+
+        if evicted:
+            self._spill_put(evicted)
+
+    def _spill_connection(self) -> Optional[sqlite3.Connection]:
+        """Lazily opened spill database; callers hold spill_lock"""
+        if not self.spill_path:
+            return None
+        if self.spill_db is None:
+            self.spill_db = sqlite3.connect(self.spill_path, check_same_thread=False)
+            self.spill_db.execute("PRAGMA journal_mode=WAL")
+            self.spill_db.execute("PRAGMA synchronous=NORMAL")
+            self.spill_db.execute(
+                "CREATE TABLE IF NOT EXISTS response_cache ("
+                "key TEXT PRIMARY KEY, expires_at REAL NOT NULL, payload TEXT NOT NULL)"
+            )
+            self.spill_db.execute("CREATE INDEX IF NOT EXISTS idx_response_cache_expires ON response_cache (expires_at)")
+            self.spill_db.commit()
+        return self.spill_db
+
+    def _spill_get(self, key: str, now: float) -> Optional[Tuple[float, str]]:
+        """A live spilled entry, removed from the spill since it moves back into memory"""
+        if not self.spill_path:
+            return None
+        try:
+            with self.spill_lock:
+                db = self._spill_connection()
+                row = db.execute("SELECT expires_at, payload FROM response_cache WHERE key = ?", (key,)).fetchone()
+                if row is None:
+                    return None
+                db.execute("DELETE FROM response_cache WHERE key = ?", (key,))
+                db.commit()
+            return row if row[0] > now else None
+        except sqlite3.Error as e:
+            logger.error(f"Response cache spill read failed: {e}")
+            return None
+
+    def _spill_put(self, rows: List[Tuple[str, float, str]]):
+        if not self.spill_path:
+            return
+        try:
+            with self.spill_lock:
+                db = self._spill_connection()
+                db.executemany("INSERT OR REPLACE INTO response_cache (key, expires_at, payload) VALUES (?, ?, ?)", rows)
+                self.spilled_since_prune += len(rows)
+                if self.spilled_since_prune >= SPILL_PRUNE_EVERY:
+                    self.spilled_since_prune = 0
+                    db.execute("DELETE FROM response_cache WHERE expires_at <= ?", (time.time(),))
+                    # Keep the entries that live longest
+                    db.execute(
+                        "DELETE FROM response_cache WHERE key IN ("
+                        "SELECT key FROM response_cache ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                        (self.spill_max_entries,)
+                    )
+                db.commit()
+        except sqlite3.Error as e:
+            logger.error(f"Response cache spill write failed: {e}")
+
+def cached_response(response: Response, namespace: str, body: Any, compute: Callable[[], Any],
+                    cacheable: Optional[Callable[[Any], bool]] = None) -> Any:
+    """
+    Serve an endpoint's result through the response cache and set its
+    Cache-Status header. Results recovered from a truncated model reply
+    ('partial': True, see structured_output) are never stored.
+    """
+    def storable(value: Any) -> bool:
+        if isinstance(value, dict) and value.get('partial'):
+            return False
+        return cacheable is None or cacheable(value)
+
+    value, cache_status = response_cache.get_or_compute(namespace, body, compute, storable)
+    response.headers["Cache-Status"] = cache_status
+    return value
+
+# Global response cache instance
+response_cache = ResponseCache(
+    max_entries=settings.response_cache_max_entries,
+    ttl_seconds=settings.response_cache_ttl_seconds,
+    spill_path=settings.response_cache_spill_path,
+    spill_max_entries=settings.response_cache_spill_max_entries
+)
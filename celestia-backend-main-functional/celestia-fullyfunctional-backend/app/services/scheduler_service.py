@@ -9,10 +9,21 @@ import logging
 from sqlalchemy.orm import Session
 from sqlalchemy import and_
 
+from app.config import settings
 from app.database import SessionLocal
 from app.models.db_models import User, NotificationLog
+from app.services.conversation_memory_service import ConversationMemoryService
+from app.services.conversation_summarizer import conversation_summarizer
+from app.services.health_monitoring_batch import batch_health_monitor
+from app.services.health_monitoring_service import HealthMonitoringService
+from app.services.meal_write_queue import meal_write_queue
+from app.services.monitoring_pipeline import monitoring_pipeline
+from app.services.notification_batch import batch_notification_generator
+from app.services.notification_dispatcher import notification_dispatcher
 from app.services.notification_service import NotificationService
 from app.services.pdf_report_service import PDFReportService
+from app.services.response_cache import response_cache
+from app.services.speculative_refinement import speculative_refiner
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -56,7 +67,7 @@ class SchedulerService:
     def _schedule_tasks(self):
         """Schedule all recurring tasks"""
         
-        # Meal reminders - every 2 hours during active hours
+        # Meal reminders - every 2 hours during active hours (users without a pending smart reminder)
         schedule.every(2).hours.do(self._check_meal_reminders)
         
         # Daily summaries - at 9 PM every day
@@ -74,6 +85,15 @@ class SchedulerService:
         # Health check - every 30 minutes
         schedule.every(30).minutes.do(self._health_check)
         
+        # Batch health monitoring for every recently active user
+        schedule.every(settings.monitoring_refresh_interval_hours).hours.do(self._refresh_health_monitoring)
+        
+        # Smart notifications for the next days, for every recently active user
+        schedule.every().day.at("00:30").do(self._generate_smart_notifications)
+        
+        # Conversation memory compaction, off the chat write path
+        schedule.every(settings.memory_compaction_interval_hours).hours.do(self._compact_conversation_memory)
+        
         logger.info("Scheduled tasks configured")
     
     def _run_scheduler(self):
@@ -295,6 +315,14 @@ class SchedulerService:
                 db.commit()
                 logger.info(f"Cleaned up {len(expired_otp_users)} expired OTPs")
             
+            # Prune expired health alerts and predictive insights
+            pruned = HealthMonitoringService(db).prune_expired()
+            if not pruned.get('error'):
+                logger.info(
+                    f"Pruned {pruned['alerts_deleted']} expired health alerts and "
+                    f"{pruned['insights_deleted']} expired insights"
+                )
+            
             db.close()
             
             logger.info("Cleanup tasks completed")
@@ -302,6 +330,50 @@ class SchedulerService:
         except Exception as e:
             logger.error(f"Error during cleanup: {e}")
     
+    def _refresh_health_monitoring(self):
+        """Run batch health monitoring for recently active users"""
+        try:
+            result = batch_health_monitor.run()
+            
+            if result.get('skipped'):
+                logger.info(f"Batch health monitoring skipped: {result['reason']}")
+            else:
+                logger.info(
+                    f"Batch health monitoring: {result['users_monitored']} users in {result['elapsed_seconds']}s "
+                    f"({result['users_per_second']} users/sec), {result.get('users_failed', 0)} failed"
+                )
+        except Exception as e:
+            logger.error(f"Error running batch health monitoring: {e}")
+    
+    def _generate_smart_notifications(self):
+        """Schedule the next days of smart notifications in one batch"""
+        try:
+            result = batch_notification_generator.run()
+            logger.info(
+                f"Smart notifications: {result.get('notifications_inserted', 0)} scheduled, "
+                f"{result.get('notifications_skipped', 0)} already scheduled for {result.get('users_processed', 0)} users "
+                f"in {result['elapsed_seconds']}s ({result['users_per_second']} users/sec)"
+            )
+        except Exception as e:
+            logger.error(f"Error generating smart notifications: {e}")
+    
+    def _compact_conversation_memory(self):
+        """Prune expired and oversized conversation memory into session digests"""
+        try:
+            db = SessionLocal()
+            result = ConversationMemoryService(db).compact_memories()
+            db.close()
+            
+            if result.get('error'):
+                logger.error(f"Conversation memory compaction failed: {result['error']}")
+            else:
+                logger.info(
+                    f"Conversation memory compacted: {result['memories_deleted']} deleted, "
+                    f"{result['sessions_digested']} sessions digested, {result['digests_expired']} digests expired"
+                )
+        except Exception as e:
+            logger.error(f"Error compacting conversation memory: {e}")
+    
     def _health_check(self):
         """Perform health check and log system status"""
         try:
@@ -452,10 +524,17 @@ scheduler_service = SchedulerService()
 def start_scheduler():
     """Start the global scheduler service"""
     scheduler_service.start()
+    notification_dispatcher.start()
 
 def stop_scheduler():
     """Stop the global scheduler service"""
     scheduler_service.stop()
+    notification_dispatcher.shutdown()
+    meal_write_queue.shutdown()
+    monitoring_pipeline.shutdown()
+    conversation_summarizer.shutdown()
+    speculative_refiner.shutdown()
+    response_cache.close()
 
 def get_scheduler() -> SchedulerService:
     """Get the global scheduler instance"""
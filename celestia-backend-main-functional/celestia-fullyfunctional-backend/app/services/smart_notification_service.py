@@ -1,15 +1,27 @@
 from datetime import datetime, timedelta, time
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import desc, and_, or_
+from sqlalchemy import desc, and_, or_, insert
 from app.models.agentic_models import SmartNotification, UserBehaviorPattern
 from app.models.db_models import User, Meal
 import json
 import statistics
 
+def notification_dedup_key(notification_type: str, title: str, scheduled_time: datetime) -> str:
+    """
+    Identity of a scheduled notification within a user's, unique per user in
+    the database so the same reminder is never scheduled twice. Every
+    generator schedules at most one notification per title and day, and meal
+    reminder times move as the eating-time pattern updates between runs, so
+    the day is part of the key rather than the minute.
+    """
+    return f"{notification_type}:{scheduled_time.replace(tzinfo=None).date().isoformat()}:{title}"
+
 class SmartNotificationService:
     def __init__(self, db: Session):
         self.db = db
+        # Notifications are staged by the generators and stored by flush_pending_notifications()
+        self.pending_notifications: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
         self.notification_types = {
             'meal_reminder': {
                 'default_message': 'Time for your {meal_type}! Based on your usual pattern.',
@@ -33,7 +45,7 @@ class SmartNotificationService:
             }
         }
     
-    def generate_smart_notifications(self, user_id: int) -> Dict[str, Any]:
+    def generate_smart_notifications(self, user_id: int, days_ahead: int = 3) -> Dict[str, Any]:
         """Generate personalized smart notifications for a user"""
         try:
             user = self.db.query(User).filter(User.id == user_id).first()
@@ -42,29 +54,15 @@ class SmartNotificationService:
             
             # Get user behavior patterns
             patterns = self._get_user_patterns(user_id)
-            recent_meals = self._get_recent_meals(user_id, days=7)
-            
-            notifications_created = []
-            
-            # 1. Generate meal reminder notifications
-            meal_reminders = self._generate_meal_reminders(user_id, patterns, recent_meals)
-            notifications_created.extend(meal_reminders)
-            
-            # 2. Generate hydration reminders
-            hydration_reminders = self._generate_hydration_reminders(user_id, patterns)
-            notifications_created.extend(hydration_reminders)
             
-            # 3. Generate goal check notifications
-            goal_reminders = self._generate_goal_check_reminders(user_id, user.daily_goals)
-            notifications_created.extend(goal_reminders)
+            notifications = self.build_notifications(user_id, user.daily_goals, patterns, days_ahead)
             
-            # 4. Generate health tip notifications
-            health_tips = self._generate_health_tip_notifications(user_id, patterns)
-            notifications_created.extend(health_tips)
+            # One deduplicated bulk insert and commit for everything generated
+            writes = self.flush_pending_notifications()
+            if writes.get('error'):
+                return {'error': writes['error']}
             
-            # 5. Generate meal planning reminders
-            planning_reminders = self._generate_meal_planning_reminders(user_id, patterns)
-            notifications_created.extend(planning_reminders)
+            notifications_created = [n for n in notifications if not n.pop('already_scheduled', False)]
             
             return {
                 'notifications_generated': len(notifications_created),
@@ -76,11 +74,42 @@ class SmartNotificationService:
             print(f"Error generating smart notifications: {e}")
             return {'error': str(e)}
     
+    def build_notifications(
+        self, 
+        user_id: int, 
+        daily_goals: Dict[str, Any], 
+        patterns: Dict[str, Any], 
+        days_ahead: int = 3
+    ) -> List[Dict[str, Any]]:
+        """
+        Build the next days_ahead days of notifications for a user from data
+        that has already been loaded. Nothing is written until
+        flush_pending_notifications() is called.
+        """
+        notifications = []
+        
+        # 1. Generate meal reminder notifications
+        notifications.extend(self._generate_meal_reminders(user_id, patterns, days_ahead))
+        
+        # 2. Generate hydration reminders
+        notifications.extend(self._generate_hydration_reminders(user_id, patterns, days_ahead))
+        
+        # 3. Generate goal check notifications
+        notifications.extend(self._generate_goal_check_reminders(user_id, daily_goals, days_ahead))
+        
+        # 4. Generate health tip notifications
+        notifications.extend(self._generate_health_tip_notifications(user_id, patterns, days_ahead))
+        
+        # 5. Generate meal planning reminders
+        notifications.extend(self._generate_meal_planning_reminders(user_id, patterns, days_ahead))
+        
+        return notifications
+    
     def _generate_meal_reminders(
         self, 
         user_id: int, 
         patterns: Dict[str, Any], 
-        recent_meals: List[Meal]
+        days_ahead: int = 3
     ) -> List[Dict[str, Any]]:
         """Generate personalized meal reminder notifications"""
         notifications = []
@@ -95,8 +124,8 @@ class SmartNotificationService:
                 'avg_dinner_time': 19.0
             }
         
-        # Generate reminders for next 3 days
-        for day_offset in range(1, 4):
+        # Generate reminders for the next days_ahead days
+        for day_offset in range(1, days_ahead + 1):
             target_date = datetime.now() + timedelta(days=day_offset)
             
             # Breakfast reminder
@@ -118,7 +147,7 @@ class SmartNotificationService:
                         user_id=user_id,
                         notification_type='meal_reminder',
                         title='Breakfast Reminder',
-                        message=self._personalize_meal_message('breakfast', patterns, recent_meals),
+                        message=self._personalize_meal_message('breakfast', patterns),
                         scheduled_time=breakfast_datetime,
                         personalization_data={
                             'meal_type': 'breakfast',
@@ -147,7 +176,7 @@ class SmartNotificationService:
                         user_id=user_id,
                         notification_type='meal_reminder',
                         title='Lunch Reminder',
-                        message=self._personalize_meal_message('lunch', patterns, recent_meals),
+                        message=self._personalize_meal_message('lunch', patterns),
                         scheduled_time=lunch_datetime,
                         personalization_data={
                             'meal_type': 'lunch',
@@ -176,7 +205,7 @@ class SmartNotificationService:
                         user_id=user_id,
                         notification_type='meal_reminder',
                         title='Dinner Reminder',
-                        message=self._personalize_meal_message('dinner', patterns, recent_meals),
+                        message=self._personalize_meal_message('dinner', patterns),
                         scheduled_time=dinner_datetime,
                         personalization_data={
                             'meal_type': 'dinner',
@@ -192,58 +221,60 @@ class SmartNotificationService:
     def _generate_hydration_reminders(
         self, 
         user_id: int, 
-        patterns: Dict[str, Any]
+        patterns: Dict[str, Any], 
+        days_ahead: int = 1
     ) -> List[Dict[str, Any]]:
         """Generate hydration reminder notifications"""
         notifications = []
         
-        # Generate hydration reminders for the next day
-        tomorrow = datetime.now() + timedelta(days=1)
-        
-        # Morning hydration reminder
-        morning_time = tomorrow.replace(hour=9, minute=0, second=0, microsecond=0)
-        if morning_time > datetime.now():
-            notification = self._create_notification(
-                user_id=user_id,
-                notification_type='hydration',
-                title='Morning Hydration',
-                message='Start your day right! Have a glass of warm water with lemon to kickstart your metabolism. 🌅💧',
-                scheduled_time=morning_time,
-                is_recurring=True,
-                recurrence_pattern={'type': 'daily', 'time': '09:00'},
-                personalization_data={
-                    'hydration_type': 'morning',
-                    'suggestions': ['Warm water with lemon', 'Herbal tea', 'Plain water']
-                }
-            )
-            if notification:
-                notifications.append(notification)
-        
-        # Afternoon hydration reminder
-        afternoon_time = tomorrow.replace(hour=15, minute=0, second=0, microsecond=0)
-        if afternoon_time > datetime.now():
-            notification = self._create_notification(
-                user_id=user_id,
-                notification_type='hydration',
-                title='Afternoon Hydration Check',
-                message='Feeling tired? You might need water! Stay hydrated to maintain energy levels. 💪💧',
-                scheduled_time=afternoon_time,
-                is_recurring=True,
-                recurrence_pattern={'type': 'daily', 'time': '15:00'},
-                personalization_data={
-                    'hydration_type': 'afternoon',
-                    'suggestions': ['Plain water', 'Buttermilk', 'Coconut water', 'Herbal tea']
-                }
-            )
-            if notification:
-                notifications.append(notification)
+        for day_offset in range(1, days_ahead + 1):
+            target_date = datetime.now() + timedelta(days=day_offset)
+            
+            # Morning hydration reminder
+            morning_time = target_date.replace(hour=9, minute=0, second=0, microsecond=0)
+            if morning_time > datetime.now():
+                notification = self._create_notification(
+                    user_id=user_id,
+                    notification_type='hydration',
+                    title='Morning Hydration',
+                    message='Start your day right! Have a glass of warm water with lemon to kickstart your metabolism. 🌅💧',
+                    scheduled_time=morning_time,
+                    is_recurring=True,
+                    recurrence_pattern={'type': 'daily', 'time': '09:00'},
+                    personalization_data={
+                        'hydration_type': 'morning',
+                        'suggestions': ['Warm water with lemon', 'Herbal tea', 'Plain water']
+                    }
+                )
+                if notification:
+                    notifications.append(notification)
+            
+            # Afternoon hydration reminder
+            afternoon_time = target_date.replace(hour=15, minute=0, second=0, microsecond=0)
+            if afternoon_time > datetime.now():
+                notification = self._create_notification(
+                    user_id=user_id,
+                    notification_type='hydration',
+                    title='Afternoon Hydration Check',
+                    message='Feeling tired? You might need water! Stay hydrated to maintain energy levels. 💪💧',
+                    scheduled_time=afternoon_time,
+                    is_recurring=True,
+                    recurrence_pattern={'type': 'daily', 'time': '15:00'},
+                    personalization_data={
+                        'hydration_type': 'afternoon',
+                        'suggestions': ['Plain water', 'Buttermilk', 'Coconut water', 'Herbal tea']
+                    }
+                )
+                if notification:
+                    notifications.append(notification)
         
         return notifications
     
     def _generate_goal_check_reminders(
         self, 
         user_id: int, 
-        daily_goals: Dict[str, Any]
+        daily_goals: Dict[str, Any], 
+        days_ahead: int = 1
     ) -> List[Dict[str, Any]]:
         """Generate goal check reminder notifications"""
         notifications = []
@@ -251,94 +282,101 @@ class SmartNotificationService:
         if not daily_goals:
             return notifications
         
-        # Evening goal check reminder
-        tomorrow = datetime.now() + timedelta(days=1)
-        evening_time = tomorrow.replace(hour=20, minute=0, second=0, microsecond=0)
-        
-        if evening_time > datetime.now():
-            notification = self._create_notification(
-                user_id=user_id,
-                notification_type='goal_check',
-                title='Daily Goal Check-in',
-                message=f'How did you do today? Check if you met your {daily_goals.get("calories", 2000)} calorie and {daily_goals.get("protein", 60)}g protein goals! 🎯',
-                scheduled_time=evening_time,
-                is_recurring=True,
-                recurrence_pattern={'type': 'daily', 'time': '20:00'},
-                personalization_data={
-                    'goal_calories': daily_goals.get('calories', 2000),
-                    'goal_protein': daily_goals.get('protein', 60),
-                    'check_type': 'daily_summary'
-                }
-            )
-            if notification:
-                notifications.append(notification)
+        for day_offset in range(1, days_ahead + 1):
+            # Evening goal check reminder
+            target_date = datetime.now() + timedelta(days=day_offset)
+            evening_time = target_date.replace(hour=20, minute=0, second=0, microsecond=0)
+            
+            if evening_time > datetime.now():
+                notification = self._create_notification(
+                    user_id=user_id,
+                    notification_type='goal_check',
+                    title='Daily Goal Check-in',
+                    message=f'How did you do today? Check if you met your {daily_goals.get("calories", 2000)} calorie and {daily_goals.get("protein", 60)}g protein goals! 🎯',
+                    scheduled_time=evening_time,
+                    is_recurring=True,
+                    recurrence_pattern={'type': 'daily', 'time': '20:00'},
+                    personalization_data={
+                        'goal_calories': daily_goals.get('calories', 2000),
+                        'goal_protein': daily_goals.get('protein', 60),
+                        'check_type': 'daily_summary'
+                    }
+                )
+                if notification:
+                    notifications.append(notification)
         
         return notifications
     
     def _generate_health_tip_notifications(
         self, 
         user_id: int, 
-        patterns: Dict[str, Any]
+        patterns: Dict[str, Any], 
+        days_ahead: int = 1
     ) -> List[Dict[str, Any]]:
         """Generate personalized health tip notifications"""
         notifications = []
         
         # Generate health tips based on user patterns
         tips = self._get_personalized_health_tips(patterns)
+        if not tips:
+            return notifications
         
-        # Schedule one tip for tomorrow morning
-        tomorrow = datetime.now() + timedelta(days=1)
-        tip_time = tomorrow.replace(hour=10, minute=0, second=0, microsecond=0)
-        
-        if tip_time > datetime.now() and tips:
-            selected_tip = tips[0]  # Use the first (most relevant) tip
-            
-            notification = self._create_notification(
-                user_id=user_id,
-                notification_type='health_tip',
-                title='Daily Health Tip',
-                message=selected_tip['message'],
-                scheduled_time=tip_time,
-                personalization_data={
-                    'tip_category': selected_tip['category'],
-                    'relevance_reason': selected_tip['reason'],
-                    'actionable': True
-                }
-            )
-            if notification:
-                notifications.append(notification)
+        # Schedule one tip each morning, rotating from the most relevant
+        for day_offset in range(1, days_ahead + 1):
+            target_date = datetime.now() + timedelta(days=day_offset)
+            tip_time = target_date.replace(hour=10, minute=0, second=0, microsecond=0)
+            
+            if tip_time > datetime.now():
+                selected_tip = tips[(day_offset - 1) % len(tips)]
+                
+                notification = self._create_notification(
+                    user_id=user_id,
+                    notification_type='health_tip',
+                    title='Daily Health Tip',
+                    message=selected_tip['message'],
+                    scheduled_time=tip_time,
+                    personalization_data={
+                        'tip_category': selected_tip['category'],
+                        'relevance_reason': selected_tip['reason'],
+                        'actionable': True
+                    }
+                )
+                if notification:
+                    notifications.append(notification)
         
         return notifications
     
     def _generate_meal_planning_reminders(
         self, 
         user_id: int, 
-        patterns: Dict[str, Any]
+        patterns: Dict[str, Any], 
+        days_ahead: int = 1
     ) -> List[Dict[str, Any]]:
         """Generate meal planning reminder notifications"""
         notifications = []
         
-        # Evening meal planning reminder for next day
-        today = datetime.now()
-        planning_time = today.replace(hour=21, minute=30, second=0, microsecond=0)
-        
-        # Only create if it's still today and in the future
-        if planning_time > datetime.now() and planning_time.date() == today.date():
-            notification = self._create_notification(
-                user_id=user_id,
-                notification_type='meal_planning',
-                title='Plan Tomorrow\'s Meals',
-                message='Take 5 minutes to plan tomorrow\'s meals! It helps you stay on track with your health goals. 📝🍽️',
-                scheduled_time=planning_time,
-                is_recurring=True,
-                recurrence_pattern={'type': 'daily', 'time': '21:30'},
-                personalization_data={
-                    'planning_type': 'next_day',
-                    'suggestions': self._get_planning_suggestions(patterns)
-                }
-            )
-            if notification:
-                notifications.append(notification)
+        # Evening meal planning reminder for the next day, starting today
+        for day_offset in range(0, days_ahead):
+            target_date = datetime.now() + timedelta(days=day_offset)
+            planning_time = target_date.replace(hour=21, minute=30, second=0, microsecond=0)
+            
+            # Only create if it's in the future
+            if planning_time > datetime.now():
+                notification = self._create_notification(
+                    user_id=user_id,
+                    notification_type='meal_planning',
+                    title='Plan Tomorrow\'s Meals',
+                    message='Take 5 minutes to plan tomorrow\'s meals! It helps you stay on track with your health goals. 📝🍽️',
+                    scheduled_time=planning_time,
+                    is_recurring=True,
+                    recurrence_pattern={'type': 'daily', 'time': '21:30'},
+                    personalization_data={
+                        'planning_type': 'next_day',
+                        'suggestions': self._get_planning_suggestions(patterns)
+                    }
+                )
+                if notification:
+                    notifications.append(notification)
         
         return notifications
     
@@ -381,12 +419,13 @@ class SmartNotificationService:
             if notification:
                 notification.is_sent = True
                 notification.sent_at = datetime.now()
+                if notification.delivery_status in (None, 'claimed', 'retry'):
+                    notification.delivery_status = 'in_app'
                 
-                # If it's recurring, create the next occurrence
-                if notification.is_recurring and notification.recurrence_pattern:
-                    self._create_recurring_notification(notification)
-                
-                self.db.commit()
+                # If it's recurring, schedule the next occurrence (commits both)
+                writes = self.schedule_next_occurrences([notification])
+                if writes.get('error'):
+                    return False
                 return True
             
             return False
@@ -396,31 +435,38 @@ class SmartNotificationService:
             self.db.rollback()
             return False
     
-    def _create_recurring_notification(self, original_notification: SmartNotification):
-        """Create the next occurrence of a recurring notification"""
-        try:
-            recurrence = original_notification.recurrence_pattern
-            if recurrence.get('type') == 'daily':
-                # Schedule for next day
-                next_time = original_notification.scheduled_time + timedelta(days=1)
-                
-                new_notification = SmartNotification(
-                    user_id=original_notification.user_id,
-                    notification_type=original_notification.notification_type,
-                    title=original_notification.title,
-                    message=original_notification.message,
-                    scheduled_time=next_time,
-                    is_recurring=True,
-                    recurrence_pattern=original_notification.recurrence_pattern,
-                    personalization_data=original_notification.personalization_data
-                )
-                
-                self.db.add(new_notification)
-                self.db.commit()
-                
-        except Exception as e:
-            print(f"Error creating recurring notification: {e}")
-            self.db.rollback()
+    def schedule_next_occurrences(self, notifications: List[SmartNotification]) -> Dict[str, int]:
+        """
+        Schedule the next occurrence of every recurring notification with one
+        deduplicated bulk insert and commit. Occurrences that would already be
+        in the past (after a delivery backlog) skip ahead to the next future one.
+        """
+        now = datetime.now()
+        for notification in notifications:
+            recurrence = notification.recurrence_pattern or {}
+            if not notification.is_recurring or recurrence.get('type') != 'daily':
+                continue
+            
+            next_time = notification.scheduled_time + timedelta(days=1)
+            if recurrence.get('time'):
+                # Back at the usual time even if this occurrence was deferred (quiet hours)
+                hour, minute = (int(part) for part in recurrence['time'].split(':')[:2])
+                next_time = next_time.replace(hour=hour, minute=minute, second=0, microsecond=0)
+            while next_time.replace(tzinfo=None) <= now:
+                next_time += timedelta(days=1)
+            
+            self._create_notification(
+                user_id=notification.user_id,
+                notification_type=notification.notification_type,
+                title=notification.title,
+                message=notification.message,
+                scheduled_time=next_time,
+                is_recurring=True,
+                recurrence_pattern=recurrence,
+                personalization_data=notification.personalization_data or {}
+            )
+        
+        return self.flush_pending_notifications()
     
     def cleanup_old_notifications(self, days_old: int = 7):
         """Clean up old sent notifications"""
@@ -447,35 +493,27 @@ class SmartNotificationService:
     # Helper methods
     def _get_user_patterns(self, user_id: int) -> Dict[str, Any]:
         """Get user behavior patterns"""
+        return self.get_patterns_for_users([user_id]).get(user_id, {})
+    
+    def get_patterns_for_users(self, user_ids: List[int]) -> Dict[int, Dict[str, Any]]:
+        """Behavior patterns for many users, one query per chunk of users"""
+        patterns_by_user = {user_id: {} for user_id in user_ids}
         try:
-            patterns = self.db.query(UserBehaviorPattern).filter(
-                UserBehaviorPattern.user_id == user_id
-            ).all()
-            
-            pattern_dict = {}
-            for pattern in patterns:
-                pattern_dict[pattern.pattern_type] = pattern.pattern_data
+            for start in range(0, len(user_ids), 500):
+                patterns = self.db.query(
+                    UserBehaviorPattern.user_id, UserBehaviorPattern.pattern_type, UserBehaviorPattern.pattern_data
+                ).filter(
+                    UserBehaviorPattern.user_id.in_(user_ids[start:start + 500])
+                ).order_by(UserBehaviorPattern.id).all()
+                
+                for user_id, pattern_type, pattern_data in patterns:
+                    patterns_by_user[user_id][pattern_type] = pattern_data
             
-            return pattern_dict
+            return patterns_by_user
             
         except Exception as e:
             print(f"Error getting user patterns: {e}")
-            return {}
-    
-    def _get_recent_meals(self, user_id: int, days: int = 7) -> List[Meal]:
-        """Get recent meals for analysis"""
-        try:
-            cutoff_date = datetime.now() - timedelta(days=days)
-            return self.db.query(Meal).filter(
-                and_(
-                    Meal.user_id == user_id,
-                    Meal.upload_time >= cutoff_date
-                )
-            ).order_by(desc(Meal.upload_time)).all()
-            
-        except Exception as e:
-            print(f"Error getting recent meals: {e}")
-            return []
+            return patterns_by_user
     
     def _calculate_optimal_reminder_time(self, usual_meal_time: float, meal_type: str) -> float:
         """Calculate optimal reminder time based on meal type and usual eating time"""
@@ -495,12 +533,7 @@ class SmartNotificationService:
         
         return reminder_time
     
-    def _personalize_meal_message(
-        self, 
-        meal_type: str, 
-        patterns: Dict[str, Any], 
-        recent_meals: List[Meal]
-    ) -> str:
+    def _personalize_meal_message(self, meal_type: str, patterns: Dict[str, Any]) -> str:
         """Create personalized meal reminder message"""
         base_messages = {
             'breakfast': [
@@ -647,35 +680,114 @@ class SmartNotificationService:
         return suggestions[:3]
     
     def _create_notification(self, **kwargs) -> Optional[Dict[str, Any]]:
-        """Create and store a smart notification"""
+        """Stage a smart notification; flush_pending_notifications() stores it unless it is already scheduled"""
+        row = {
+            'user_id': kwargs['user_id'],
+            'notification_type': kwargs['notification_type'],
+            'title': kwargs['title'],
+            'message': kwargs['message'],
+            'scheduled_time': kwargs['scheduled_time'],
+            'is_recurring': kwargs.get('is_recurring', False),
+            'recurrence_pattern': kwargs.get('recurrence_pattern', {}),
+            'personalization_data': kwargs.get('personalization_data', {}),
+            'dedup_key': notification_dedup_key(kwargs['notification_type'], kwargs['title'], kwargs['scheduled_time'])
+        }
+        notification = {
+            'id': None,
+            'notification_type': row['notification_type'],
+            'title': row['title'],
+            'message': row['message'],
+            'scheduled_time': row['scheduled_time'].isoformat(),
+            'is_recurring': row['is_recurring'],
+            'personalization_data': row['personalization_data'],
+            'created_at': datetime.now().isoformat()
+        }
+        self.pending_notifications.append((row, notification))
+        return notification
+    
+    def flush_pending_notifications(self) -> Dict[str, int]:
+        """
+        Store staged notifications for every user with one bulk insert and a
+        single commit. A notification is skipped when the same reminder (user,
+        type, title and day) is already scheduled; its dict gets the id of
+        the existing row and is flagged already_scheduled. The insert is
+        ON CONFLICT DO NOTHING on the unique (user_id, dedup_key), so a
+        concurrent run (another worker, or /notifications/batch overlapping
+        the scheduler) can't schedule a duplicate either.
+        """
+        pending = self.pending_notifications
+        self.pending_notifications = []
+        if not pending:
+            return {'notifications_inserted': 0, 'notifications_skipped': 0}
+        
         try:
-            notification = SmartNotification(
-                user_id=kwargs['user_id'],
-                notification_type=kwargs['notification_type'],
-                title=kwargs['title'],
-                message=kwargs['message'],
-                scheduled_time=kwargs['scheduled_time'],
-                is_recurring=kwargs.get('is_recurring', False),
-                recurrence_pattern=kwargs.get('recurrence_pattern', {}),
-                personalization_data=kwargs.get('personalization_data', {})
-            )
+            keyed = [((row['user_id'], row['dedup_key']), row, notification) for row, notification in pending]
+            existing = self._load_scheduled_ids([key for key, _, _ in keyed])
+            
+            inserts = {}
+            for key, row, notification in keyed:
+                if key in existing or key in inserts:
+                    notification['already_scheduled'] = key in existing
+                    continue
+                inserts[key] = row
             
-            self.db.add(notification)
+            inserted = self._insert_new(list(inserts.values())) if inserts else set()
             self.db.commit()
-            self.db.refresh(notification)
             
-            return {
-                'id': notification.id,
-                'notification_type': notification.notification_type,
-                'title': notification.title,
-                'message': notification.message,
-                'scheduled_time': notification.scheduled_time.isoformat(),
-                'is_recurring': notification.is_recurring,
-                'personalization_data': notification.personalization_data,
-                'created_at': notification.created_at.isoformat()
-            }
+            # Hand the stored row ids back to the notification dicts
+            ids = self._load_scheduled_ids(list(inserts)) if inserts else {}
+            for key, row, notification in keyed:
+                notification['id'] = existing.get(key, ids.get(key))
+                if key in inserts and key not in inserted:
+                    # Scheduled by a concurrent run since the lookup above
+                    notification['already_scheduled'] = True
+            
+            return {'notifications_inserted': len(inserted), 'notifications_skipped': len(pending) - len(inserted)}
             
         except Exception as e:
-            print(f"Error creating notification: {e}")
+            print(f"Error storing notifications: {e}")
             self.db.rollback()
-            return None
+            return {'error': str(e)}
+    
+    def _insert_new(self, rows: List[Dict[str, Any]]) -> set:
+        """INSERT ... ON CONFLICT (user_id, dedup_key) DO NOTHING; returns the (user_id, dedup_key) inserted"""
+        dialect = self.db.get_bind().dialect.name
+        if dialect == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert as dialect_insert
+        elif dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert as dialect_insert
+        else:
+            # No ON CONFLICT; the unique constraint rejects a concurrent duplicate and the flush rolls back
+            self.db.execute(insert(SmartNotification), rows)
+            return {(row['user_id'], row['dedup_key']) for row in rows}
+        
+        inserted = set()
+        for start in range(0, len(rows), 500):
+            statement = dialect_insert(SmartNotification).values(rows[start:start + 500]).on_conflict_do_nothing(
+                index_elements=['user_id', 'dedup_key']
+            ).returning(SmartNotification.user_id, SmartNotification.dedup_key)
+            inserted.update(tuple(row) for row in self.db.execute(statement))
+        return inserted
+    
+    def _load_scheduled_ids(self, keys: List[Tuple]) -> Dict[Tuple, int]:
+        """Map (user_id, dedup_key) keys to the ids of rows already scheduled for them"""
+        if not keys:
+            return {}
+        
+        wanted = set(keys)
+        user_ids = sorted({user_id for user_id, _ in wanted})
+        dedup_keys = list({dedup_key for _, dedup_key in wanted})
+        
+        found = {}
+        for start in range(0, len(user_ids), 500):
+            rows = self.db.query(
+                SmartNotification.id, SmartNotification.user_id, SmartNotification.dedup_key
+            ).filter(
+                SmartNotification.user_id.in_(user_ids[start:start + 500]),
+                SmartNotification.dedup_key.in_(dedup_keys)
+            ).all()
+            
+            for row_id, user_id, dedup_key in rows:
+                if (user_id, dedup_key) in wanted:
+                    found[(user_id, dedup_key)] = row_id
+        return found
@@ -0,0 +1,239 @@
+from collections import Counter, OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+import re
+
+from app.config import settings
+from app.services.analysis_service import refine_analysis_with_answers
+
+logger = logging.getLogger(__name__)
+
+PORTION_WORDS = ('portion', 'quantity', 'how much', 'how many', 'size', 'serving', 'amount', 'gram', 'cup', 'piece', 'bowl', 'plate')
+YES_NO_PREFIXES = ('is ', 'are ', 'was ', 'were ', 'did ', 'do ', 'does ', 'has ', 'have ', 'can ', 'could ', 'should ', 'will ')
+
+# Cap on distinct (question type, food) keys whose answers are counted; least recently answered dropped
+MAX_LEARNED_QUESTIONS = 5000
+# Distinct answers counted per key; the least common are dropped past this
+MAX_ANSWERS_PER_QUESTION = 20
+# An answer is only suggested once this many sessions have given it (so no one user's wording is shown to others)
+MIN_SUGGESTION_SESSIONS = 3
+
+DEFAULT_PORTION_ANSWER = "medium serving"
+DEFAULT_YES_NO_ANSWER = "yes"
+DEFAULT_ANSWER = "not sure, keep the estimate"
+
+# Answers that mean the same thing once normalized
+ANSWER_SYNONYMS = {
+    'y': 'yes', 'yeah': 'yes', 'yep': 'yes', 'yes it is': 'yes', 'correct': 'yes',
+    'n': 'no', 'nope': 'no', 'no it is not': 'no',
+    'medium': 'medium serving', 'medium portion': 'medium serving', 'regular': 'medium serving',
+    'normal': 'medium serving', 'average': 'medium serving', 'standard': 'medium serving',
+    'regular portion': 'medium serving', 'normal portion': 'medium serving',
+    'not sure': 'not sure keep the estimate', 'dont know': 'not sure keep the estimate',
+    'don t know': 'not sure keep the estimate', 'idk': 'not sure keep the estimate',
+    'unsure': 'not sure keep the estimate'
+}
+
+def normalize_text(text: str) -> str:
+    return ' '.join(re.findall(r"[a-z0-9]+", (text or '').lower()))
+
+def normalize_answer(answer: str) -> str:
+    normalized = normalize_text(answer)
+    return ANSWER_SYNONYMS.get(normalized, normalized)
+
+def question_type(question: str) -> str:
+    text = question.lower().strip()
+    if any(word in text for word in PORTION_WORDS):
+        return 'portion'
+    if text.startswith(YES_NO_PREFIXES):
+        return 'yes_no'
+    return 'other'
+
+def default_answer(question: str) -> str:
+    """The answer that keeps the model's own estimate for a clarifying question"""
+    return {'portion': DEFAULT_PORTION_ANSWER, 'yes_no': DEFAULT_YES_NO_ANSWER}.get(question_type(question), DEFAULT_ANSWER)
+
+def question_key(question: str, analysis_data: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    What answers are learned under: the question's type and the analyzed food
+    it mentions (the longest matching item name), so differently worded
+    questions about the same thing share their answers.
+    """
+    text = f" {normalize_text(question)} "
+    names = [normalize_text(item.get('name')) for item in (analysis_data or {}).get('items', []) if isinstance(item, dict)]
+    mentioned = [name for name in names if name and f" {name} " in text]
+    return question_type(question), max(mentioned, key=len) if mentioned else ''
+
+class SpeculativeRefiner:
+    """
+    Precomputes likely refinements while the user is answering clarifying
+    questions. When questions are issued, the most likely answer sets (the
+    most common answer to that kind of question about that food, then the
+    default that keeps the estimate) are refined in the background. /refine
+    answers that normalize to one of them are served from the speculative
+    result instead of a new model round trip. Learned answers are suggested
+    in normalized form and only once several sessions have given them.
+    """
+
+    def __init__(self, max_speculations: int = 2, max_workers: int = 2, max_sessions: int = 500):
+        self.max_speculations = max_speculations
+        self.max_workers = max_workers
+        self.max_sessions = max_sessions
+        self.executor = None
+        self.lock = Lock()
+        # session_id -> {'analysis_data', 'questions', 'speculations': {answers key: Future}}
+        self.sessions: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        # (question type, food) -> sessions that gave each normalized answer, least recently answered first
+        self.answers: 'OrderedDict[Tuple[str, str], Counter]' = OrderedDict()
+        # Sessions whose answers were already counted
+        self.recorded_sessions: 'OrderedDict[str, None]' = OrderedDict()
+
+        self.speculations_started = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(
+                max_workers=self.max_workers,
+                thread_name_prefix="speculative-refine"
+            )
+        return self.executor
+
+    def suggest_answers(self, analysis_data: Dict[str, Any], questions: List[str]) -> List[List[str]]:
+        """Likely answers per question, most likely first"""
+        suggestions = []
+        with self.lock:
+            for question in questions:
+                learned = self.answers.get(question_key(question, analysis_data), Counter())
+                candidates = [
+                    answer for answer, sessions in learned.most_common(2) if sessions >= MIN_SUGGESTION_SESSIONS
+                ]
+                candidates.append(default_answer(question))
+
+                unique, seen = [], set()
+                for candidate in candidates:
+                    if normalize_answer(candidate) not in seen:
+                        seen.add(normalize_answer(candidate))
+                        unique.append(candidate)
+                suggestions.append(unique)
+        return suggestions
+
+    def speculate(self, session_id: str, analysis_data: Dict[str, Any], questions: List[str]) -> List[List[str]]:
+        """Start refining the likeliest answer sets; returns the per-question suggestions"""
+        suggestions = self.suggest_answers(analysis_data, questions)
+        if self.max_speculations <= 0 or not questions:
+            return suggestions
+
+        # The i-th answer set takes each question's i-th suggestion (or its last one)
+        answer_sets = []
+        for rank in range(self.max_speculations):
+            answers = [options[min(rank, len(options) - 1)] for options in suggestions]
+            if answers not in answer_sets:
+                answer_sets.append(answers)
+
+        speculations = {}
+        try:
+            for answers in answer_sets:
+                speculations[self._answers_key(answers)] = self._get_executor().submit(
+                    refine_analysis_with_answers, analysis_data, questions, answers
+                )
+        except RuntimeError as e:
+            # Executor already shut down
+            logger.warning(f"Speculative refinement unavailable for session {session_id}: {e}")
+
+        with self.lock:
+            self.sessions[session_id] = {
+                'analysis_data': analysis_data,
+                'questions': list(questions),
+                'speculations': speculations
+            }
+            self.sessions.move_to_end(session_id)
+            while len(self.sessions) > self.max_sessions:
+                _, evicted = self.sessions.popitem(last=False)
+                for future in evicted['speculations'].values():
+                    future.cancel()
+            self.speculations_started += len(speculations)
+
+        return suggestions
+
+    def refine(self, session_id: str, analysis_data: Dict[str, Any], questions: List[str],
+               answers: List[str]) -> Tuple[Optional[Dict[str, Any]], bool]:
+        """Refined analysis for the user's answers, and whether it came from a speculation"""
+        self._record_answers(session_id, analysis_data, questions, answers)
+
+        with self.lock:
+            entry = self.sessions.pop(session_id, None)
+
+        future: Optional[Future] = None
+        if entry and entry['analysis_data'] is analysis_data and entry['questions'] == list(questions):
+            future = entry['speculations'].pop(self._answers_key(answers), None)
+            for other in entry['speculations'].values():
+                other.cancel()
+
+        if future is not None and not future.cancelled():
+            try:
+                # Already running since the questions were issued, so at worst a shorter wait
+                result = future.result(timeout=settings.speculative_refinement_wait_seconds)
+                with self.lock:
+                    self.hits += 1
+                return result, True
+            except Exception as e:
+                logger.warning(f"Speculative refinement for session {session_id} unusable: {e}")
+
+        with self.lock:
+            self.misses += 1
+        return refine_analysis_with_answers(analysis_data, questions, answers), False
+
+    def get_status(self) -> Dict[str, Any]:
+        with self.lock:
+            served = self.hits + self.misses
+            return {
+                'max_speculations': self.max_speculations,
+                'sessions_pending': len(self.sessions),
+                'speculations_started': self.speculations_started,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / served, 3) if served else None,
+                'questions_learned': len(self.answers)
+            }
+
+    def shutdown(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+
+    def _answers_key(self, answers: List[str]) -> Tuple[str, ...]:
+        return tuple(normalize_answer(answer) for answer in answers)
+
+    def _record_answers(self, session_id: str, analysis_data: Dict[str, Any], questions: List[str], answers: List[str]):
+        with self.lock:
+            if session_id in self.recorded_sessions:
+                return
+            self.recorded_sessions[session_id] = None
+            while len(self.recorded_sessions) > self.max_sessions:
+                self.recorded_sessions.popitem(last=False)
+
+            for question, answer in zip(questions, answers):
+                normalized = normalize_answer(answer)
+                if not normalized:
+                    continue
+                key = question_key(question, analysis_data)
+                learned = self.answers.get(key)
+                if learned is None:
+                    learned = self.answers[key] = Counter()
+                    while len(self.answers) > MAX_LEARNED_QUESTIONS:
+                        self.answers.popitem(last=False)
+                self.answers.move_to_end(key)
+
+                learned[normalized] += 1
+                if len(learned) > MAX_ANSWERS_PER_QUESTION:
+                    # The answer just given is kept even if it is the rarest
+                    kept = dict(learned.most_common(MAX_ANSWERS_PER_QUESTION - 1))
+                    kept[normalized] = learned[normalized]
+                    self.answers[key] = Counter(kept)
+
+# Global speculative refiner instance
+speculative_refiner = SpeculativeRefiner(max_speculations=settings.speculative_refinements)
@@ -0,0 +1,200 @@
+from collections import deque
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple, Type
+import json
+import re
+
+from pydantic import BaseModel, ValidationError
+
+_DECODER = json.JSONDecoder()
+
+# Strings (closed, or cut off at the end of the text) and structural characters.
+# Everything between tokens (numbers, literals, colons, whitespace) is skipped.
+_TOKENS = re.compile(
+    r'(?P<string>"(?:[^"\\]|\\.)*")|(?P<open_string>"(?:[^"\\]|\\.)*\\?$)|(?P<punct>[{}\[\],])',
+    re.DOTALL
+)
+
+# How many element boundaries to try when recovering a truncated object
+MAX_RECOVERY_ATTEMPTS = 12
+# How many candidate start positions to try past leading prose with stray braces
+MAX_START_ATTEMPTS = 5
+
+class _ParseStats:
+    def __init__(self):
+        self.lock = Lock()
+        self.counts = {'parsed': 0, 'repaired': 0, 'recovered_partial': 0, 'invalid': 0, 'failed': 0}
+
+    def add(self, outcome: str):
+        with self.lock:
+            self.counts[outcome] += 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self.lock:
+            return dict(self.counts)
+
+parse_stats = _ParseStats()
+
+def _closers(stack: Tuple[str, ...]) -> str:
+    return ''.join('}' if opener == '{' else ']' for opener in reversed(stack))
+
+def _without(text: str, start: int, end: int, positions: List[int]) -> str:
+    """text[start:end] with the characters at positions (trailing commas) removed"""
+    if not positions:
+        return text[start:end]
+    pieces, previous = [], start
+    for position in positions:
+        pieces.append(text[previous:position])
+        previous = position + 1
+    pieces.append(text[previous:end])
+    return ''.join(pieces)
+
+def _scan(text: str, start: int) -> Dict[str, Any]:
+    """
+    One string-aware pass over the object starting at text[start]. Finds where
+    it closes, commas directly followed by a closer (trailing commas), and, in
+    case the text ends first, the open containers at the last few commas that
+    aren't inside an unfinished array element (an object in a list).
+    """
+    stack: List[str] = []
+    trailing_commas: List[int] = []
+    boundaries: deque = deque(maxlen=MAX_RECOVERY_ATTEMPTS)
+    last_comma = None
+    open_arrays = 0
+    open_elements = 0
+
+    for match in _TOKENS.finditer(text, start):
+        if match.lastgroup == 'open_string':
+            return {'end': None, 'stack': tuple(stack), 'open_string': match.start(), 'open_element': open_elements > 0,
+                    'trailing_commas': trailing_commas, 'boundaries': boundaries}
+        if match.lastgroup == 'string':
+            last_comma = None
+            continue
+
+        char = match.group()
+        if char in '{[':
+            stack.append(char)
+            if char == '[':
+                open_arrays += 1
+            elif open_arrays:
+                open_elements += 1
+            last_comma = None
+        elif char in '}]':
+            if not stack or (stack[-1] == '{') != (char == '}'):
+                return {'end': None, 'stack': None}
+            if last_comma is not None and not text[last_comma + 1:match.start()].strip():
+                trailing_commas.append(last_comma)
+            stack.pop()
+            if char == ']':
+                open_arrays -= 1
+            elif open_arrays:
+                open_elements -= 1
+            last_comma = None
+            if not stack:
+                return {'end': match.end(), 'trailing_commas': trailing_commas}
+        else:
+            last_comma = match.start()
+            # Cutting here would keep part of an element whose object never closed
+            if not open_elements:
+                boundaries.append((match.start(), tuple(stack), len(trailing_commas)))
+
+    return {'end': None, 'stack': tuple(stack), 'open_string': None, 'open_element': open_elements > 0,
+            'trailing_commas': trailing_commas, 'boundaries': boundaries}
+
+def _loads(candidate: str) -> Optional[Any]:
+    try:
+        return json.loads(candidate)
+    except ValueError:
+        return None
+
+def _recover_truncated(text: str, start: int, scan: Dict[str, Any]) -> Optional[Any]:
+    """Close a cut-off object, dropping the incomplete trailing element if needed"""
+    trailing = scan['trailing_commas']
+
+    # Everything up to the cut with the open containers closed, unless the
+    # cut fell inside a value (a string or number may be incomplete) or
+    # inside an object in a list
+    body = _without(text, start, len(text), trailing).rstrip()
+    if (scan['open_string'] is None and not scan['open_element']
+            and body.endswith(('}', ']', '"', '{', '[', ','))):
+        value = _loads(body.rstrip(',') + _closers(scan['stack']))
+        if value is not None:
+            return value
+
+    # Otherwise cut back to the last element boundaries that still parse
+    for position, stack, trailing_before in reversed(scan['boundaries']):
+        value = _loads(_without(text, start, position, trailing[:trailing_before]) + _closers(stack))
+        if value is not None:
+            return value
+    return None
+
+def extract_json_object(text: str, partial: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    The first JSON object in an LLM response, wherever it is: inside code
+    fences, after prose, followed by more text. Well-formed objects are
+    decoded directly; otherwise one string-aware pass locates the object,
+    drops trailing commas and, when partial is set, recovers a truncated
+    object up to its last complete element. Recovered objects are marked
+    with 'partial': True since fields or list elements may be missing, so
+    only callers that check the flag should set partial.
+    """
+    if not text:
+        parse_stats.add('failed')
+        return None
+
+    start = text.find('{')
+    for _ in range(MAX_START_ATTEMPTS):
+        if start == -1:
+            break
+
+        try:
+            value, _ = _DECODER.raw_decode(text, start)
+            parse_stats.add('parsed')
+            return value
+        except ValueError:
+            pass
+
+        scan = _scan(text, start)
+        if scan['end'] is not None:
+            # A complete but malformed object, e.g. with trailing commas
+            value = _loads(_without(text, start, scan['end'], scan['trailing_commas']))
+            if isinstance(value, dict):
+                parse_stats.add('repaired')
+                return value
+            start = text.find('{', scan['end'])
+            continue
+
+        if scan['stack'] is not None and partial:
+            value = _recover_truncated(text, start, scan)
+            if isinstance(value, dict):
+                parse_stats.add('recovered_partial')
+                value['partial'] = True
+                return value
+        break
+
+    parse_stats.add('failed')
+    return None
+
+def parse_structured_output(
+    text: str,
+    schema: Optional[Type[BaseModel]] = None,
+    partial: bool = False
+) -> Optional[Dict[str, Any]]:
+    """
+    Extract the JSON object from an LLM response and, given a schema,
+    validate it (coercing types and filling defaults). Returns None when no
+    object can be recovered or it doesn't match the schema.
+    """
+    data = extract_json_object(text, partial)
+    if data is None or schema is None:
+        return data
+
+    try:
+        return schema.model_validate(data).model_dump()
+    except ValidationError as e:
+        print(f"Structured output validation error ({schema.__name__}): {e.error_count()} errors")
+        parse_stats.add('invalid')
+        return None
+
+def get_parse_stats() -> Dict[str, int]:
+    return parse_stats.snapshot()
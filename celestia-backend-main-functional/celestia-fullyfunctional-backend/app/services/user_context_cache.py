@@ -0,0 +1,105 @@
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from threading import Lock
+from typing import Dict, Any, Callable, Set, Tuple
+import copy
+
+from app.config import settings
+
+class UserContextCache:
+    """
+    Shared per-user cache for the context both agent services build on every
+    chat turn (profile, goals, meal history, dashboard aggregates).
+    Entries are invalidated when a meal is logged or goals/profile change,
+    expire after a TTL, and never outlive the day they were built on.
+    Entries are kept for the max_users most recently active users.
+    A build that overlaps an invalidation of its user is returned but not
+    stored, so the next turn rebuilds from the new data.
+    """
+
+    def __init__(self, ttl_seconds: int = 600, max_users: int = 1000):
+        self.ttl = timedelta(seconds=ttl_seconds)
+        self.max_users = max_users
+        self.lock = Lock()
+        # user_id -> {kind: (built_at, built_on, value)}, least recently used first
+        self.entries: 'OrderedDict[int, Dict[str, Tuple[datetime, date, Any]]]' = OrderedDict()
+        # user_id -> tokens of builds in progress; invalidate() drops them so they aren't stored
+        self.builds: Dict[int, Set[object]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_build(self, user_id: int, kind: str, builder: Callable[[], Any]) -> Any:
+        """Return the cached value for (user_id, kind), building it on a miss"""
+        now = datetime.now()
+
+        with self.lock:
+            kinds = self.entries.get(user_id)
+            entry = kinds.get(kind) if kinds else None
+            if entry and now - entry[0] < self.ttl and entry[1] == now.date():
+                self.entries.move_to_end(user_id)
+                self.hits += 1
+                return copy.deepcopy(entry[2])
+            if entry:
+                # Expired
+                del kinds[kind]
+                if not kinds:
+                    del self.entries[user_id]
+            self.misses += 1
+            token = object()
+            self.builds.setdefault(user_id, set()).add(token)
+
+        try:
+            value = builder()
+        except Exception:
+            with self.lock:
+                self._end_build(user_id, token)
+            raise
+
+        with self.lock:
+            # Don't cache empty, failed or already invalidated builds so the next turn rebuilds
+            current = self._end_build(user_id, token)
+            if current and value and not (isinstance(value, dict) and value.get('error')):
+                self.entries.setdefault(user_id, {})[kind] = (now, now.date(), value)
+                self.entries.move_to_end(user_id)
+                while len(self.entries) > self.max_users:
+                    self.entries.popitem(last=False)
+
+        return copy.deepcopy(value)
+
+    def _end_build(self, user_id: int, token: object) -> bool:
+        """Forget a finished build; True unless the user was invalidated while it ran. Caller holds the lock."""
+        builds = self.builds.get(user_id)
+        if builds is None or token not in builds:
+            return False
+        builds.discard(token)
+        if not builds:
+            del self.builds[user_id]
+        return True
+
+    def invalidate(self, user_id: int):
+        """Drop every cached context entry for a user"""
+        with self.lock:
+            self.builds.pop(user_id, None)
+            self.entries.pop(user_id, None)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'users': len(self.entries),
+                'max_users': self.max_users,
+                'entries': sum(len(kinds) for kinds in self.entries.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / total, 3) if total else 0.0
+            }
+
+# Global user context cache instance
+user_context_cache = UserContextCache(
+    ttl_seconds=settings.user_context_cache_ttl_seconds,
+    max_users=settings.user_context_cache_max_users
+)
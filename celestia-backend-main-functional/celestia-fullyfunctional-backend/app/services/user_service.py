@@ -1,6 +1,9 @@
 from sqlalchemy.orm import Session
 from app.models.db_models import User, Meal
 from app.models.pydantic_models import UserCreate
+from app.services.food_index import food_search_index
+from app.services.behavior_patterns import behavior_pattern_tracker
+from app.services.user_context_cache import user_context_cache
 from typing import List, Dict, Any
 from datetime import datetime
 import hashlib
@@ -35,6 +38,34 @@ def get_user(db: Session, user_id: int):
     """Get user by ID"""
     return db.query(User).filter(User.id == user_id).first()
 
+def after_daily_summaries_updated(user_id: int):
+    """Refresh what is built from a user's DailySummary rows once they include the latest meals"""
+    # Agent context (dashboard aggregates) built from the old summaries is stale
+    user_context_cache.invalidate(user_id)
+    
+    # Re-run proactive health monitoring in the background
+    try:
+        from app.services.monitoring_pipeline import monitoring_pipeline
+        monitoring_pipeline.request_refresh(user_id, reason="meal_logged")
+    except Exception as monitoring_error:
+        print(f"Failed to queue health monitoring: {monitoring_error}")
+
+def after_meals_logged(db: Session, user_id: int, meals: List[Meal], summaries_updated: bool = True):
+    """
+    Keep caches, indexes and pattern statistics current after meals are
+    committed. Callers that update the daily summary later pass
+    summaries_updated=False and call after_daily_summaries_updated() then.
+    """
+    # Agent context built before these meals is now stale
+    user_context_cache.invalidate(user_id)
+    for meal in meals:
+        food_search_index.add_meal(user_id, meal)
+    # O(1) per meal update of the user's behavior pattern statistics
+    behavior_pattern_tracker.record_meals(db, user_id, meals)
+    
+    if summaries_updated:
+        after_daily_summaries_updated(user_id)
+
 def log_meal(db: Session, user_id: int, analysis_data: Dict, portion_estimates: Dict, nutrition_summary: Dict, recommendations: Dict):
     """Log a meal for a user with automatic calendar sync and notification tracking"""
     try:
@@ -69,12 +100,63 @@ def log_meal(db: Session, user_id: int, analysis_data: Dict, portion_estimates:
             print(f"Failed to update daily summary: {dashboard_error}")
             # Don't fail the meal logging if dashboard update fails
         
+        after_meals_logged(db, user_id, [meal])
+        
         return meal
     except Exception as e:
         db.rollback()
         print(f"Failed to log meal: {e}")
         raise e
 
+def log_meals_bulk(db: Session, user_id: int, entries: List[Dict[str, Dict]]) -> List[Meal]:
+    """
+    Log several meals for a user in one transaction. Each entry carries the
+    analysis_data, portion_estimates, nutrition_summary and recommendations
+    of one meal. The daily summary, caches and behavior patterns are updated
+    once for the whole batch.
+    """
+    if not entries:
+        return []
+    try:
+        now = datetime.now()
+        
+        meals = [
+            Meal(
+                user_id=user_id,
+                analysis_data=entry.get('analysis_data') or {},
+                portion_estimates=entry.get('portion_estimates') or {},
+                nutrition_summary=entry.get('nutrition_summary') or {},
+                recommendations=entry.get('recommendations') or {},
+                upload_date=now.date(),
+                upload_time=now,
+                day_of_week=now.strftime("%A")
+            )
+            for entry in entries
+        ]
+        db.add_all(meals)
+        
+        user = db.query(User).filter(User.id == user_id).first()
+        if user:
+            user.last_meal_time = now
+        
+        db.commit()
+        
+        # One daily summary update for the whole batch
+        try:
+            from app.services.dashboard_service import DashboardService
+            dashboard_service = DashboardService(db)
+            dashboard_service.create_or_update_daily_summary(user_id, now.date())
+        except Exception as dashboard_error:
+            print(f"Failed to update daily summary: {dashboard_error}")
+        
+        after_meals_logged(db, user_id, meals)
+        
+        return meals
+    except Exception as e:
+        db.rollback()
+        print(f"Failed to log meals: {e}")
+        raise e
+
 def get_meal_history(db: Session, user_id: int) -> List[Meal]:
     """Get meal history for a user"""
     try:
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the declarative health rules.
+Builds a synthetic 14-day summary frame, scales the shipped rule set up to
+a few hundred rules with varied thresholds and times compiling, computing
+the summary frame and evaluating every alert rule in one pass.
+
+Usage: python bench_health_rules.py [users] [rule_copies]
+"""
+import copy
+import json
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date, timedelta
+
+import numpy as np
+import pandas as pd
+
+from app.services.health_metrics import compute_summary_frame
+from app.services.health_rules import HealthRuleSet, HealthRuleEngine, DEFAULT_RULES_PATH
+
+def build_frame(users: int, days: int = 14) -> pd.DataFrame:
+    rng = np.random.default_rng(7)
+    size = users * days
+    return pd.DataFrame({
+        'user_id': np.repeat(np.arange(1, users + 1), days),
+        'date': np.tile([date.today() - timedelta(days=offset) for offset in range(days)], users),
+        'calories': rng.uniform(900, 3200, size).round(1),
+        'protein': rng.uniform(20, 120, size).round(1),
+        'carbs': rng.uniform(100, 450, size).round(1),
+        'fat': rng.uniform(20, 120, size).round(1),
+        'fiber': rng.uniform(5, 40, size).round(1)
+    })
+
+def scale_rules(spec: dict, copies: int) -> dict:
+    """Copies of every alert rule with shifted thresholds, so copies don't all fire together"""
+    scaled = copy.deepcopy(spec)
+    for index in range(1, copies):
+        for rule in spec['alerts']:
+            clone = copy.deepcopy(rule)
+            clone['id'] = f"{rule['id']}_{index}"
+            clone['when'] = f"({rule['when']}) and avg_calories > {1500 + index * 40}"
+            scaled['alerts'].append(clone)
+    return scaled
+
+def bench_health_rules(users: int = 10000, copies: int = 40):
+    with open(DEFAULT_RULES_PATH, encoding='utf-8') as rules_file:
+        spec = scale_rules(json.load(rules_file), copies)
+
+    started = time.perf_counter()
+    ruleset = HealthRuleSet(spec)
+    compile_ms = (time.perf_counter() - started) * 1000
+    print(f"✓ Compiled {len(ruleset.alerts)} alert rules and {len(ruleset.day_counts)} day counts in {compile_ms:.1f} ms")
+
+    frame = build_frame(users)
+    goals = {user_id: {'calories': 2100, 'protein': 70} for user_id in range(1, users + 1, 2)}
+
+    started = time.perf_counter()
+    summary_frame = compute_summary_frame(frame, goals, ruleset.day_counts)
+    frame_ms = (time.perf_counter() - started) * 1000
+    print(f"✓ Summary frame for {users} users ({len(frame)} days) in {frame_ms:.1f} ms")
+
+    engine = HealthRuleEngine(DEFAULT_RULES_PATH)
+    columns = {name: summary_frame[name].to_numpy() for name in summary_frame.columns}
+
+    started = time.perf_counter()
+    for rule in ruleset.alerts:
+        rule.when(columns)
+    predicate_ms = (time.perf_counter() - started) * 1000
+    print(f"✓ 'when' predicates of {len(ruleset.alerts)} rules over {users} users in {predicate_ms:.1f} ms")
+
+    started = time.perf_counter()
+    alerts = engine.evaluate_alerts(ruleset, summary_frame.index.tolist(), columns)
+    evaluate_seconds = time.perf_counter() - started
+
+    fired = sum(len(outputs) for outputs in alerts.values())
+    rule_rows = users * len(ruleset.alerts)
+    print(f"✓ Evaluated and rendered {rule_rows} rule-user pairs in {evaluate_seconds * 1000:.1f} ms "
+          f"({rule_rows / evaluate_seconds:,.0f} rule-users/s, {fired} alerts fired)")
+    print(f"✓ {users / evaluate_seconds:,.0f} users/s, "
+          f"{evaluate_seconds / users * 1e6:.1f} µs per user for {len(ruleset.alerts)} rules")
+
+if __name__ == "__main__":
+    bench_health_rules(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 10000,
+        int(sys.argv[2]) if len(sys.argv) > 2 else 40
+    )
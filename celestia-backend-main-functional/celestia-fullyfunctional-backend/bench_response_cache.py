@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the AI endpoint response cache.
+Replays a skewed stream of nutrition-lookup bodies from concurrent clients
+against a simulated model call and reports upstream calls, latency and
+Cache-Status outcomes, with and without the cache.
+
+Usage: python bench_response_cache.py [requests] [model_seconds]
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import os
+import random
+import sys
+import tempfile
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.response_cache import ResponseCache
+
+DISHES = ["Masala dosa", "Idli", "Chicken biryani", "Dal tadka", "Aloo paratha", "Poha", "Upma", "Sambar"]
+
+def build_bodies(count: int):
+    """Meals drawn with a popularity skew; key order varies like it does across clients"""
+    rng = random.Random(7)
+    bodies = []
+    for _ in range(count):
+        dish = DISHES[min(int(rng.expovariate(0.6)), len(DISHES) - 1)]
+        item = {"name": dish, "quantity": f"{rng.choice([1, 1, 2])} serving"}
+        if rng.random() < 0.5:
+            item = dict(reversed(list(item.items())))
+        bodies.append({"items": [item]})
+    return bodies
+
+def bench(name, bodies, model_seconds, cache=None, clients=16):
+    upstream = Counter()
+
+    def model_call(body):
+        upstream["calls"] += 1
+        time.sleep(model_seconds)
+        return {"items": body["items"], "total_calories": 250}
+
+    def serve(body):
+        started = time.perf_counter()
+        if cache is None:
+            model_call(body)
+            status = "uncached"
+        else:
+            _, status = cache.get_or_compute("nutrition_lookup", body, lambda: model_call(body))
+        return time.perf_counter() - started, status.split('; ', 1)[1] if cache else status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as executor:
+        results = list(executor.map(serve, bodies))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for latency, _ in results)
+    outcomes = Counter(status for _, status in results)
+    print(f"✓ {name}: {upstream['calls']} model calls for {len(bodies)} requests in {elapsed:.2f}s, "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+    print(f"    Cache-Status: {dict(outcomes)}")
+
+def bench_response_cache(count: int = 400, model_seconds: float = 0.2):
+    bodies = build_bodies(count)
+    print(f"✓ {count} requests, {len({str(sorted(b['items'][0].items())) for b in bodies})} distinct bodies, "
+          f"{model_seconds * 1000:.0f} ms simulated model call")
+    bench("no cache", bodies, model_seconds)
+    bench("memory LRU", bodies, model_seconds, ResponseCache(max_entries=1000))
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache = ResponseCache(max_entries=4, spill_path=os.path.join(directory, "spill.db"))
+        bench("4-entry LRU + SQLite spill", bodies, model_seconds, cache)
+        print(f"    {cache.get_status()}")
+        cache.close()
+
+if __name__ == "__main__":
+    bench_response_cache(
+        int(sys.argv[1]) if len(sys.argv) > 1 else 400,
+        float(sys.argv[2]) if len(sys.argv) > 2 else 0.2
+    )
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+"""
+Benchmark for the structured-output extractor.
+Builds a corpus of model responses in the shapes Gemini returns them (plain
+JSON, code fences, prose around the object, braces inside strings, trailing
+commas, truncated output) and compares parse success and time per response
+of the previous clean_json_response with extract_json_object, and the
+AnalysisResponse validation pass on top of it.
+
+Usage: python bench_structured_output.py [copies]
+"""
+import json
+import random
+import re
+import sys
+import os
+import time
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.models.pydantic_models import AnalysisResponse
+from app.services.structured_output import extract_json_object, parse_structured_output
+
+DISHES = ["Masala dosa", "Idli", "Chicken biryani", "Dal tadka", "Aloo paratha", "Paneer butter masala",
+          "Rajma chawal", "Poha", "Upma", "Chole bhature", "Sambar", "Curd rice"]
+
+def legacy_clean_json_response(text):
+    """clean_json_response as it was before structured_output"""
+    text = re.sub(r'```json', '', text)
+    text = re.sub(r'```', '', text)
+    text = text.strip()
+    brace_count = 0
+    start_idx = -1
+    end_idx = -1
+    for i, char in enumerate(text):
+        if char == '{':
+            if start_idx == -1:
+                start_idx = i
+            brace_count += 1
+        elif char == '}':
+            brace_count -= 1
+            if brace_count == 0 and start_idx != -1:
+                end_idx = i + 1
+                break
+    if start_idx != -1 and end_idx != -1:
+        try:
+            return json.loads(text[start_idx:end_idx])
+        except Exception:
+            return None
+    return None
+
+def analysis(rng: random.Random, items: int) -> dict:
+    chosen = [
+        {
+            "name": rng.choice(DISHES),
+            "quantity": f"{rng.randint(1, 3)} serving",
+            "confidence": rng.randint(50, 95),
+            "calories": rng.randint(80, 600),
+            "protein": round(rng.uniform(2, 30), 1),
+            "carbs": round(rng.uniform(5, 80), 1),
+            "fat": round(rng.uniform(1, 30), 1),
+            "is_vegetarian": rng.random() < 0.7,
+            "regional_cuisine": rng.choice(["North Indian", "South Indian"]),
+            "cooking_method": rng.choice(["fried", "steamed", "tawa"])
+        }
+        for _ in range(items)
+    ]
+    return {
+        "items": chosen,
+        "total_calories": sum(item["calories"] for item in chosen),
+        "total_protein": round(sum(item["protein"] for item in chosen), 1),
+        "total_carbs": round(sum(item["carbs"] for item in chosen), 1),
+        "total_fat": round(sum(item["fat"] for item in chosen), 1),
+        "confidence_overall": 80,
+        "need_clarification": False,
+        "unclear_items": []
+    }
+
+def build_corpus(copies: int):
+    """(label, response text, expected to be recoverable)"""
+    rng = random.Random(11)
+    corpus = []
+    for _ in range(copies):
+        data = analysis(rng, rng.randint(1, 6))
+        body = json.dumps(data, indent=2)
+
+        corpus.append(("plain", body, True))
+        corpus.append(("fenced", f"```json\n{body}\n```", True))
+        corpus.append(("prose", f"Here is the analysis of your meal:\n{body}\nLet me know if you need anything else!", True))
+
+        braces = dict(data, unclear_items=["Is the {gravy} made with cream?"])
+        braces["items"][0]["quantity"] = "1 bowl } with extra {ghee}"
+        corpus.append(("braces_in_strings", f"```json\n{json.dumps(braces, indent=2)}\n```", True))
+
+        trailing = re.sub(r'("unclear_items": \[\])', r'\1,', body)
+        trailing = trailing.replace('"cooking_method": "fried"', '"cooking_method": "fried",')
+        corpus.append(("trailing_commas", trailing, True))
+
+        cut = body[:int(len(body) * rng.uniform(0.55, 0.95))]
+        # Recoverable once the first item's object has closed
+        corpus.append(("truncated", f"```json\n{cut}", '"items": [' in cut and '}' in cut[cut.index('"items": [') + 10:]))
+
+        corpus.append(("stray_prose_braces", f"Estimates use {{standard}} Indian portions.\n{body}", True))
+        corpus.append(("no_json", "I'm sorry, I couldn't identify any food in this image.", False))
+    return corpus
+
+def bench(name, parse, corpus, repeats):
+    started = time.perf_counter()
+    for _ in range(repeats):
+        results = [parse(text) for _, text, _ in corpus]
+    elapsed = time.perf_counter() - started
+
+    by_label = {}
+    for (label, _, recoverable), result in zip(corpus, results):
+        ok, total = by_label.get(label, (0, 0))
+        by_label[label] = (ok + (1 if isinstance(result, dict) and result.get("items") else 0), total + (1 if recoverable else 0))
+
+    parsed = sum(ok for ok, _ in by_label.values())
+    recoverable = sum(total for _, total in by_label.values())
+    print(f"✓ {name}: {parsed}/{recoverable} recoverable responses parsed, "
+          f"{elapsed / (repeats * len(corpus)) * 1e6:.1f} µs per response")
+    for label, (ok, total) in by_label.items():
+        print(f"    {label:<20} {ok}/{total}")
+
+def bench_structured_output(copies: int = 200, repeats: int = 5):
+    corpus = build_corpus(copies)
+    print(f"✓ Corpus of {len(corpus)} responses, {sum(len(text) for _, text, _ in corpus) / len(corpus):.0f} chars on average")
+    bench("legacy clean_json_response", legacy_clean_json_response, corpus, repeats)
+    bench("extract_json_object", lambda text: extract_json_object(text, partial=True), corpus, repeats)
+    bench("parse_structured_output(AnalysisResponse)", lambda text: parse_structured_output(text, AnalysisResponse, partial=True), corpus, repeats)
+
+if __name__ == "__main__":
+    bench_structured_output(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Checks the meal-history intent classifier against example chat messages,
+including advice questions that must go to the LLM rather than be answered
+from the meal log.
+
+Usage: python check_intent_classifier.py
+"""
+import os
+import sys
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from app.services.meal_intent_classifier import MealIntentClassifier
+
+CASES = [
+    # Meal-history questions answered from the database
+    ("when did I last eat biryani?", 'when_eaten'),
+    ("how often do I eat paneer", 'frequency'),
+    ("what did I eat with dal yesterday", 'co_occurrence'),
+    ("how much protein did I have today?", 'nutrient_total'),
+    ("how many calories have I had this week", 'nutrient_total'),
+    ("what's my calorie intake today", 'nutrient_total'),
+    ("what did I eat yesterday?", 'meal_log'),
+    ("show me my meals", 'meal_log'),
+    ("my recent meals from the past 3 days", 'meal_log'),
+
+    # nutrient_total negatives: advice or no history cue
+    ("how much protein should I have per day?", 'none'),
+    ("how many calories do I need to lose weight?", 'none'),
+    ("how much fiber is recommended for diabetics", 'none'),
+    ("my protein intake goal", 'none'),
+    ("how much fat is in ghee, I have to know", 'none'),
+
+    # meal_log negatives: advice or no history cue
+    ("I had my meals late, any tips?", 'none'),
+    ("how to plan my meals for the week", 'none'),
+    ("should my meals have more protein?", 'none'),
+    ("suggest healthier options for my meals", 'none'),
+]
+
+def check_intent_classifier() -> bool:
+    classifier = MealIntentClassifier()
+    failures = 0
+    for message, expected in CASES:
+        intent = classifier.classify(message)['intent']
+        if intent == expected:
+            print(f"✓ {message!r} -> {intent}")
+        else:
+            failures += 1
+            print(f"❌ {message!r} -> {intent}, expected {expected}")
+
+    print(f"\n{len(CASES) - failures}/{len(CASES)} cases passed")
+    return failures == 0
+
+if __name__ == "__main__":
+    sys.exit(0 if check_intent_classifier() else 1)
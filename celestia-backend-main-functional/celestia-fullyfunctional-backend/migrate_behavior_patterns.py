@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Database migration script for incrementally maintained behavior patterns.
+Adds the stats column to user_behavior_patterns and seeds the online
+statistics of every user with recent meals, so logged meals update their
+patterns in place from then on.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from datetime import date, timedelta
+from sqlalchemy import text
+from app.database import engine, SessionLocal
+from app.models.db_models import Meal
+from app.services.behavior_patterns import SEED_DAYS, behavior_pattern_tracker
+
+def migrate_behavior_patterns():
+    """Add the stats column and seed pattern statistics from recent meals"""
+    is_sqlite = engine.dialect.name == "sqlite"
+
+    with engine.connect() as connection:
+        trans = connection.begin()
+        try:
+            connection.execute(text(
+                "ALTER TABLE user_behavior_patterns ADD COLUMN stats JSON" if is_sqlite
+                else "ALTER TABLE user_behavior_patterns ADD COLUMN IF NOT EXISTS stats JSON"
+            ))
+            trans.commit()
+            print("✓ Added stats column to user_behavior_patterns table")
+        except Exception as e:
+            trans.rollback()
+            if "duplicate column name" in str(e).lower() or "already exists" in str(e).lower():
+                print("✓ stats column already exists in user_behavior_patterns table")
+            else:
+                print(f"❌ Migration failed: {e}")
+                raise e
+
+    db = SessionLocal()
+    try:
+        cutoff = date.today() - timedelta(days=SEED_DAYS)
+        user_ids = [
+            row[0] for row in db.query(Meal.user_id).filter(
+                Meal.upload_date >= cutoff
+            ).distinct().order_by(Meal.user_id).all()
+        ]
+
+        seeded = sum(1 for user_id in user_ids if behavior_pattern_tracker.rebuild(db, user_id))
+        print(f"✓ Seeded behavior pattern statistics for {seeded} of {len(user_ids)} active users")
+        print("✅ Behavior pattern migration completed successfully!")
+    except Exception as e:
+        print(f"❌ Seeding failed: {e}")
+        raise e
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate_behavior_patterns()
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Database migration script for deduplicated health alerts and insights.
+Adds the dedup_key columns and the unique (user_id, dedup_key) indexes the
+monitoring upserts conflict on, gives legacy alerts without an expiry one,
+collapses duplicate active rows and prunes long-expired ones.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+from app.database import engine, SessionLocal
+from app.models.db_models import User  # registers the model the agentic tables relate to
+from app.services.health_monitoring_service import HealthMonitoringService
+
+def migrate_health_alerts():
+    """Add dedup_key columns and clean up duplicate alerts and insights"""
+    is_sqlite = engine.dialect.name == "sqlite"
+
+    for table in ["health_alerts", "predictive_insights"]:
+        with engine.connect() as connection:
+            trans = connection.begin()
+            try:
+                connection.execute(text(
+                    f"ALTER TABLE {table} ADD COLUMN dedup_key VARCHAR" if is_sqlite
+                    else f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS dedup_key VARCHAR"
+                ))
+                trans.commit()
+                print(f"✓ Added dedup_key column to {table} table")
+            except Exception as e:
+                trans.rollback()
+                if "duplicate column name" in str(e).lower() or "already exists" in str(e).lower():
+                    print(f"✓ dedup_key column already exists in {table} table")
+                else:
+                    print(f"❌ Migration failed: {e}")
+                    raise e
+
+    with engine.begin() as connection:
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_health_alerts_dedup_key ON health_alerts (dedup_key)"))
+        connection.execute(text("CREATE INDEX IF NOT EXISTS ix_predictive_insights_dedup_key ON predictive_insights (dedup_key)"))
+        print("✓ Created dedup_key indexes")
+
+        # Alerts used to be created without an expiry for some types; give them the default 7 days
+        expiry = "datetime(triggered_at, '+7 days')" if is_sqlite else "triggered_at + INTERVAL '7 days'"
+        result = connection.execute(text(f"UPDATE health_alerts SET expires_at = {expiry} WHERE expires_at IS NULL"))
+        print(f"✓ Set an expiry on {result.rowcount} legacy alerts")
+
+        # Keep only the newest legacy alert per user, type and title (and insight per user and type)
+        result = connection.execute(text("""
+            DELETE FROM health_alerts WHERE dedup_key IS NULL AND id NOT IN (
+                SELECT MAX(id) FROM health_alerts WHERE dedup_key IS NULL GROUP BY user_id, alert_type, title
+            )
+        """))
+        print(f"✓ Removed {result.rowcount} duplicate alerts")
+
+        result = connection.execute(text("""
+            DELETE FROM predictive_insights WHERE dedup_key IS NULL AND id NOT IN (
+                SELECT MAX(id) FROM predictive_insights WHERE dedup_key IS NULL GROUP BY user_id, insight_type
+            )
+        """))
+        print(f"✓ Removed {result.rowcount} duplicate insights")
+
+        # Rows written concurrently before the unique indexes existed; keep the newest per key
+        for table in ["health_alerts", "predictive_insights"]:
+            result = connection.execute(text(f"""
+                DELETE FROM {table} WHERE dedup_key IS NOT NULL AND id NOT IN (
+                    SELECT MAX(id) FROM {table} WHERE dedup_key IS NOT NULL GROUP BY user_id, dedup_key
+                )
+            """))
+            print(f"✓ Removed {result.rowcount} duplicate keyed rows from {table}")
+            connection.execute(text(
+                f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table}_user_dedup ON {table} (user_id, dedup_key)"
+            ))
+            print(f"✓ Created uq_{table}_user_dedup unique index")
+
+    db = SessionLocal()
+    try:
+        pruned = HealthMonitoringService(db).prune_expired()
+        if pruned.get('error'):
+            raise RuntimeError(pruned['error'])
+        print(f"✓ Pruned {pruned['alerts_deleted']} expired alerts and {pruned['insights_deleted']} expired insights")
+        print("✅ Health alert migration completed successfully!")
+    except Exception as e:
+        print(f"❌ Pruning failed: {e}")
+        raise e
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate_health_alerts()
@@ -0,0 +1,68 @@
+#!/usr/bin/env python3
+"""
+Database migration script for semantic conversation memory.
+Adds the conversation_memory.embedding column and backfills float32
+embeddings for existing memories (pass --reembed after changing the model).
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+from app.database import engine, SessionLocal
+from app.models.db_models import User  # registers the model ConversationMemory relates to
+from app.models.agentic_models import ConversationMemory
+from app.services.memory_embeddings import memory_vector_index, vector_to_bytes
+
+def migrate_memory_embeddings(reembed: bool = False):
+    """Add the embedding column and embed existing conversation memories"""
+    is_sqlite = engine.dialect.name == "sqlite"
+    
+    with engine.connect() as connection:
+        trans = connection.begin()
+        try:
+            print("Adding embedding column to conversation_memory table...")
+            connection.execute(text(
+                "ALTER TABLE conversation_memory ADD COLUMN embedding BLOB" if is_sqlite
+                else "ALTER TABLE conversation_memory ADD COLUMN IF NOT EXISTS embedding BYTEA"
+            ))
+            trans.commit()
+            print("✓ Added embedding column to conversation_memory table")
+        except Exception as e:
+            trans.rollback()
+            if "duplicate column name" in str(e).lower() or "already exists" in str(e).lower():
+                print("✓ embedding column already exists in conversation_memory table")
+            else:
+                print(f"❌ Migration failed: {e}")
+                raise e
+    
+    db = SessionLocal()
+    try:
+        embedder = memory_vector_index.get_embedder()
+        print(f"Embedding conversation memories with the {embedder.name} embedder ({embedder.dim} dimensions)...")
+        
+        query = db.query(ConversationMemory.id)
+        if not reembed:
+            query = query.filter(ConversationMemory.embedding.is_(None))
+        memory_ids = [memory_id for (memory_id,) in query.order_by(ConversationMemory.id).all()]
+        
+        for start in range(0, len(memory_ids), 256):
+            batch = db.query(ConversationMemory).filter(
+                ConversationMemory.id.in_(memory_ids[start:start + 256])
+            ).all()
+            vectors = embedder.embed([memory.content or "" for memory in batch])
+            for memory, vector in zip(batch, vectors):
+                memory.embedding = vector_to_bytes(vector)
+            db.commit()
+        
+        print(f"✅ Embedded {len(memory_ids)} conversation memories")
+        
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Embedding backfill failed: {e}")
+        raise e
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    migrate_memory_embeddings(reembed="--reembed" in sys.argv)
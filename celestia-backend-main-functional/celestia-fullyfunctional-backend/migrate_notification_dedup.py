@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Database migration script for deduplicated smart notifications.
+Adds the dedup_key column to smart_notifications, fills it in for existing
+rows, removes unsent duplicate reminders and creates the unique
+(user_id, dedup_key) index the notification inserts conflict on.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text, update
+from app.database import engine, SessionLocal
+from app.models.db_models import User  # registers the model the agentic tables relate to
+from app.models.agentic_models import SmartNotification
+from app.services.smart_notification_service import notification_dedup_key
+
+def migrate_notification_dedup():
+    """Add and backfill dedup_key, then make it unique per user"""
+    is_sqlite = engine.dialect.name == "sqlite"
+
+    with engine.connect() as connection:
+        trans = connection.begin()
+        try:
+            connection.execute(text(
+                "ALTER TABLE smart_notifications ADD COLUMN dedup_key VARCHAR" if is_sqlite
+                else "ALTER TABLE smart_notifications ADD COLUMN IF NOT EXISTS dedup_key VARCHAR"
+            ))
+            trans.commit()
+            print("✓ Added dedup_key column to smart_notifications table")
+        except Exception as e:
+            trans.rollback()
+            if "duplicate column name" in str(e).lower() or "already exists" in str(e).lower():
+                print("✓ dedup_key column already exists in smart_notifications table")
+            else:
+                print(f"❌ Migration failed: {e}")
+                raise e
+
+    db = SessionLocal()
+    try:
+        rows = db.query(
+            SmartNotification.id, SmartNotification.user_id, SmartNotification.notification_type,
+            SmartNotification.title, SmartNotification.scheduled_time, SmartNotification.is_sent,
+            SmartNotification.dedup_key
+        ).order_by(SmartNotification.id).all()
+
+        # The oldest row per key keeps it; later unsent copies are duplicates, sent ones stay as history
+        claimed = {(row.user_id, row.dedup_key) for row in rows if row.dedup_key}
+        keys, duplicates = [], []
+        for row in rows:
+            if row.dedup_key or row.scheduled_time is None:
+                continue
+            key = (row.user_id, notification_dedup_key(row.notification_type, row.title, row.scheduled_time))
+            if key not in claimed:
+                claimed.add(key)
+                keys.append({'id': row.id, 'dedup_key': key[1]})
+            elif not row.is_sent:
+                duplicates.append(row.id)
+
+        for start in range(0, len(keys), 500):
+            db.execute(update(SmartNotification), keys[start:start + 500])
+        for start in range(0, len(duplicates), 500):
+            db.query(SmartNotification).filter(
+                SmartNotification.id.in_(duplicates[start:start + 500])
+            ).delete(synchronize_session=False)
+        db.commit()
+        print(f"✓ Set dedup_key on {len(keys)} notifications")
+        print(f"✓ Removed {len(duplicates)} duplicate unsent notifications")
+    except Exception as e:
+        db.rollback()
+        print(f"❌ Migration failed: {e}")
+        raise e
+    finally:
+        db.close()
+
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE UNIQUE INDEX IF NOT EXISTS uq_smart_notifications_user_dedup "
+            "ON smart_notifications (user_id, dedup_key)"
+        ))
+        print("✓ Created uq_smart_notifications_user_dedup unique index")
+    print("✅ Notification dedup migration completed successfully!")
+
+if __name__ == "__main__":
+    migrate_notification_dedup()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Database migration script for smart notification delivery.
+Adds the delivery_status and delivery_attempts columns to smart_notifications
+and the (is_sent, scheduled_time) index the dispatcher polls for due rows, then
+expires the backlog of past-due notifications that were never delivered so
+they aren't all sent at once when the dispatcher starts.
+"""
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from sqlalchemy import text
+from app.database import SessionLocal, engine
+
+def migrate_notification_dispatch():
+    """Add delivery columns and the due-notification index"""
+    is_sqlite = engine.dialect.name == "sqlite"
+    columns = [
+        ("delivery_status", "VARCHAR"),
+        ("delivery_attempts", "INTEGER DEFAULT 0")
+    ]
+
+    with engine.connect() as connection:
+        for column, column_type in columns:
+            trans = connection.begin()
+            try:
+                connection.execute(text(
+                    f"ALTER TABLE smart_notifications ADD COLUMN {column} {column_type}" if is_sqlite
+                    else f"ALTER TABLE smart_notifications ADD COLUMN IF NOT EXISTS {column} {column_type}"
+                ))
+                trans.commit()
+                print(f"✓ Added {column} column to smart_notifications table")
+            except Exception as e:
+                trans.rollback()
+                if "duplicate column name" in str(e).lower() or "already exists" in str(e).lower():
+                    print(f"✓ {column} column already exists in smart_notifications table")
+                else:
+                    print(f"❌ Migration failed: {e}")
+                    raise e
+
+        trans = connection.begin()
+        try:
+            connection.execute(text(
+                "CREATE INDEX IF NOT EXISTS ix_smart_notifications_due "
+                "ON smart_notifications (is_sent, scheduled_time)"
+            ))
+            trans.commit()
+            print("✓ Created ix_smart_notifications_due index")
+        except Exception as e:
+            trans.rollback()
+            print(f"❌ Migration failed: {e}")
+            raise e
+
+    # Same rule the dispatcher applies on every poll
+    from app.services.notification_dispatcher import notification_dispatcher
+    db = SessionLocal()
+    try:
+        expired = notification_dispatcher.expire_overdue(db)
+        print(f"✓ Expired {expired} overdue undelivered notifications")
+    finally:
+        db.close()
+    print("✅ Notification dispatch migration completed successfully!")
+
+if __name__ == "__main__":
+    migrate_notification_dispatch()